@@ -45,6 +45,20 @@ import storm_control.sc_library.parameters as params
 #
 # This class handles the execution of commands that can be given to Dave
 #
+# Normally the commands are run one at a time. If lookahead is greater than
+# zero then up to lookahead more commands can be started while a command is
+# running, as long as they don't use any of the resources (see
+# DaveAction.getResources()) of the commands that are already running. Dave
+# starts the commands in order, the engine emits the done signal whenever a
+# command completes, or when a command was started and there is room for
+# another. Commands are always run one at a time in test mode.
+#
+# Note that HAL still handles the TCP actions that it receives one at a time
+# (see hal4000.tcpControl). Commands sent to HAL only overlap with each other
+# if HAL's tcp_control module is in parallel mode, and then only a command
+# that HAL does not handle as an action (e.g. 'Move Stage') overlaps with the
+# one that follows it. Commands for HAL and for Kilroy always overlap.
+#
 class CommandEngine(QtCore.QObject):
     done = QtCore.pyqtSignal()
     paused = QtCore.pyqtSignal()
@@ -54,13 +68,16 @@ class CommandEngine(QtCore.QObject):
     
     ## __init__
     #
+    # @param lookahead (Optional) The number of commands that can be started before the current command is complete.
+    # @param parent (Optional) The PyQt parent of this object.
     #
     @hdebug.debug
-    def __init__(self, parent = None):
+    def __init__(self, lookahead = 0, parent = None):
         QtCore.QObject.__init__(self, parent)
 
         # Set defaults
-        self.command = None
+        self.commands = [] # The running commands, oldest first.
+        self.lookahead = lookahead
         
         self.test_mode = False
         
@@ -68,19 +85,61 @@ class CommandEngine(QtCore.QObject):
         self.HALClient = tcpClient.TCPClient(port = 9000,
                                              server_name = "HAL",
                                              verbose = False)
+        self.HALClient.messageReceived.connect(self.handleMessageReceived)
         
         # Kilroy Client
         self.kilroyClient = tcpClient.TCPClient(port = 9500,
                                                 server_name = "Kilroy",
                                                 verbose = False)
+        self.kilroyClient.messageReceived.connect(self.handleMessageReceived)
     
     ## abort
     #
-    # Aborts the current action (if any).
+    # Aborts the current actions (if any).
     #
     @hdebug.debug
     def abort(self):
-        self.command.abort()
+        for command in list(self.commands):
+            command.abort()
+
+    ## canStart
+    #
+    # @param command A DaveAction.
+    #
+    # @return True/False if the command can be started now.
+    #
+    def canStart(self, command):
+        if (len(self.commands) == 0):
+            return True
+        if self.test_mode or (len(self.commands) > self.lookahead):
+            return False
+        if command.getResources() is None:
+            return False
+        resources = set(command.getResources())
+        for running in self.commands:
+            if (running.getResources() is None) or not resources.isdisjoint(running.getResources()):
+                return False
+        return True
+
+    ## findCommand
+    #
+    # @param message A TCP message object.
+    #
+    # @return The running command that sent message, the oldest running command if none of them did, or None.
+    #
+    def findCommand(self, message):
+        for command in self.commands:
+            if (command.getMessage().getID() == message.getID()):
+                return command
+        if (len(self.commands) > 0):
+            return self.commands[0]
+
+    ## isIdle
+    #
+    # @return True/False if there are no running commands.
+    #
+    def isIdle(self):
+        return (len(self.commands) == 0)
 
     ## startCommand
     #
@@ -90,37 +149,48 @@ class CommandEngine(QtCore.QObject):
     # @param test_mode (Optional) Run the command in test mode.
     #
     def startCommand(self, command, test_mode = False):
-        self.command = command
+        self.commands.append(command)
+        self.test_mode = test_mode
 
         # Connect signals.
-        self.command.complete_signal.connect(self.handleActionComplete)
-        self.command.error_signal.connect(self.handleErrorSignal)
-        self.command.warning_signal.connect(self.handleWarningSignal)
+        command.complete_signal.connect(self.handleActionComplete)
+        command.error_signal.connect(self.handleErrorSignal)
+        command.warning_signal.connect(self.handleWarningSignal)
         
         # Start command.
-        if (self.command.getActionType() == "hal"):
-            self.command.start(self.HALClient, test_mode)
-        elif (self.command.getActionType() == "kilroy"):
-            self.command.start(self.kilroyClient, test_mode)
-        elif (self.command.getActionType() == "dave"):
-            self.dave_action.emit(self.command.getMessage())
-        elif (self.command.getActionType() == "NA"):
-            self.command.start(False, test_mode)
+        if (command.getActionType() == "hal"):
+            command.start(self.HALClient, test_mode)
+        elif (command.getActionType() == "kilroy"):
+            command.start(self.kilroyClient, test_mode)
+        elif (command.getActionType() == "dave"):
+            self.dave_action.emit(command.getMessage())
+        elif (command.getActionType() == "NA"):
+            command.start(False, test_mode)
         else:
-            raise Exception("No TCPClient for " + self.command.getActionType())
+            raise Exception("No TCPClient for " + command.getActionType())
+
+        # Check if there is room for another command (if the command is
+        # already complete then done was emitted when it completed).
+        if (command in self.commands) and not test_mode and (len(self.commands) <= self.lookahead):
+            self.done.emit()
 
     ## handleActionComplete
     #
-    # Handle the completion of the previous action
+    # Handle the completion of an action
     #
     def handleActionComplete(self, message):
-        self.command.cleanUp()
-        self.command.complete_signal.disconnect()
-        self.command.error_signal.disconnect()
-        self.command.warning_signal.disconnect()
+        command = self.findCommand(message)
+        if command is None:
+            return
+        self.commands.remove(command)
+        
+        command.cleanUp()
+        command.complete_signal.disconnect()
+        command.error_signal.disconnect()
+        command.warning_signal.disconnect()
 
         # Configure the command engine to pause after completion of the command sequence
-        if self.command.shouldPause() and not message.isTest():
+        if command.shouldPause() and not message.isTest():
             self.should_pause = True
             self.paused.emit()
         
@@ -134,6 +204,17 @@ class CommandEngine(QtCore.QObject):
         self.problem.emit(message)
         self.handleActionComplete(message)
 
+    ## handleMessageReceived
+    #
+    # Pass a TCP message to the command that sent it.
+    #
+    # @param message A TCP message object.
+    #
+    def handleMessageReceived(self, message):
+        command = self.findCommand(message)
+        if command is not None and (command.getActionType() in ["hal", "kilroy"]):
+            command.handleReply(message)
+
     ## handleWarningSignal
     #
     # Handle a warning signal
@@ -168,6 +249,7 @@ class Dave(QtWidgets.QMainWindow):
         self.sequence_validated = False
         self.test_mode = False
         self.skip_warning = False
+        self.stop_tcp = False
         self.needs_hal = False
         self.needs_kilroy = False
 
@@ -235,7 +317,7 @@ class Dave(QtWidgets.QMainWindow):
         self.ui.progressBar.setMaximum(1)
 
         # Command engine.
-        self.command_engine = CommandEngine()
+        self.command_engine = CommandEngine(lookahead = parameters.get("lookahead", 0))
         self.command_engine.done.connect(self.handleDone)
         self.command_engine.problem.connect(self.handleProblem)
         self.command_engine.paused.connect(self.handlePauseFromCommandEngine)
@@ -408,6 +490,21 @@ class Dave(QtWidgets.QMainWindow):
         if self.test_mode:
             self.ui.commandSequenceTreeView.updateEstimates()
 
+        # If there are still commands running then only continue if the next
+        # command can be started now, otherwise wait for them to complete.
+        if not self.command_engine.isIdle():
+            next_action = self.ui.commandSequenceTreeView.peekNextAction()
+            if (not self.running) or (next_action is None) or (not self.command_engine.canStart(next_action)):
+                return
+
+        # Stop TCP communication after a problem.
+        if self.stop_tcp:
+            self.stop_tcp = False
+            if self.needs_hal:
+                self.command_engine.HALClient.stopCommunication()
+            if self.needs_kilroy:
+                self.command_engine.kilroyClient.stopCommunication()
+
         # Increment command to the next valid command / action.
         next_command = self.ui.commandSequenceTreeView.getNextItem()
 
@@ -554,20 +651,20 @@ class Dave(QtWidgets.QMainWindow):
     @hdebug.debug
     def handleProblem(self, message, message_str = False):
         current_item = self.ui.commandSequenceTreeView.getCurrentItem()
-        # Compose message string.
+        # Compose message string, with lookahead the command with the problem is not always the current item.
         if not message_str:
-            message_str = current_item.getDaveAction().getDescriptor() + "\n" + message.getErrorMessage()
+            command = self.command_engine.findCommand(message)
+            if command is None:
+                command = current_item.getDaveAction()
+            message_str = command.getDescriptor() + "\n" + message.getErrorMessage()
 
         if not self.test_mode:
 
             # Pause Dave.
             self.handlePause()
 
-            # Stop TCP communication.
-            if self.needs_hal:
-                self.command_engine.HALClient.stopCommunication()
-            if self.needs_kilroy:
-                self.command_engine.kilroyClient.stopCommunication()
+            # Stop TCP communication, this happens once the running commands are complete.
+            self.stop_tcp = True
             
             # Display errors.
             if (self.ui.errorMsgCheckBox.isChecked()):
@@ -54,15 +54,19 @@ class DaveAction(QtCore.QObject):
         self.message = None
         self.valid = True
 
+        # The resources (i.e. "stage", "focus", ..) that the action uses. Actions
+        # that don't share any resources can be run at the same time. None means
+        # that the action can only be run by itself.
+        self.resources = None
+
         # Define pause behaviors
         self.should_pause = False            # Pause after completion
         self.should_pause_default = False    # Default pause state for reset
         self.should_pause_after_error = True # Pause after an error
                 
-        # Initialize internal timer
-        self.lost_message_timer = QtCore.QTimer(self)
-        self.lost_message_timer.setSingleShot(True)
-        self.lost_message_timer.timeout.connect(self.handleTimerDone)
+        # Internal timer, this is created when it is first needed as
+        # sequences can have many thousands of actions.
+        self.lost_message_timer = None
         self.lost_message_delay = 2000 # Wait for a test message to be returned before issuing an error
 
     ## abort
@@ -77,7 +81,6 @@ class DaveAction(QtCore.QObject):
     # Handle clean up of the action
     #
     def cleanUp(self):
-        self.tcp_client.messageReceived.disconnect()
         self.resetPause() # Allow a paused action to be rerun without a pause
 
     ## createETree
@@ -192,6 +195,13 @@ class DaveAction(QtCore.QObject):
     def getMessage(self):
         return self.message
 
+    ## getResources
+    #
+    # @return A list of the resources that the action uses, or None.
+    #
+    def getResources(self):
+        return self.resources
+
     ## getUsage
     #
     # @return Disk usage.
@@ -209,7 +219,8 @@ class DaveAction(QtCore.QObject):
     def handleReply(self, message, warning = False):
 
         # Stop lost message timer
-        self.lost_message_timer.stop()
+        if self.lost_message_timer is not None:
+            self.lost_message_timer.stop()
 
         # Check to see if the same message got returned
         if not (message.getID() == self.message.getID()):
@@ -297,7 +308,7 @@ class DaveAction(QtCore.QObject):
 
     ## start
     #
-    # Start the action.
+    # Start the action. The reply is passed to handleReply() by the command engine.
     #
     # @param tcp_client The TCP client to use for communication.
     # @param test_mode Send the command in test mode.
@@ -306,8 +317,11 @@ class DaveAction(QtCore.QObject):
         self.tcp_client = tcp_client
         self.message.setTestMode(test_mode)
 
-        self.tcp_client.messageReceived.connect(self.handleReply)
         if self.message.isTest():
+            if self.lost_message_timer is None:
+                self.lost_message_timer = QtCore.QTimer(self)
+                self.lost_message_timer.setSingleShot(True)
+                self.lost_message_timer.timeout.connect(self.handleTimerDone)
             self.lost_message_timer.start(self.lost_message_delay)
         self.tcp_client.sendMessage(self.message)
 
@@ -327,6 +341,7 @@ class DACheckFocus(DaveAction):
         DaveAction.__init__(self)
 
         self.action_type = "hal"
+        self.resources = ["fluidics", "focus", "parameters", "stage"]
         self.num_focus_checks = 10 # A default number of focus checks
         self.focus_scan = False # The default is to not scan for focus
         self.scan_range = False # The range to scan for focus in microns
@@ -633,6 +648,7 @@ class DAFindSum(DaveAction):
         DaveAction.__init__(self)
 
         self.action_type = "hal"
+        self.resources = ["fluidics", "focus", "parameters", "stage"]
         self.min_sum = None
     ## createETree
     #
@@ -697,6 +713,7 @@ class DAMoveStage(DaveAction):
         DaveAction.__init__(self)
 
         self.action_type = "hal"
+        self.resources = ["stage"]
 
     ## createETree
     #
@@ -820,6 +837,7 @@ class DARecenterPiezo(DaveAction):
         DaveAction.__init__(self)
 
         self.action_type = "hal"
+        self.resources = ["focus"]
 
     ## createETree
     #
@@ -869,6 +887,7 @@ class DALockOff(DaveAction):
         DaveAction.__init__(self)
 
         self.action_type = "hal"
+        self.resources = ["focus"]
 
     ## createETree
     #
@@ -911,6 +930,7 @@ class DASetDirectory(DaveAction):
         DaveAction.__init__(self)
 
         self.action_type = "hal"
+        self.resources = ["directory"]
 
     ## createETree
     #
@@ -959,6 +979,7 @@ class DASetFocusLockTarget(DaveAction):
         DaveAction.__init__(self)
 
         self.action_type = "hal"
+        self.resources = ["focus"]
 
     ## createETree
     #
@@ -1004,6 +1025,7 @@ class DASetParameters(DaveAction):
         DaveAction.__init__(self)
 
         self.action_type = "hal"
+        self.resources = ["parameters"]
 
         # Allow for a longer delay in case the parameters need to be initialized
         self.lost_message_delay = 15000
@@ -1059,6 +1081,7 @@ class DASetProgression(DaveAction):
         DaveAction.__init__(self)
 
         self.action_type = "hal"
+        self.resources = ["parameters"]
 
     ## createETree
     #
@@ -1138,6 +1161,7 @@ class DATakeMovie(DaveAction):
         DaveAction.__init__(self)
 
         self.action_type = "hal"
+        self.resources = ["directory", "fluidics", "focus", "parameters", "stage"]
         self.properties = {"name" : None,
                            "length" : None,
                            "min_spots" : None,
@@ -1268,6 +1292,7 @@ class DAValveProtocol(DaveAction):
         DaveAction.__init__(self)
 
         self.action_type = "kilroy"
+        self.resources = ["fluidics"]
         self.properties = {"name" : None}
 
     ## createETree
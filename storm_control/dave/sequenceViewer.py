@@ -7,7 +7,9 @@
 # Hazen 06/14
 #
 
+import numpy
 from xml.etree import ElementTree
+from xml.sax import saxutils
 from PyQt5 import QtCore, QtGui, QtWidgets
 
 import storm_control.dave.daveActions as daveActions
@@ -23,12 +25,12 @@ class DaveActionStandardItem(QtGui.QStandardItem):
 
     ## __init__
     #
-    # @param node A XML node describing the DaveAction.
+    # @param dave_action The DaveAction.
+    # @param index (Optional) The index of the DaveAction in the sequence, defaults to 0.
     #
-    def __init__(self, node):
-        dave_action_class = getattr(daveActions, node.tag)
-        self.dave_action = dave_action_class()
-        self.dave_action.setup(node)
+    def __init__(self, dave_action, index = 0):
+        self.dave_action = dave_action
+        self.index = index
         self.valid = True
 
         QtGui.QStandardItem.__init__(self, self.dave_action.getDescriptor())
@@ -48,6 +50,13 @@ class DaveActionStandardItem(QtGui.QStandardItem):
     def getDaveActionID(self):
         return self.dave_action.getID()
 
+    ## getIndex
+    #
+    # @return The index of the DaveAction in the sequence.
+    #
+    def getIndex(self):
+        return self.index
+
     ## isValid
     #
     # @return True/False if the command is valid.
@@ -267,6 +276,19 @@ class DaveCommandTreeViewer(QtWidgets.QTreeView):
                 painter.setPen(QtGui.QColor(100,0,0))
                 painter.drawRect(select_rect)
 
+    ## peekNextAction
+    #
+    # @param (Optional) skip_invalid True/False to skip invalid commands. Defaults to True.
+    #
+    # @return The DaveAction of the item that getNextItem() will return, or None.
+    #
+    def peekNextAction(self, skip_invalid = True):
+        if self.aborted:
+            return None
+
+        if self.dv_model is not None:
+            return self.dv_model.peekNextAction(skip_invalid)
+
     ## resetItemIndex
     #
     # Reset to the first DaveAction.
@@ -335,63 +357,227 @@ class DaveCommandTreeViewer(QtWidgets.QTreeView):
         self.update.emit(item.getDaveAction().getLongDescriptor())
 
 
+## DaveBranchStandardItem
+#
+# A QStandardItem for a DaveBranch.
+#
+class DaveBranchStandardItem(QtGui.QStandardItem):
+
+    ## __init__
+    #
+    # @param dave_branch The DaveBranch.
+    #
+    def __init__(self, dave_branch):
+        QtGui.QStandardItem.__init__(self, dave_branch.name)
+        self.dave_branch = dave_branch
+        self.setFlags(QtCore.Qt.ItemIsEnabled)
+
+    ## getDaveBranch
+    #
+    # @return The DaveBranch associated with this item.
+    #
+    def getDaveBranch(self):
+        return self.dave_branch
+
+
+## DaveBranch
+#
+# A branch of the sequence. The QStandardItems for the children of a
+# branch are only created when the branch is expanded in the tree view
+# or when one of the DaveActions in the branch becomes the current
+# action.
+#
+class DaveBranch(object):
+
+    ## __init__
+    #
+    # @param name (Optional) The name of the branch, defaults to None (the root branch).
+    # @param parent (Optional) The parent DaveBranch, defaults to None.
+    #
+    def __init__(self, name = None, parent = None):
+        self.children = []   # DaveBranches and DaveAction indices.
+        self.n_fetched = 0   # The number of children that have QStandardItems.
+        self.name = name
+        self.parent = parent
+        self.qt_item = None  # The QStandardItem for this branch.
+        self.row = 0         # The row of this branch in it's parent.
+
+        if self.parent is not None:
+            self.row = len(self.parent.children)
+            self.parent.children.append(self)
+
+    ## canFetchMore
+    #
+    # @return True/False if there are children without QStandardItems.
+    #
+    def canFetchMore(self):
+        return (self.n_fetched < len(self.children))
+
+
 ## DaveStandardItemModel
 #
 # A QStandardItemModel specialized for Dave.
 #
+# The DaveActions are identified by their index in the sequence. The
+# duration and disk usage estimates are kept as arrays so that the
+# estimates for the run can be calculated from their prefix sums.
+#
 class DaveStandardItemModel(QtGui.QStandardItemModel):
 
     ## __init__
     #
-    def __init__(self):
+    # @param fetch_size (Optional) The number of items to create when a branch is expanded.
+    #
+    def __init__(self, fetch_size = 1000):
         QtGui.QStandardItemModel.__init__(self)
 
         self.dave_action_index = 0
-        self.dave_actions_cur = []   # The active list of DaveActionStandardItems
-        self.dave_actions_all = []   # The full list of DaveActionStandardItems
+        self.dave_actions = []       # The full list of DaveActions
+        self.dave_actions_all = []   # The indices of all the DaveActions
+        self.dave_actions_cur = self.dave_actions_all # The active list of DaveAction indices
+        self.dave_action_branches = [] # The DaveBranch that each DaveAction is in
+        self.dave_action_items = []  # The DaveActionStandardItems (or None if not created yet)
+        self.dave_action_rows = []   # The row of each DaveAction in it's DaveBranch
+        self.fetch_size = fetch_size
+        self.root = DaveBranch()
+        self.sums = None             # The prefix sums of the estimates (or None if out of date)
+        
+        # Estimates & validity.
+        self.durations = []
+        self.usages = []
+        self.valid = []
         
         # Lists for fast validation.
-        self.dave_actions_test = []  # A list of actions to validate
-        self.dave_actions_test_dict = dict() # A dictionary of test ids and lists of actions that have these
+        self.dave_actions_test = []  # A list of indices of the actions to validate
+        self.dave_actions_test_dict = dict() # A dictionary of test ids and lists of indices of the actions that have these
+        self.dave_actions_test_positions = dict() # A dictionary of indices and their position in the test list
 
         self.test_mode = False
 
-    ## addItem
-    #
-    # @param dave_action_si A DaveActionStandardItem.
-    #
-    def addItem(self, dave_action_si):
-        self.dave_actions_all.append(dave_action_si)
-        self.dave_actions_cur.append(dave_action_si) # Build current actions simultaneously
+    ## addAction
+    #
+    # @param dave_action A DaveAction.
+    # @param branch The DaveBranch the DaveAction is in.
+    #
+    def addAction(self, dave_action, branch):
+        index = len(self.dave_actions)
+        self.dave_actions.append(dave_action)
+        self.dave_actions_all.append(index)
+        self.dave_action_branches.append(branch)
+        self.dave_action_items.append(None)
+        self.dave_action_rows.append(len(branch.children))
+        self.durations.append(dave_action.getDuration())
+        self.usages.append(dave_action.getUsage())
+        self.valid.append(True)
+        self.sums = None
+        branch.children.append(index)
         
         # Check if action requires validation
-        action_id = dave_action_si.getDaveAction().getID()
+        action_id = dave_action.getID()
         if action_id is not None:
-            # Check for existing id
-            is_present = False
-            for id_value in self.dave_actions_test_dict.keys():
-                if action_id == id_value:
-                    is_present = True
 
             # Add to list if the id is not currently on the id list
-            if not is_present:
-                self.dave_actions_test.append(dave_action_si)
-                self.dave_actions_test_dict[action_id] = [dave_action_si] # Start list
+            if not (action_id in self.dave_actions_test_dict):
+                self.dave_actions_test_positions[index] = len(self.dave_actions_test)
+                self.dave_actions_test.append(index)
+                self.dave_actions_test_dict[action_id] = [index] # Start list
             else: # Add to current list of actions with the same id
-                self.dave_actions_test_dict[action_id].append(dave_action_si)
-        
+                self.dave_actions_test_dict[action_id].append(index)
+
+    ## canFetchMore
+    #
+    # @param parent The QModelIndex of a branch.
+    #
+    # @return True/False if the branch has children that have not been created.
+    #
+    def canFetchMore(self, parent):
+        branch = self.getBranch(parent)
+        if branch is not None:
+            return branch.canFetchMore()
+        return QtGui.QStandardItemModel.canFetchMore(self, parent)
+
+    ## fetchAction
+    #
+    # Create the DaveActionStandardItem for a DaveAction, as well as the items
+    # of the branches that it is in.
+    #
+    # @param index The index of the DaveAction.
+    #
+    def fetchAction(self, index):
+        chain = [[self.dave_action_branches[index], self.dave_action_rows[index]]]
+        while chain[-1][0].parent is not None:
+            branch = chain[-1][0]
+            chain.append([branch.parent, branch.row])
+        for [branch, row] in reversed(chain):
+            if (branch.n_fetched <= row):
+                self.fetchBranch(branch, last = row)
+
+    ## fetchBranch
+    #
+    # Create the QStandardItems for the children of a branch.
+    #
+    # @param branch The DaveBranch.
+    # @param last (Optional) The last child to create, defaults to the next fetch_size children.
+    #
+    def fetchBranch(self, branch, last = None):
+        if last is None:
+            last = branch.n_fetched + self.fetch_size - 1
+        last = min(last, len(branch.children) - 1)
+
+        rows = []
+        for child in branch.children[branch.n_fetched:last+1]:
+            if isinstance(child, DaveBranch):
+                child.qt_item = DaveBranchStandardItem(child)
+                rows.append(child.qt_item)
+            else:
+                item = DaveActionStandardItem(self.dave_actions[child], child)
+                if not self.valid[child]:
+                    item.setValid(False)
+                self.dave_action_items[child] = item
+                rows.append(item)
+        branch.n_fetched = last + 1
+
+        if branch.qt_item is None:
+            self.invisibleRootItem().appendRows(rows)
+        else:
+            branch.qt_item.appendRows(rows)
+
+    ## fetchMore
+    #
+    # @param parent The QModelIndex of a branch.
+    #
+    def fetchMore(self, parent):
+        branch = self.getBranch(parent)
+        if branch is not None:
+            self.fetchBranch(branch)
+        else:
+            QtGui.QStandardItemModel.fetchMore(self, parent)
+
     ## getActionTypes
     #
     # @return A list of DaveAction types (i.e. "hal" or "kilroy").
     #
     def getActionTypes(self):
         types = []
-        for item in self.dave_actions_cur:
-            type = item.getDaveAction().getActionType()
+        for index in self.dave_actions_cur:
+            type = self.dave_actions[index].getActionType()
             if not type in types:
                 types.append(type)
         return types
 
+    ## getBranch
+    #
+    # @param model_index A QModelIndex.
+    #
+    # @return The DaveBranch for model_index, or None if it is not a branch.
+    #
+    def getBranch(self, model_index):
+        if not model_index.isValid():
+            return self.root
+        qt_item = self.itemFromIndex(model_index)
+        if isinstance(qt_item, DaveBranchStandardItem):
+            return qt_item.getDaveBranch()
+
     ## getCurrentIndex
     #
     # @return The current item index.
@@ -404,26 +590,53 @@ class DaveStandardItemModel(QtGui.QStandardItemModel):
     # @return The current DaveActionStandardItem.
     #
     def getCurrentItem(self):
-        return self.dave_actions_cur[self.dave_action_index]
+        return self.getItem(self.dave_actions_cur[self.dave_action_index])
 
-    ## getNextItem
+    ## getItem
+    #
+    # The items for the next fetch_size DaveActions are also created so
+    # that the tree view doesn't have to update for every action.
+    #
+    # @param index The index of a DaveAction.
+    #
+    # @return The DaveActionStandardItem for the DaveAction.
+    #
+    def getItem(self, index):
+        if self.dave_action_items[index] is None:
+            for i in range(index, min(index + self.fetch_size, len(self.dave_actions))):
+                if self.dave_action_items[i] is None:
+                    self.fetchAction(i)
+        return self.dave_action_items[index]
+
+    ## getNextIndex
     #
     # @param skip_invalid True/False to skip invalid commands.
     #
-    # @return The next DaveActionStandardItem or none if there are no more items.
+    # @return The position of the next action in the active list.
     #
-    def getNextItem(self, skip_invalid):
-        self.dave_action_index += 1
+    def getNextIndex(self, skip_invalid):
+        index = self.dave_action_index + 1
 
         # If requested, skip over invalid commands.
         if skip_invalid:
-            while (self.dave_action_index < len(self.dave_actions_cur)) and (not self.dave_actions_cur[self.dave_action_index].isValid()):
-                self.dave_action_index += 1
+            while (index < len(self.dave_actions_cur)) and (not self.valid[self.dave_actions_cur[index]]):
+                index += 1
+
+        return index
+
+    ## getNextItem
+    #
+    # @param skip_invalid True/False to skip invalid commands.
+    #
+    # @return The next DaveActionStandardItem or none if there are no more items.
+    #
+    def getNextItem(self, skip_invalid):
+        self.dave_action_index = self.getNextIndex(skip_invalid)
 
         if (self.dave_action_index >= len(self.dave_actions_cur)):
             return None
         else:
-            return self.dave_actions_cur[self.dave_action_index]
+            return self.getCurrentItem()
 
     ## getNumberItems
     #
@@ -439,25 +652,42 @@ class DaveStandardItemModel(QtGui.QStandardItemModel):
     # @return An estimate of how much time is left in the run.
     #
     def getRemainingTime(self, start = 0):
-        est_time = 0
-        i = start
-        while (i < len(self.dave_actions_cur)):
-            item = self.dave_actions_cur[i]
-            if item.isValid():
-                est_time += item.getDaveAction().getDuration()
-            i += 1
-        return est_time
+        time_sums = self.getSums()[0]
+        return float(time_sums[-1] - time_sums[min(start, len(time_sums) - 1)])
 
     ## getRunSize
     #
     # @return An estimate of the run size.
     #
     def getRunSize(self):
-        est_space = 0
-        for item in self.dave_actions_cur:
-            if item.isValid():
-                est_space += item.getDaveAction().getUsage()
-        return est_space
+        return float(self.getSums()[1][-1])
+
+    ## getSums
+    #
+    # @return The prefix sums of the duration and the disk usage of the valid actions in the active list.
+    #
+    def getSums(self):
+        if self.sums is None:
+            cur = numpy.array(self.dave_actions_cur, dtype = numpy.int64)
+            valid = numpy.array(self.valid, dtype = numpy.bool_)[cur]
+            self.sums = []
+            for values in [self.durations, self.usages]:
+                values = numpy.array(values, dtype = numpy.float64)[cur]
+                values[~valid] = 0.0
+                self.sums.append(numpy.concatenate(([0.0], numpy.cumsum(values))))
+        return self.sums
+
+    ## hasChildren
+    #
+    # @param parent (Optional) A QModelIndex.
+    #
+    # @return True/False if the item has children, including children that have not been created.
+    #
+    def hasChildren(self, parent = QtCore.QModelIndex()):
+        branch = self.getBranch(parent)
+        if branch is not None:
+            return (len(branch.children) > 0)
+        return QtGui.QStandardItemModel.hasChildren(self, parent)
 
     ## haveNextItem
     #
@@ -474,11 +704,23 @@ class DaveStandardItemModel(QtGui.QStandardItemModel):
     # @return True/False if all the items are valid.
     #
     def isAllValid(self):
-        all_valid = True
-        for item in self.dave_actions_cur:
-            if not item.isValid():
-                all_valid = False
-        return all_valid
+        for index in self.dave_actions_cur:
+            if not self.valid[index]:
+                return False
+        return True
+
+    ## peekNextAction
+    #
+    # @param skip_invalid True/False to skip invalid commands.
+    #
+    # @return The next DaveAction (without changing the current item) or None if there are no more actions.
+    #
+    def peekNextAction(self, skip_invalid):
+        index = self.getNextIndex(skip_invalid)
+        if (index >= len(self.dave_actions_cur)):
+            return None
+        else:
+            return self.dave_actions[self.dave_actions_cur[index]]
 
     ## resetItemIndex
     #
@@ -492,20 +734,26 @@ class DaveStandardItemModel(QtGui.QStandardItemModel):
     # @param valid True/False Sets the valid status of all the items.
     #
     def setAllValid(self, valid):
-        for item in self.dave_actions_all:
-            item.setValid(valid)
+        self.valid = [valid] * len(self.dave_actions)
+        self.sums = None
+        for item in self.dave_action_items:
+            if item is not None:
+                item.setValid(valid)
 
     ## setCurrentItem
     #
     # @param an_item The desired DaveActionStandardItem.
     #
     def setCurrentAction(self, an_item):
-        self.dave_action_index = 0
-        for i in range(len(self.dave_actions_cur)):
-            if (self.dave_actions_cur[i] == an_item):
-                self.dave_action_index = i
-                break
+        if self.test_mode:
+            position = self.dave_actions_test_positions.get(an_item.getIndex())
+        else:
+            position = an_item.getIndex()
+
+        if position is not None:
+            self.dave_action_index = position
         else:
+            self.dave_action_index = 0
             print("item not found!")
 
     ## setCurrentItemValid
@@ -515,19 +763,22 @@ class DaveStandardItemModel(QtGui.QStandardItemModel):
     def setCurrentItemValid(self, is_valid):
         if self.test_mode:
             # Find current id
-            current_item = self.dave_actions_cur[self.dave_action_index]
-            current_action = current_item.getDaveAction()
-            current_id = current_action.getID()
+            current_index = self.dave_actions_cur[self.dave_action_index]
+            current_id = self.dave_actions[current_index].getID()
 
             print(current_id, is_valid)
             
             # Change validity of all actions that have this id
-            for item in self.dave_actions_test_dict[current_id]:
-                item.setValid(is_valid)
+            indices = self.dave_actions_test_dict[current_id]
                 
         else: # Not used
-            item = self.dave_actions_cur[self.dave_action_index]
-            item.setValid(is_valid)
+            indices = [self.dave_actions_cur[self.dave_action_index]]
+
+        for index in indices:
+            self.valid[index] = is_valid
+            if self.dave_action_items[index] is not None:
+                self.dave_action_items[index].setValid(is_valid)
+        self.sums = None
                     
     ## setTestMode
     #
@@ -538,11 +789,13 @@ class DaveStandardItemModel(QtGui.QStandardItemModel):
             if not test_mode: # Toggle off test mode
                 self.test_mode = False
                 self.dave_actions_cur = self.dave_actions_all # Recover full list
+                self.sums = None
                 self.resetItemIndex()
         else:
             if test_mode:
                 self.test_mode = True
                 self.dave_actions_cur = self.dave_actions_test # Set to test list
+                self.sums = None
                 self.resetItemIndex()
 
     ## updateEstimates
@@ -551,51 +804,154 @@ class DaveStandardItemModel(QtGui.QStandardItemModel):
         if self.test_mode: # Only needed in test mode
 
             # Find current id and the current disk usage and duration.
-            current_item = self.dave_actions_cur[self.dave_action_index]
-            current_action = current_item.getDaveAction()
+            current_index = self.dave_actions_cur[self.dave_action_index]
+            current_action = self.dave_actions[current_index]
             current_id = current_action.getID()
             disk_usage = current_action.getUsage()
             duration = current_action.getDuration()
             
             # Update usage estimated for all actions that have this id.
-            for item in self.dave_actions_test_dict[current_id]:
-                item.setUsageEstimates(disk_usage, duration)
-
-## parseSequenceFile
+            for index in self.dave_actions_test_dict[current_id]:
+                self.dave_actions[index].setDiskUsage(disk_usage)
+                self.dave_actions[index].setDuration(duration)
+                self.durations[index] = duration
+                self.usages[index] = disk_usage
+            self.sums = None
+
+## createDaveAction
 #
-# @param xml_file The xml_file to parse to create the command sequence.
+# @param node A XML node describing the DaveAction.
 #
-# @return A DaveStandardItemModel object for using in a DaveCommandTreeViewer.
+# @return The DaveAction.
 #
-def parseSequenceFile(xml_file):
-    model = DaveStandardItemModel()
-    xml = ElementTree.parse(xml_file).getroot()
-    recursiveParse(model, model, xml)
-    return model
+def createDaveAction(node):
+    dave_action_class = getattr(daveActions, node.tag)
+    dave_action = dave_action_class()
+    dave_action.setup(node)
+    return dave_action
 
-## recursiveParse
+## indentNode
+#
+# Set the whitespace of a node and it's children for a readable xml file.
+#
+# @param node The node.
+# @param depth The depth of the node in the xml file.
+#
+def indentNode(node, depth):
+    node.tail = None
+    if (len(node) > 0):
+        if (node.text is None) or (len(node.text.strip()) == 0):
+            node.text = "\n" + "  " * (depth + 1)
+        for child in node:
+            indentNode(child, depth + 1)
+            child.tail = "\n" + "  " * (depth + 1)
+        node[-1].tail = "\n" + "  " * depth
+
+## iterSequence
+#
+# @param xml_branch A sequence or branch element.
 #
-# Recursively parse the XML tree.
+# @return A generator of ("branch", name), ("end", None) and ("action", node) tuples.
 #
-# @param model The root DaveStandardItemModel.
-# @param model_branch_model A branch of a DaveStandardItemModel.
-# @param xml_branch The current xml branch
-# 
-def recursiveParse(model, model_branch, xml_branch):
+def iterSequence(xml_branch):
     for node in xml_branch:
+        if (node.tag == "branch"):
+            yield ("branch", node.get("name", "NA"))
+            yield from iterSequence(node)
+            yield ("end", None)
+        else:
+            yield ("action", node)
+
+## iterSequenceFile
+#
+# Parse a sequence xml file incrementally, so that only the current
+# DaveAction (and the branches it is in) are in memory.
+#
+# @param xml_file The xml file to parse.
+#
+# @return A generator of ("branch", name), ("end", None) and ("action", node) tuples.
+#
+def iterSequenceFile(xml_file):
+    action_depth = 0 # The depth of the current element in the current action.
+    parents = []     # The sequence element and the branches that we are in.
+    for [event, node] in ElementTree.iterparse(xml_file, events = ("start", "end")):
+        if (event == "start"):
+            if (len(parents) == 0):
+                parents.append(node)
+            elif (action_depth > 0):
+                action_depth += 1
+            elif (node.tag == "branch"):
+                yield ("branch", node.get("name", "NA"))
+                parents.append(node)
+            else:
+                action_depth = 1
+
+        else:
+            if (action_depth > 0):
+                action_depth -= 1
+                if (action_depth == 0):
+                    yield ("action", node)
+                    parents[-1].remove(node)
+            elif (len(parents) > 1):
+                yield ("end", None)
+                parents.pop()
+                parents[-1].remove(node)
+
+## parseSequence
+#
+# @param events A generator of ("branch", name), ("end", None) and ("action", node) tuples.
+#
+# @return A DaveStandardItemModel object for using in a DaveCommandTreeViewer.
+#
+def parseSequence(events):
+    model = DaveStandardItemModel()
+    branch = model.root
+    for [event, data] in events:
 
         # Everything is either a branch.
-        if (node.tag == "branch"):
-            parent = QtGui.QStandardItem(node.get("name", "NA"))
-            parent.setFlags(QtCore.Qt.ItemIsEnabled)
-            model_branch.appendRow(parent)
-            recursiveParse(model, parent, node)
+        if (event == "branch"):
+            branch = DaveBranch(name = data, parent = branch)
+        elif (event == "end"):
+            branch = branch.parent
 
         # Or a leaf (DaveAction).
         else:
-            action = DaveActionStandardItem(node)
-            model.addItem(action)
-            model_branch.appendRow(action)
+            model.addAction(createDaveAction(data), branch)
+
+    model.fetchBranch(model.root)
+    return model
+
+## parseSequenceFile
+#
+# @param xml_file The xml_file to parse to create the command sequence.
+#
+# @return A DaveStandardItemModel object for using in a DaveCommandTreeViewer.
+#
+def parseSequenceFile(xml_file):
+    return parseSequence(iterSequenceFile(xml_file))
+
+## writeSequence
+#
+# Write a sequence xml file one DaveAction at a time.
+#
+# @param fp The file to write to.
+# @param events A generator of ("branch", name), ("end", None) and ("action", node) tuples.
+#
+def writeSequence(fp, events):
+    fp.write('<?xml version="1.0" encoding="' + fp.encoding + '"?>\n')
+    fp.write("<sequence>\n")
+    depth = 1
+    for [event, data] in events:
+        if (event == "branch"):
+            fp.write("  " * depth + "<branch name=" + saxutils.quoteattr(data) + ">\n")
+            depth += 1
+        elif (event == "end"):
+            depth -= 1
+            fp.write("  " * depth + "</branch>\n")
+        else:
+            indentNode(data, depth)
+            fp.write("  " * depth + ElementTree.tostring(data, encoding = "unicode") + "\n")
+    fp.write("</sequence>\n")
 
 #
 # The MIT License
@@ -3,7 +3,8 @@
 ## @file
 #
 # An xml parser class that takes a sequence recipe xml file and converts it to
-# a flat sequence file that can be read by Dave
+# a flat sequence file that can be read by Dave. The flat sequence is generated
+# and written one Dave primitive at a time.
 #
 # Jeffrey Moffitt
 # 1/5/14
@@ -18,13 +19,13 @@ import os
 import sys
 import traceback
 from xml.etree import ElementTree
-from xml.dom import minidom
 
 from PyQt5 import QtCore, QtGui, QtWidgets
 
 import storm_control.dave.xml_generators.nodeToDict as nodeToDict
 
 import storm_control.dave.daveActions as daveActions
+import storm_control.dave.sequenceViewer as sequenceViewer
 
 ## XMLRecipeParser
 # 
@@ -63,11 +64,8 @@ class XMLRecipeParser(QtWidgets.QWidget):
         self.loop_variable_names = []
         self.loop_iterator = []
 
-        self.flat_sequence = []
         self.flat_sequence_xml = []
         self.xml_sequence_file_path = output_filename
-        
-        self.da_primitives_xml = []
 
         # A convenient list of dave actions required for parsing a <movie> tag. 
         # Also determines the order in which commands are given
@@ -88,10 +86,6 @@ class XMLRecipeParser(QtWidgets.QWidget):
     # @param flat_sequence The element tree that contains a flat sequence of higher order commands, e.g. <movie>
     #
     def convertToDaveXMLPrimitives(self, primitives_xml, flat_sequence):
-        if self.verbose:
-            print("---------------------------------------------------------")
-            print("Converting to Dave Primitives")
-        
         # Loop over all children
         for child in flat_sequence:
             if child.tag == "branch": # Generate block and call recursively to handle elements in blocks
@@ -162,6 +156,40 @@ class XMLRecipeParser(QtWidgets.QWidget):
                 pass
                 ## Eventually display an unknown tag error. For now ignore
 
+    ## copyChild
+    #
+    # Handles copying a child to the new_parent specifically handling <loop> and <variable_entry> tags
+    #
+    # @param child The element tree to be copied
+    # @param new_parent The element tree that will contain the flat sequence
+    #       
+    def copyChild(self, child, new_parent):
+        if child.tag == "loop":
+            self.handleLoop(child, new_parent)
+        elif child.tag == "variable_entry":
+            self.handleVariableEntry(child, new_parent)
+        elif child.attrib.get("increment") == "Yes":
+            new_child = ElementTree.SubElement(new_parent, child.tag, child.attrib)
+            if child.text == None: new_child.text = ""
+            else:
+                new_child.text = str(child.text)
+                for [loop_ID, loop_iterator] in enumerate(self.loop_iterator):
+                    pad_length = len(str(len(self.loop_variables[loop_ID])))
+                    if loop_iterator >= 0:
+                        new_child.text += "_" + str(loop_iterator).zfill(pad_length)
+
+            if child.tail == None: new_child.tail = ""
+            else: new_child.tail = str(child.tail)
+            del new_child.attrib["increment"]
+            self.copyChildren(child, new_child)
+        else:
+            new_child = ElementTree.SubElement(new_parent, child.tag, child.attrib)
+            if child.text == None: new_child.text = ""
+            else: new_child.text = str(child.text)
+            if child.tail == None: new_child.tail = ""
+            else: new_child.tail = str(child.tail)
+            self.copyChildren(child, new_child)
+
     ## copyChildren
     #
     # Handles copying children of the specified parent to the new_parent specifically handling <loop> and <variable_entry> tags
@@ -171,31 +199,7 @@ class XMLRecipeParser(QtWidgets.QWidget):
     #       
     def copyChildren(self, parent, new_parent):
         for child in parent:
-            if child.tag == "loop":
-                self.handleLoop(child, new_parent)
-            elif child.tag == "variable_entry":
-                self.handleVariableEntry(child, new_parent)
-            elif child.attrib.get("increment") == "Yes":
-                new_child = ElementTree.SubElement(new_parent, child.tag, child.attrib)
-                if child.text == None: new_child.text = ""
-                else:
-                    new_child.text = str(child.text)
-                    for [loop_ID, loop_iterator] in enumerate(self.loop_iterator):
-                        pad_length = len(str(len(self.loop_variables[loop_ID])))
-                        if loop_iterator >= 0:
-                            new_child.text += "_" + str(loop_iterator).zfill(pad_length)
-                
-                if child.tail == None: new_child.tail = ""
-                else: new_child.tail = str(child.tail)
-                del new_child.attrib["increment"]
-                self.copyChildren(child, new_child)
-            else:
-                new_child = ElementTree.SubElement(new_parent, child.tag, child.attrib)
-                if child.text == None: new_child.text = ""
-                else: new_child.text = str(child.text)
-                if child.tail == None: new_child.tail = ""
-                else: new_child.tail = str(child.tail)
-                self.copyChildren(child, new_child)
+            self.copyChild(child, new_parent)
 
         return new_parent
 
@@ -236,6 +240,54 @@ class XMLRecipeParser(QtWidgets.QWidget):
         
         self.copyChildren(variable_entry, new_parent)
         
+    ## iterDavePrimitives
+    #
+    # Generates the Dave primitives of the recipe. The loops are expanded as
+    # the primitives are requested, so the flat sequence is never in memory.
+    #
+    # @return A generator of ("branch", name), ("end", None) and ("action", element) tuples.
+    #
+    def iterDavePrimitives(self):
+        if self.verbose:
+            print("---------------------------------------------------------")
+            print("Converting to Dave Primitives")
+
+        for command_sequence in self.command_sequences:
+            yield from self.iterFlatSequence(command_sequence)
+
+    ## iterFlatSequence
+    #
+    # @param parent The element tree to expand.
+    #
+    # @return A generator of the Dave primitives of the children of parent.
+    #
+    def iterFlatSequence(self, parent):
+        for child in parent:
+            if child.tag == "loop": # All of the iterations are in a single branch
+                loop_ID = self.loop_variable_names.index(child.attrib["name"])
+                yield ("branch", child.attrib["name"])
+                for local_iterator in range(len(self.loop_variables[loop_ID])):
+                    self.loop_iterator[loop_ID] = local_iterator # Store iterator for updating names
+                    yield from self.iterFlatSequence(child)
+                yield ("end", None)
+                self.loop_iterator[loop_ID] = -1
+
+            elif child.tag == "variable_entry":
+                loop_ID = self.loop_variable_names.index(child.attrib["name"])
+                yield from self.iterFlatSequence(self.loop_variables[loop_ID][self.loop_iterator[loop_ID]])
+
+            elif child.tag == "branch":
+                yield ("branch", child.attrib["name"])
+                yield from self.iterFlatSequence(child)
+                yield ("end", None)
+
+            else: # Expand and convert a single command, e.g. <movie>
+                flat_sequence = ElementTree.Element("sequence")
+                self.copyChild(child, flat_sequence)
+                primitives_xml = ElementTree.Element("sequence")
+                self.convertToDaveXMLPrimitives(primitives_xml, flat_sequence)
+                yield from sequenceViewer.iterSequence(primitives_xml)
+
     ## loadXML
     #
     # Load generic XML files
@@ -380,20 +432,7 @@ class XMLRecipeParser(QtWidgets.QWidget):
         for command_sequence in self.command_sequences:
             command_sequence = self.replaceItems(command_sequence)
 
-        # Create flat command sequence and convert to new xml element tree
-        self.flat_sequence = ElementTree.Element("sequence")
-        self.flat_sequence.text = "\n" # Clean up display
-
-        # Fill sequence from command sequence elements
-        for command_sequence in self.command_sequences:
-            self.copyChildren(command_sequence, self.flat_sequence)
-
-        # Create Dave action primitives
-        self.da_primitives_xml = ElementTree.Element("sequence")
-        self.da_primitives_xml.text = "\n"
-        self.convertToDaveXMLPrimitives(self.da_primitives_xml, self.flat_sequence)
-
-        # Save dave primitives
+        # Create and save the dave primitives
         self.saveDavePrimitives()
 
     ## parseXMLExperiment
@@ -451,11 +490,8 @@ class XMLRecipeParser(QtWidgets.QWidget):
                                                                                 self.directory,
                                                                                 "*.xml")[0]
         try:
-            out_fp = open(self.xml_sequence_file_path, "w")
-            rough_string = ElementTree.tostring(self.da_primitives_xml, 'utf-8')        
-            reparsed = minidom.parseString(rough_string)
-            out_fp.write(reparsed.toprettyxml(indent="  ", encoding = "ISO-8859-1").decode())
-            out_fp.close()
+            with open(self.xml_sequence_file_path, "w", encoding = "ISO-8859-1", errors = "xmlcharrefreplace") as out_fp:
+                sequenceViewer.writeSequence(out_fp, self.iterDavePrimitives())
             self.wrote_XML = True
         except:
             QtWidgets.QMessageBox.information(self,
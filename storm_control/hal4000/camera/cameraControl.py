@@ -243,6 +243,7 @@ class CameraControl(QtCore.QThread):
         Data from the camera should go through this method on it's
         way to the camera functionality object.
         """
+        n_frames = 0
         for frame in frames:
             if self.film_length is not None:
 
@@ -252,6 +253,10 @@ class CameraControl(QtCore.QThread):
                     break
                 
             self.camera_functionality.newFrame.emit(frame)
+            n_frames += 1
+
+        if (n_frames > 0):
+            self.camera_functionality.setLatestFrame(frames[n_frames-1], n_frames = n_frames)
 
     def newParameters(self, parameters):
         """
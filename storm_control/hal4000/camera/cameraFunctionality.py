@@ -68,6 +68,16 @@ class CameraFunctionality(halFunctionality.HalFunctionality):
         # Current state of the camera shutter.
         self.shutter_state = False
 
+        #
+        # The most recent frame and the total number of frames. Displays
+        # poll these at their own rate instead of handling every newFrame
+        # signal. See display.cameraFrameViewer.
+        #
+        # These are set in the camera thread and read in the GUI thread, so
+        # they are stored as a single tuple which is replaced atomically.
+        #
+        self.latest_frame = (None, 0)
+
     def copy(self):
         # Not used, kept because it may be useful for enforcing invalid functionalities?
         return copy.deepcopy(self)
@@ -106,6 +116,12 @@ class CameraFunctionality(halFunctionality.HalFunctionality):
         zy = self.getParameter("y_bin") * self.getParameter("y_start")
         return [zx, zy]
 
+    def getLatestFrame(self):
+        """
+        Returns [the most recent frame, the number of frames so far].
+        """
+        return list(self.latest_frame)
+
     def getParameter(self, pname):
         return self.parameters.get(pname)
 
@@ -142,6 +158,13 @@ class CameraFunctionality(halFunctionality.HalFunctionality):
     def setEMCCDGain(self, gain):
         pass
 
+    def setLatestFrame(self, frame, n_frames = 1):
+        """
+        This should be called (with the last frame) whenever newFrame
+        is emitted. n_frames is the number of frames that were emitted.
+        """
+        self.latest_frame = (frame, self.latest_frame[1] + n_frames)
+
     def toggleShutter(self):
         pass
 
@@ -6,17 +6,118 @@ or the data from a feed and it's meta-information.
 Notes: 
  (1) The numpy data field (np_data) is expected to
      be of type numpy.uint16.
+
+ (2) Frames can (optionally) get their storage from a
+     FramePool. The storage is returned to the pool when
+     the frame is garbage collected, or when release() is
+     called. The pool will only re-use storage that nothing
+     else (i.e. a view of the data) is still referencing.
  
 Hazen 3/17
 """
 
+import collections
+import numpy
+import sys
+
+from PyQt5 import QtCore
+
+
+#
+# The frame pools, these are keyed by (x_pixels, y_pixels, dtype).
+#
+frame_pools = {}
+frame_pools_mutex = QtCore.QMutex()
+
+
+def getFramePool(x_pixels, y_pixels, dtype = numpy.uint16):
+    """
+    Returns the (shared) FramePool for frames of this size and type.
+    """
+    key = (x_pixels, y_pixels, numpy.dtype(dtype).str)
+    frame_pools_mutex.lock()
+    if not key in frame_pools:
+        frame_pools[key] = FramePool(x_pixels, y_pixels, dtype)
+    pool = frame_pools[key]
+    frame_pools_mutex.unlock()
+    return pool
+
+
+class FramePool(object):
+    """
+    A pool of preallocated storage for frames of a particular
+    size and type. This is thread safe as frames are usually
+    created in a camera thread and released in the GUI thread.
+
+    release() does not lock as it is called from Frame.__del__(),
+    and the garbage collector can run in a thread that is already
+    holding the mutex in acquire().
+    """
+    def __init__(self, x_pixels, y_pixels, dtype, max_free = 64, **kwds):
+        """
+        x_pixels - The size of the frames in x.
+        y_pixels - The size of the frames in y.
+        dtype - The numpy type of the frame data.
+        max_free - The maximum number of unused buffers to keep.
+        """
+        super().__init__(**kwds)
+        self.dtype = dtype
+        self.free = collections.deque(maxlen = max_free)
+        self.max_free = max_free
+        self.mutex = QtCore.QMutex()
+        self.n_allocated = 0
+        self.size = x_pixels * y_pixels
+
+    def acquire(self):
+        """
+        Returns a (flat) numpy array, the contents are undefined.
+        """
+        in_use = []
+        self.mutex.lock()
+        try:
+            for i in range(len(self.free)):
+                try:
+                    np_data = self.free.popleft()
+                except IndexError:
+                    break
+
+                # The only references should be np_data and the
+                # getrefcount() argument, otherwise someone still
+                # has a view of this data.
+                if (sys.getrefcount(np_data) == 2):
+                    return np_data
+                in_use.append(np_data)
+            self.n_allocated += 1
+        finally:
+            self.free.extend(in_use)
+            self.mutex.unlock()
+        return numpy.empty(self.size, dtype = self.dtype)
+
+    def getNAllocated(self):
+        return self.n_allocated
+
+    def getNFree(self):
+        return len(self.free)
+    
+    def release(self, np_data):
+        # deque.append() is atomic, the oldest buffer is dropped
+        # if there are already max_free buffers.
+        self.free.append(np_data)
+
+
 class Frame(object):
     """
     Class for the storage of a single frame of camera data
     and it's meta-information.
     """
+    __slots__ = ("frame_number",
+                 "image_x",
+                 "image_y",
+                 "np_data",
+                 "pool",
+                 "which_camera")
 
-    def __init__(self, np_data, frame_number, image_x, image_y, which_camera):
+    def __init__(self, np_data, frame_number, image_x, image_y, which_camera, pool = None):
         """
         Create a camera frame object.
         FIXME: Are we consistent in the use of master vs. camera1?
@@ -25,14 +126,20 @@ class Frame(object):
         frame_number - The frame number of this frame.
         image_x - The size of the frame in pixels in x.
         image_y - The size of the frame in pixels in y.
+        which_camera - The camera (or feed) the frame came from.
+        pool - The FramePool that np_data came from (if any).
         """
 
         self.image_x = image_x
         self.image_y = image_y
         self.np_data = np_data
         self.frame_number = frame_number
+        self.pool = pool
         self.which_camera = which_camera
 
+    def __del__(self):
+        self.release()
+
     def getData(self):
         """
         Returns the numpy object that stores the camera frame data.
@@ -46,6 +153,16 @@ class Frame(object):
         """
         return self.np_data.ctypes.data
 
+    def release(self):
+        """
+        Return the frame's storage to it's pool. This is also called
+        when the frame is garbage collected, so you only need to call
+        this if you want the storage to be available sooner.
+        """
+        if self.pool is not None:
+            self.pool.release(self.np_data)
+            self.pool = None
+
 
 #
 # The MIT License
@@ -25,6 +25,7 @@ class NoneCameraControl(cameraControl.CameraControl):
         
         self.fake_frame = 0
         self.fake_frame_size = [0,0]
+        self.min_exposure_time = config.get("min_exposure_time", 0.01)
         self.pause_time = config.get("mean_pause", 0.1)
 
         #
@@ -52,11 +53,11 @@ class NoneCameraControl(cameraControl.CameraControl):
         self.parameters.set("exposure_time", params.ParameterRangeFloat(description = "Exposure time (seconds)", 
                                                                         name = "exposure_time", 
                                                                         value = 0.02,
-                                                                        min_value = 0.01,
+                                                                        min_value = self.min_exposure_time,
                                                                         max_value = 10.0))
         self.parameters.setv("max_intensity", 512)
         
-        chip_size = 512
+        chip_size = config.get("chip_size", 512)
         for pname in ["x_start", "x_end", "y_start", "y_end"]:
             self.parameters.getp(pname).setMaximum(chip_size)
 
@@ -126,16 +127,14 @@ class NoneCameraControl(cameraControl.CameraControl):
 
             # Configure camera.
             p = self.parameters
-            if (p.get("exposure_time") < 0.010):
-                p.set("exposure_time", 0.010)
+            if (p.get("exposure_time") < self.min_exposure_time):
+                p.set("exposure_time", self.min_exposure_time)
 
             p.set("fps", 1.0/p.get("exposure_time"))
 
             self.fake_frame_size = [size_x, size_y]
-            self.fake_frame = numpy.zeros(size_x * size_y, dtype = numpy.uint16)
-            for i in range(size_x):
-                for j in range(size_y):
-                    self.fake_frame[j*size_x+i] = i % 128 + j % 128
+            [fx, fy] = numpy.meshgrid(numpy.arange(size_x) % 128, numpy.arange(size_y) % 128)
+            self.fake_frame = (fx + fy).astype(numpy.uint16).ravel()
 
             if running:
                 self.startCamera()
@@ -147,15 +146,25 @@ class NoneCameraControl(cameraControl.CameraControl):
         # Pause a random amount of time on start. 
         time.sleep(random.expovariate(1.0/self.pause_time))
         
+        pool = frame.getFramePool(self.fake_frame_size[0], self.fake_frame_size[1])
+        size = self.fake_frame.size
+        
         self.running = True
         self.thread_started = True
         while(self.running):
-            aframe = frame.Frame(numpy.roll(self.fake_frame,
-                                            int(self.frame_number * self.parameters.get("roll"))),
+
+            # This is numpy.roll(), but without allocating a new array.
+            np_data = pool.acquire()
+            shift = int(self.frame_number * self.parameters.get("roll")) % size
+            np_data[shift:] = self.fake_frame[:size - shift]
+            np_data[:shift] = self.fake_frame[size - shift:]
+            
+            aframe = frame.Frame(np_data,
                                  self.frame_number,
                                  self.fake_frame_size[0],
                                  self.fake_frame_size[1],
-                                 self.camera_name)
+                                 self.camera_name,
+                                 pool = pool)
             self.frame_number += 1
 
             if self.film_length is not None:
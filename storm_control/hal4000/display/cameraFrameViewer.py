@@ -11,6 +11,12 @@ frame display. This includes:
 6. Handling the changing the feed.
 7. Handling information, target, and grid.
 
+Frames are not delivered to the viewer one at a time. Instead the
+display timer picks up the camera functionality's latest frame and
+passes it to a QtCameraFrameRenderer thread for rescaling. The only
+exception is when we are filming with 'sync', then we need to see
+every frame in order to pick out the ones with the right phase.
+
 Hazen 2/17
 """
 import os
@@ -109,8 +115,13 @@ class CameraFrameViewer(QtWidgets.QFrame):
         self.default_parameters = params.StormXMLObject(validate = False) 
         self.display_name = display_name
         self.display_timer = QtCore.QTimer(self)
+        self.display_stats = {"frames skipped" : 0,
+                              "render time" : 0.0}
         self.filming = False
-        self.frame = False
+        self.frame = None
+        self.frame_renderer = qtCameraGraphicsScene.QtCameraFrameRenderer()
+        self.n_frames = 0
+        self.new_frame_connected = False
         self.parameters = False
         self.rubber_band_rect = None
         self.show_grid = False
@@ -190,11 +201,18 @@ class CameraFrameViewer(QtWidgets.QFrame):
         self.ui.syncSpinBox.valueChanged.connect(self.handleSync)
         self.ui.targetAct.triggered.connect(self.handleTarget)
 
+        self.frame_renderer.rendered.connect(self.handleRendered)
+        self.frame_renderer.start(QtCore.QThread.NormalPriority)
+
         # Display timer, the display updates at approximately 10Hz.
         self.display_timer.setInterval(100)
         self.display_timer.timeout.connect(self.handleDisplayTimer)
         self.display_timer.start()
 
+    def cleanUp(self):
+        self.display_timer.stop()
+        self.frame_renderer.stopThread()
+
     def contextMenuEvent(self, event):
         menu = QtWidgets.QMenu(self)
         menu.addAction(self.ui.infoAct)
@@ -289,6 +307,13 @@ class CameraFrameViewer(QtWidgets.QFrame):
         """
         return self.parameters.get("feed_name")
 
+    def getDisplayStatistics(self):
+        """
+        Returns a dictionary with the number of frames that were not
+        displayed and the average render time (in seconds).
+        """
+        return self.display_stats
+
     def getFunctionality(self):
         """
         Returns our CameraFrameViewerFunctionality.
@@ -299,7 +324,7 @@ class CameraFrameViewer(QtWidgets.QFrame):
         """
         Wrapper to make it easier to get the appropriate parameter value.
         """
-        return self.parameters.get(self.getFeedName()).get(pname)
+        return self.parameters.get(self.getFeedName() + "." + pname)
 
     def getParameters(self):
         """
@@ -323,13 +348,19 @@ class CameraFrameViewer(QtWidgets.QFrame):
         self.color_gradient.newColorTable(color_table)
 
     def handleDisplayTimer(self):
-        if self.frame:
-            self.camera_widget.updateImageWithFrame(self.frame)
-            if self.show_info:
-                self.handleIntensityInfo(*self.camera_widget.getIntensityInfo())
-            if self.cfv_functionality.isConnected():
-                q_pixmap = self.camera_view.grab()
-                self.cfv_functionality.handleNewPixmap(q_pixmap)
+
+        # Check for a new frame, unless we're getting every frame.
+        if (self.cam_fn is not None) and not self.new_frame_connected:
+            [latest_frame, n_frames] = self.cam_fn.getLatestFrame()
+            if (n_frames != self.n_frames) and (latest_frame is not None):
+                if (n_frames > self.n_frames):
+                    self.display_stats["frames skipped"] += n_frames - self.n_frames - 1
+                self.frame = latest_frame
+                self.n_frames = n_frames
+
+        # If the renderer is still busy with the last frame we skip this one.
+        if self.frame is not None:
+            self.frame_renderer.render(self.frame, self.camera_widget.getRenderSettings())
 
     def handleDragMove(self, dx, dy):
         self.stage_functionality.dragMove(dx, dy)
@@ -361,6 +392,7 @@ class CameraFrameViewer(QtWidgets.QFrame):
                 self.cam_fn.newFrame.disconnect(self.handleNewFrame)
             except TypeError:
                 pass
+            self.new_frame_connected = False
             
         self.parameters.setv("feed_name", str(feed_name))
         self.feedChange.emit(feed_name)
@@ -396,8 +428,9 @@ class CameraFrameViewer(QtWidgets.QFrame):
         self.camera_widget.setClickPos(*self.cam_fn.transformChipToFrame(cx, cy))
 
     def handleNewFrame(self, frame):
-        if self.filming and (self.getParameter("sync") != 0):
-            if((frame.frame_number % self.cycle_length) == (self.getParameter("sync") - 1)):
+        sync = self.getParameter("sync") if self.filming else 0
+        if (sync != 0):
+            if((frame.frame_number % self.cycle_length) == (sync - 1)):
                 self.frame = frame
         else:
             self.frame = frame
@@ -415,6 +448,27 @@ class CameraFrameViewer(QtWidgets.QFrame):
         self.setParameter("display_min", int(scale_min))
         self.updateRange()
 
+    def handleRendered(self, rendered):
+        """
+        Called with the results from the frame renderer.
+        """
+        self.frame_renderer.renderingDone()
+        self.camera_widget.newRenderedImage(rendered)
+
+        # Running average of the time from render request to display.
+        if (self.display_stats["render time"] == 0.0):
+            self.display_stats["render time"] = rendered["latency"]
+        else:
+            self.display_stats["render time"] = 0.9 * self.display_stats["render time"] + 0.1 * rendered["latency"]
+        self.camera_view.setToolTip("render {0:.1f}ms, skipped {1:d} frames".format(1000.0 * self.display_stats["render time"],
+                                                                                      self.display_stats["frames skipped"]))
+
+        if self.show_info:
+            self.handleIntensityInfo(*self.camera_widget.getIntensityInfo())
+        if self.cfv_functionality.isConnected():
+            q_pixmap = self.camera_view.grab()
+            self.cfv_functionality.handleNewPixmap(q_pixmap)
+
     def handleRubberBandChanged(self, rubber_band_rect, from_scene_point, to_scene_point):
         print(">hrbc", rubber_band_rect)
         print(">hrbc", from_scene_point)
@@ -425,6 +479,7 @@ class CameraFrameViewer(QtWidgets.QFrame):
 
     def handleSync(self, sync_value):
         self.setParameter("sync", sync_value)
+        self.updateNewFrameConnection()
 
     def handleTarget(self, boolean):
         if self.show_target:
@@ -490,9 +545,9 @@ class CameraFrameViewer(QtWidgets.QFrame):
                 msg = "Old camera functionality was not disconnected."
                 raise halExceptions.HalException(msg)
                 
-        # Connect new camera functionality.
+        # Switch to the new camera functionality.
         self.cam_fn = camera_functionality
-        self.cam_fn.newFrame.connect(self.handleNewFrame)
+        [self.frame, self.n_frames] = self.cam_fn.getLatestFrame()
 
         #
         # Add a sub-section for this camera / feed if we don't already have one.
@@ -558,6 +613,7 @@ class CameraFrameViewer(QtWidgets.QFrame):
                                        float(self.getParameter("display_max"))])
 
         self.ui.syncSpinBox.setValue(self.getParameter("sync"))
+        self.updateNewFrameConnection()
 
     def setFeedNames(self, feed_names):
         """
@@ -607,6 +663,7 @@ class CameraFrameViewer(QtWidgets.QFrame):
         
     def startFilm(self, film_settings):
         self.filming = True
+        self.updateNewFrameConnection()
         if film_settings.runShutters():
             self.ui.syncLabel.show()
             self.ui.syncSpinBox.show()
@@ -616,6 +673,7 @@ class CameraFrameViewer(QtWidgets.QFrame):
             
     def stopFilm(self):
         self.filming = False
+        self.updateNewFrameConnection()
         self.ui.syncLabel.hide()
         self.ui.syncSpinBox.hide()
 
@@ -630,6 +688,22 @@ class CameraFrameViewer(QtWidgets.QFrame):
 #        """
 #        self.handleFeedChange(self.parameters.get("feed_name"))
             
+    def updateNewFrameConnection(self):
+        """
+        Connect to the camera functionality's newFrame signal only if we
+        need to see every frame, i.e. we are filming with sync.
+        """
+        if self.cam_fn is None:
+            return
+        
+        want_connection = self.filming and (self.getParameter("sync") != 0)
+        if want_connection and not self.new_frame_connected:
+            self.cam_fn.newFrame.connect(self.handleNewFrame)
+            self.new_frame_connected = True
+        elif not want_connection and self.new_frame_connected:
+            self.cam_fn.newFrame.disconnect(self.handleNewFrame)
+            self.new_frame_connected = False
+            
     def updateRange(self):
         self.ui.scaleMax.setText(str(self.getParameter("display_max")))
         self.ui.scaleMin.setText(str(self.getParameter("display_min")))
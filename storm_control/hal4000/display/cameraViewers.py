@@ -125,7 +125,7 @@ class ClassicViewer(QtCore.QObject, CameraParamsMixin):
         self.frame_viewer.ui.recordButton.clicked.connect(self.handleRecordButton)
 
     def cleanUp(self, qt_settings):
-        pass
+        self.frame_viewer.cleanUp()
 
     def configure1(self):
         """
@@ -187,6 +187,10 @@ class FeedViewer(halDialog.HalDialog, CameraParamsMixin):
         self.frame_viewer.feedChange.connect(self.handleFeedChange)
         self.frame_viewer.guiMessage.connect(self.handleGuiMessage)
 
+    def cleanUp(self, qt_settings):
+        self.frame_viewer.cleanUp()
+        super().cleanUp(qt_settings)
+
 
 class DetachedViewer(halDialog.HalDialog, CameraParamsMixin):
     """
@@ -219,3 +223,7 @@ class DetachedViewer(halDialog.HalDialog, CameraParamsMixin):
         self.frame_viewer.guiMessage.connect(self.handleGuiMessage)
         self.frame_viewer.ui.recordButton.clicked.connect(self.handleRecordButton)
 
+    def cleanUp(self, qt_settings):
+        self.frame_viewer.cleanUp()
+        super().cleanUp(qt_settings)
+
@@ -126,12 +126,15 @@ class FeedFunctionality(cameraFunctionality.CameraFunctionality):
         return self.feed_name
 
     def handleNewFrame(self, new_frame):
-        sliced_data = self.sliceFrame(new_frame)
-        self.newFrame.emit(frame.Frame(sliced_data,
-                                       new_frame.frame_number,
-                                       self.x_pixels,
-                                       self.y_pixels,
-                                       self.camera_name))
+        [sliced_data, pool] = self.sliceFrame(new_frame)
+        a_frame = frame.Frame(sliced_data,
+                              new_frame.frame_number,
+                              self.x_pixels,
+                              self.y_pixels,
+                              self.camera_name,
+                              pool = pool)
+        self.setLatestFrame(a_frame)
+        self.newFrame.emit(a_frame)
 
     def handleStarted(self):
         self.started.emit()
@@ -227,14 +230,20 @@ class FeedFunctionality(cameraFunctionality.CameraFunctionality):
     def sliceFrame(self, new_frame):
         """
         Slices out a part of the frame based on self.frame_slice.
+
+        Returns [data, pool], where pool is the FramePool that
+        the data came from, or None if the data was not copied.
         """
         if self.frame_slice is None:
-            return new_frame.np_data
+            return [new_frame.np_data, None]
         else:
             w = new_frame.image_x
             h = new_frame.image_y
-            sliced_frame = numpy.reshape(new_frame.np_data, (h,w))[self.frame_slice]
-            return numpy.ascontiguousarray(sliced_frame)
+            pool = frame.getFramePool(self.x_pixels, self.y_pixels)
+            sliced_data = pool.acquire()
+            numpy.copyto(numpy.reshape(sliced_data, (self.y_pixels, self.x_pixels)),
+                         numpy.reshape(new_frame.np_data, (h,w))[self.frame_slice])
+            return [sliced_data, pool]
 
     def toggleShutter(self):
         assert False
@@ -252,28 +261,41 @@ class FeedFunctionalityAverage(FeedFunctionality):
         self.frames_to_average = self.parameters.get("frames_to_average")
 
     def handleNewFrame(self, new_frame):
-        sliced_data = self.sliceFrame(new_frame)
+        [sliced_data, sliced_pool] = self.sliceFrame(new_frame)
 
-        if self.average_frame is None:
-            self.average_frame = sliced_data.astype(numpy.uint32)
+        # The accumulator is allocated once and then re-used.
+        if (self.average_frame is None) or (self.average_frame.size != sliced_data.size):
+            self.average_frame = numpy.zeros(sliced_data.size, dtype = numpy.uint32)
+            
+        if (self.counts == 0):
+            numpy.copyto(self.average_frame, sliced_data)
         else:
             self.average_frame += sliced_data
         self.counts += 1
 
+        if sliced_pool is not None:
+            sliced_pool.release(sliced_data)
+
         if (self.counts == self.frames_to_average):
-            average_frame = self.average_frame/self.frames_to_average
-            self.newFrame.emit(frame.Frame(average_frame.astype(numpy.uint16),
-                                           self.frame_number,
-                                           self.x_pixels,
-                                           self.y_pixels,
-                                           self.camera_name))
-            self.average_frame = None
+            pool = frame.getFramePool(self.x_pixels, self.y_pixels)
+            average_frame = pool.acquire()
+            numpy.floor_divide(self.average_frame,
+                               self.frames_to_average,
+                               out = average_frame,
+                               casting = "unsafe")
+            a_frame = frame.Frame(average_frame,
+                                  self.frame_number,
+                                  self.x_pixels,
+                                  self.y_pixels,
+                                  self.camera_name,
+                                  pool = pool)
+            self.setLatestFrame(a_frame)
+            self.newFrame.emit(a_frame)
             self.counts = 0
             self.frame_number += 1
 
     def reset(self):
         super().reset()
-        self.average_frame = None
         self.counts = 0
         
     
@@ -289,14 +311,16 @@ class FeedFunctionalityInterval(FeedFunctionality):
         self.cycle_length = self.parameters.get("cycle_length")
 
     def handleNewFrame(self, new_frame):
-        sliced_data = self.sliceFrame(new_frame)
-        
         if (new_frame.frame_number % self.cycle_length) in self.capture_frames:
-            self.newFrame.emit(frame.Frame(sliced_data,
-                                           self.frame_number,
-                                           self.x_pixels,
-                                           self.y_pixels,
-                                           self.camera_name))
+            [sliced_data, pool] = self.sliceFrame(new_frame)
+            a_frame = frame.Frame(sliced_data,
+                                  self.frame_number,
+                                  self.x_pixels,
+                                  self.y_pixels,
+                                  self.camera_name,
+                                  pool = pool)
+            self.setLatestFrame(a_frame)
+            self.newFrame.emit(a_frame)
             self.frame_number += 1
 
 
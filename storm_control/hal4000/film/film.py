@@ -14,6 +14,7 @@ Hazen 01/17
 
 import copy
 import datetime
+import math
 import os
 
 from PyQt5 import QtCore, QtWidgets
@@ -31,6 +32,42 @@ import storm_control.hal4000.halLib.imagewriters as imagewriters
 import storm_control.hal4000.qtdesigner.film_ui as filmUi
 
 
+def filmParameters(responses, number_frames, dropped_frames):
+    """
+    Returns the parameters to save with a film, and the notes, from the
+    responses to the 'stop film' message.
+
+    The responses are often the current parameters of the modules, so
+    copies are saved. Otherwise the temporary StormXMLObject would be
+    added to their owners and never removed.
+    """
+    notes = ""
+    to_save = params.StormXMLObject()
+    acq_p = to_save.addSubSection("acquisition")
+    acq_p.add(params.ParameterString(name = "version",
+                                     value = hgit.getVersion()))
+    acq_p.add(params.ParameterInt(name = "number_frames",
+                                  value = number_frames))
+    acq_p.add(params.ParameterInt(name = "dropped_frames",
+                                  value = dropped_frames))
+    for response in responses:
+        data = response.getData()
+
+        # Add general parameters 'en-bloc'.
+        if "parameters" in data:
+            to_save.addSubSection(response.source,
+                                  svalue = data["parameters"].copy())
+
+        # Add any acquisition parameters, these will be a list.
+        if "acquisition" in data:
+            for p in data["acquisition"]:
+                acq_p.addParameter(p.getName(), p.copy())
+                if (p.getName() == "notes"):
+                    notes = p.getv()
+
+    return [to_save, notes]
+
+
 def truncateFilename(filename):
     max_len = 25
     if (len(filename) > max_len):
@@ -289,6 +326,20 @@ class FilmBox(QtWidgets.QGroupBox):
         else:
             self.ui.sizeText.setText("{0:.1f} GB".format(new_size * 0.00097656))
 
+    def updateWriterStatistics(self, queue_depth, queue_size, rate, dropped):
+        """
+        Show the state of the image writers in the size tooltip, the size
+        is shown in red if any frames were dropped.
+        """
+        tooltip = "Queued frames: {0:d} / {1:d}\n".format(queue_depth, queue_size)
+        tooltip += "Write rate: {0:.1f} MB/s\n".format(rate * 0.000000953674)
+        tooltip += "Dropped frames: {0:d}".format(dropped)
+        self.ui.sizeText.setToolTip(tooltip)
+        if (dropped > 0):
+            self.ui.sizeText.setStyleSheet("QLabel { color: red}")
+        else:
+            self.ui.sizeText.setStyleSheet("QLabel { color: black}")
+
 
 class Film(halModule.HalModule):
     """
@@ -330,9 +381,12 @@ class Film(halModule.HalModule):
         super().__init__(**kwds)
 
         self.camera_functionalities = []
+        self.dropped_frames = 0
         self.feed_names = None
         self.film_settings = None
         self.film_state = "idle"
+        self.index_fn_names = {}
+        self.index_values = None
         self.locked_out = False
         self.number_frames = 0
         self.number_fn_requested = 0
@@ -341,6 +395,8 @@ class Film(halModule.HalModule):
         self.timing_functionality = None
         self.wait_for = []
         self.waiting_on = []
+        self.writer_buffer_mb = module_params.get("configuration.writer_buffer_mb",
+                                                  imagewriters.DEFAULT_BUFFER_MB)
         self.writers = None
         self.writers_stopped_timer = QtCore.QTimer(self)
 
@@ -354,6 +410,20 @@ class Film(halModule.HalModule):
         self.writers_stopped_timer.setInterval(10)
         self.writers_stopped_timer.timeout.connect(self.stopFilmingLevel2)
 
+        #
+        # If requested, we also save a .idx file with per frame timestamps,
+        # stage positions and focus lock offsets for .dax movies. These
+        # values come from the (optional) stage and qpd functionalities.
+        #
+        if module_params.get("configuration.dax_index", False):
+            self.index_values = {"lock offset" : math.nan,
+                                 "stage x" : math.nan,
+                                 "stage y" : math.nan}
+            for fn_type in ["qpd", "stage"]:
+                fn_name = module_params.get("configuration." + fn_type + "_functionality", "")
+                if (len(fn_name) > 0):
+                    self.index_fn_names[fn_name] = fn_type
+
         p = module_params.getp("parameters")
         p.add(params.ParameterStringDirectory("Current working directory",
                                               "directory",
@@ -434,6 +504,13 @@ class Film(halModule.HalModule):
         self.sendMessage(halMessage.HalMessage(m_type = "live mode",
                                                data = {"live mode" : state}))
 
+    def handleQPDUpdate(self, qpd_dict):
+        self.index_values["lock offset"] = qpd_dict["offset"]
+
+    def handleStagePosition(self, pos_dict):
+        self.index_values["stage x"] = pos_dict["x"]
+        self.index_values["stage y"] = pos_dict["y"]
+
     def handleNewFrame(self, frame_number):
         self.number_frames = frame_number + 1
 
@@ -445,11 +522,35 @@ class Film(halModule.HalModule):
         for writer in self.writers:
             total_size += writer.getSize()
         self.view.updateSize(total_size)
+
+        # Update display of the image writers status.
+        if (len(self.writers) > 0):
+            [queue_depth, queue_size, rate, dropped] = [0, 0, 0.0, 0]
+            for writer in self.writers:
+                stats = writer.getStatistics()
+                queue_depth += stats["queue depth"]
+                queue_size += stats["queue size"]
+                rate += stats["bytes per second"]
+                dropped += stats["dropped frames"]
+            self.view.updateWriterStatistics(queue_depth, queue_size, rate, dropped)
         
     def handleResponses(self, message):
 
         if message.isType("get functionality"):
             assert (len(message.getResponses()) == 1)
+
+            # Functionalities for the .idx file.
+            fn_type = self.index_fn_names.get(message.getData()["name"])
+            if fn_type is not None:
+                functionality = message.getResponses()[0].getData()["functionality"]
+                if (fn_type == "qpd"):
+                    functionality.qpdUpdate.connect(self.handleQPDUpdate)
+                else:
+                    functionality.stagePosition.connect(self.handleStagePosition)
+                    if functionality.getCurrentPosition() is not None:
+                        self.handleStagePosition(functionality.getCurrentPosition())
+                return
+            
             for response in message.getResponses():
                 self.camera_functionalities.append(response.getData()["functionality"])
                 self.number_fn_requested -= 1
@@ -476,27 +577,10 @@ class Film(halModule.HalModule):
             film_settings = message.getData()["film settings"]
             number_frames = message.getData()["number frames"]
             if film_settings.isSaved():
-                to_save = params.StormXMLObject()
-                acq_p = to_save.addSubSection("acquisition")
-                acq_p.add(params.ParameterString(name = "version",
-                                                 value = hgit.getVersion()))
-                acq_p.add(params.ParameterInt(name = "number_frames",
-                                              value = number_frames))
-                for response in message.getResponses():
-                    data = response.getData()
-
-                    # Add general parameters 'en-bloc'.
-                    if "parameters" in data:
-                        to_save.addSubSection(response.source,
-                                              svalue = data["parameters"])
-
-                    # Add any acquisition parameters, these will be a list.
-                    if "acquisition" in data:
-                        for p in data["acquisition"]:
-                            acq_p.addParameter(p.getName(), p)
-                            if (p.getName() == "notes"):
-                                notes = p.getv()
-
+                [to_save, notes] = filmParameters(message.getResponses(),
+                                                  number_frames,
+                                                  self.dropped_frames)
+                acq_p = to_save.get("acquisition")
                 to_save.saveToFile(film_settings.getBasename() + ".xml")
 
                 if self.logfile_fp is not None:
@@ -558,6 +642,11 @@ class Film(halModule.HalModule):
             self.sendMessage(halMessage.HalMessage(m_type = "initial parameters",
                                                    data = {"parameters" : self.view.getParameters()}))
 
+            # Get the functionalities for the .idx file, if any.
+            for fn_name in self.index_fn_names:
+                self.sendMessage(halMessage.HalMessage(m_type = "get functionality",
+                                                       data = {"name" : fn_name}))
+
             # Let the settings.settings module know that it needs
             # to wait for us during a parameter change.
             self.sendMessage(halMessage.HalMessage(m_type = "wait for",
@@ -689,9 +778,11 @@ class Film(halModule.HalModule):
         # Create writers as needed for each feed.
         self.writers = []
         if self.film_settings.isSaved():
-            for camera in self.camera_functionalities:
-                if camera.getParameter("saved"):
-                    self.writers.append(imagewriters.createFileWriter(camera, self.film_settings))
+            saved = [camera for camera in self.camera_functionalities if camera.getParameter("saved")]
+            self.writers = imagewriters.createFileWriters(saved,
+                                                          self.film_settings,
+                                                          buffer_mb = self.writer_buffer_mb,
+                                                          index_values = self.index_values)
         if (len(self.writers) == 0):
             self.view.updateSize(0.0)
         
@@ -747,9 +838,23 @@ class Film(halModule.HalModule):
                 self.writers_stopped_timer.start()
                 return
 
-        # Close writers.
+        # Close writers. This will block until all of the frames that
+        # are still in the writers buffers are saved.
+        #
+        # Errors are reported once filming has stopped, otherwise one
+        # failed writer would leave the other writers (and the UI) hanging.
+        #
+        errors = []
+        self.dropped_frames = 0
         for writer in self.writers:
-            writer.closeWriter()
+            try:
+                writer.closeWriter()
+            except imagewriters.ImageWriterException as exception:
+                errors.append(str(exception))
+            dropped = writer.getStatistics()["dropped frames"]
+            if (dropped > 0):
+                print(">> Warning", writer.filename, "dropped", dropped, "frames!")
+            self.dropped_frames += dropped
 
         # Enable the UI.
         self.view.enableUI(True)
@@ -773,6 +878,9 @@ class Film(halModule.HalModule):
             if self.view.soundBell():
                 print("\7\7")
 
+        if errors:
+            raise imagewriters.ImageWriterException("Error saving film " + ", ".join(errors))
+
         #raise halExceptions.HalException("done now!")
 
 #
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 """
-Python interface to the focus_quality library.
+Python interface to the focus_quality library. If the library
+is not available the focus quality is calculated with numpy.
 
 Hazen 10/13
 """
@@ -13,22 +14,38 @@ import sys
 
 import storm_control.c_libraries.loadclib as loadclib
 
-focus_quality = loadclib.loadCLibrary("focus_quality")
+try:
+    focus_quality = loadclib.loadCLibrary("focus_quality")
 
-c_imageGradient = focus_quality.imageGradient
-c_imageGradient.argtypes = [ndpointer(dtype=numpy.uint16),
-                            ctypes.c_int,
-                            ctypes.c_int]
-c_imageGradient.restype = ctypes.c_float
+    c_imageGradient = focus_quality.imageGradient
+    c_imageGradient.argtypes = [ndpointer(dtype=numpy.uint16),
+                                ctypes.c_int,
+                                ctypes.c_int]
+    c_imageGradient.restype = ctypes.c_float
 
+except OSError:
+    print("focus_quality library not found, reverting to numpy.")
+    focus_quality = None
 
-def imageGradient(frame):
+
+def imageGradient(frame, use_numpy = False):
     """
     Returns the magnitude of the image gradient in the x direction.
+
+    use_numpy - (optional) Use numpy even if the C library exists, defaults to False.
     """
-    return c_imageGradient(frame.getData(),
-                           frame.image_x,
-                           frame.image_y)
+    if (focus_quality is not None) and (not use_numpy):
+        return c_imageGradient(frame.getData(),
+                               frame.image_x,
+                               frame.image_y)
+
+    # Like the C code this treats the image as signed shorts, and
+    # the last column is not included in the sum.
+    image = numpy.ascontiguousarray(frame.getData(), dtype = numpy.uint16)
+    image = image.reshape(frame.image_y, frame.image_x).view(numpy.int16).astype(numpy.int32)
+    diff = numpy.sum(numpy.abs(numpy.diff(image, axis = 1)), dtype = numpy.int64)
+    total = numpy.sum(image[:,:-1], dtype = numpy.int64)
+    return float(numpy.float32(diff)/numpy.float32(total))
 
 
 
@@ -10,6 +10,7 @@ from PyQt5 import QtCore
 import tifffile
 import numpy as np
 import storm_control.hal4000.halLib.halMessage as halMessage
+import storm_control.hal4000.focusLock.lockTelemetry as lockTelemetry
 import time
 
 class LockControl(QtCore.QObject):
@@ -21,6 +22,7 @@ class LockControl(QtCore.QObject):
         self.lock_mode = None
         self.offset_fp = None
         self.qpd_functionality = None
+        self.telemetry = lockTelemetry.LockTelemetry(size = configuration.get("telemetry_size", 1048576))
         self.timing_functionality = None
         self.working = False
         self.z_stage_functionality = None
@@ -44,7 +46,7 @@ class LockControl(QtCore.QObject):
     def getQPDSumSignal(self):
         qpd_state = self.lock_mode.getQPDState()
         # contains "is_good" , "image", "offset", "sigma", "sum", x_off1, y_off1, x_off2, y_off2
-        if qpd_state["x_off1"]!=0 and qpd_state["x_off2"]!=0:  # specific for two-spot method (controlled in uc480Cam) cam
+        if qpd_state.get("x_off1", 0)!=0 and qpd_state.get("x_off2", 0)!=0:  # specific for two-spot method (controlled in uc480Cam) cam
             outputValue = self.lock_mode.getQPDState()["sum"]
         else:
             outputValue = 0
@@ -149,6 +151,7 @@ class LockControl(QtCore.QObject):
         self.lock_mode.done.connect(self.handleDone)
 
         # FIXME: We only need to do this once, maybe not that big a deal.
+        self.lock_mode.setTelemetry(self.telemetry)
         self.lock_mode.setZStageFunctionality(self.z_stage_functionality)
 
         self.z_stage_functionality.recenter()
@@ -211,6 +214,12 @@ class LockControl(QtCore.QObject):
         #
         self.lock_mode.handleQPDUpdate(qpd_dict)
 
+        # Record the QPD reading and the lock state.
+        self.telemetry.addQPD(qpd_dict,
+                              self.z_stage_functionality.getCurrentPosition(),
+                              self.lock_mode.amLocked(),
+                              self.lock_mode.isGoodLock())
+
         # Save image if we have a valid tiff counter.
         #
         # There is some kind of race condition here as checking self.tiff_fp
@@ -235,13 +244,23 @@ class LockControl(QtCore.QObject):
         """
         Handles TCP messages from tcpControl.TCPControl.
         """
+        tcp_message = message.getData()["tcp message"]
+
+        # This works in all the lock modes.
+        if tcp_message.isType("Get Lock Telemetry"):
+            if not tcp_message.isTest():
+                response = self.telemetry.getResponse(duration = tcp_message.getData("duration"),
+                                                      max_points = tcp_message.getData("max_points"))
+                for name, value in response.items():
+                    tcp_message.addResponse(name, value)
+            return True
+
         if not self.working:
             return False
 
         if not self.lock_mode.canHandleTCPMessages():
             return False
         
-        tcp_message = message.getData()["tcp message"]
         if tcp_message.isType("Check Focus Lock"):
             if tcp_message.isTest():
                 tcp_message.addResponse("duration", 2)
@@ -388,6 +407,9 @@ class LockControl(QtCore.QObject):
 
                 self.offset_fp.write(" ".join(headers) + "\n")
 
+                # Save all the QPD readings.
+                self.telemetry.startFilm(film_settings.getBasename() + "_lock.txt")
+
             # Check for a waveform from a hardware timed lock mode that uses the DAQ.
             waveform = self.lock_mode.getWaveform()
             if waveform is not None:
@@ -415,6 +437,8 @@ class LockControl(QtCore.QObject):
             if self.offset_fp is not None:
                 self.offset_fp.close()
                 self.offset_fp = None
+
+            self.telemetry.stopFilm()
                 
             if self.tiff_fp is not None:
                 self.tiff_counter = None
@@ -470,6 +470,9 @@ class LockMode(QtCore.QObject):
     # variable so it is still available even when we change lock modes.
     qpd_state = None
 
+    # lockTelemetry.LockTelemetry object. All the classes use the same one.
+    telemetry = None
+
     # Z stage functionality. All the classes use the same one.
     z_stage_functionality = None
     
@@ -545,6 +548,9 @@ class LockMode(QtCore.QObject):
         self.lockTarget.emit(target)
         self.lm_target = target
 
+    def setTelemetry(self, telemetry):
+        LockMode.telemetry = telemetry
+
     def setZStageFunctionality(self, z_stage_functionality):
         LockMode.z_stage_functionality = z_stage_functionality
         self.last_good_z = LockMode.z_stage_functionality.getCenterPosition()
@@ -702,6 +708,9 @@ class OptimalLockMode(AlwaysOnLockMode):
     focus quality & offset are recorded. When the stage returns to 
     zero, the data is fit with a gaussian and the lock target is 
     set to the offset corresponding to the center of the gaussian.
+
+    The focus quality & offset are recorded in the lock telemetry, so
+    they are still available after the fit.
     """
     def __init__(self, parameters = None, **kwds):
         kwds["parameters"] = parameters
@@ -709,7 +718,6 @@ class OptimalLockMode(AlwaysOnLockMode):
         self.name = "Optimal"
         self.olm_bracket_step = None
         self.olm_counter = 0
-        self.olm_fvalues = None
         self.olm_mode = "none"
         self.olm_pname = "optimal_mode"
         self.olm_quality_threshold = 0
@@ -717,7 +725,7 @@ class OptimalLockMode(AlwaysOnLockMode):
         self.olm_scan_hold = None
         self.olm_scan_step = None
         self.olm_scan_state = "na"
-        self.olm_zvalues = None
+        self.olm_start = 0
 
         # Add optimal lock specific parameters.
         p = self.parameters.addSubSection(self.olm_pname)
@@ -750,8 +758,7 @@ class OptimalLockMode(AlwaysOnLockMode):
         if (self.olm_mode == "optimizing"):
             quality = focusQuality.imageGradient(frame)
             if (quality > self.olm_quality_threshold):
-                self.olm_zvalues[self.olm_counter] = LockMode.qpd_state["offset"]
-                self.olm_fvalues[self.olm_counter] = quality
+                LockMode.telemetry.addFocusQuality(LockMode.qpd_state["offset"], quality)
                 self.olm_counter += 1
 
                 if ((self.olm_counter % self.olm_scan_hold) == 0):
@@ -778,8 +785,9 @@ class OptimalLockMode(AlwaysOnLockMode):
                             n = self.olm_counter - 1
 
                             # Fit offset data to a 1D gaussian (lorentzian would be better?)
-                            zvalues = self.olm_zvalues[0:n]
-                            fvalues = self.olm_fvalues[0:n]
+                            scan = LockMode.telemetry.getFocusQuality(since = self.olm_start)
+                            zvalues = scan["offset"][0:n]
+                            fvalues = scan["quality"][0:n]
                             fitfunc = lambda p, x: p[0] + p[1] * numpy.exp(- (x - p[2]) * (x - p[2]) * p[3])
                             errfunc = lambda p: fitfunc(p, zvalues) - fvalues
                             p0 = [numpy.min(fvalues),
@@ -810,9 +818,7 @@ class OptimalLockMode(AlwaysOnLockMode):
         self.olm_relative_z = 0.0
         self.olm_scan_state = "scan up"
         self.olm_counter = 0
-        size_guess = round(self.olm_scan_hold * (self.olm_bracket_step / self.olm_scan_step) * 6)
-        self.olm_fvalues = numpy.zeros(size_guess)
-        self.olm_zvalues = numpy.zeros(size_guess)
+        self.olm_start = LockMode.telemetry.getFocusQualityCount()
                             
     def newParameters(self, parameters):
         if hasattr(super(), "newParameters"):
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+"""
+Constant memory recording of the focus lock state.
+
+LockTelemetry keeps the most recent QPD updates and focus quality
+measurements in ring buffers. These are numpy structured arrays so
+recording a sample is cheap enough to do for every QPD update.
+
+During a film the QPD updates are also saved (in chunks) to a text
+file, so the file has all of them no matter how long the film is.
+"""
+import numpy
+import time
+
+
+#
+# The QPD updates.
+#
+qpd_dtype = numpy.dtype([("time", numpy.float64),
+                         ("offset", numpy.float64),
+                         ("sum", numpy.float64),
+                         ("z", numpy.float64),
+                         ("is_good", numpy.bool_),
+                         ("locked", numpy.bool_),
+                         ("good_lock", numpy.bool_)])
+
+#
+# The focus quality measurements (from OptimalLockMode).
+#
+quality_dtype = numpy.dtype([("time", numpy.float64),
+                             ("offset", numpy.float64),
+                             ("quality", numpy.float64)])
+
+
+def subsample(data, max_points):
+    """
+    Returns (at most) max_points evenly spaced elements of data.
+    """
+    if (data.size <= max_points):
+        return data
+    return data[numpy.linspace(0, data.size - 1, max_points).astype(int)]
+
+
+class RingBuffer(object):
+    """
+    A fixed size buffer of records, once it is full each new record
+    replaces the oldest record.
+
+    Records are identified by their index, which is the number of
+    records that were added to the buffer before them.
+    """
+    def __init__(self, dtype = None, size = None, **kwds):
+        super().__init__(**kwds)
+        self.count = 0
+        self.data = numpy.zeros(size, dtype = dtype)
+        self.size = size
+
+    def add(self, record):
+        self.data[self.count % self.size] = record
+        self.count += 1
+
+    def getCount(self):
+        """
+        Returns the index of the next record.
+        """
+        return self.count
+
+    def getData(self, since = 0):
+        """
+        Returns a copy of the records with an index of at least since
+        that are still in the buffer, oldest first.
+        """
+        start = max(since, self.getFirst())
+        n = max(self.count - start, 0)
+        i = start % self.size
+        if ((i + n) <= self.size):
+            return self.data[i:i+n].copy()
+        else:
+            return numpy.concatenate((self.data[i:], self.data[:(i + n - self.size)]))
+
+    def getFirst(self):
+        """
+        Returns the index of the oldest record in the buffer.
+        """
+        return max(self.count - self.size, 0)
+
+
+class LockTelemetry(object):
+    """
+    The focus lock telemetry.
+    """
+    def __init__(self, quality_size = 262144, size = 1048576, **kwds):
+        """
+        quality_size - The number of focus quality measurements to keep.
+        size - The number of QPD updates to keep.
+        """
+        super().__init__(**kwds)
+        self.film_fp = None
+        self.film_index = 0
+        self.qpd = RingBuffer(dtype = qpd_dtype, size = size)
+        self.quality = RingBuffer(dtype = quality_dtype, size = quality_size)
+
+        # Save to the film file when the buffer is half full.
+        self.flush_size = max(size//2, 1)
+
+    def addFocusQuality(self, offset, quality):
+        self.quality.add((time.time(), offset, quality))
+
+    def addQPD(self, qpd_state, z, locked, good_lock):
+        self.qpd.add((time.time(),
+                      qpd_state["offset"],
+                      qpd_state["sum"],
+                      z,
+                      qpd_state["is_good"],
+                      locked,
+                      good_lock))
+
+        if (self.film_fp is not None) and ((self.qpd.getCount() - self.film_index) >= self.flush_size):
+            self.flush()
+
+    def flush(self):
+        """
+        Save the QPD updates since the last flush to the film file.
+        """
+        data = self.qpd.getData(since = self.film_index)
+        if (data.size > 0):
+            numpy.savetxt(self.film_fp,
+                          numpy.column_stack([data[x] for x in qpd_dtype.names]),
+                          fmt = ["%.6f", "%.6f", "%.6f", "%.6f", "%d", "%d", "%d"])
+        self.film_index = self.qpd.getCount()
+
+    def getFocusQuality(self, since = 0):
+        return self.quality.getData(since = since)
+
+    def getFocusQualityCount(self):
+        return self.quality.getCount()
+
+    def getQPD(self, duration = None):
+        """
+        Returns the QPD updates from the last duration seconds, or
+        all of them if duration is None.
+        """
+        data = self.qpd.getData()
+        if duration is not None:
+            data = data[data["time"] >= (time.time() - duration)]
+        return data
+
+    def getResponse(self, duration = None, max_points = None):
+        """
+        Returns a dictionary with a summary of the QPD updates from the
+        last duration seconds and (at most) max_points (default 1000) of
+        the updates and the focus quality measurements. This is the
+        response to the 'Get Lock Telemetry' TCP message.
+        """
+        if max_points is None:
+            max_points = 1000
+
+        response = {"points" : 0}
+        data = self.getQPD(duration = duration)
+        if (data.size > 0):
+            response = {"points" : int(data.size),
+                        "start_time" : float(data["time"][0]),
+                        "end_time" : float(data["time"][-1]),
+                        "good_lock_fraction" : float(numpy.mean(data["good_lock"])),
+                        "locked_fraction" : float(numpy.mean(data["locked"])),
+                        "offset_mean" : float(numpy.mean(data["offset"])),
+                        "offset_std" : float(numpy.std(data["offset"])),
+                        "sum_mean" : float(numpy.mean(data["sum"])),
+                        "z_min" : float(numpy.min(data["z"])),
+                        "z_max" : float(numpy.max(data["z"]))}
+            data = subsample(data, max_points)
+            for name in qpd_dtype.names:
+                response[name] = data[name].tolist()
+
+            quality = self.getFocusQuality()
+            quality = subsample(quality[quality["time"] >= data["time"][0]], max_points)
+            response["focus_quality_time"] = quality["time"].tolist()
+            response["focus_quality"] = quality["quality"].tolist()
+
+        return response
+
+    def startFilm(self, filename):
+        """
+        Start saving the QPD updates to filename.
+        """
+        self.film_fp = open(filename, "w")
+        self.film_fp.write(" ".join(["time", "offset", "power", "stage-z", "good-offset", "locked", "good-lock"]) + "\n")
+        self.film_index = self.qpd.getCount()
+
+    def stopFilm(self):
+        if self.film_fp is not None:
+            self.flush()
+            self.film_fp.close()
+            self.film_fp = None
@@ -392,6 +392,7 @@ class HalCore(QtCore.QObject):
         self.qt_settings = QtCore.QSettings("storm-control", "hal4000" + config.get("setup_name").lower())
         self.queued_messages = deque()
         self.queued_messages_timer = QtCore.QTimer(self)
+        self.routes = {}
         self.running = True # This is solely for the benefit of unit tests.
         self.sent_messages = []
         self.strict = config.get("strict", False)
@@ -571,6 +572,20 @@ class HalCore(QtCore.QObject):
                 return m_child
         assert False, "UI element " + name + " not found."
 
+    def getRoute(self, m_type):
+        """
+        Returns the list of modules that handle messages of type m_type.
+        """
+        try:
+            return self.routes[m_type]
+        except KeyError:
+            route = []
+            for module in self.modules:
+                if (module.message_types is None) or (m_type in module.message_types):
+                    route.append(module)
+            self.routes[m_type] = route
+            return route
+
     def handleErrors(self, message):
         """
         Handle errors in messages from 'core'
@@ -599,8 +614,7 @@ class HalCore(QtCore.QObject):
                 msg += "' received from " + message.getSourceName()
                 raise halExceptions.HalException(msg)
 
-            validator = halMessage.valid_messages[message.m_type].get("data")
-            halMessage.validateData(validator, message)
+            halMessage.validateData(message)
             
         message.logEvent("queued")
 
@@ -618,8 +632,8 @@ class HalCore(QtCore.QObject):
         # Remove message from list of sent messages.
         self.sent_messages.remove(message)
 
-        # Disconnect messages processed signal.
-        message.processed.disconnect(self.handleProcessed)
+        # Disconnect messages processed callback.
+        message.processed_fn = None
         
         # Call message finalizer.
         message.finalize()
@@ -641,9 +655,8 @@ class HalCore(QtCore.QObject):
 
         # Check the responses if we are in strict mode.
         if self.strict:
-            validator = halMessage.valid_messages[message.m_type].get("resp")
             for response in message.getResponses():
-                halMessage.validateResponse(validator, message, response)
+                halMessage.validateResponse(message, response)
 
         # Notify the sender of any responses to the message.
         message.getSource().handleResponses(message)
@@ -667,11 +680,16 @@ class HalCore(QtCore.QObject):
 
     def handleSendMessage(self):
         """
-        Handle sending the current message to all the modules.
+        Handle sending the queued messages to the modules. This
+        sends up to halModule.max_batch_size messages at a time.
         """
-        # Process the next message.
-        if (len(self.queued_messages) > 0):
-            cur_message = self.queued_messages.popleft()
+        for i in range(halModule.max_batch_size):
+            if not self.running:
+                return
+
+            cur_message = self.nextQueuedMessage()
+            if cur_message is None:
+                return
             
             #
             # If this message requested synchronization and there are
@@ -685,36 +703,47 @@ class HalCore(QtCore.QObject):
                     print(text)
                 print("")
                 self.queued_messages.appendleft(cur_message)
+                return
             
+            print(cur_message.source.module_name + " '" + cur_message.m_type + "'")
+
+            # Check for "closeEvent" message from the main window.
+            if cur_message.isType("close event") and (cur_message.getSourceName() == "hal"):
+                self.cleanUp()
+                return
+
+            # Check for "sync" message, these don't actually get sent.
+            if cur_message.isType("sync"):
+                continue
+
+            # Otherwise send the message to the modules that handle it.
+            cur_message.logEvent("sent")
+
+            cur_message.processed_fn = self.handleProcessed
+            self.sent_messages.append(cur_message)
+
             #
-            # Otherwise process the message.
+            # We hold a reference to the message while sending it, so that
+            # it still gets processed (and finalized) if no module handles
+            # this type of message.
             #
-            else:
-                print(cur_message.source.module_name + " '" + cur_message.m_type + "'")
+            cur_message.ref_count += 1
+            for module in self.getRoute(cur_message.m_type):
+                cur_message.ref_count += 1
+                module.handleMessage(cur_message)
+            cur_message.decRefCount(name = self.module_name)
 
-                # Check for "closeEvent" message from the main window.
-                if cur_message.isType("close event") and (cur_message.getSourceName() == "hal"):
-                    self.cleanUp()
-                    return
+        # Process any remaining messages with immediate timeout.
+        self.startMessageTimer()
 
-                else:
-                    # Check for "sync" message, these don't actually get sent.
-                    if cur_message.isType("sync"):
-                        pass
-
-                    # Otherwise send the message.
-                    else:
-                        cur_message.logEvent("sent")
-
-                        cur_message.processed.connect(self.handleProcessed)
-                        self.sent_messages.append(cur_message)
-                        for module in self.modules:
-                            cur_message.ref_count += 1
-                            module.handleMessage(cur_message)
-
-                    # Process any remaining messages with immediate timeout.
-                    if (len(self.queued_messages) > 0):
-                        self.startMessageTimer()
+    def nextQueuedMessage(self):
+        """
+        Returns the next message to send, or None if there
+        are no queued messages.
+        """
+        if (len(self.queued_messages) > 0):
+            return self.queued_messages.popleft()
+        return None
 
     def startMessageTimer(self, interval = 0):
         if not self.queued_messages_timer.isActive():
@@ -10,6 +10,10 @@
  *
  * Hazen 09/15
  *
+ * Replace the orientation specific functions with a single function
+ * that uses a lookup table and which can work on a subset of the rows
+ * so that a large image can be split across several threads.
+ *
  *
  * Compilation (windows):
  * gcc -c c_image_manipulation.c -O3
@@ -26,25 +30,14 @@
 #include <stdio.h>
 #include <stdint.h>
 
+#define TILE 64
+
 /* function definitions */
 int compare(uint8_t*, uint8_t*, int);
-void rescaleImage000(uint8_t*, unsigned short *, int, int, int, int, int, double, int *, int *);
-void rescaleImage001(uint8_t*, unsigned short *, int, int, int, int, int, double, int *, int *);
-void rescaleImage010(uint8_t*, unsigned short *, int, int, int, int, int, double, int *, int *);
-void rescaleImage011(uint8_t*, unsigned short *, int, int, int, int, int, double, int *, int *);
-void rescaleImage100(uint8_t*, unsigned short *, int, int, int, int, int, double, int *, int *);
-void rescaleImage101(uint8_t*, unsigned short *, int, int, int, int, int, double, int *, int *);
-void rescaleImage110(uint8_t*, unsigned short *, int, int, int, int, int, double, int *, int *);
-void rescaleImage111(uint8_t*, unsigned short *, int, int, int, int, int, double, int *, int *);
+void rescaleImage(uint8_t*, uint16_t*, uint8_t*, int, int, int, int, int, int, int, int *, int *);
 
 /* 
  * Functions 
- *
- * Yes there is horrible duplication here as pretty much the only difference between
- * the functions is how the indexing is done. I did not want to pass in an indexing
- * function as I'm trying to keep the optimized. Though this is probably a case of
- * premature optimization. In Lisp the problem would be solved with a macro..
- *
  */
 
 /* compare
@@ -72,361 +65,83 @@ int compare(uint8_t* array1, uint8_t* array2, int n_values)
   return ndiff;
 }
 
-/* rescaleImage000
+/* rescaleImage
  *
- * Converts to thresholded 8 bit for Qt.
+ * Converts to thresholded 8 bit for Qt using a lookup table and
+ * changes the orientation of the image. This only processes rows
+ * row_start to row_end (exclusive) of the original image, so it is
+ * safe to call it from several threads with different rows.
+ *
+ * The orientation operations are done in the order flip horizontal,
+ * flip vertical, then transpose.
  *
  * @param scaled_image Storage for the scaled image.
  * @param image The original image data from the camera, assumed to be 16 bit.
- * @param image_width The width of the image (the "slow" dimension).
- * @param image_height The height of the image (the "fast" dimension).
- * @param display_min The value in image that will be zero in the scaled image.
- * @param display_max The value in image that will be 255 in the scaled image.
- * @param saturated The value at which the camera is saturated.
- * @param max_range The maximum value when rescaled.
- * @param image_min The minimum value in image.
- * @param image_max The maxiumum value in image.
+ * @param lut A 65536 element lookup table.
+ * @param image_rows The number of rows in the image (the "slow" dimension).
+ * @param image_cols The number of columns in the image (the "fast" dimension).
+ * @param flip_h Reverse the order of the columns.
+ * @param flip_v Reverse the order of the rows.
+ * @param transpose Transpose the image.
+ * @param row_start The first row to process.
+ * @param row_end The row after the last row to process.
+ * @param image_min The minimum value in the processed rows.
+ * @param image_max The maxiumum value in the processed rows.
  */
-void rescaleImage000(uint8_t *scaled_image, unsigned short *image, int image_width, int image_height, int display_min, int display_max, int saturated, double max_range, int *image_min, int *image_max)
+void rescaleImage(uint8_t *scaled_image, uint16_t *image, uint8_t *lut, int image_rows, int image_cols, int flip_h, int flip_v, int transpose, int row_start, int row_end, int *image_min, int *image_max)
 {
-  int cur_min,cur_max,i,image_size;
-  double min,scale,temp;
-
-  min = (double)display_min;
-  scale = max_range/((double)(display_max - display_min));
-
-  image_size = image_width * image_height;
-  cur_min = image[0];
-  cur_max = image[0];
-  for(i=0;i<image_size;i++){
-
-    if(image[i]<cur_min){
-      cur_min = image[i];
-    }
-    else if(image[i]>cur_max){
-      cur_max = image[i];
-    }
-
-    if (image[i] >= saturated){
-      scaled_image[i] = 255;
-    }
-    else{
-      temp = (double)image[i] - min;
-      temp = temp*scale;
-      if(temp < 0.0){
-	temp = 0.0;
-      }
-      else if(temp > max_range){
-	temp = max_range;
-      }
-      scaled_image[i] = (uint8_t)(temp + 0.5);
-    }
+  int col_step,cur_max,cur_min,i,i0,i1,j,j0,j1,k,row_step,start;
+  uint16_t value;
+  uint16_t *src;
+
+  cur_min = 65535;
+  cur_max = 0;
+
+  /*
+   * Work out where the first pixel of each row goes, and how far apart
+   * (in the scaled image) adjacent pixels in a row and adjacent rows are.
+   */
+  if (transpose){
+    col_step = image_rows;
+    row_step = 1;
   }
-
-  *image_min = cur_min;
-  *image_max = cur_max;
-}
-
-/* Transpose */
-void rescaleImage001(uint8_t *scaled_image, unsigned short *image, int image_width, int image_height, int display_min, int display_max, int saturated, double max_range, int *image_min, int *image_max)
-{
-  int cur_min,cur_max,i,ij,j;
-  double min,scale,temp;
-
-  min = (double)display_min;
-  scale = max_range/((double)(display_max - display_min));
-
-  cur_min = image[0];
-  cur_max = image[0];
-  for(i=0;i<image_width;i++){
-    for(j=0;j<image_height;j++){
-
-      ij = i*image_height + j;
-      
-      if(image[ij]<cur_min){
-	cur_min = image[ij];
-      }
-      else if(image[ij]>cur_max){
-	cur_max = image[ij];
-      }
-      
-      if (image[ij] >= saturated){
-	scaled_image[j*image_width+i] = 255;
-      }
-      else{
-	temp = (double)image[ij] - min;
-	temp = temp*scale;
-	if(temp < 0.0){
-	  temp = 0.0;
-	}
-	else if(temp > max_range){
-	  temp = max_range;
-	}
-	scaled_image[j*image_width+i] = (uint8_t)(temp + 0.5);
-      }
-    }
+  else{
+    col_step = 1;
+    row_step = image_cols;
   }
 
-  *image_min = cur_min;
-  *image_max = cur_max;
-}
-
-/* Flip vertical */
-void rescaleImage010(uint8_t *scaled_image, unsigned short *image, int image_width, int image_height, int display_min, int display_max, int saturated, double max_range, int *image_min, int *image_max)
-{
-  int cur_min,cur_max,i,ij,j;
-  double min,scale,temp;
-
-  min = (double)display_min;
-  scale = max_range/((double)(display_max - display_min));
-
-  cur_min = image[0];
-  cur_max = image[0];
-  for(i=0;i<image_width;i++){
-    for(j=0;j<image_height;j++){
-
-      ij = i*image_height + j;
-      
-      if(image[ij]<cur_min){
-	cur_min = image[ij];
-      }
-      else if(image[ij]>cur_max){
-	cur_max = image[ij];
-      }
-      
-      if (image[ij] >= saturated){
-	scaled_image[(image_width-i-1)*image_height+j] = 255;
-      }
-      else{
-	temp = (double)image[ij] - min;
-	temp = temp*scale;
-	if(temp < 0.0){
-	  temp = 0.0;
-	}
-	else if(temp > max_range){
-	  temp = max_range;
-	}
-	scaled_image[(image_width-i-1)*image_height+j] = (uint8_t)(temp + 0.5);
-      }
-    }
+  start = 0;
+  if (flip_h){
+    start += (image_cols - 1) * col_step;
+    col_step = -col_step;
   }
-
-  *image_min = cur_min;
-  *image_max = cur_max;
-}
-
-/* Flip vertical, then transpose */
-void rescaleImage011(uint8_t *scaled_image, unsigned short *image, int image_width, int image_height, int display_min, int display_max, int saturated, double max_range, int *image_min, int *image_max)
-{
-  int cur_min,cur_max,i,ij,j;
-  double min,scale,temp;
-
-  min = (double)display_min;
-  scale = max_range/((double)(display_max - display_min));
-
-  cur_min = image[0];
-  cur_max = image[0];
-  for(i=0;i<image_width;i++){
-    for(j=0;j<image_height;j++){
-
-      ij = i*image_height + j;
-      
-      if(image[ij]<cur_min){
-	cur_min = image[ij];
-      }
-      else if(image[ij]>cur_max){
-	cur_max = image[ij];
-      }
-      
-      if (image[ij] >= saturated){
-	scaled_image[j*image_width+(image_width-i-1)] = 255;
-      }
-      else{
-	temp = (double)image[ij] - min;
-	temp = temp*scale;
-	if(temp < 0.0){
-	  temp = 0.0;
-	}
-	else if(temp > max_range){
-	  temp = max_range;
-	}
-	scaled_image[j*image_width+(image_width-i-1)] = (uint8_t)(temp + 0.5);
-      }
-    }
+  if (flip_v){
+    start += (image_rows - 1) * row_step;
+    row_step = -row_step;
   }
 
-  *image_min = cur_min;
-  *image_max = cur_max;
-}
-
-/* Flip horizontal */
-void rescaleImage100(uint8_t *scaled_image, unsigned short *image, int image_width, int image_height, int display_min, int display_max, int saturated, double max_range, int *image_min, int *image_max)
-{
-  int cur_min,cur_max,i,ij,j;
-  double min,scale,temp;
-
-  min = (double)display_min;
-  scale = max_range/((double)(display_max - display_min));
-
-  cur_min = image[0];
-  cur_max = image[0];
-  for(i=0;i<image_width;i++){
-    for(j=0;j<image_height;j++){
-
-      ij = i*image_height + j;
-      
-      if(image[ij]<cur_min){
-	cur_min = image[ij];
-      }
-      else if(image[ij]>cur_max){
-	cur_max = image[ij];
-      }
-      
-      if (image[ij] >= saturated){
-	scaled_image[i*image_height+(image_height-j-1)] = 255;
-      }
-      else{
-	temp = (double)image[ij] - min;
-	temp = temp*scale;
-	if(temp < 0.0){
-	  temp = 0.0;
-	}
-	else if(temp > max_range){
-	  temp = max_range;
-	}
-	scaled_image[i*image_height+(image_height-j-1)] = (uint8_t)(temp + 0.5);
-      }
-    }
-  }
-
-  *image_min = cur_min;
-  *image_max = cur_max;
-}
-
-/* Flip horizontal, then transpose */
-void rescaleImage101(uint8_t *scaled_image, unsigned short *image, int image_width, int image_height, int display_min, int display_max, int saturated, double max_range, int *image_min, int *image_max)
-{
-  int cur_min,cur_max,i,ij,j;
-  double min,scale,temp;
-
-  min = (double)display_min;
-  scale = max_range/((double)(display_max - display_min));
-
-  cur_min = image[0];
-  cur_max = image[0];
-  for(i=0;i<image_width;i++){
-    for(j=0;j<image_height;j++){
-
-      ij = i*image_height + j;
-      
-      if(image[ij]<cur_min){
-	cur_min = image[ij];
-      }
-      else if(image[ij]>cur_max){
-	cur_max = image[ij];
-      }
-      
-      if (image[ij] >= saturated){
-	scaled_image[(image_height-j-1)*image_width+i] = 255;
-      }
-      else{
-	temp = (double)image[ij] - min;
-	temp = temp*scale;
-	if(temp < 0.0){
-	  temp = 0.0;
-	}
-	else if(temp > max_range){
-	  temp = max_range;
-	}
-	scaled_image[(image_height-j-1)*image_width+i] = (uint8_t)(temp + 0.5);
-      }
-    }
-  }
-
-  *image_min = cur_min;
-  *image_max = cur_max;
-}
-
-/* Flip horizontal, then vertical */
-void rescaleImage110(uint8_t *scaled_image, unsigned short *image, int image_width, int image_height, int display_min, int display_max, int saturated, double max_range, int *image_min, int *image_max)
-{
-  int cur_min,cur_max,i,ij,j;
-  double min,scale,temp;
-
-  min = (double)display_min;
-  scale = max_range/((double)(display_max - display_min));
-
-  cur_min = image[0];
-  cur_max = image[0];
-  for(i=0;i<image_width;i++){
-    for(j=0;j<image_height;j++){
-
-      ij = i*image_height + j;
-      
-      if(image[ij]<cur_min){
-	cur_min = image[ij];
-      }
-      else if(image[ij]>cur_max){
-	cur_max = image[ij];
-      }
-      
-      if (image[ij] >= saturated){
-	scaled_image[(image_width-i-1)*image_height+(image_height-j-1)] = 255;
-      }
-      else{
-	temp = (double)image[ij] - min;
-	temp = temp*scale;
-	if(temp < 0.0){
-	  temp = 0.0;
-	}
-	else if(temp > max_range){
-	  temp = max_range;
-	}
-	scaled_image[(image_width-i-1)*image_height+(image_height-j-1)] = (uint8_t)(temp + 0.5);
-      }
-    }
-  }
-
-  *image_min = cur_min;
-  *image_max = cur_max;
-}
-
-/* Flip horizontal, then vertical, then tranpose */
-void rescaleImage111(uint8_t *scaled_image, unsigned short *image, int image_width, int image_height, int display_min, int display_max, int saturated, double max_range, int *image_min, int *image_max)
-{
-  int cur_min,cur_max,i,ij,j;
-  double min,scale,temp;
-
-  min = (double)display_min;
-  scale = max_range/((double)(display_max - display_min));
-
-  cur_min = image[0];
-  cur_max = image[0];
-  for(i=0;i<image_width;i++){
-    for(j=0;j<image_height;j++){
-
-      ij = i*image_height + j;
-      
-      if(image[ij]<cur_min){
-	cur_min = image[ij];
-      }
-      else if(image[ij]>cur_max){
-	cur_max = image[ij];
-      }
-      
-      if (image[ij] >= saturated){
-	scaled_image[(image_height-j-1)*image_width+(image_width-i-1)] = 255;
-      }
-      else{
-	temp = (double)image[ij] - min;
-	temp = temp*scale;
-	if(temp < 0.0){
-	  temp = 0.0;
-	}
-	else if(temp > max_range){
-	  temp = max_range;
+  /*
+   * The image is processed in TILE x TILE blocks so that the writes
+   * to the scaled image stay in the cache when we are transposing.
+   */
+  for(i0=row_start;i0<row_end;i0+=TILE){
+    i1 = (i0 + TILE < row_end) ? i0 + TILE : row_end;
+    for(j0=0;j0<image_cols;j0+=TILE){
+      j1 = (j0 + TILE < image_cols) ? j0 + TILE : image_cols;
+      for(i=i0;i<i1;i++){
+	src = image + i*image_cols;
+	k = start + i*row_step + j0*col_step;
+	for(j=j0;j<j1;j++){
+	  value = src[j];
+	  if(value<cur_min){
+	    cur_min = value;
+	  }
+	  if(value>cur_max){
+	    cur_max = value;
+	  }
+	  scaled_image[k] = lut[value];
+	  k += col_step;
 	}
-	scaled_image[(image_height-j-1)*image_width+(image_width-i-1)] = (uint8_t)(temp + 0.5);
       }
     }
   }
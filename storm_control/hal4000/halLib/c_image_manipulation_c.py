@@ -6,10 +6,15 @@ is used to speed up the rendering of the image in the UI. My experience
 was that for large images, such as those from a sCMOS camera, using numpy
 to do the image scaling and type conversion was not fast enough.
 
+The scaling is done with a (cached) 65536 element lookup table, and large
+images are split into bands of rows that are processed in parallel.
+
 Hazen 09/15
 """
 
+import concurrent.futures
 import ctypes
+import functools
 import math
 import numpy
 from numpy.ctypeslib import ndpointer
@@ -26,30 +31,42 @@ try:
                                     ndpointer(dtype=numpy.uint8),
                                     ctypes.c_int]
     image_manip.compare.restype = ctypes.c_int
-                                                               
-    rescale_fn_arg_types = [ndpointer(dtype=numpy.uint8),
-                            ndpointer(dtype=numpy.uint16),
-                            ctypes.c_int,
-                            ctypes.c_int,
-                            ctypes.c_int,
-                            ctypes.c_int,
-                            ctypes.c_int,
-                            ctypes.c_double,
-                            ctypes.c_void_p,
-                            ctypes.c_void_p]
-    image_manip.rescaleImage000.argtypes = rescale_fn_arg_types
-    image_manip.rescaleImage001.argtypes = rescale_fn_arg_types
-    image_manip.rescaleImage010.argtypes = rescale_fn_arg_types
-    image_manip.rescaleImage011.argtypes = rescale_fn_arg_types
-    image_manip.rescaleImage100.argtypes = rescale_fn_arg_types
-    image_manip.rescaleImage101.argtypes = rescale_fn_arg_types
-    image_manip.rescaleImage110.argtypes = rescale_fn_arg_types
-    image_manip.rescaleImage111.argtypes = rescale_fn_arg_types
+
+    image_manip.rescaleImage.argtypes = [ndpointer(dtype=numpy.uint8),
+                                         ndpointer(dtype=numpy.uint16, flags="C_CONTIGUOUS"),
+                                         ndpointer(dtype=numpy.uint8),
+                                         ctypes.c_int,
+                                         ctypes.c_int,
+                                         ctypes.c_int,
+                                         ctypes.c_int,
+                                         ctypes.c_int,
+                                         ctypes.c_int,
+                                         ctypes.c_int,
+                                         ctypes.c_void_p,
+                                         ctypes.c_void_p]
 
 except OSError:
     print("C image manipulation library not found, reverting to numpy.")
     image_manip = None
 
+except AttributeError:
+    print("C image manipulation library is out of date, reverting to numpy.")
+    image_manip = None
+
+
+#
+# Images with more pixels than this are split into bands of rows
+# which are rescaled in parallel.
+#
+THREADED_SIZE = 1024 * 1024
+
+#
+# The maximum number of threads to use for rescaling.
+#
+MAX_THREADS = 4
+
+rescale_pool = None
+
 
 def compare(image1, image2):
     """
@@ -67,7 +84,46 @@ def compare(image1, image2):
     return image_manip.compare(image1, image2, image1.size)
 
 
-def rescaleImage(image, flip_h, flip_v, transpose, display_range, saturated_value, use_numpy = False):
+@functools.lru_cache(maxsize = 16)
+def getLUT(display_min, display_max, saturated_value):
+    """
+    Returns the lookup table to convert uint16 to uint8 for a given
+    display range and saturated value.
+
+    display_min - The image value that equals 0.
+    display_max - The image value that equals 255 (or 254).
+    saturated_value - The value above which the image has saturated the camera.
+    """
+    # Determine maximum in the rescaled image.
+    if saturated_value is not None:
+        max_range = 254.0
+    else:
+        saturated_value = 65536
+        max_range = 255.0
+
+    lut = numpy.arange(65536, dtype = numpy.float64)
+    lut = max_range*(lut - display_min)/max(display_max - display_min, 1)
+    lut = numpy.clip(lut, 0.0, max_range) + 0.5
+    lut[int(saturated_value):] = 255.0
+    lut = lut.astype(numpy.uint8)
+
+    # This is shared by all the callers.
+    lut.flags.writeable = False
+    return lut
+
+
+def getRescalePool():
+    """
+    Returns the thread pool for rescaling large images.
+    """
+    global rescale_pool
+    if rescale_pool is None:
+        n_threads = max(1, min(MAX_THREADS, os.cpu_count()))
+        rescale_pool = concurrent.futures.ThreadPoolExecutor(max_workers = n_threads)
+    return rescale_pool
+
+
+def rescaleImage(image, flip_h, flip_v, transpose, display_range, saturated_value, use_numpy = False, out = None):
     """
     This converts a uint16 image into a uint8 image based on the display
     range. As a side effect it also returns the minimum and maximum values
@@ -80,58 +136,61 @@ def rescaleImage(image, flip_h, flip_v, transpose, display_range, saturated_valu
     display_range - [image value that equals 0, image value that equals 255].
     saturated_value - The value above which the image has saturated the camera.
     use_numpy - (optional) Use numpy even if the C library exists, defaults to False.
+    out - (optional) A C contiguous numpy.uint8 array of the right shape to use for
+          the rescaled image.
 
     return [numpy.uint8 image, original image minimum, original image maximum]
     """
     
-    # Create a string specifying the operations that will be performed on the image.
-    op_code = ""
-    for op in [flip_h, flip_v, transpose]:
-        if op:
-            op_code += "1"
-        else:
-            op_code += "0"
+    lut = getLUT(display_range[0], display_range[1], saturated_value)
 
-    # Determine maximum in the rescaled image.
-    if saturated_value is not None:
-        max_range = 254.0
+    if transpose:
+        shape = (image.shape[1], image.shape[0])
     else:
-        saturated_value = 65536
-        max_range = 255.0
-        
+        shape = (image.shape[0], image.shape[1])
+
+    if out is not None:
+        assert(out.shape == shape) and (out.dtype == numpy.uint8) and out.flags["C_CONTIGUOUS"]
+        rescaled = out
+    else:
+        rescaled = numpy.empty(shape, dtype = numpy.uint8)
+
     # Use C library for image manipulation, this will be faster and less memory intensive.
     if (image_manip is not None) and (not use_numpy):
-
-        if transpose:
-            rescaled = numpy.empty((image.shape[1], image.shape[0]), dtype = numpy.uint8)
+        image = numpy.ascontiguousarray(image, dtype = numpy.uint16)
+
+        def rescaleRows(rows):
+            image_min = ctypes.c_int(0)
+            image_max = ctypes.c_int(0)
+            image_manip.rescaleImage(rescaled,
+                                     image,
+                                     lut,
+                                     image.shape[0],
+                                     image.shape[1],
+                                     flip_h,
+                                     flip_v,
+                                     transpose,
+                                     rows[0],
+                                     rows[1],
+                                     ctypes.byref(image_min),
+                                     ctypes.byref(image_max))
+            return [image_min.value, image_max.value]
+
+        # The C library releases the GIL so the bands are processed in parallel.
+        bands = splitRows(image)
+        if (len(bands) > 1):
+            results = list(getRescalePool().map(rescaleRows, bands))
         else:
-            rescaled = numpy.empty((image.shape[0], image.shape[1]), dtype = numpy.uint8)
-
-        image_min = ctypes.c_int(0)
-        image_max = ctypes.c_int(0)
-
-        # Get the appropriate C function based on the op_code.
-        image_fn = getattr(image_manip, "rescaleImage" + op_code)
-
-        image_fn(rescaled,
-                 image,
-                 image.shape[0],
-                 image.shape[1],
-                 display_range[0],
-                 display_range[1],
-                 saturated_value,
-                 max_range,
-                 ctypes.byref(image_min),
-                 ctypes.byref(image_max))
-
-        image_min = image_min.value
-        image_max = image_max.value
+            results = [rescaleRows(bands[0])]
+        image_min = min(map(lambda x : x[0], results))
+        image_max = max(map(lambda x : x[1], results))
 
     # Fall back to using numpy.
     else:
         image_min = numpy.min(image)
         image_max = numpy.max(image)
-            
+
+        # These are all views, the only copy is the final lookup.
         if flip_h:
             image = numpy.fliplr(image)
             
@@ -140,22 +199,24 @@ def rescaleImage(image, flip_h, flip_v, transpose, display_range, saturated_valu
 
         if transpose:
             image = numpy.transpose(image)
-        
-        rescaled = image.astype(numpy.float64)
-        rescaled = max_range*(rescaled - display_range[0])/(display_range[1] - display_range[0])
-        rescaled[(rescaled > max_range)] = max_range 
-        rescaled[(rescaled < 0.0)] = 0.0
-        
-        # Check for saturated pixels
-        if saturated_value is not None:
-            rescaled[(image >= saturated_value)] = 255.0
-
-        # Convert to contiguous uint8 array.
-        rescaled += 0.5
-        rescaled = rescaled.astype(numpy.uint8, order='C')
+
+        numpy.take(lut, image, out = rescaled, mode = "clip")
 
     return [rescaled, image_min, image_max]
 
+
+def splitRows(image):
+    """
+    Returns a list of [first row, last row + 1] bands for rescaleImage().
+    """
+    n_rows = image.shape[0]
+    if (image.size < THREADED_SIZE) or (n_rows < 2):
+        return [[0, n_rows]]
+
+    n_bands = min(MAX_THREADS, os.cpu_count(), n_rows)
+    edges = numpy.linspace(0, n_rows, n_bands + 1).astype(int)
+    return [[int(edges[i]), int(edges[i+1])] for i in range(n_bands)]
+
             
 #
 # The MIT License
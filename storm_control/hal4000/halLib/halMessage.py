@@ -29,6 +29,9 @@ message_id = 0
 #
 # The format of each entry is "field" : [Required, Expected type].
 #
+# The validators are compiled (see compileValidator()) when the message
+# is added, these are stored in compiled_validators.
+#
 # It is convenient to have this be a property of this module rather than
 # say HalCore as it makes it typo checking easier. This was problematic
 # for testing because this module was not getting reset between tests.
@@ -36,6 +39,7 @@ message_id = 0
 # restore this dictionary to its original state.
 #
 valid_messages = {}
+compiled_validators = {}
 
 def addMessage(name, validator = {}, check_exists = True):
     """
@@ -45,6 +49,7 @@ def addMessage(name, validator = {}, check_exists = True):
     if check_exists and name in valid_messages:
         raise halExceptions.HalException("Message " + name + " already exists!")
     valid_messages[name] = validator
+    compiled_validators[name] = compileValidators(validator)
     
 
 def chainMessages(send_fn, messages):
@@ -61,10 +66,70 @@ def chainMessages(send_fn, messages):
     return messages[0]
 
 
+def compileValidator(validator):
+    """
+    Returns a function that checks that the data (or response) field of
+    a message is correct. The function is called with the data and a
+    function that returns the start of the error message.
+
+    All the work of parsing the validator is done once here, and the
+    error message is only created if there is an error.
+    """
+    # There should be no data if the validator is None.
+    if validator is None:
+        def checkFn(data, base_string_fn):
+            if data is not None:
+                raise HalMessageException(base_string_fn() + "' should not have data.")
+        return checkFn
+
+    required = frozenset(filter(lambda x: validator[x][0], validator))
+    types = {}
+    for item in validator:
+        types[item] = validator[item][1]
+
+    def checkFn(data, base_string_fn):
+
+        # Check that there is data if there are required values.
+        if data is None:
+            if required:
+                raise HalMessageException(base_string_fn() + "' should have data.")
+            return
+
+        # Check that every item in data exists in validator, and that
+        # all the items are of the correct type.
+        for item, value in data.items():
+            if not item in types:
+                msg = base_string_fn() + "' has an unexpected field '" + item + "'."
+                raise HalMessageException(msg)
+
+            if not isinstance(value, types[item]):
+                msg = base_string_fn() + "' is not the expected type, got '"
+                msg += str(type(value)) + "' expected '" + str(types[item])
+                msg += " for item '" + item + "'."
+                raise HalMessageException(msg)
+
+        # Check that every item that should be in data is.
+        if not required.issubset(data):
+            for item in sorted(required.difference(data)):
+                msg = base_string_fn() + "' does not have required item '" + item + "'."
+                raise HalMessageException(msg)
+
+    return checkFn
+
+
+def compileValidators(validator):
+    """
+    Returns a [data, response] pair of compiled validators.
+    """
+    return [compileValidator(validator.get("data")),
+            compileValidator(validator.get("resp"))]
+
+
 def initializeMessages():
     """
     Called by HAL core to create/reset the dictionary of valid messages.
     """
+    global compiled_validators
     global valid_messages
 
     # These are all the core messages. Module can add additional messages
@@ -149,6 +214,10 @@ def initializeMessages():
         'wait for' : {"data" : {"module names" : [True, list]}, "resp" : None}
     }
 
+    compiled_validators = {}
+    for name in valid_messages:
+        compiled_validators[name] = compileValidators(valid_messages[name])
+
     
 def isValidMessageName(name):
     """
@@ -159,77 +228,77 @@ def isValidMessageName(name):
     return (name in valid_messages)
         
 
-def validate(validator, data, base_string):
+def validateData(message):
     """
-    Checks that data (or response) field of a message is correct.
+    Checks that a message is correct, including the data field. HAL
+    core only does this in strict mode.
     """
-    # Check that there is no data if the validator is None.
-    if validator is None:
-        if data is not None:
-            msg = base_string + "' should not have data."
-            raise HalMessageException(msg)
-        else:
-            return
-    
-    # Check that there is data if validator is not None
-    # and there are required values.
-    if data is None:
-        for item in validator:
-            if validator[item][0]:
-                msg = base_string + "' should have data."
-                raise HalMessageException(msg)
-        return
+    if (message.data is not None) and not isinstance(message.data, dict):
+        raise HalMessageException("data is not of type 'dict'")
 
-    # Check that every item in data exists in validator.
-    for item in data:
-        if not item in validator:
-            msg = base_string + "' has an unexpected field '" + item + "'."
-            raise HalMessageException(msg)
+    if (message.finalizer is not None) and not callable(message.finalizer):
+        raise HalMessageException("function is not of type 'function'")
 
-    # Check that every item that should be in data is, and that
-    # all items are of the correct type.
-    for item in validator:
+    if not isinstance(message.m_type, str):
+        raise HalMessageException("m_type is not of type 'str'")
+                 
+    if not isinstance(message.sync, bool):
+        raise HalMessageException("sync is not of type 'bool'")
 
-        # Existence check.
-        if (not item in data) and validator[item][0]:
-            msg = base_string + "' does not have required item '" + item + "'."
-            raise HalMessageException(msg)
-        
-        # Type check.
-        if item in data:
-            if not isinstance(data[item], validator[item][1]):
-                msg = base_string + "' is not the expected type, got '"
-                msg += str(type(data[item])) + "' expected '" + str(validator[item][1])
-                msg += " for item '" + item + "'."
-                raise HalMessageException(msg)
-            
-    
-def validateData(validator, message):
-    """
-    Checks that data field of a message is correct.
-    """
-    base_string = "Data in message '" + message.m_type + "' from '" 
-    base_string += message.getSourceName()
-    validate(validator, message.getData(), base_string)
+    compiled_validators[message.m_type][0](message.data,
+                                           lambda : "Data in message '" + message.m_type + "' from '" + message.getSourceName())
 
     
-def validateResponse(validator, message, response):
+def validateResponse(message, response):
     """
     Checks that response field of a message is correct.
     """
-    base_string = "Response from '" + response.source + "' in message '" 
-    base_string += message.m_type + "' from '" + message.getSourceName()
-    validate(validator, response.getData(), base_string)
+    base_string_fn = lambda : "Response from '" + response.source + "' in message '" + message.m_type + "' from '" + message.getSourceName()
+    compiled_validators[message.m_type][1](response.getData(), base_string_fn)
 
 
 class HalMessageException(halExceptions.HalException):
     pass
 
 
-class HalMessage(QtCore.QObject):
-    istype_warned = {}    
+class HalMessageSignaler(QtCore.QObject):
+    """
+    Messages are not QObjects as they are created in large numbers, so
+    they share this object to signal that they have been processed.
+    This is so that errors in processed_fn are handled by Qt in the
+    same way as errors in any other slot.
+    """
     processed = QtCore.pyqtSignal(object)
 
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.processed.connect(self.handleProcessed)
+
+    def handleProcessed(self, message):
+        message.processed_fn(message)
+
+signaler = HalMessageSignaler()
+
+
+class HalMessage(object):
+    """
+    Note that the message type and data are only checked by HAL core
+    in strict mode, see validateData().
+    """
+    __slots__ = ("data",
+                 "finalizer",
+                 "keep_alive",
+                 "m_errors",
+                 "m_id",
+                 "m_type",
+                 "processed_fn",
+                 "ref_count",
+                 "responses",
+                 "source",
+                 "sync")
+    
+    istype_warned = {}    
+
     def __init__(self,
                  data = None,
                  finalizer = None,
@@ -252,27 +321,20 @@ class HalMessage(QtCore.QObject):
                this message should be processed before continuing to this message.
         """
         super().__init__(**kwds)
-
-        if data is not None:
-            if not isinstance(data, dict):
-                raise HalMessageException("data is not of type 'dict'")
-
-        if finalizer is not None:
-            if not callable(finalizer):
-                raise HalMessageException("function is not of type 'function'")
-
-        if not isinstance(m_type, str):
-            raise HalMessageException("m_type is not of type 'str'")
-                 
-        if not isinstance(sync, bool):
-            raise HalMessageException("sync is not of type 'bool'")
                          
         self.data = data
 #        self.finalizing = False
         self.finalizer = finalizer
+
+        # Modules can use this to keep an object that is
+        # associated with the message from getting garbage
+        # collected until the message has been processed.
+        self.keep_alive = None
+
         self.m_errors = []
         self.responses = []
         self.m_type = m_type
+        self.processed_fn = None
         self.source = source
         self.sync = sync
 
@@ -280,8 +342,8 @@ class HalMessage(QtCore.QObject):
         self.m_id = message_id
         message_id += 1
         
-        # We use a mutex for the ref_count because threaded
-        # modules could change this inside the thread.
+        # The number of modules that have not finished processing the
+        # message. When this reaches zero processed_fn is called.
         self.ref_count = 0
 
     def addError(self, hal_message_error):
@@ -293,12 +355,11 @@ class HalMessage(QtCore.QObject):
     def decRefCount(self, name = None):
 
         # This is helpful for debugging who has not responded to the message.
-        if True:
-            hdebug.logText(",".join(["handled by", str(self.m_id), str(name), self.m_type]))
+        hdebug.logEvent("handled by", self.m_id, str(name), self.m_type)
             
         self.ref_count -= 1
-        if (self.ref_count == 0):
-            self.processed.emit(self)
+        if (self.ref_count == 0) and (self.processed_fn is not None):
+            signaler.processed.emit(self)
 
     def finalize(self):
 
@@ -353,7 +414,7 @@ class HalMessage(QtCore.QObject):
         return (self.m_type == m_type)
 
     def logEvent(self, event_name):
-        hdebug.logText(",".join([event_name, str(self.m_id), self.source.module_name, self.m_type]))
+        hdebug.logEvent(event_name, self.m_id, self.source.module_name, self.m_type)
 
 #    def refCountIsZero(self):
 #        return (self.ref_count == 0)
@@ -440,6 +501,8 @@ class SyncMessage(HalMessage):
     A message whose sole purpose is to jam up the queue until 
     everything before it is processed. Use sparingly..
     """
+    __slots__ = ()
+
     def __init__(self, source = None):
         kwds = {"m_type" : "sync",
                 "source" : source,
@@ -26,6 +26,10 @@ threadpool = QtCore.QThreadPool.globalInstance()
 # benefit of QT signalling.
 max_job_time = -1
 
+# Maximum number of messages that are handled in a single pass
+# of the event loop, both by HAL core and by the modules.
+max_batch_size = 50
+
 def runWorkerTask(module, message, task, job_time_ms = None):
     """
     Use this to handle long running (non-GUI) tasks. See
@@ -127,12 +131,16 @@ class HalModule(QtCore.QObject):
     Conventions:
        1. self.view is the GUI view, if any that is associated with this module.
        2. self.control is the controller, if any.
+       3. self.message_types is the set of message types that the module
+          handles. The default (None) is all message types. Modules that
+          set this will only be sent messages of these types by HAL core.
 
     """
     newMessage = QtCore.pyqtSignal(object)
 
     def __init__(self, module_name = "", **kwds):
         super().__init__(**kwds)
+        self.message_types = None
         self.module_name = module_name
 
         self.queued_messages = deque()
@@ -316,23 +324,27 @@ class HalModule(QtCore.QObject):
         """
         Don't override..
         """
-        # Get the next message from the queue.
-        message = self.queued_messages.popleft()
-
-        try:
-            self.processMessage(message)
-        except Exception as exception:
-            message.addError(halMessage.HalMessageError(source = self.module_name,
-                                                        message = str(exception),
-                                                        m_exception = exception,
-                                                        stack_trace = traceback.format_exc()))
-        message.decRefCount(name = self.module_name)
-
-        # Check if this is being handled by a worker. If it is then we
-        # wait until the worker is done before moving on to process the
-        # next message.
-        if self.worker is not None:
-            return
+        # Process the messages in the queue, up to max_batch_size.
+        for i in range(max_batch_size):
+            message = self.queued_messages.popleft()
+
+            try:
+                self.processMessage(message)
+            except Exception as exception:
+                message.addError(halMessage.HalMessageError(source = self.module_name,
+                                                            message = str(exception),
+                                                            m_exception = exception,
+                                                            stack_trace = traceback.format_exc()))
+            message.decRefCount(name = self.module_name)
+
+            # Check if this is being handled by a worker. If it is then we
+            # wait until the worker is done before moving on to process the
+            # next message.
+            if self.worker is not None:
+                return
+
+            if (len(self.queued_messages) == 0):
+                return
             
         # Start the timer if we still have messages left.
         if (len(self.queued_messages) > 0):
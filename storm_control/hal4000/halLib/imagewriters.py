@@ -5,18 +5,56 @@ Image file writers for various formats.
 Hazen 03/17
 """
 
+import concurrent.futures
 import copy
 import datetime
+import functools
+import numpy
+import os
 import struct
 import tifffile
 import time
+import traceback
+import zlib
 
 from PyQt5 import QtCore
 
+try:
+    import h5py
+except ModuleNotFoundError:
+    print(">> Warning! h5py not found, HDF5 movies are not available. <<")
+    h5py = None
+
+import storm_control.sc_library.daxMovie as daxMovie
 import storm_control.sc_library.halExceptions as halExceptions
 import storm_control.sc_library.parameters as params
 
 
+#
+# The default amount of memory (in MB) to use for each writers frame
+# buffer. This can be changed with the 'writer_buffer_mb' setting in
+# the film modules configuration block.
+#
+DEFAULT_BUFFER_MB = 128
+
+#
+# The maximum number of frames that we'll try to write with a
+# single system call.
+#
+MAX_BATCH = 16
+
+#
+# The zlib compression level for HDF5 movies. Mostly dark STORM frames
+# compress well even at the fastest setting.
+#
+HDF5_COMPRESSION_LEVEL = 1
+
+#
+# The number of threads to use to compress the frames of a HDF5 movie.
+#
+HDF5_COMPRESSION_THREADS = 4
+
+
 class ImageWriterException(halExceptions.HalException):
     pass
 
@@ -31,40 +69,260 @@ def availableFileFormats(test_mode):
     #        extension.
     #
 
+    formats = [".dax", ".tif", ".big.tif"]
+    if h5py is not None:
+        formats += [".h5", ".multi.h5"]
     if test_mode:
-        return [".dax", ".tif", ".big.tif", ".test"]
-    else:
-        return [".dax", ".tif", ".big.tif"]
+        formats.append(".test")
+    return formats
 
-def createFileWriter(camera_functionality, film_settings):
+def createFileWriter(camera_functionality, film_settings, buffer_mb = DEFAULT_BUFFER_MB, index_values = None):
     """
     This is convenience function which creates the appropriate file writer
     based on the filetype.
+
+    index_values is a dictionary with the current 'stage x', 'stage y' and
+    'lock offset' values. If this is not None then .dax movies will also
+    have a .idx file, and .h5 movies will also have these values for each
+    frame.
     """
     ft = film_settings.getFiletype()
     if (ft == ".dax"):
-        return DaxFile(camera_functionality = camera_functionality,
-                       film_settings = film_settings)
+        return DaxFile(buffer_mb = buffer_mb,
+                       camera_functionality = camera_functionality,
+                       film_settings = film_settings,
+                       index_values = index_values)
     elif (ft == ".big.tif"):
         return TIFFile(bigtiff = True,
+                       buffer_mb = buffer_mb,
                        camera_functionality = camera_functionality,
                        film_settings = film_settings)
+    elif (ft == ".h5"):
+        return HDF5File(buffer_mb = buffer_mb,
+                        camera_functionality = camera_functionality,
+                        film_settings = film_settings,
+                        index_values = index_values)
     elif (ft == ".spe"):
-        return SPEFile(camera_functionality = camera_functionality,
+        return SPEFile(buffer_mb = buffer_mb,
+                       camera_functionality = camera_functionality,
                        film_settings = film_settings)
     elif (ft == ".test"):
-        return TestFile(camera_functionality = camera_functionality,
-                       film_settings = film_settings)
+        return TestFile(buffer_mb = buffer_mb,
+                        camera_functionality = camera_functionality,
+                        film_settings = film_settings,
+                        index_values = index_values)
     elif (ft == ".tif"):
-        return TIFFile(camera_functionality = camera_functionality,
+        return TIFFile(buffer_mb = buffer_mb,
+                       camera_functionality = camera_functionality,
                        film_settings = film_settings)
     else:
         raise ImageWriterException("Unknown output file format '" + ft + "'")
 
 
-class BaseFileWriter(object):
+def createFileWriters(camera_functionalities, film_settings, buffer_mb = DEFAULT_BUFFER_MB, index_values = None):
+    """
+    Returns a list of file writers for the (saved) camera functionalities.
 
-    def __init__(self, camera_functionality = None, film_settings = None, **kwds):
+    This is one writer per camera, except for '.multi.h5' movies where
+    a single writer saves all of the cameras in the same file.
+    """
+    if (len(camera_functionalities) == 0):
+        return []
+    
+    if (film_settings.getFiletype() == ".multi.h5"):
+        return [HDF5MultiFile(buffer_mb = buffer_mb * len(camera_functionalities),
+                              camera_functionalities = camera_functionalities,
+                              film_settings = film_settings,
+                              index_values = index_values)]
+    
+    writers = []
+    for camera in camera_functionalities:
+        writers.append(createFileWriter(camera,
+                                        film_settings,
+                                        buffer_mb = buffer_mb,
+                                        index_values = index_values))
+    return writers
+
+
+def shuffleAndCompress(np_data, level):
+    """
+    Returns the (uint16) frame as it would be stored by the HDF5 'shuffle'
+    and 'gzip' filters. zlib releases the GIL so this can be run in
+    parallel from several threads.
+    """
+    shuffled = numpy.ascontiguousarray(np_data, dtype = "<u2").view(numpy.uint8).reshape(-1, 2).T
+    return zlib.compress(shuffled.tobytes(), level)
+
+
+def writeBuffers(fp, buffers):
+    """
+    Write a list of numpy arrays to an unbuffered file. Where the OS
+    supports it this is done with (usually) a single writev() call.
+    """
+    if hasattr(os, "writev"):
+        views = [memoryview(buf).cast("B") for buf in buffers]
+        while (len(views) > 0):
+            n_written = os.writev(fp.fileno(), views)
+
+            # Handle partial writes.
+            while (n_written > 0):
+                if (n_written >= len(views[0])):
+                    n_written -= len(views[0])
+                    views.pop(0)
+                else:
+                    views[0] = views[0][n_written:]
+                    n_written = 0
+    else:
+        for buf in buffers:
+            buf.tofile(fp)
+
+
+class WriterThread(QtCore.QThread):
+    """
+    Saves frames in a separate thread so that a slow disk does not
+    block the thread that is handling the camera's newFrame signals.
+
+    Frames are copied into a bounded ring of preallocated buffers by
+    addFrame(), then run() passes them in (up to MAX_BATCH) batches to
+    write_fn(). If the ring is full the frame is dropped and counted,
+    we never block the caller.
+
+    A 'tagged' writer thread can be shared by several cameras. In this
+    case frames can be smaller than frame_size, and write_fn() is called
+    with a list of [tag, frame] pairs instead.
+    """
+    def __init__(self, frame_size = None, n_buffers = None, tagged = False, write_fn = None, **kwds):
+        """
+        frame_size - The number of pixels in a frame (the largest frame
+                     for a tagged writer thread).
+        n_buffers - The number of frames in the ring.
+        tagged - Frames are added with a tag.
+        write_fn - The function to call (in this thread) with a list
+                   of frames (as numpy arrays) to save.
+        """
+        super().__init__(**kwds)
+        self.bytes_written = 0
+        self.dropped = 0
+        self.error = None
+        self.n_buffers = n_buffers
+        self.n_queued = 0
+        self.next_in = 0
+        self.next_out = 0
+        self.running = True
+        self.start_time = None
+        self.tagged = tagged
+        self.write_fn = write_fn
+
+        self.buffers = numpy.zeros((n_buffers, frame_size), dtype = numpy.uint16)
+        self.sizes = numpy.full(n_buffers, frame_size)
+        self.tags = [None] * n_buffers
+        self.mutex = QtCore.QMutex()
+        self.not_empty = QtCore.QWaitCondition()
+
+    def addFrame(self, np_data, tag = None):
+        """
+        Copy np_data into the ring. Returns False if the frame was
+        dropped because the ring was full.
+        """
+        if self.tagged:
+            if (np_data.size > self.buffers.shape[1]):
+                raise ImageWriterException("Frame size " + str(np_data.size) + " is larger than " + str(self.buffers.shape[1]))
+        elif (np_data.size != self.buffers.shape[1]):
+            raise ImageWriterException("Frame size " + str(np_data.size) + " does not match " + str(self.buffers.shape[1]))
+
+        self.mutex.lock()
+        if self.start_time is None:
+            self.start_time = time.time()
+        if (self.n_queued == self.n_buffers):
+            self.dropped += 1
+            self.mutex.unlock()
+            return False
+        index = self.next_in
+        self.mutex.unlock()
+
+        # This slot is not visible to run() until n_queued is
+        # incremented so we can copy without holding the lock.
+        numpy.copyto(self.buffers[index,:np_data.size], np_data.ravel(), casting = "unsafe")
+        self.sizes[index] = np_data.size
+        self.tags[index] = tag
+
+        self.mutex.lock()
+        self.next_in = (index + 1) % self.n_buffers
+        self.n_queued += 1
+        self.not_empty.wakeAll()
+        self.mutex.unlock()
+        return True
+
+    def getStatistics(self):
+        self.mutex.lock()
+        rate = 0.0
+        if self.start_time is not None:
+            elapsed = time.time() - self.start_time
+            if (elapsed > 0.0):
+                rate = self.bytes_written/elapsed
+        stats = {"bytes per second" : rate,
+                 "dropped frames" : self.dropped,
+                 "queue depth" : self.n_queued,
+                 "queue size" : self.n_buffers}
+        self.mutex.unlock()
+        return stats
+
+    def run(self):
+        while True:
+            self.mutex.lock()
+            while (self.n_queued == 0) and self.running:
+                self.not_empty.wait(self.mutex)
+
+            # Only exit once all of the frames have been written.
+            if (self.n_queued == 0):
+                self.mutex.unlock()
+                break
+
+            # Batches never wrap around the end of the ring.
+            first = self.next_out
+            n_frames = min(self.n_queued, self.n_buffers - first, MAX_BATCH)
+            self.mutex.unlock()
+
+            # If there was an error we just discard frames until we are
+            # stopped. The error will be raised by stopThread().
+            frames = [self.buffers[i,:self.sizes[i]] for i in range(first, first + n_frames)]
+            if self.error is None:
+                try:
+                    if self.tagged:
+                        self.write_fn([[self.tags[i], frames[i - first]] for i in range(first, first + n_frames)])
+                    else:
+                        self.write_fn(frames)
+                except Exception:
+                    self.error = traceback.format_exc()
+
+            self.mutex.lock()
+            for i in range(first, first + n_frames):
+                self.bytes_written += frames[i - first].nbytes
+                self.tags[i] = None
+            self.next_out = (first + n_frames) % self.n_buffers
+            self.n_queued -= n_frames
+            self.mutex.unlock()
+
+    def stopThread(self):
+        """
+        Wait for all of the queued frames to be written, then stop.
+        """
+        self.mutex.lock()
+        self.running = False
+        self.not_empty.wakeAll()
+        self.mutex.unlock()
+        self.wait()
+
+        if self.error is not None:
+            raise ImageWriterException("Writing failed with:\n" + self.error)
+
+
+class BaseFileWriter(object):
+    """
+    Sub-classes should implement writeFrames(), this is called from
+    the writer thread with a list of the frames to save.
+    """
+    def __init__(self, buffer_mb = DEFAULT_BUFFER_MB, camera_functionality = None, film_settings = None, **kwds):
         super().__init__(**kwds)
         self.cam_fn = camera_functionality
         self.film_settings = film_settings
@@ -80,17 +338,36 @@ class BaseFileWriter(object):
             self.basename += "_" + self.cam_fn.getParameter("extension")
         self.filename = self.basename + self.film_settings.getFiletype()
 
+        # Create the writer thread.
+        x_pixels = self.cam_fn.getParameter("x_pixels")
+        y_pixels = self.cam_fn.getParameter("y_pixels")
+        n_buffers = int(buffer_mb/(2.0 * x_pixels * y_pixels * 0.000000953674))
+        self.writer_thread = WriterThread(frame_size = x_pixels * y_pixels,
+                                          n_buffers = max(4, min(n_buffers, 256)),
+                                          write_fn = self.writeFrames)
+        self.writer_thread.start(QtCore.QThread.NormalPriority)
+
         # Connect the camera functionality.
         self.cam_fn.newFrame.connect(self.saveFrame)
         self.cam_fn.stopped.connect(self.handleStopped)
 
     def closeWriter(self):
+        """
+        Sub-classes should call this first so that all the frames
+        have been written before the file is closed. This raises an
+        ImageWriterException if writing failed, so sub-classes should
+        close their files in a 'finally' block.
+        """
         assert self.stopped
         self.cam_fn.newFrame.disconnect(self.saveFrame)
         self.cam_fn.stopped.disconnect(self.handleStopped)
+        self.writer_thread.stopThread()
 
     def getSize(self):
         return self.frame_size * self.number_frames
+
+    def getStatistics(self):
+        return self.writer_thread.getStatistics()
     
     def handleStopped(self):
         self.stopped = True
@@ -98,44 +375,279 @@ class BaseFileWriter(object):
     def isStopped(self):
         return self.stopped
         
-    def saveFrame(self):
-        self.number_frames += 1
+    def saveFrame(self, frame):
+        """
+        Returns True if the frame was queued for saving.
+        """
+        if self.writer_thread.addFrame(frame.getData()):
+            self.number_frames += 1
+            return True
+        return False
+
+    def writeFrames(self, frames):
+        pass
 
 
 class DaxFile(BaseFileWriter):
     """
-    Dax file writing class.
+    Dax file writing class. These movies can be read with
+    sc_library.daxMovie.DaxMovie.
     """
-    def __init__(self, **kwds):
+    def __init__(self, index_values = None, **kwds):
         super().__init__(**kwds)
-        self.fp = open(self.filename, "wb")
+        self.fp = open(self.filename, "wb", buffering = 0)
+
+        # Per frame index records, these are only saved if we
+        # were given index_values.
+        self.index = []
+        self.index_values = index_values
 
     def closeWriter(self):
         """
         Close the file and write a very simple .inf file. All the metadata is
         now stored in the .xml file that is saved with each recording.
         """
-        super().closeWriter()
-        self.fp.close()
-
-        w = str(self.cam_fn.getParameter("x_pixels"))
-        h = str(self.cam_fn.getParameter("y_pixels"))
-        with open(self.basename + ".inf", "w") as inf_fp:
-            inf_fp.write("binning = 1 x 1\n")
-            inf_fp.write("data type = 16 bit integers (binary, little endian)\n")
-            inf_fp.write("frame dimensions = " + w + " x " + h + "\n")
-            inf_fp.write("number of frames = " + str(self.number_frames) + "\n")
-            if True:
-                inf_fp.write("x_start = 1\n")
-                inf_fp.write("x_end = " + w + "\n")
-                inf_fp.write("y_start = 1\n")
-                inf_fp.write("y_end = " + h + "\n")
-            inf_fp.close()
+        try:
+            super().closeWriter()
+        finally:
+            self.fp.close()
+
+        daxMovie.writeInf(self.basename + ".inf",
+                          self.cam_fn.getParameter("x_pixels"),
+                          self.cam_fn.getParameter("y_pixels"),
+                          self.number_frames)
+
+        if self.index_values is not None:
+            daxMovie.saveIndex(self.basename + ".idx", self.index)
 
     def saveFrame(self, frame):
-        super().saveFrame()
-        np_data = frame.getData()
-        np_data.tofile(self.fp)
+        if super().saveFrame(frame) and (self.index_values is not None):
+            self.index.append((frame.frame_number,
+                               time.time(),
+                               self.index_values["stage x"],
+                               self.index_values["stage y"],
+                               self.index_values["lock offset"]))
+            return True
+        return False
+
+    def writeFrames(self, frames):
+        writeBuffers(self.fp, frames)
+
+
+class HDF5File(BaseFileWriter):
+    """
+    HDF5 file writing class. The frames are stored in the 'movie'
+    dataset with one (compressed) chunk per frame. The compression
+    uses the standard 'shuffle' and 'gzip' filters so these files
+    can be read with any HDF5 library.
+
+    The 'frame_number' and 'timestamp' datasets contain the
+    corresponding values for each frame. If index_values is not None
+    there are also 'stage_x', 'stage_y' and 'lock_offset' datasets.
+    """
+    def __init__(self, compression_level = HDF5_COMPRESSION_LEVEL, index_values = None, **kwds):
+        super().__init__(**kwds)
+        self.compression_level = compression_level
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers = HDF5_COMPRESSION_THREADS)
+
+        self.h5 = h5py.File(self.filename, "w")
+        self.stream = HDF5Stream(camera_functionality = self.cam_fn,
+                                 compression_level = compression_level,
+                                 film_settings = self.film_settings,
+                                 h5_group = self.h5,
+                                 index_values = index_values)
+
+    def closeWriter(self):
+        try:
+            super().closeWriter()
+            self.stream.saveIndex()
+        finally:
+            self.pool.shutdown()
+            self.h5.close()
+
+    def saveFrame(self, frame):
+        if super().saveFrame(frame):
+            self.stream.addFrame(frame)
+            return True
+        return False
+
+    def writeFrames(self, frames):
+        self.stream.writeChunks(list(self.pool.map(self.stream.compress, frames)))
+
+
+class HDF5MultiFile(object):
+    """
+    Saves all of the cameras in a single HDF5 file with one group (named
+    after the camera) per camera. Each group is laid out in the same way
+    as a HDF5File file.
+
+    All the cameras share a single writer thread, so the file is written
+    sequentially in the order that the frames arrived. This is a lot
+    faster than having several threads writing to several files on the
+    same disk.
+    """
+    def __init__(self,
+                 buffer_mb = DEFAULT_BUFFER_MB,
+                 camera_functionalities = None,
+                 compression_level = HDF5_COMPRESSION_LEVEL,
+                 film_settings = None,
+                 index_values = None,
+                 **kwds):
+        super().__init__(**kwds)
+        self.cam_fns = camera_functionalities
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers = HDF5_COMPRESSION_THREADS)
+        self.streams = []
+
+        self.filename = film_settings.getBasename() + film_settings.getFiletype()
+        self.h5 = h5py.File(self.filename, "w")
+
+        max_pixels = 0
+        for cam_fn in self.cam_fns:
+            stream = HDF5Stream(camera_functionality = cam_fn,
+                                compression_level = compression_level,
+                                film_settings = film_settings,
+                                h5_group = self.h5.create_group(cam_fn.getCameraName()),
+                                index_values = index_values)
+            stream.save_frame = functools.partial(self.saveFrame, stream)
+            stream.handle_stopped = functools.partial(self.handleStopped, stream)
+            self.streams.append(stream)
+            max_pixels = max(max_pixels, cam_fn.getParameter("x_pixels") * cam_fn.getParameter("y_pixels"))
+
+        # Create the (shared) writer thread.
+        n_buffers = int(buffer_mb/(2.0 * max_pixels * 0.000000953674))
+        self.writer_thread = WriterThread(frame_size = max_pixels,
+                                          n_buffers = max(4, min(n_buffers, 256 * len(self.cam_fns))),
+                                          tagged = True,
+                                          write_fn = self.writeFrames)
+        self.writer_thread.start(QtCore.QThread.NormalPriority)
+
+        # Connect the camera functionalities.
+        for stream in self.streams:
+            stream.cam_fn.newFrame.connect(stream.save_frame)
+            stream.cam_fn.stopped.connect(stream.handle_stopped)
+
+    def closeWriter(self):
+        assert self.isStopped()
+        for stream in self.streams:
+            stream.cam_fn.newFrame.disconnect(stream.save_frame)
+            stream.cam_fn.stopped.disconnect(stream.handle_stopped)
+        try:
+            self.writer_thread.stopThread()
+            for stream in self.streams:
+                stream.saveIndex()
+        finally:
+            self.pool.shutdown()
+            self.h5.close()
+
+    def getSize(self):
+        size = 0.0
+        for stream in self.streams:
+            size += stream.frame_size * stream.number_frames
+        return size
+
+    def getStatistics(self):
+        return self.writer_thread.getStatistics()
+
+    def handleStopped(self, stream):
+        stream.stopped = True
+
+    def isStopped(self):
+        for stream in self.streams:
+            if not stream.stopped:
+                return False
+        return True
+
+    def saveFrame(self, stream, frame):
+        if self.writer_thread.addFrame(frame.getData(), tag = stream):
+            stream.addFrame(frame)
+            return True
+        return False
+
+    def writeFrames(self, frames):
+        chunks = self.pool.map(lambda x : x[0].compress(x[1]), frames)
+
+        # Group the chunks by stream so that we only resize each
+        # stream's dataset once per batch.
+        by_stream = {}
+        for [stream, np_data], chunk in zip(frames, chunks):
+            if not stream in by_stream:
+                by_stream[stream] = []
+            by_stream[stream].append(chunk)
+        for stream in by_stream:
+            stream.writeChunks(by_stream[stream])
+
+
+class HDF5Stream(object):
+    """
+    The movie and per frame datasets for a single camera in
+    a HDF5 file (or group).
+    """
+    def __init__(self,
+                 camera_functionality = None,
+                 compression_level = HDF5_COMPRESSION_LEVEL,
+                 film_settings = None,
+                 h5_group = None,
+                 index_values = None,
+                 **kwds):
+        super().__init__(**kwds)
+        self.cam_fn = camera_functionality
+        self.compression_level = compression_level
+        self.h5_group = h5_group
+        self.index = []
+        self.index_values = index_values
+        self.n_written = 0
+        self.number_frames = 0
+        self.stopped = False
+
+        # This is the frame size in MB.
+        self.frame_size = self.cam_fn.getParameter("bytes_per_frame") *  0.000000953674
+
+        x_pixels = self.cam_fn.getParameter("x_pixels")
+        y_pixels = self.cam_fn.getParameter("y_pixels")
+        self.movie = self.h5_group.create_dataset("movie",
+                                                  shape = (0, y_pixels, x_pixels),
+                                                  maxshape = (None, y_pixels, x_pixels),
+                                                  chunks = (1, y_pixels, x_pixels),
+                                                  dtype = "<u2",
+                                                  compression = "gzip",
+                                                  compression_opts = self.compression_level,
+                                                  shuffle = True)
+        self.movie.attrs["camera"] = self.cam_fn.getCameraName()
+        self.movie.attrs["pixel_size"] = film_settings.getPixelSize()
+
+    def addFrame(self, frame):
+        """
+        Record the index values for a frame that was queued for saving.
+        """
+        self.number_frames += 1
+        if self.index_values is None:
+            self.index.append((frame.frame_number, time.time(), numpy.nan, numpy.nan, numpy.nan))
+        else:
+            self.index.append((frame.frame_number,
+                               time.time(),
+                               self.index_values["stage x"],
+                               self.index_values["stage y"],
+                               self.index_values["lock offset"]))
+
+    def compress(self, np_data):
+        return shuffleAndCompress(np_data, self.compression_level)
+
+    def saveIndex(self):
+        index = numpy.array(self.index, dtype = daxMovie.INDEX_DTYPE)
+        self.h5_group.create_dataset("frame_number", data = index["frame"])
+        self.h5_group.create_dataset("timestamp", data = index["timestamp"])
+        if self.index_values is not None:
+            for name in ["stage_x", "stage_y", "lock_offset"]:
+                self.h5_group.create_dataset(name, data = index[name])
+
+    def writeChunks(self, chunks):
+        """
+        Append compressed frames to the movie.
+        """
+        self.movie.resize(self.n_written + len(chunks), axis = 0)
+        for chunk in chunks:
+            self.movie.id.write_direct_chunk((self.n_written, 0, 0), chunk)
+            self.n_written += 1
 
 
 class SPEFile(BaseFileWriter):
@@ -174,14 +686,16 @@ class SPEFile(BaseFileWriter):
         self.fp.seek(4100)
 
     def closeWriter(self):
-        super().closeWriter()
-        self.fp.seek(1446)
-        self.fp.write(struct.pack("i", self.number_frames))
+        try:
+            super().closeWriter()
+            self.fp.seek(1446)
+            self.fp.write(struct.pack("i", self.number_frames))
+        finally:
+            self.fp.close()
 
-    def saveFrame(self, frame):
-        super().saveFrame()
-        np_data = frame.getData()
-        np_data.tofile(self.file_ptrs[index])
+    def writeFrames(self, frames):
+        for np_data in frames:
+            np_data.tofile(self.fp)
 
 
 class TestFile(DaxFile):
@@ -209,6 +723,7 @@ class TIFFile(BaseFileWriter):
     """
     def __init__(self, bigtiff = False, **kwds):
         super().__init__(**kwds)
+        self.image_shape = (self.cam_fn.getParameter("y_pixels"), self.cam_fn.getParameter("x_pixels"))
         self.metadata = {'unit' : 'um'}
         if bigtiff:
             self.resolution = (25400.0/self.film_settings.getPixelSize(),
@@ -221,15 +736,17 @@ class TIFFile(BaseFileWriter):
                                            imagej = True)
 
     def closeWriter(self):
-        super().closeWriter()
-        self.tif.close()
+        try:
+            super().closeWriter()
+        finally:
+            self.tif.close()
         
-    def saveFrame(self, frame):
-        super().saveFrame()
-        image = frame.getData()
-        self.tif.save(image.reshape((frame.image_y, frame.image_x)),
-                      metadata = self.metadata,
-                      resolution = self.resolution)
+    def writeFrames(self, frames):
+        for image in frames:
+            self.tif.write(image.reshape(self.image_shape),
+                           contiguous = True,
+                           metadata = self.metadata,
+                           resolution = self.resolution)
 
 
 #
@@ -511,6 +511,15 @@ class Progressions(halModule.HalModule):
 
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.message_types = {"change directory",
+                              "configuration",
+                              "configure1",
+                              "new parameters",
+                              "show",
+                              "start",
+                              "start film",
+                              "stop film",
+                              "tcp message"}
 
         configuration = module_params.get("configuration")
         self.ilm_fn_name = configuration.get("illumination_functionality")
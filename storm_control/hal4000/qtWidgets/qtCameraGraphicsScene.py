@@ -1,14 +1,16 @@
 #!/usr/bin/env python
 """
 A QGraphicsScene and a QGraphicsItem customized for displaying
-data from a camera.
+data from a camera, and a thread for converting frames to QImages.
 
 Hazen 3/17.
 """
 
-from PyQt5 import QtCore, QtGui, QtWidgets
+from PyQt5 import QtCore, QtGui, QtWidgets, sip
 
 import numpy
+import time
+import traceback
 
 import storm_control.hal4000.halLib.c_image_manipulation_c as c_image
 
@@ -59,6 +61,18 @@ class QtCameraGraphicsItem(QtWidgets.QGraphicsItem):
     def getAutoScale(self):
         return [self.image_min, self.image_max]
 
+    def getRenderSettings(self):
+        """
+        Returns the settings for QtCameraFrameRenderer.render().
+        """
+        max_intensity = self.max_intensity
+        if not self.display_saturated_pixels:
+            max_intensity = None
+        return {"colortable" : self.colortable,
+                "display_range" : list(self.display_range),
+                "saturated_value" : max_intensity,
+                "scale" : [self.scale_x, self.scale_y]}
+
     def getImage(self):
         return self.q_image
     
@@ -88,6 +102,26 @@ class QtCameraGraphicsItem(QtWidgets.QGraphicsItem):
     def newRange(self, d_min, d_max):
         self.display_range = [d_min, d_max]
 
+    def newRenderedImage(self, rendered):
+        """
+        Display an image from QtCameraFrameRenderer.
+        """
+        self.image_min = rendered["image min"]
+        self.image_max = rendered["image max"]
+        self.q_image = rendered["q image"]
+
+        # Record the intensity where the user last clicked on the image.
+        a_frame = rendered["frame"]
+        xl = self.click_x
+        yl = self.click_y
+        if ((xl >= 0) and (xl < a_frame.image_x) and (yl >= 0) and (yl < a_frame.image_y)):
+            self.intensity_info = int(a_frame.getData()[yl * a_frame.image_x + xl])
+        else:
+            self.intensity_info = 0
+
+        # Force re-paint.
+        self.update()
+
     def paint(self, painter, option, widget):
         if self.q_image is not None:
 
@@ -116,82 +150,161 @@ class QtCameraGraphicsItem(QtWidgets.QGraphicsItem):
         self.click_x = cx
         self.click_y = cy
 
-    def setColorTable(self):
-        """
-        Sets the color table of the new image. If you don't do this Qt
-        will segfault without giving you a traceback or any kind of
-        warning message..
-        """
-        if self.colortable:
-            for i in range(256):
-                self.q_image.setColor(i, QtGui.qRgb(self.colortable[i][0], 
-                                                    self.colortable[i][1], 
-                                                    self.colortable[i][2]))
-        else:
-            for i in range(256):
-                self.q_image.setColor(i,QtGui.qRgb(i,i,i))        
-
     def setShowGrid(self, show):
         self.draw_grid = show
         
     def setShowTarget(self, show):
         self.draw_target = show
-        
-    def updateImageWithFrame(self, frame):
+
+
+class QtCameraGraphicsScene(QtWidgets.QGraphicsScene):
+    pass
+
+
+class QtCameraFrameRenderer(QtCore.QThread):
+    """
+    Converts frames to (indexed 8 bit) QImages in a separate thread
+    so that the GUI thread only has to draw them.
+
+    Only one frame is rendered at a time. The renderer stays busy
+    until the GUI calls renderingDone(), so there are two sets of
+    image buffers which are used alternately. The set that is being
+    displayed is never written to.
+    """
+    rendered = QtCore.pyqtSignal(object)
+
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.buffers = [None, None]
+        self.busy = False
+        self.colortable = None
+        self.colortable_rgb = None
+        self.current = 0
+        self.mutex = QtCore.QMutex()
+        self.request = None
+        self.running = True
+        self.wake = QtCore.QWaitCondition()
+
+    def getColorTable(self, colortable):
+        """
+        Returns colortable as a list of QRgb values.
+        """
+        if (self.colortable_rgb is None) or (colortable is not self.colortable):
+            if colortable:
+                self.colortable_rgb = [QtGui.qRgb(colortable[i][0], colortable[i][1], colortable[i][2]) for i in range(256)]
+            else:
+                self.colortable_rgb = [QtGui.qRgb(i, i, i) for i in range(256)]
+            self.colortable = colortable
+        return self.colortable_rgb
+
+    def render(self, frame, settings):
         """
-        Convert the frame to a QImage, then call update() to display it.
+        Request that frame be rendered with settings (from
+        QtCameraGraphicsItem.getRenderSettings()). Returns False if we
+        are still busy with the previous frame.
         """
+        self.mutex.lock()
+        if self.busy:
+            self.mutex.unlock()
+            return False
+        self.busy = True
+        self.request = [frame, settings, time.time()]
+        self.wake.wakeAll()
+        self.mutex.unlock()
+        return True
+
+    def renderFrame(self, a_frame, settings):
+        w = a_frame.image_x
+        h = a_frame.image_y
+
         #
         # For reasons lost in the mists of time 'frame' is a 1D numpy array
         # and needs to be reshaped before rescaling and converting to a QImage.
         #
-        w = frame.image_x
-        h = frame.image_y
-        image_data = frame.getData()
+        image_data = a_frame.getData()
         try:
             image_data = image_data.reshape((h,w))
         except ValueError as e:
             print("Got an image with an unexpected size, ", image_data.shape, "expected [", w, ",", h, "]")
-            return
+            return None
 
-        max_intensity = self.max_intensity
-        if not self.display_saturated_pixels:
-            max_intensity = None
+        # Switch buffers, creating new ones if the frame size changed.
+        self.current = 1 - self.current
+        if (self.buffers[self.current] is None) or (self.buffers[self.current][0].shape != (h, w)):
+            np_image = numpy.empty((h, w), dtype = numpy.uint8)
+
+            # This has to be a writeable pointer, otherwise Qt treats the data as
+            # read only and makes a copy of it when the color table is set.
+            q_image = QtGui.QImage(sip.voidptr(np_image.ctypes.data), w, h, w, QtGui.QImage.Format_Indexed8)
+
+            # New images need a color table. If you don't do this Qt will segfault
+            # without giving you a traceback or any kind of warning message..
+            q_image.setColorTable(self.getColorTable(settings["colortable"]))
+            self.buffers[self.current] = [np_image, q_image, settings["colortable"]]
+        [np_image, q_image, colortable] = self.buffers[self.current]
 
         # Rescale the image & record it's minimum and maximum.
-        [temp, self.image_min, self.image_max] = c_image.rescaleImage(image_data,
-                                                                      False,
-                                                                      False,
-                                                                      False,
-                                                                      self.display_range,
-                                                                      max_intensity)
-        
-        # Create QImage & re-scale to compensate for binning, if any.
-        temp_image = QtGui.QImage(temp.data, w, h, QtGui.QImage.Format_Indexed8)
-        if (self.scale_x != 1) or (self.scale_y != 1):
-            self.q_image = temp_image.scaled(w * self.scale_x, h * self.scale_y)
-        else:
-            self.q_image = temp_image
-        self.q_image.ndarray = temp
+        [temp, image_min, image_max] = c_image.rescaleImage(image_data,
+                                                            False,
+                                                            False,
+                                                            False,
+                                                            settings["display_range"],
+                                                            settings["saturated_value"],
+                                                            out = np_image)
 
-        # Set the images color table.
-        self.setColorTable()
+        # Set the images color table, this only needs to be done when it changes.
+        if colortable is not settings["colortable"]:
+            q_image.setColorTable(self.getColorTable(settings["colortable"]))
+            self.buffers[self.current][2] = settings["colortable"]
 
-        # Record the intensity where the user last clicked on the image.
-        # self.click_x and self.click_y are in frame coordinates.
-        xl = self.click_x
-        yl = self.click_y
-        if ((xl >= 0) and (xl < w) and (yl >= 0) and (yl < h)):
-            self.intensity_info = image_data[yl, xl]
-        else:
-            self.intensity_info = 0
+        # Re-scale to compensate for binning, if any.
+        [scale_x, scale_y] = settings["scale"]
+        if (scale_x != 1) or (scale_y != 1):
+            q_image = q_image.scaled(w * scale_x, h * scale_y)
 
-        # Force re-paint.
-        self.update()
+        return {"frame" : a_frame,
+                "image max" : image_max,
+                "image min" : image_min,
+                "q image" : q_image}
 
+    def renderingDone(self):
+        """
+        The GUI should call this once it has the image from the rendered signal.
+        """
+        self.mutex.lock()
+        self.busy = False
+        self.mutex.unlock()
 
-class QtCameraGraphicsScene(QtWidgets.QGraphicsScene):
-    pass
+    def run(self):
+        while True:
+            self.mutex.lock()
+            while (self.request is None) and self.running:
+                self.wake.wait(self.mutex)
+            if not self.running:
+                self.mutex.unlock()
+                break
+            [a_frame, settings, start_time] = self.request
+            self.request = None
+            self.mutex.unlock()
+
+            try:
+                rendered = self.renderFrame(a_frame, settings)
+            except Exception:
+                traceback.print_exc()
+                rendered = None
+
+            if rendered is None:
+                self.renderingDone()
+            else:
+                rendered["latency"] = time.time() - start_time
+                self.rendered.emit(rendered)
+
+    def stopThread(self):
+        self.mutex.lock()
+        self.running = False
+        self.wake.wakeAll()
+        self.mutex.unlock()
+        self.wait()
         
         
 #
@@ -2,37 +2,146 @@
 """
 Analyze frames using QRunnables and QThreadPool.
 
+The frames from each camera are put in a (bounded) queue and the
+workers take frames from the queues of the cameras in turn. What
+happens when a queue is full depends on the queue policy:
+
+  "drop_oldest" - Drop the oldest frame in the queue.
+  "latest_only" - Only analyze the most recent frame (a queue size of 1).
+  "every_nth" - Only analyze frames whose frame number is a multiple
+                of every_nth, otherwise the same as "drop_oldest".
+
+With "every_nth" and a large enough queue the frames that are analyzed
+are the same in every film, so the spot counts can be compared between
+films.
+
+Frames that are larger than max_size are ignored, unless tile_size
+is not zero. In which case they are split into tiles of (about)
+tile_size rows and the workers analyze the tiles in parallel. The
+localizations are merged once all the tiles of a frame have been
+analyzed.
+
 Hazen 05/17
 """
+import numpy
 import time
 
+from collections import deque
+
 from PyQt5 import QtCore
 
+import storm_control.sc_library.halExceptions as halExceptions
+
 import storm_control.hal4000.halLib.halModule as halModule
 import storm_control.hal4000.spotCounter.lmmObjectFinder as lmmObjectFinder
 
 
+policies = ["drop_oldest", "every_nth", "latest_only"]
+
+
+class SpotCounterException(halExceptions.HalException):
+    pass
+
+
+class AnalysisQueue(object):
+    """
+    The frames from a single camera that are waiting to be analyzed, and
+    the statistics for the camera.
+    """
+    def __init__(self, every_nth = 1, policy = "drop_oldest", queue_size = 2, **kwds):
+        super().__init__(**kwds)
+        self.every_nth = every_nth if (policy == "every_nth") else 1
+        self.queue_size = 1 if (policy == "latest_only") else max(1, queue_size)
+        self.queue = deque()
+        self.resetStatistics()
+
+    def addFrameAnalysis(self, frame_analysis):
+        self.updateRates()
+        if ((frame_analysis.getFrameNumber() % self.every_nth) != 0):
+            self.skipped += 1
+            return
+        
+        self.queue.append(frame_analysis)
+        if (len(self.queue) > self.queue_size):
+            self.queue.popleft()
+            self.dropped += 1
+
+    def getFrameAnalysis(self):
+        if (len(self.queue) > 0):
+            return self.queue.popleft()
+
+    def getStatistics(self):
+        self.updateRates()
+        return {"dropped" : self.dropped,
+                "dropped/s" : self.dropped_rate,
+                "processed" : self.processed,
+                "processed/s" : self.processed_rate,
+                "queued" : len(self.queue),
+                "skipped" : self.skipped}
+
+    def incProcessed(self):
+        self.processed += 1
+
+    def resetStatistics(self):
+        self.dropped = 0
+        self.processed = 0
+        self.skipped = 0
+
+        # These are for the rates.
+        self.dropped_rate = 0.0
+        self.processed_rate = 0.0
+        self.window = [time.perf_counter(), 0, 0]
+
+    def updateRates(self):
+        """
+        The rates are updated (about) once a second.
+        """
+        [start_time, processed, dropped] = self.window
+        elapsed = time.perf_counter() - start_time
+        if (elapsed > 1.0):
+            self.dropped_rate = (self.dropped - dropped)/elapsed
+            self.processed_rate = (self.processed - processed)/elapsed
+            self.window = [start_time + elapsed, self.processed, self.dropped]
+
+
 class AnalysisWorker(QtCore.QRunnable):
     """
     Runnable for performing image analysis.
+
+    Each worker has its own localization buffers. The worker is not
+    given another frame until its results have been handled, which
+    happens in SpotCounter.handleAnalysisDone().
     """
     def __init__(self, **kwds):
         super().__init__(**kwds)
         self.aw_signaler = AnalysisWorkerSignaler()
         self.frame_analysis = None
         self.busy = False
+        self.running = False
+        self.tile = 0
+        self.x_locs = numpy.zeros(lmmObjectFinder.max_locs, dtype = numpy.float32)
+        self.y_locs = numpy.zeros(lmmObjectFinder.max_locs, dtype = numpy.float32)
 
     def isBusy(self):
         return self.busy
+
+    def isRunning(self):
+        return self.running
         
     def run(self):
-        self.frame_analysis.analyzeImage()
-        self.aw_signaler.analysisDone.emit(self.frame_analysis)
-        self.busy = False
+        self.frame_analysis.analyzeTile(self.tile, self.x_locs, self.y_locs)
+        self.running = False
+        self.aw_signaler.analysisDone.emit(self)
         
-    def setFrameAnalysis(self, frame_analysis):
+    def setFrameAnalysis(self, frame_analysis, tile = 0):
         self.frame_analysis = frame_analysis
         self.busy = True
+        self.running = True
+        self.tile = tile
+
+    def setIdle(self):
+        self.frame_analysis = None
+        self.busy = False
 
 
 class AnalysisWorkerSignaler(QtCore.QObject):
@@ -49,23 +158,52 @@ class FrameAnalysis(QtCore.QObject):
      1. Stores the frame to analyze.
      2. Does the analysis (with AnalysisWorker).
      3. Stores the results of the analysis.
+
+    The frame is analyzed in one or more tiles (from lmmObjectFinder.tiles()).
     """
     def __init__(self,
                  camera_name = None,
                  frame = None,
                  threshold = None,
+                 tiles = None,
                  **kwds):
         super().__init__(**kwds)
         self.camera_name = camera_name
         self.frame = frame
         self.locs_count = 0
         self.threshold = threshold
+        self.tiles = tiles
+        self.tiles_done = 0
         self.x_locs = None
         self.y_locs = None
+
+        if self.tiles is None:
+            self.tiles = [[0, self.frame.image_y]]
+        self.results = [None] * len(self.tiles)
         
-    def analyzeImage(self):
-        [self.x_locs, self.y_locs, self.locs_count] = lmmObjectFinder.findObjects(self.frame,
-                                                                                  self.threshold)
+    def analyzeImage(self, x_locs = None, y_locs = None):
+        """
+        Analyze all the tiles of the frame in the current thread.
+        """
+        for i in range(len(self.tiles)):
+            self.analyzeTile(i, x_locs, y_locs)
+            self.tileDone()
+
+    def analyzeTile(self, index, x_locs = None, y_locs = None):
+        """
+        This is called by the AnalysisWorker. If there is more than one
+        tile the results are copied as the workers re-use x_locs and y_locs.
+        """
+        tile = self.tiles[index]
+        [x, y, n] = lmmObjectFinder.findObjects(self.frame,
+                                                self.threshold,
+                                                x = x_locs,
+                                                y = y_locs,
+                                                tile = tile)
+        if (len(self.tiles) == 1):
+            self.results[index] = [x[:n], y[:n]]
+        else:
+            self.results[index] = [x[:n].copy(), y[:n] + tile[0]]
 
     def getCameraName(self):
         return self.camera_name
@@ -77,22 +215,62 @@ class FrameAnalysis(QtCore.QObject):
         return self.frame.frame_number
         
     def getLocalizations(self):
+        """
+        Note that these are only valid in the handlers of the
+        SpotCounter imageProcessed signal.
+        """
         return [self.x_locs[:self.locs_count],
                 self.y_locs[:self.locs_count]]
+
+    def getNTiles(self):
+        return len(self.tiles)
+
+    def tileDone(self):
+        """
+        Returns True when all the tiles have been analyzed, at which
+        point the localizations from the tiles are merged.
+        """
+        self.tiles_done += 1
+        if (self.tiles_done < len(self.tiles)):
+            return False
+
+        if (len(self.results) == 1):
+            [self.x_locs, self.y_locs] = self.results[0]
+        else:
+            self.x_locs = numpy.concatenate([x[0] for x in self.results])
+            self.y_locs = numpy.concatenate([x[1] for x in self.results])
+        self.locs_count = self.x_locs.size
+        self.results = None
+        return True
         
 
 class SpotCounter(QtCore.QObject):
     imageProcessed = QtCore.pyqtSignal(object)
 
-    def __init__(self, max_threads = None, max_size = 0, **kwds):
+    def __init__(self,
+                 every_nth = 1,
+                 max_threads = None,
+                 max_size = 0,
+                 queue_policy = "drop_oldest",
+                 queue_size = 2,
+                 tile_size = 0,
+                 **kwds):
         super().__init__(**kwds)
 
-        self.dropped = 0
+        self.every_nth = every_nth
         self.max_size = max_size
+        self.next_queue = 0
+        self.queue_policy = queue_policy
+        self.queue_size = queue_size
+        self.queues = {}
         self.threadpool = halModule.threadpool
-        self.total = 0
+        self.tile_size = tile_size
+        self.tiles = deque()
         self.workers = []
 
+        if not queue_policy in policies:
+            raise SpotCounterException("Unknown queue policy '" + str(queue_policy) + "'")
+
         # Create analysis workers.
         for i in range(max_threads):
             aw = AnalysisWorker()
@@ -106,47 +284,89 @@ class SpotCounter(QtCore.QObject):
     def cleanUp(self):
 
         # Wait for workers to finish.
-        still_busy = True
-        while still_busy:
-            all_busy = False
-            for worker in self.workers:
-                if worker.isBusy():
-                    all_busy = True
-                    break
-            still_busy = all_busy
+        while any(map(lambda x: x.isRunning(), self.workers)):
             time.sleep(0.1)
         
         # Object finder cleanup.
         lmmObjectFinder.cleanUp()
 
         # Print statistics.
-        print("> spot counter dropped", self.dropped, "images out of", self.total, "total images")
+        for camera_name, queue in self.queues.items():
+            stats = queue.getStatistics()
+            print("> spot counter", camera_name, "dropped", stats["dropped"], "images, analyzed",
+                  stats["processed"], "images and skipped", stats["skipped"], "images")
+
+    def getStatistics(self):
+        """
+        Returns a dictionary with the statistics for each camera.
+        """
+        stats = {}
+        for camera_name, queue in self.queues.items():
+            stats[camera_name] = queue.getStatistics()
+        return stats
 
-    def handleAnalysisDone(self, frame_analysis):
-        self.imageProcessed.emit(frame_analysis)
+    def handleAnalysisDone(self, worker):
+        frame_analysis = worker.frame_analysis
+        if frame_analysis.tileDone():
+            self.queues[frame_analysis.getCameraName()].incProcessed()
+            self.imageProcessed.emit(frame_analysis)
+        worker.setIdle()
+        self.startWorkers()
+
+    def nextFrameAnalysis(self):
+        """
+        Returns the next frame to analyze, taking frames from the
+        queue of each camera in turn.
+        """
+        queues = list(self.queues.values())
+        for i in range(len(queues)):
+            queue = queues[(self.next_queue + i) % len(queues)]
+            frame_analysis = queue.getFrameAnalysis()
+            if frame_analysis is not None:
+                self.next_queue = (self.next_queue + i + 1) % len(queues)
+                return frame_analysis
         
     def newFrameToAnalyze(self, camera_name, frame, threshold):
         
-        # Check if the current camera image is small
-        # enough that we can analyze it.
+        # Check if the current camera image is small enough that
+        # we can analyze it, or if we should analyze it in tiles.
+        tiles = None
         if ((frame.image_x * frame.image_y) > self.max_size):
-            return
+            if (self.tile_size == 0):
+                return
+            tiles = lmmObjectFinder.tiles(frame.image_y, self.tile_size)
+
+        if not camera_name in self.queues:
+            self.queues[camera_name] = AnalysisQueue(every_nth = self.every_nth,
+                                                     policy = self.queue_policy,
+                                                     queue_size = self.queue_size)
         
-        self.total += 1
+        self.queues[camera_name].addFrameAnalysis(FrameAnalysis(camera_name = camera_name,
+                                                                frame = frame,
+                                                                threshold = threshold,
+                                                                tiles = tiles))
+        self.startWorkers()
 
-        # Check if there is a thread available to analyze the image.
-        was_dropped = True
+    def resetStatistics(self):
+        for queue in self.queues.values():
+            queue.resetStatistics()
+
+    def startWorkers(self):
+        """
+        Give the tiles of the frames to the idle workers, the
+        tiles of a frame are started before those of the next frame.
+        """
         for worker in self.workers:
             if not worker.isBusy():
-                worker.setFrameAnalysis(FrameAnalysis(camera_name = camera_name,
-                                                      frame = frame,
-                                                      threshold = threshold))
+                if (len(self.tiles) == 0):
+                    frame_analysis = self.nextFrameAnalysis()
+                    if frame_analysis is None:
+                        return
+                    for i in range(frame_analysis.getNTiles()):
+                        self.tiles.append([frame_analysis, i])
+                [frame_analysis, tile] = self.tiles.popleft()
+                worker.setFrameAnalysis(frame_analysis, tile)
                 self.threadpool.start(worker)
-                was_dropped = False
-                break
-
-        if was_dropped:
-            self.dropped += 1
 
 
 #
@@ -5,6 +5,16 @@ works by indentifying local maxima, then computing their first moment.
 
 Note that the maximum number of objects found per image is limited to 1000.
 
+Large images can be analyzed in tiles, these are bands of rows that
+overlap by 'margin' rows so that every pixel that would be checked for
+a peak in the whole image is checked in exactly one tile. The C code
+only reads from its (static) peak definition arrays once it has been
+initialized, and ctypes releases the GIL, so tiles can be analyzed in
+parallel.
+
+If the C library is not available the same analysis is done with numpy,
+with identical results. The numpy version is slower though.
+
 Hazen 09/13
 """
 
@@ -17,14 +27,35 @@ import sys
 import storm_control.c_libraries.loadclib as loadclib
 
 lmmoment = False
+margin = 5        # This is BSIZE in LMMoment.c.
 max_locs = 1000
 
+#
+# The peak definition from LMMoment.c, 1 is the boundary and 2 is the center.
+#
+peak = numpy.array([[0, 0, 0, 1, 1, 1, 0, 0, 0],
+                    [0, 0, 1, 2, 2, 2, 1, 0, 0],
+                    [0, 1, 2, 2, 2, 2, 2, 1, 0],
+                    [1, 2, 2, 2, 2, 2, 2, 2, 1],
+                    [1, 2, 2, 2, 2, 2, 2, 2, 1],
+                    [1, 2, 2, 2, 2, 2, 2, 2, 1],
+                    [0, 1, 2, 2, 2, 2, 2, 1, 0],
+                    [0, 0, 1, 2, 2, 2, 1, 0, 0],
+                    [0, 0, 0, 1, 1, 1, 0, 0, 0]])
+
+#
+# The [row, column] offsets of the boundary and the center pixels.
+#
+bdy_offsets = numpy.transpose(numpy.nonzero(peak == 1)) - (margin - 1)
+cnt_offsets = numpy.transpose(numpy.nonzero(peak == 2)) - (margin - 1)
+
 
 def cleanUp():
     """
     Called at program shutdown to free arrays allocated in C.
     """
-    lmmoment.cleanup()
+    if lmmoment is not None:
+        lmmoment.cleanup()
 
 
 def initialize():
@@ -34,7 +65,12 @@ def initialize():
     """
     
     global lmmoment
-    lmmoment = loadclib.loadCLibrary("LMMoment")
+    try:
+        lmmoment = loadclib.loadCLibrary("LMMoment")
+    except OSError:
+        print("LMMoment library not found, reverting to numpy.")
+        lmmoment = None
+        return
 
     lmmoment.initialize.argtypes = []
     lmmoment.cleanup.argtypes = []
@@ -48,15 +84,110 @@ def initialize():
     lmmoment.initialize()
 
 
-def findObjects(frame, threshold):
+def numberAndLocObjects(image, threshold, x, y):
+    """
+    This is numberAndLocObjects() from LMMoment.c using numpy.
+
+    image - A 2D numpy.uint16 array.
+    threshold - Peak height above the background ring to be considered a peak.
+    x - A numpy.float32 array to store the x (column) locations in.
+    y - A numpy.float32 array to store the y (row) locations in.
+
+    Returns the number of objects found.
+    """
+    # The C code treats the image as signed shorts.
+    image = image.view(numpy.int16).astype(numpy.int32)
+    [size_r, size_c] = image.shape
+    b = margin
+    if (size_r <= 2 * b) or (size_c <= 2 * b):
+        return 0
+
+    # Local maxima, the comparisons are strict for the pixels before
+    # the center (in C order) and not strict for those after it.
+    def shifted(dr, dc):
+        return image[b+dr:size_r-b+dr, b+dc:size_c-b+dc]
+
+    cur = shifted(0, 0)
+    mask = numpy.ones(cur.shape, dtype = numpy.bool_)
+    for [dr, dc] in [[-1, -1], [-1, 0], [-1, 1], [0, -1], [1, -1]]:
+        mask &= (cur > shifted(dr, dc))
+    for [dr, dc] in [[0, 1], [1, 0], [1, 1]]:
+        mask &= (cur >= shifted(dr, dc))
+
+    # Peaks, all of the boundary pixels must be at least threshold
+    # below the center and their (C integer) mean must be positive.
+    [rows, cols] = numpy.nonzero(mask)
+    rows += b
+    cols += b
+    centers = image[rows, cols]
+    bdy = image[rows[:,None] + bdy_offsets[:,0], cols[:,None] + bdy_offsets[:,1]]
+    mean = numpy.fix(numpy.sum(bdy, axis = 1)/len(bdy_offsets)).astype(numpy.int32)
+    is_peak = numpy.all(centers[:,None] >= (bdy + threshold), axis = 1) & (mean > 0)
+
+    # The C code stops once it has found as many peaks as there is storage for.
+    n = min(numpy.count_nonzero(is_peak), x.size, y.size)
+    rows = rows[is_peak][:n]
+    cols = cols[is_peak][:n]
+    mean = mean[is_peak][:n]
+
+    # First moment, in single precision like the C code.
+    cnt = image[rows[:,None] + cnt_offsets[:,0], cols[:,None] + cnt_offsets[:,1]] - mean[:,None]
+    c_sum = numpy.sum(cnt, axis = 1).astype(numpy.float32)
+    c_sumr = numpy.sum(cnt * cnt_offsets[:,0], axis = 1).astype(numpy.float32)
+    c_sumc = numpy.sum(cnt * cnt_offsets[:,1], axis = 1).astype(numpy.float32)
+
+    valid = (c_sum > 0)
+    c_sum[~valid] = 1.0
+    x[:n] = numpy.where(valid, cols.astype(numpy.float32) + c_sumc/c_sum, -1.0)
+    y[:n] = numpy.where(valid, rows.astype(numpy.float32) + c_sumr/c_sum, -1.0)
+    return n
+
+
+def tiles(image_y, tile_size):
+    """
+    Returns a list of the [start, stop] rows of the tiles for an
+    image with image_y rows. Each tile (other than at the edges of
+    the image) is tile_size + 2 * margin rows.
+    """
+    tile_size = max(tile_size, 1)
+    tile_list = []
+    for core_start in range(0, image_y, tile_size):
+        core_stop = min(core_start + tile_size, image_y)
+        tile_list.append([max(core_start - margin, 0), min(core_stop + margin, image_y)])
+    return tile_list
+
+
+def findObjects(frame, threshold, x = None, y = None, tile = None, use_numpy = False):
     """
     Find the objects in the image.
+
+    x and y are (optional) float32 arrays of size max_locs to
+    store the object locations in.
+
+    tile is an (optional) [start, stop] range of rows from tiles(),
+    the y locations are relative to the start row.
+
+    use_numpy - (optional) Use numpy even if the C library exists, defaults to False.
     """
-    x = numpy.zeros((max_locs), dtype = numpy.float32)
-    y = numpy.zeros((max_locs), dtype = numpy.float32)
+    if x is None:
+        x = numpy.zeros((max_locs), dtype = numpy.float32)
+    if y is None:
+        y = numpy.zeros((max_locs), dtype = numpy.float32)
+    if tile is None:
+        tile = [0, frame.image_y]
+
+    # Rows of a C ordered image are contiguous, so this does not copy.
+    [start, stop] = tile
+    np_data = numpy.ascontiguousarray(frame.getData(), dtype = numpy.uint16).reshape(-1)
+    np_data = np_data[start * frame.image_x:stop * frame.image_x]
+
+    if (lmmoment is None) or use_numpy:
+        n = numberAndLocObjects(np_data.reshape(stop - start, frame.image_x), threshold, x, y)
+        return [x, y, n]
+
     n = ctypes.c_int(max_locs)
-    lmmoment.numberAndLocObjects(numpy.ascontiguousarray(frame.getData(), dtype = numpy.uint16),
-                                 frame.image_y,
+    lmmoment.numberAndLocObjects(np_data,
+                                 stop - start,
                                  frame.image_x,
                                  threshold,
                                  x,
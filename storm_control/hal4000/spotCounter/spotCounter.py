@@ -205,6 +205,18 @@ class SpotCounterView(halDialog.HalDialog):
         self.ui.maxSpinBox.setValue(self.parameters.get("max_spots"))
         
         self.setEnabled(True)
+
+    def setStatistics(self, statistics):
+        """
+        Show the analysis rates of each camera.
+        """
+        lines = []
+        for camera_name in sorted(statistics):
+            stats = statistics[camera_name]
+            lines.append("{0:s}: {1:.1f} analyzed/s, {2:.1f} dropped/s".format(camera_name,
+                                                                            stats["processed/s"],
+                                                                            stats["dropped/s"]))
+        self.ui.label.setText("\n".join(lines))
         
         
 class SpotCounter(halModule.HalModule):
@@ -220,8 +232,17 @@ class SpotCounter(halModule.HalModule):
 
         configuration = module_params.get("configuration")
 
-        self.spot_counter = findSpots.SpotCounter(max_threads = configuration.get("max_threads"),
-                                                  max_size = configuration.get("max_size"))
+        self.spot_counter = findSpots.SpotCounter(every_nth = configuration.get("every_nth", 1),
+                                                  max_threads = configuration.get("max_threads"),
+                                                  max_size = configuration.get("max_size"),
+                                                  queue_policy = configuration.get("queue_policy", "drop_oldest"),
+                                                  queue_size = configuration.get("queue_size", 2),
+                                                  tile_size = configuration.get("tile_size", 0))
+
+        # Timer for updating the analysis rates in the UI.
+        self.statistics_timer = QtCore.QTimer(self)
+        self.statistics_timer.setInterval(1000)
+        self.statistics_timer.timeout.connect(self.handleStatisticsTimer)
 
         self.view = SpotCounterView(module_name = self.module_name,
                                     configuration = configuration)
@@ -258,6 +279,7 @@ class SpotCounter(halModule.HalModule):
                                                    is_saved = False))
 
     def cleanUp(self, qt_settings):
+        self.statistics_timer.stop()
         self.cleanUpAnalyzers()
         self.spot_counter.cleanUp()
         self.view.cleanUp(qt_settings)
@@ -287,6 +309,9 @@ class SpotCounter(halModule.HalModule):
                 self.view.newAnalyzers(self.parameters,
                                        self.analyzers)
                 
+    def handleStatisticsTimer(self):
+        self.view.setStatistics(self.spot_counter.getStatistics())
+
     def processMessage(self, message):
 
         if message.isType("changing parameters"):
@@ -336,6 +361,7 @@ class SpotCounter(halModule.HalModule):
 
         elif message.isType("start"):
             self.newAnalyzers()
+            self.statistics_timer.start()
             if message.getData()["show_gui"]:
                 self.view.showIfVisible()
 
@@ -346,6 +372,7 @@ class SpotCounter(halModule.HalModule):
 
             for analyzer in self.analyzers:
                 analyzer.startFilm(film_settings)
+            self.spot_counter.resetStatistics()
 
         elif message.isType("stop film"):
             total_spots = 0
@@ -360,10 +387,28 @@ class SpotCounter(halModule.HalModule):
             message.addResponse(halMessage.HalMessageResponse(source = self.module_name,
                                                               data = {"parameters" : self.parameters.copy()}))
 
+            # Also record how many frames were analyzed, so that we know how
+            # comparable the spot counts of different films are.
+            statistics = self.spot_counter.getStatistics().values()
             counts_param = params.ParameterInt(name = "spot_counts",
                                                value = total_spots)
+            analyzed_param = params.ParameterInt(name = "spot_frames_analyzed",
+                                                 value = sum(map(lambda x: x["processed"], statistics)))
+            dropped_param = params.ParameterInt(name = "spot_frames_dropped",
+                                                value = sum(map(lambda x: x["dropped"], statistics)))
             message.addResponse(halMessage.HalMessageResponse(source = self.module_name,
-                                                              data = {"acquisition" : [counts_param]}))
+                                                              data = {"acquisition" : [counts_param,
+                                                                                       analyzed_param,
+                                                                                       dropped_param]}))
+
+        elif message.isType("tcp message"):
+            tcp_message = message.getData()["tcp message"]
+            if tcp_message.isType("Get Spot Counter Statistics"):
+                if not tcp_message.isTest():
+                    for camera_name, stats in self.spot_counter.getStatistics().items():
+                        tcp_message.addResponse(camera_name, stats)
+                message.addResponse(halMessage.HalMessageResponse(source = self.module_name,
+                                                                  data = {"handled" : True}))
 
     def newAnalyzers(self):
 
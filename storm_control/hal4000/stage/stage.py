@@ -234,6 +234,12 @@ class Stage(halModule.HalModule):
 
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.message_types = {"change directory",
+                              "configure1",
+                              "new parameters",
+                              "show",
+                              "start",
+                              "stop film"}
 
         self.stage_fn_name = module_params.get("configuration.stage_functionality")
         
@@ -7,6 +7,7 @@ Hazen 05/17
 
 import os
 import warnings
+from collections import deque
 from PyQt5 import QtCore
 
 import storm_control.sc_library.halExceptions as halExceptions
@@ -18,6 +19,19 @@ import storm_control.hal4000.halLib.halMessage as halMessage
 import storm_control.hal4000.halLib.halModule as halModule
 
 
+def frameInfo(frame):
+    return {"camera" : frame.which_camera,
+            "frame_number" : frame.frame_number}
+
+
+def sendFrame(server, frame, message_id):
+    """
+    Send a camera frame to the TCP client as an array.
+    """
+    np_array = frame.getData().reshape((frame.image_y, frame.image_x))
+    server.sendData(np_array, message_id = message_id, info = frameInfo(frame))
+
+
 def calculateMovieStats(tcp_message, parameters):
     """
     Calculate movie size and duration based on parameters
@@ -49,6 +63,47 @@ def calculateMovieStats(tcp_message, parameters):
     tcp_message.addResponse("duration", frames/fps)
     
     
+class FrameStream(QtCore.QObject):
+    """
+    Sends the frames from a camera to the TCP client as they arrive. If
+    the client is not keeping up the frames are dropped.
+    """
+    def __init__(self, camera_fn = None, every = 1, max_bytes = None, message_id = None, server = None, **kwds):
+        super().__init__(**kwds)
+        self.camera_fn = camera_fn
+        self.dropped = 0
+        self.every = every
+        self.max_bytes = max_bytes
+        self.message_id = message_id
+        self.n_frames = 0
+        self.sent = 0
+        self.server = server
+
+        self.camera_fn.newFrame.connect(self.handleNewFrame)
+
+    def handleNewFrame(self, frame):
+        self.n_frames += 1
+        if ((self.n_frames % self.every) != 0):
+            return
+
+        # Drop the frame if the client is not keeping up.
+        if (self.server.getBytesToWrite() > self.max_bytes):
+            self.dropped += 1
+            return
+
+        sendFrame(self.server, frame, self.message_id)
+        self.sent += 1
+
+    def stop(self, tcp_message = None):
+        """
+        Stop streaming, and add the stream statistics to tcp_message.
+        """
+        self.camera_fn.newFrame.disconnect(self.handleNewFrame)
+        if tcp_message is not None:
+            tcp_message.addResponse("dropped_frames", self.dropped)
+            tcp_message.addResponse("sent_frames", self.sent)
+
+
 class TCPAction(QtCore.QObject):
     """
     The base class for TCP messages that are handled using actions. These
@@ -104,6 +159,40 @@ class TCPAction(QtCore.QObject):
         server.sendMessage(self.tcp_message)
 
 
+class TCPActionGetFrame(TCPAction):
+    """
+    This is used to get the most recent frame from a camera. The
+    frame is sent as an array before the response.
+    """
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.frame = None
+        self.hal_message = halMessage.HalMessage(m_type = "get functionality",
+                                                 data = {"name" : self.tcp_message.getData("camera", default = "camera1")})
+
+    def handleResponses(self, message):
+        if (message != self.hal_message):
+            return False
+
+        self.was_handled = True
+        if not message.hasResponses():
+            self.tcp_message.setError(True, "Camera '" + message.getData()["name"] + "' not found")
+            return True
+
+        [self.frame, n_frames] = message.getResponses()[0].getData()["functionality"].getLatestFrame()
+        if self.frame is None:
+            self.tcp_message.setError(True, "No frames from '" + message.getData()["name"] + "'")
+        else:
+            for key, value in frameInfo(self.frame).items():
+                self.tcp_message.addResponse(key, value)
+        return True
+
+    def sendResponse(self, server):
+        if (self.frame is not None) and not self.tcp_message.isTest():
+            sendFrame(server, self.frame, self.tcp_message.getID())
+        super().sendResponse(server)
+
+
 class TCPActionGetMovieStats(TCPAction):
     """
     This is used to calculate the stats of a movie request that 
@@ -257,6 +346,45 @@ class TCPActionSetParameters(TCPAction):
         return False
 
 
+class TCPActionStreamFrames(TCPAction):
+    """
+    This is used to start (or stop) sending all the frames from a camera
+    to the TCP client. The arrays will have the ID of this message.
+    """
+    def __init__(self, max_bytes = None, streams = None, **kwds):
+        super().__init__(**kwds)
+        self.camera_fn = None
+        self.max_bytes = max_bytes
+        self.streams = streams
+        self.hal_message = halMessage.HalMessage(m_type = "get functionality",
+                                                 data = {"name" : self.tcp_message.getData("camera", default = "camera1")})
+
+    def handleResponses(self, message):
+        if (message != self.hal_message):
+            return False
+
+        self.was_handled = True
+        if not message.hasResponses():
+            self.tcp_message.setError(True, "Camera '" + message.getData()["name"] + "' not found")
+        else:
+            self.camera_fn = message.getResponses()[0].getData()["functionality"]
+        return True
+
+    def sendResponse(self, server):
+        if (self.camera_fn is not None) and not self.tcp_message.isTest():
+            name = self.hal_message.getData()["name"]
+            if name in self.streams:
+                self.streams.pop(name).stop(tcp_message = self.tcp_message)
+
+            if self.tcp_message.getData("stream", default = True):
+                self.streams[name] = FrameStream(camera_fn = self.camera_fn,
+                                                 every = self.tcp_message.getData("every", default = 1),
+                                                 max_bytes = self.max_bytes,
+                                                 message_id = self.tcp_message.getID(),
+                                                 server = server)
+        super().sendResponse(server)
+
+        
 class TCPActionTakeMovie(TCPAction):
     """
     This is used to tell HAL to take a movie.
@@ -357,8 +485,22 @@ class Controller(QtCore.QObject):
     In parallel mode only the following TCP messages are handled as actions:
     1. 'Check Focus Lock'
     2. 'Find Sum'
-    3. 'Set Parameters'
-    4. 'Take Movie'
+    3. 'Get Frame'
+    4. 'Set Parameters'
+    5. 'Stream Frames'
+    6. 'Take Movie'
+
+    Queries (the 'Get ...' messages) are also always handled as actions, as
+    the response has the data. Any other message is sent to HAL and the
+    response is returned to the TCP client as soon as the message is queued.
+    The message still waits for any earlier actions, but the following actions
+    don't wait for HAL to process it, so a 'Move Stage' and the following
+    'Set Parameters' are handled by HAL at the same time.
+
+    'Get Frame' and 'Stream Frames' send camera frames to the TCP client
+    as arrays (see sc_library.tcpCommunications), these are only available
+    to clients that use the framed protocol. Frames are not streamed if
+    more than max_stream_bytes are waiting to be sent.
 
     The recommended order of TCP messages for maximum throughput in a standard 
     imaging cycle is:
@@ -368,16 +510,23 @@ class Controller(QtCore.QObject):
     4. 'Take Movie'
     In this sequence 1 and 2 can happen in parallel.
 
-    Note also the expectation that the TCP client does not send another message
-    until it gets a response to the first message.
+    The TCP client does not have to wait for a response before sending the
+    next message. Messages are queued and handled in the order that they were
+    received, and the client is sent a 'Busy' message when the number of
+    pending messages reaches max_pending (and another when it has dropped to
+    half of this).
     """
     controlAction = QtCore.pyqtSignal(object)
     controlMessage = QtCore.pyqtSignal(object)
     gotConnection = QtCore.pyqtSignal(bool)
     
-    def __init__(self, parallel_mode = None, server = None, verbose = True, **kwds):
+    def __init__(self, max_pending = 20, max_stream_bytes = 2**26, parallel_mode = None, server = None, verbose = True, **kwds):
         super().__init__(**kwds)
-        self.parallel_mode = None
+        self.busy = False
+        self.frame_streams = {}
+        self.max_pending = max_pending
+        self.max_stream_bytes = max_stream_bytes
+        self.parallel_mode = parallel_mode
         self.server = server
         self.test_directory = None
         self.test_parameters = None
@@ -397,9 +546,12 @@ class Controller(QtCore.QObject):
         tcp_action.sendResponse(self.server)
 
     def cleanUp(self):
+        self.stopStreams()
         self.server.close()
         
     def handleLostConnection(self):
+        self.busy = False
+        self.stopStreams()
         self.gotConnection.emit(False)
 
     def handleMessageReceived(self, tcp_message):
@@ -425,6 +577,17 @@ class Controller(QtCore.QObject):
             action = TCPAction(tcp_message = tcp_message)
             self.controlAction.emit(action)            
                 
+        elif tcp_message.isType("Get Frame") or tcp_message.isType("Stream Frames"):
+            if not self.server.framed:
+                tcp_message.setError(True, "Frames can only be sent with the framed protocol.")
+                self.server.sendMessage(tcp_message)
+            elif tcp_message.isType("Get Frame"):
+                self.controlAction.emit(TCPActionGetFrame(tcp_message = tcp_message))
+            else:
+                self.controlAction.emit(TCPActionStreamFrames(max_bytes = self.max_stream_bytes,
+                                                              streams = self.frame_streams,
+                                                              tcp_message = tcp_message))
+                
         elif tcp_message.isType("Set Directory"):
             warnings.warn("The 'Set Directory' message is deprecated.")
             directory = tcp_message.getData("directory")
@@ -498,7 +661,7 @@ class Controller(QtCore.QObject):
                 self.controlAction.emit(action)
 
         else:
-            if tcp_message.isTest() or (not self.parallel_mode):
+            if tcp_message.isTest() or (not self.parallel_mode) or tcp_message.getType().startswith("Get "):
                 action = TCPAction(tcp_message = tcp_message)
                 self.controlAction.emit(action)
             else:
@@ -515,8 +678,27 @@ class Controller(QtCore.QObject):
 
     def setParameters(self, parameters):
         self.test_parameters = parameters
-        
-        
+
+    def setPending(self, pending):
+        """
+        Tell the client if we are busy based on the number of pending messages.
+        """
+        if self.busy:
+            busy = (pending > int(self.max_pending/2))
+        else:
+            busy = (pending >= self.max_pending)
+
+        if (busy != self.busy) and self.server.isConnected():
+            self.busy = busy
+            self.server.sendMessage(tcpMessage.TCPMessage(message_type = "Busy",
+                                                          message_data = {"busy" : busy}))
+
+    def stopStreams(self):
+        for stream in self.frame_streams.values():
+            stream.stop()
+        self.frame_streams.clear()
+
+
 class TCPControl(halModule.HalModule):
     """
     HAL TCP control module.
@@ -524,12 +706,15 @@ class TCPControl(halModule.HalModule):
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
         self.control_action = None
+        self.control_queue = deque()
 
         configuration = module_params.get("configuration")
         server = tcpServer.TCPServer(port = configuration.get("tcp_port"),
                                      server_name = "Hal",
                                      parent = self)
-        self.control = Controller(parallel_mode = configuration.get("parallel_mode"),
+        self.control = Controller(max_pending = configuration.get("max_pending", 20),
+                                  max_stream_bytes = configuration.get("max_stream_bytes", 2**26),
+                                  parallel_mode = configuration.get("parallel_mode"),
                                   server = server,
                                   parent = self)
         self.control.controlAction.connect(self.handleControlAction)
@@ -552,24 +737,24 @@ class TCPControl(halModule.HalModule):
         self.control.actionDone(self.control_action)
         self.control_action.actionMessage.disconnect(self.sendMessage)
         self.control_action = None
+        self.startNextAction()
         
     def handleControlAction(self, action):
         #
         # Actions will persist until some condition is met, at which point
         # a response is returned to the TCP client.
         #
-        assert (self.control_action is None)
-        
-        self.control_action = action
-        self.control_action.actionMessage.connect(self.sendMessage)
-        self.sendMessage(self.control_action.getHalMessage())
+        self.control_queue.append(action)
+        self.startNextAction()
         
     def handleControlMessage(self, message):
         #
         # For messages a response is immediately returned to the TCP client
-        # even if the request is still being handled by HAL.
+        # even if the request is still being handled by HAL. These still
+        # have to wait for any earlier actions though.
         #
-        self.sendMessage(message)
+        self.control_queue.append(message)
+        self.startNextAction()
 
     def handleGotConnection(self, connected):
         if connected:
@@ -585,6 +770,7 @@ class TCPControl(halModule.HalModule):
             if self.control_action is not None:
                 self.control_action.actionMessage.disconnect(self.sendMessage)
                 self.control_action = None
+            self.control_queue.clear()
                 
             self.sendMessage(halMessage.HalMessage(m_type = "configuration",
                                                    data = {"properties" : {"connected" : False}}))
@@ -621,6 +807,21 @@ class TCPControl(halModule.HalModule):
         elif message.isType("updated parameters"):
             self.control.setParameters(message.getData()["parameters"])
 
+    def startNextAction(self):
+        """
+        Send queued messages to HAL until we get to an action, or
+        we run out of messages.
+        """
+        while (self.control_action is None) and self.control_queue:
+            item = self.control_queue.popleft()
+            if isinstance(item, TCPAction):
+                self.control_action = item
+                self.control_action.actionMessage.connect(self.sendMessage)
+                self.sendMessage(self.control_action.getHalMessage())
+            else:
+                self.sendMessage(item)
+        self.control.setPending(len(self.control_queue))
+
 
 
 #
@@ -16,6 +16,7 @@ class TestActionTCP(testActions.TestAction):
     """
     def __init__(self, test_mode = False, **kwds):
         super().__init__(**kwds)
+        self.data = []
         self.tcp_message = None
         self.test_mode = test_mode
 
@@ -26,6 +27,12 @@ class TestActionTCP(testActions.TestAction):
         """
         pass
         
+    def handleDataReceived(self, header, np_array):
+        """
+        Arrays from HAL are saved so that checkMessage() can look at them.
+        """
+        self.data.append([header, np_array])
+        
     def handleMessageReceived(self, tcp_message):
         """
         The default behavior as most actions are complete 
@@ -67,6 +74,29 @@ class FindSum(TestActionTCP):
                                                  test_mode = self.test_mode)
 
         
+class GetFrame(TestActionTCP):
+    """
+    Get the most recent frame from a camera.
+    """
+    def __init__(self, camera = "camera1", **kwds):
+        super().__init__(**kwds)
+        self.tcp_message = tcpMessage.TCPMessage(message_type = "Get Frame",
+                                                 message_data = {"camera" : camera},
+                                                 test_mode = self.test_mode)
+
+
+class GetLockTelemetry(TestActionTCP):
+    """
+    Get the recent focus lock telemetry.
+    """
+    def __init__(self, duration = None, max_points = None, **kwds):
+        super().__init__(**kwds)
+        self.tcp_message = tcpMessage.TCPMessage(message_type = "Get Lock Telemetry",
+                                                 message_data = {"duration" : duration,
+                                                                 "max_points" : max_points},
+                                                 test_mode = self.test_mode)
+
+        
 class GetMosaicSettings(TestActionTCP):
     """
     Query HAL for the current mosaic settings.
@@ -167,6 +197,19 @@ class SetProgression(TestActionTCP):
                                                  test_mode = self.test_mode)
         
         
+class StreamFrames(TestActionTCP):
+    """
+    Tell HAL to start (or stop) streaming the frames from a camera.
+    """
+    def __init__(self, camera = "camera1", every = 1, stream = True, **kwds):
+        super().__init__(**kwds)
+        self.tcp_message = tcpMessage.TCPMessage(message_type = "Stream Frames",
+                                                 message_data = {"camera" : camera,
+                                                                 "every" : every,
+                                                                 "stream" : stream},
+                                                 test_mode = self.test_mode)
+
+        
 class TakeMovie(TestActionTCP):
     """
     Tell HAL to take a movie.
@@ -151,6 +151,13 @@ class TestingTCP(Testing):
         if not done and isinstance(self.current_action, testActionsTCP.TestActionTCP):
             self.hal_client.sendMessage(self.current_action.tcp_message)
 
+    def handleDataReceived(self, header, np_array):
+        """
+        Handle an array from HAL.
+        """
+        if isinstance(self.current_action, testActionsTCP.TestActionTCP):
+            self.current_action.handleDataReceived(header, np_array)
+        
     def handleMessageReceived(self, tcp_message):
         """
         Handle a TCP (response) message from HAL.
@@ -163,6 +170,7 @@ class TestingTCP(Testing):
             self.hal_client = tcpClient.TCPClient(port = 9000,
                                                   server_name = "HAL",
                                                   verbose = False)
+            self.hal_client.dataReceived.connect(self.handleDataReceived)
             self.hal_client.messageReceived.connect(self.handleMessageReceived)
             self.hal_client.startCommunication()
 
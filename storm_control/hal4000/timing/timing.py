@@ -71,6 +71,12 @@ class Timing(halModule.HalModule):
     """
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.message_types = {"configuration",
+                              "configure1",
+                              "current parameters",
+                              "new parameters",
+                              "start film",
+                              "stop film"}
         self.also_allowed = []
         self.timing_functionality = None
 
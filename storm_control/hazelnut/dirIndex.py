@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+#
+# A persistent index of the files in a directory (and it's sub-directories).
+#
+# The index is kept in memory and saved in a SQLite database. It is updated
+# from file system events, after transfers and by scan(). scan() only lists
+# the directories whose modification time has changed so it does not have
+# to look at every file. Note that changing the contents of a file does not
+# change the modification time of it's directory, these changes are only
+# found from the file system events.
+#
+# Paths in the index are relative to the directory and use '/' as the
+# separator.
+#
+
+import collections
+import os
+import posixpath
+import sqlite3
+import stat
+import threading
+import time
+
+
+IndexEntry = collections.namedtuple("IndexEntry", ["size", "mtime", "hash"])
+
+
+def toIndexPath(path):
+    """
+    Convert a (relative) file system path to an index path.
+    """
+    return path.replace(os.sep, "/")
+
+
+class LocalDirectory(object):
+    """
+    Lists a local (or mounted) directory for DirIndex.scan().
+    """
+    def __init__(self, root, **kwds):
+        super().__init__(**kwds)
+        self.root = root
+
+    def fullPath(self, path):
+        if path:
+            return os.path.join(self.root, *path.split("/"))
+        return self.root
+
+    def getMTime(self, path):
+        return os.stat(self.fullPath(path)).st_mtime
+
+    def listDirectory(self, path):
+        """
+        Returns a list of [name, is_dir, size, mtime] for each entry.
+        """
+        entries = []
+        with os.scandir(self.fullPath(path)) as dir_iter:
+            for entry in dir_iter:
+                if entry.is_dir(follow_symlinks = False):
+                    entries.append([entry.name, True, 0, 0.0])
+                elif entry.is_file():
+                    entry_stat = entry.stat()
+                    entries.append([entry.name, False, entry_stat.st_size, entry_stat.st_mtime])
+        return entries
+
+
+class SFTPDirectory(LocalDirectory):
+    """
+    Lists a remote directory for DirIndex.scan() using a paramiko.SFTPClient,
+    there is one request per directory instead of one per file.
+    """
+    def __init__(self, sftp_client, root = ".", **kwds):
+        super().__init__(root, **kwds)
+        self.sftp_client = sftp_client
+
+    def fullPath(self, path):
+        if path:
+            return posixpath.join(self.root, path)
+        return self.root
+
+    def getMTime(self, path):
+        return self.sftp_client.stat(self.fullPath(path)).st_mtime
+
+    def listDirectory(self, path):
+        entries = []
+        for attr in self.sftp_client.listdir_attr(self.fullPath(path)):
+            if stat.S_ISDIR(attr.st_mode):
+                entries.append([attr.filename, True, 0, 0.0])
+            elif stat.S_ISREG(attr.st_mode):
+                entries.append([attr.filename, False, attr.st_size, attr.st_mtime])
+        return entries
+
+
+class DirIndex(object):
+    """
+    The index of a directory. This is used from several threads so
+    access is protected by a lock.
+    """
+    def __init__(self, filename, commit_interval = 5.0, **kwds):
+        """
+        filename - The SQLite database file.
+        commit_interval - The maximum time in seconds between saving changes.
+        """
+        super().__init__(**kwds)
+        self.commit_interval = commit_interval
+        self.dir_files = collections.defaultdict(set)
+        self.dir_subdirs = collections.defaultdict(set)
+        self.dirs = {}
+        self.files = {}
+        self.last_commit = time.time()
+        self.lock = threading.RLock()
+
+        self.db = sqlite3.connect(filename, check_same_thread = False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, hash TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime REAL)")
+
+        for [path, size, mtime, a_hash] in self.db.execute("SELECT path, size, mtime, hash FROM files"):
+            self.files[path] = IndexEntry(size, mtime, a_hash)
+            self.dir_files[posixpath.dirname(path)].add(path)
+
+        for [path, mtime] in self.db.execute("SELECT path, mtime FROM dirs"):
+            self.dirs[path] = mtime
+            if path:
+                self.dir_subdirs[posixpath.dirname(path)].add(path)
+
+    def addFile(self, path, size, mtime, a_hash = None):
+        with self.lock:
+            self.files[path] = IndexEntry(size, mtime, a_hash)
+            self.dir_files[posixpath.dirname(path)].add(path)
+            self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", (path, size, mtime, a_hash))
+            self.checkCommit()
+
+    def checkCommit(self):
+        if ((time.time() - self.last_commit) > self.commit_interval):
+            self.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+    def commit(self):
+        with self.lock:
+            self.db.commit()
+            self.last_commit = time.time()
+
+    def getFile(self, path):
+        """
+        Returns the IndexEntry for path or None if the file is not in the index.
+        """
+        with self.lock:
+            return self.files.get(path)
+
+    def getNumberFiles(self):
+        with self.lock:
+            return len(self.files)
+
+    def getPaths(self, ext = None):
+        """
+        Returns the paths of the files in the index, or only those with the
+        extension ext (case is ignored).
+        """
+        with self.lock:
+            if ext is None:
+                return list(self.files)
+            ext = ext.lower()
+            return [x for x in self.files if x.lower().endswith(ext)]
+
+    def removeDirectory(self, path):
+        """
+        Remove a directory, it's files and it's sub-directories.
+        """
+        with self.lock:
+            for subdir in list(self.dir_subdirs.pop(path, [])):
+                self.removeDirectory(subdir)
+            for a_file in list(self.dir_files.pop(path, [])):
+                self.removeFile(a_file)
+            if path in self.dirs:
+                del self.dirs[path]
+                self.db.execute("DELETE FROM dirs WHERE path = ?", (path,))
+            if path:
+                self.dir_subdirs[posixpath.dirname(path)].discard(path)
+            self.checkCommit()
+
+    def removeFile(self, path):
+        with self.lock:
+            if path in self.files:
+                del self.files[path]
+                self.dir_files[posixpath.dirname(path)].discard(path)
+                self.db.execute("DELETE FROM files WHERE path = ?", (path,))
+                self.checkCommit()
+
+    def scan(self, directory):
+        """
+        Update the index from directory (a LocalDirectory or an SFTPDirectory).
+        Only the directories whose modification time has changed are listed.
+
+        Returns the paths of the files that were added or changed.
+        """
+        changed = []
+        todo = [""]
+        with self.lock:
+            while todo:
+                path = todo.pop()
+                try:
+                    mtime = directory.getMTime(path)
+                except (IOError, OSError):
+                    continue
+
+                # Nothing was added or removed, check the sub-directories.
+                if (self.dirs.get(path) == mtime):
+                    todo.extend(self.dir_subdirs[path])
+                    continue
+
+                files = set()
+                subdirs = set()
+                for [name, is_dir, size, file_mtime] in directory.listDirectory(path):
+                    entry_path = posixpath.join(path, name)
+                    if is_dir:
+                        subdirs.add(entry_path)
+                        continue
+                    files.add(entry_path)
+                    entry = self.files.get(entry_path)
+                    if (entry is None) or (entry.size != size) or (entry.mtime != file_mtime):
+                        self.addFile(entry_path, size, file_mtime)
+                        changed.append(entry_path)
+
+                for a_file in self.dir_files[path] - files:
+                    self.removeFile(a_file)
+                for subdir in self.dir_subdirs[path] - subdirs:
+                    self.removeDirectory(subdir)
+
+                # New sub-directories are recorded without a time so that they
+                # are listed in the next scan if this one doesn't get to them.
+                for subdir in subdirs:
+                    if not subdir in self.dirs:
+                        self.setDirectory(subdir, None)
+                self.setDirectory(path, mtime)
+                todo.extend(subdirs)
+
+            self.commit()
+        return changed
+
+    def setDirectory(self, path, mtime):
+        with self.lock:
+            self.dirs[path] = mtime
+            if path:
+                self.dir_subdirs[posixpath.dirname(path)].add(path)
+            self.db.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?)", (path, mtime))
+            self.checkCommit()
+
+    def updateFile(self, path, filename):
+        """
+        Update the entry for path from filename, this removes
+        the entry if the file no longer exists.
+        """
+        try:
+            file_stat = os.stat(filename)
+        except OSError:
+            self.removeFile(path)
+            return
+        if stat.S_ISREG(file_stat.st_mode):
+            self.addFile(path, file_stat.st_size, file_stat.st_mtime)
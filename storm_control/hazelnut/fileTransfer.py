@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+#
+# Chunked file copies for Hazelnut.
+#
+# Files are copied to a '.partial' file which is renamed when the copy
+# is complete, so a copy that was interrupted can be resumed from where
+# it stopped. The data is hashed (in a separate thread) as it is copied
+# and this is checked against the hash of the destination file.
+#
+
+import collections
+import hashlib
+import os
+import queue
+import threading
+import time
+
+
+#
+# MD5 is used to detect corrupted copies, it is faster than the SHA hashes
+# and it is also supported by SFTP servers that can hash files.
+#
+chunk_size = 4 * 1024 * 1024
+hash_name = "md5"
+partial_ext = ".partial"
+
+
+class TransferException(Exception):
+    pass
+
+
+class TransferCancelled(TransferException):
+    pass
+
+
+class Hasher(threading.Thread):
+    """
+    Hashes the chunks of a file in a separate thread, so that the
+    hashing happens while the next chunk is being read and written.
+    """
+    def __init__(self, max_chunks = 4, **kwds):
+        super().__init__(**kwds)
+        self.chunks = queue.Queue(maxsize = max_chunks)
+        self.daemon = True
+        self.hash = hashlib.new(hash_name)
+        self.start()
+
+    def hexdigest(self):
+        """
+        Wait for all the chunks to be hashed and return the hash.
+        """
+        self.chunks.put(None)
+        self.join()
+        return self.hash.hexdigest()
+
+    def run(self):
+        chunk = self.chunks.get()
+        while chunk is not None:
+            self.hash.update(chunk)
+            chunk = self.chunks.get()
+
+    def update(self, chunk):
+        self.chunks.put(chunk)
+
+
+class TransferStatistics(object):
+    """
+    Keeps track of the transfers to a destination. This is updated by
+    several transfer threads so access is protected by a lock.
+    """
+    def __init__(self, window = 10.0, **kwds):
+        """
+        window - The time in seconds over which the current rate is measured.
+        """
+        super().__init__(**kwds)
+        self.lock = threading.Lock()
+        self.window = window
+        self.reset()
+
+    def addBytes(self, n_bytes):
+        with self.lock:
+            now = time.time()
+            if self.start_time is None:
+                self.start_time = now
+            self.bytes += n_bytes
+            self.recent.append([now, n_bytes])
+            while (self.recent[0][0] < (now - self.window)):
+                self.recent.popleft()
+
+    def addFailure(self):
+        with self.lock:
+            self.failed += 1
+
+    def addFile(self, n_bytes, elapsed, resumed_bytes):
+        """
+        n_bytes - The size of the file.
+        elapsed - The time in seconds that the transfer took.
+        resumed_bytes - The number of bytes that were already copied.
+        """
+        with self.lock:
+            self.busy_time += elapsed
+            self.file_bytes += n_bytes - resumed_bytes
+            self.files += 1
+            if (resumed_bytes > 0):
+                self.resumed += 1
+                self.resumed_bytes += resumed_bytes
+
+    def getStatistics(self):
+        """
+        Returns a dictionary with the statistics, rates are in bytes / second.
+
+        "bandwidth" is the average rate since the first transfer started,
+        "rate" is the average rate in the last window seconds and "throughput"
+        is the average rate of a single transfer.
+        """
+        with self.lock:
+            now = time.time()
+            stats = {"bytes" : self.bytes,
+                     "failed" : self.failed,
+                     "files" : self.files,
+                     "resumed" : self.resumed,
+                     "resumed_bytes" : self.resumed_bytes,
+                     "bandwidth" : 0.0,
+                     "rate" : 0.0,
+                     "throughput" : 0.0}
+            if self.start_time is not None:
+                elapsed = max(now - self.start_time, 1.0e-3)
+                stats["bandwidth"] = self.bytes/elapsed
+                stats["rate"] = sum(x[1] for x in self.recent if (x[0] >= (now - self.window)))/min(elapsed, self.window)
+            if (self.busy_time > 0.0):
+                stats["throughput"] = self.file_bytes/self.busy_time
+            return stats
+
+    def getSummary(self):
+        stats = self.getStatistics()
+        summary = "{0:d} files, {1:.2f} GB, {2:.1f} MB/s ({3:.1f} MB/s per file)".format(stats["files"],
+                                                                                         stats["bytes"] * 1.0e-9,
+                                                                                         stats["rate"] * 1.0e-6,
+                                                                                         stats["throughput"] * 1.0e-6)
+        if (stats["resumed"] > 0):
+            summary += ", {0:d} resumed".format(stats["resumed"])
+        if (stats["failed"] > 0):
+            summary += ", {0:d} failed".format(stats["failed"])
+        return summary
+
+    def reset(self):
+        with self.lock:
+            self.busy_time = 0.0
+            self.bytes = 0
+            self.failed = 0
+            self.file_bytes = 0
+            self.files = 0
+            self.recent = collections.deque()
+            self.resumed = 0
+            self.resumed_bytes = 0
+            self.start_time = None
+
+
+def copyData(src_fp, dest_fp, offset, callback = None, cancel = None, statistics = None):
+    """
+    Copy from src_fp to dest_fp starting at offset, dest_fp should already
+    be at offset. Returns the hash of all of src_fp.
+    """
+    size = os.fstat(src_fp.fileno()).st_size
+    hasher = Hasher()
+    try:
+        # Hash the part that was already copied.
+        remaining = offset
+        while (remaining > 0):
+            chunk = src_fp.read(min(chunk_size, remaining))
+            if not chunk:
+                raise TransferException(src_fp.name + " is smaller than the partial copy.")
+            hasher.update(chunk)
+            remaining -= len(chunk)
+
+        copied = offset
+        while True:
+            if cancel is not None and cancel.is_set():
+                raise TransferCancelled("Transfer of " + src_fp.name + " was cancelled.")
+            chunk = src_fp.read(chunk_size)
+            if not chunk:
+                break
+            dest_fp.write(chunk)
+            hasher.update(chunk)
+            copied += len(chunk)
+            if statistics is not None:
+                statistics.addBytes(len(chunk))
+            if callback is not None:
+                callback(min(int(100.0 * copied/max(size, 1)), 100))
+    finally:
+        digest = hasher.hexdigest()
+    return digest
+
+
+def copyFile(src_name, dest_name, callback = None, cancel = None, statistics = None, verify = True):
+    """
+    Copy a file to a local (or mounted) file system. Returns the hash of the file.
+
+    callback - Called with the progress (0 - 100).
+    cancel - A threading.Event, the copy stops with a TransferCancelled exception
+             when this is set. The copy will be resumed next time.
+    statistics - A TransferStatistics object.
+    verify - Check the hash of the destination file.
+    """
+    start_time = time.time()
+    partial_name = dest_name + partial_ext
+
+    dest_dir = os.path.dirname(dest_name)
+    if dest_dir and not os.path.exists(dest_dir):
+        os.makedirs(dest_dir, exist_ok = True)
+
+    offset = 0
+    if os.path.exists(partial_name):
+        offset = resumeOffset(os.stat(src_name), os.stat(partial_name))
+
+    mode = "wb"
+    if (offset > 0):
+        mode = "r+b"
+    with open(src_name, "rb") as src_fp:
+        with open(partial_name, mode) as dest_fp:
+            dest_fp.seek(offset)
+            dest_fp.truncate()
+            digest = copyData(src_fp, dest_fp, offset,
+                              callback = callback,
+                              cancel = cancel,
+                              statistics = statistics)
+
+    if verify and (hashFile(partial_name) != digest):
+        os.remove(partial_name)
+        raise TransferException("The hash of " + dest_name + " does not match " + src_name)
+
+    src_stat = os.stat(src_name)
+    os.replace(partial_name, dest_name)
+    os.utime(dest_name, (src_stat.st_atime, src_stat.st_mtime))
+
+    if statistics is not None:
+        statistics.addFile(src_stat.st_size, time.time() - start_time, offset)
+    return digest
+
+
+def hashFile(filename):
+    """
+    Returns the hash of a file.
+    """
+    hasher = Hasher()
+    try:
+        with open(filename, "rb") as fp:
+            chunk = fp.read(chunk_size)
+            while chunk:
+                hasher.update(chunk)
+                chunk = fp.read(chunk_size)
+    finally:
+        digest = hasher.hexdigest()
+    return digest
+
+
+def resumeOffset(src_stat, partial_stat):
+    """
+    Returns where to resume a copy given the stat() results of the
+    source and the partial copy. The copy starts again if the source
+    was modified after the partial copy or is smaller than it.
+
+    These can also be paramiko.SFTPAttributes.
+    """
+    if (partial_stat.st_size <= src_stat.st_size) and (partial_stat.st_mtime >= src_stat.st_mtime):
+        return partial_stat.st_size
+    return 0
+
+
+def sftpCopyFile(sftp_client, src_name, dest_name, callback = None, cancel = None, statistics = None, verify = True):
+    """
+    Copy a file using a paramiko.SFTPClient. dest_name is relative to
+    the clients current directory. Returns the hash of the file.
+
+    This works the same as copyFile(). The hash is only checked if the
+    server supports the 'check-file' extension, otherwise the size of
+    the destination file is checked.
+    """
+    start_time = time.time()
+    partial_name = dest_name + partial_ext
+    src_stat = os.stat(src_name)
+
+    offset = 0
+    try:
+        offset = resumeOffset(src_stat, sftp_client.stat(partial_name))
+    except IOError:
+        pass
+
+    mode = "wb"
+    if (offset > 0):
+        mode = "r+b"
+    with open(src_name, "rb") as src_fp:
+        with sftp_client.open(partial_name, mode) as dest_fp:
+            dest_fp.set_pipelined(True)
+            dest_fp.truncate(offset)
+            dest_fp.seek(offset)
+            digest = copyData(src_fp, dest_fp, offset,
+                              callback = callback,
+                              cancel = cancel,
+                              statistics = statistics)
+
+    if verify:
+        remote_digest = None
+        with sftp_client.open(partial_name, "rb") as fp:
+            try:
+                remote_digest = fp.check(hash_name).hex()
+            except IOError:
+                pass
+        if remote_digest is None:
+            verified = (sftp_client.stat(partial_name).st_size == src_stat.st_size)
+        else:
+            verified = (remote_digest == digest)
+        if not verified:
+            sftp_client.remove(partial_name)
+            raise TransferException("The copy of " + src_name + " to " + dest_name + " is not correct.")
+
+    # Rename, replacing the destination file if it already exists.
+    try:
+        sftp_client.posix_rename(partial_name, dest_name)
+    except IOError:
+        try:
+            sftp_client.remove(dest_name)
+        except IOError:
+            pass
+        sftp_client.rename(partial_name, dest_name)
+    sftp_client.utime(dest_name, (src_stat.st_atime, src_stat.st_mtime))
+
+    if statistics is not None:
+        statistics.addFile(src_stat.st_size, time.time() - start_time, offset)
+    return digest
@@ -10,8 +10,9 @@
 #
 
 import datetime
+import hashlib
 import os
-import shutil
+import queue
 import sys
 import time
 import watchdog
@@ -21,11 +22,18 @@ import watchdog.observers
 from PyQt5 import QtCore, QtGui, QtWidgets
 
 import destination
+import dirIndex
+import fileTransfer
 import qtdesigner.hazelnut_ui as hazelnutUi
 
 
 class DirObject(object):
-    movie_extensions = (".dax", ".inf", ".off", ".png", ".power", ".spe", ".tif", ".xml")
+
+    # These are suffixes of the movie name (the .xml file name without
+    # the extension), not file extensions, e.g. 'movie.multi.h5' or
+    # 'movie_lock.txt'.
+    movie_extensions = (".dax", ".h5", ".idx", ".inf", ".multi.h5", ".off", ".png",
+                        ".power", ".spe", ".tif", ".xml", "_lock.txt")
     """
     A class for doing several things.
     1. Source directory:
@@ -36,11 +44,21 @@ class DirObject(object):
     2. Transfer directory.
        a. Check if the file needs to be transferred.
        b. Transfer a file.
-       
+       c. Keep track of the transfer statistics.
+
+    If there is an index (a dirIndex.DirIndex) the files are found and
+    checked using the index instead of looking at every file.
     """
-    def __init__(self):
+    def __init__(self, index = None):
         self.directory = ""
         self.files = []
+        self.index = index
+        self.statistics = fileTransfer.TransferStatistics()
+
+    def cleanUp(self):
+        if self.index is not None:
+            self.index.close()
+            self.index = None
         
     def getDirectory(self):
         return self.directory
@@ -49,14 +67,17 @@ class DirObject(object):
         temp = self.files
         self.files = []
         return temp
+
+    def getStatistics(self):
+        return self.statistics
     
     
 class DirObjectFileSystem(DirObject):
     """
     Specialized for the file system protocol.
     """
-    def __init__(self, directory, local = True):
-        DirObject.__init__(self)
+    def __init__(self, directory, local = True, index = None):
+        DirObject.__init__(self, index = index)
         self.directory = directory
         self.watcher = None
 
@@ -84,15 +105,45 @@ class DirObjectFileSystem(DirObject):
                                       datetime.datetime.fromtimestamp(os.path.getmtime(fullpath_name)))
                 self.files.append(f_object)
 
+    def addIndexedFile(self, xml_path):
+        """
+        Add the files of a movie using the index.
+        """
+        basename = os.path.splitext(xml_path)[0]
+        for ext in DirObject.movie_extensions:
+            path = basename + ext
+            entry = self.index.getFile(path)
+            if entry is not None:
+                partialpath_name = os.path.join(*path.split("/"))
+                f_object = FileObject(os.path.join(self.directory, partialpath_name),
+                                      partialpath_name,
+                                      datetime.datetime.fromtimestamp(entry.mtime))
+                self.files.append(f_object)
+
     def getCurrentFiles(self):
         """
         Get all the current files in the directory (and it's sub-directories).
         """
+        if self.index is not None:
+            self.updateIndex()
+            for xml_path in self.index.getPaths(".xml"):
+                self.addIndexedFile(xml_path)
+            return
+        
         for (path_original, dirs, files) in os.walk(self.directory):
             for filename in files:
                 self.addFile(os.path.join(path_original, filename))
-                
+
+    def indexPath(self, fullpath_name):
+        return dirIndex.toIndexPath(os.path.relpath(fullpath_name, self.directory))
+    
     def shouldTransfer(self, file_object):
+        if self.index is not None:
+            entry = self.index.getFile(dirIndex.toIndexPath(file_object.getPartialPathName()))
+            if entry is None:
+                return True
+            return file_object.isNewerThan(datetime.datetime.fromtimestamp(entry.mtime))
+        
         dest_file = os.path.join(self.directory, file_object.getPartialPathName())
         if os.path.exists(dest_file):
             dest_file_time = datetime.datetime.fromtimestamp(os.path.getmtime(dest_file))
@@ -102,30 +153,45 @@ class DirObjectFileSystem(DirObject):
                 return False
         return True
         
-    def transferFile(self, file_object, callback):
+    def transferFile(self, file_object, callback, cancel = None):
         """
         The callback function expects an integer in the range 0-100 that
-        indicates the current progress of the transfer.
+        indicates the current progress of the transfer. The transfer stops
+        if cancel (a threading.Event) is set.
         """
         dest_file = os.path.join(self.directory, file_object.getPartialPathName())
+        digest = fileTransfer.copyFile(file_object.getFullPathName(),
+                                       dest_file,
+                                       callback = callback,
+                                       cancel = cancel,
+                                       statistics = self.statistics)
+        if self.index is not None:
+            dest_stat = os.stat(dest_file)
+            self.index.addFile(dirIndex.toIndexPath(file_object.getPartialPathName()),
+                               dest_stat.st_size,
+                               dest_stat.st_mtime,
+                               digest)
+
+    def updateIndex(self):
+        """
+        Update the index with the changes since it was last updated.
+        """
+        self.index.scan(dirIndex.LocalDirectory(self.directory))
 
-        # For GUI testing.
-        if True:
-            for i in range(10):
-                callback(10 * i)
-                time.sleep(0.1)
+    def updateIndexFile(self, fullpath_name, is_directory = False):
+        """
+        Update the index from a file system event.
+        """
+        if self.index is None:
             return
 
-        # Make a directory if necessary first.
-        #
-        # FIXME: Limited to a single level?
-        #
-        dest_dir = os.path.dirname(dest_file)
-        if not os.path.exists(dest_dir):
-            os.makedirs(dest_dir)
-
-        # Copy the file.
-        shutil.copyfile(file_object.getFullPathName(), dest_file)
+        # New directories are found by the next scan.
+        path = self.indexPath(fullpath_name)
+        if is_directory:
+            if not os.path.exists(fullpath_name):
+                self.index.removeDirectory(path)
+        else:
+            self.index.updateFile(path, fullpath_name)
         
     def watchDirectory(self, start):
 
@@ -146,11 +212,17 @@ class DirObjectSFTP(DirObject):
     """
     Specialized for a SFTP protocol.
     """
-    def __init__(self, sftp_transport, destination_directory):
-        DirObject.__init__(self)
+    def __init__(self, sftp_transport, destination_directory, index = None):
+        DirObject.__init__(self, index = index)
+        self.directory = destination_directory
         self.sftp_transport = sftp_transport
         self.sftp_client = self.sftp_transport.open_sftp_client()
 
+        # SFTP clients (channels) that are not being used. Each transfer
+        # thread takes one while it is running, so there are never more
+        # clients than the maximum number of transfers at the same time.
+        self.client_pool = queue.Queue()
+
         # Check that the destination directory exists.
         try:
             sftp_attr = self.sftp_client.chdir(destination_directory)
@@ -161,27 +233,82 @@ class DirObjectSFTP(DirObject):
             msg_box.setIcon(QtWidgets.QMessageBox.Critical)
             msg_box.exec_()
             self.sftp_client = None
+        else:
+            self.client_pool.put(self.sftp_client)
+
+    def cleanUp(self):
+        DirObject.cleanUp(self)
+        while not self.client_pool.empty():
+            self.client_pool.get().close()
+
+    def getSFTPClient(self):
+        """
+        Returns an SFTP client from the pool, opening a new one if they are
+        all in use. It should be returned with releaseSFTPClient().
+        """
+        assert (self.sftp_client is not None)
+
+        try:
+            return self.client_pool.get_nowait()
+        except queue.Empty:
+            sftp_client = self.sftp_transport.open_sftp_client()
+            sftp_client.chdir(self.directory)
+            return sftp_client
+
+    def releaseSFTPClient(self, sftp_client):
+        self.client_pool.put(sftp_client)
             
     def shouldTransfer(self, file_object):
-        try:
-            sftp_attr = self.sftp_client.stat(file_object.getPartialPathName())
-        except IOError:
-            return True
+        if self.index is not None:
+            entry = self.index.getFile(dirIndex.toIndexPath(file_object.getPartialPathName()))
+            if entry is None:
+                return True
+            dest_mtime = entry.mtime
+        else:
+            sftp_client = self.getSFTPClient()
+            try:
+                dest_mtime = sftp_client.stat(file_object.getPartialPathName()).st_mtime
+            except IOError:
+                return True
+            finally:
+                self.releaseSFTPClient(sftp_client)
 
-        print(sftp_attr)
-        dest_file_time = datetime.datetime.fromtimestamp(sftp_attr.st_mtime)
-        if file_object.isNewerThan(dest_file_time):
+        # SFTP file times are in seconds.
+        dest_file_time = datetime.datetime.fromtimestamp(dest_mtime)
+        if (file_object.getMTime().replace(microsecond = 0) > dest_file_time):
             return True
         else:
             return False
         
-    def transferFile(self, file_object, callback):
-        assert (self.sftp_client is not None)
-        
-        sftp_callback = lambda bytes_trans, bytes_total : callback(int(100.0 * bytes_trans/bytes_total))
-        self.sftp_client.put(file_object.getFullPathName(),
-                             file_object.getPartialPathName(),
-                             callback = sftp_callback)
+    def transferFile(self, file_object, callback, cancel = None):
+        sftp_client = self.getSFTPClient()
+        try:
+            digest = fileTransfer.sftpCopyFile(sftp_client,
+                                               file_object.getFullPathName(),
+                                               file_object.getPartialPathName(),
+                                               callback = callback,
+                                               cancel = cancel,
+                                               statistics = self.statistics)
+        finally:
+            self.releaseSFTPClient(sftp_client)
+        if self.index is not None:
+            src_stat = os.stat(file_object.getFullPathName())
+            self.index.addFile(dirIndex.toIndexPath(file_object.getPartialPathName()),
+                               src_stat.st_size,
+                               int(src_stat.st_mtime),
+                               digest)
+
+    def updateIndex(self):
+        """
+        Update the index from the listings of the directories that have changed.
+        """
+        if self.sftp_client is None:
+            return
+        sftp_client = self.getSFTPClient()
+        try:
+            self.index.scan(dirIndex.SFTPDirectory(sftp_client))
+        finally:
+            self.releaseSFTPClient(sftp_client)
 
         
 class FileObject(object):
@@ -219,8 +346,21 @@ class FileSystemWatcher(watchdog.events.FileSystemEventHandler):
         self.dir_object = dir_object
         
     def on_created(self, event):
+        self.dir_object.updateIndexFile(event.src_path, event.is_directory)
         self.dir_object.addFile(event.src_path)
 
+    def on_deleted(self, event):
+        self.dir_object.updateIndexFile(event.src_path, event.is_directory)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.dir_object.updateIndexFile(event.src_path)
+
+    def on_moved(self, event):
+        self.dir_object.updateIndexFile(event.src_path, event.is_directory)
+        self.dir_object.updateIndexFile(event.dest_path, event.is_directory)
+        self.dir_object.addFile(event.dest_path)
+
 
 class Window(QtWidgets.QMainWindow):
 
@@ -241,6 +381,8 @@ class Window(QtWidgets.QMainWindow):
         # Load settings
         self.resize(self.settings.value("MainWindow/Size", self.size()))
         self.move(self.settings.value("MainWindow/Position", self.pos()))
+        self.ui.threadsSpinBox.setValue(int(self.settings.value("Transfer/Threads", self.ui.threadsSpinBox.value())))
+        self.ui.transferQueueMVC.setMaxThreads(self.ui.threadsSpinBox.value())
 
         # Connect signals.
         self.ui.actionDestination.triggered.connect(self.handleDestination)
@@ -248,6 +390,7 @@ class Window(QtWidgets.QMainWindow):
         self.ui.actionSource.triggered.connect(self.handleSource)
 
         self.ui.startPushButton.pressed.connect(self.handleStartButton)
+        self.ui.threadsSpinBox.valueChanged.connect(self.ui.transferQueueMVC.setMaxThreads)
 
         self.ui.transferQueueMVC.transferStarted.connect(self.handleStarted)
         self.ui.transferQueueMVC.transferStopped.connect(self.handleStopped)
@@ -259,23 +402,45 @@ class Window(QtWidgets.QMainWindow):
     def closeEvent(self, event):
         if self.source_dir_obj is not None:
             self.source_dir_obj.watchDirectory(False)
+
+        # Transfers that are stopped now will resume next time.
+        self.ui.transferQueueMVC.cleanUp()
+
+        for dir_obj in [self.source_dir_obj, self.destination_dir_obj]:
+            if dir_obj is not None:
+                dir_obj.cleanUp()
             
         self.settings.setValue("MainWindow/Size", self.size())
         self.settings.setValue("MainWindow/Position", self.pos())
+        self.settings.setValue("Transfer/Threads", self.ui.threadsSpinBox.value())
 
     def handleDestination(self, boolean):
         dest = self.dhandler.getDestination()
         if dest is not None:
+            if self.destination_dir_obj is not None:
+                self.destination_dir_obj.cleanUp()
             if (dest[0] == "file"):
-                self.destination_dir_obj = DirObjectFileSystem(dest[1], local = False)
+                self.destination_dir_obj = DirObjectFileSystem(dest[1],
+                                                               local = False,
+                                                               index = self.openIndex("file:" + dest[1]))
                 self.ui.destinationLabel.setText(dest[1])
             if (dest[0] == "sftp"):
-                self.destination_dir_obj = DirObjectSFTP(dest[1], dest[2])
+                address = dest[1].getpeername()[0]
+                self.destination_dir_obj = DirObjectSFTP(dest[1],
+                                                         dest[2],
+                                                         index = self.openIndex("sftp:" + address + ":" + dest[2]))
                 self.ui.destinationLabel.setText(str(dest[2]))
+            self.ui.statusbar.showMessage("Updating the destination index..")
+            self.destination_dir_obj.updateIndex()
             self.ui.transferQueueMVC.addDestination(self.destination_dir_obj)
             if self.source_dir_obj is not None:
                 self.ui.startPushButton.setEnabled(True)
 
+                # Only queue the files that this destination needs.
+                self.ui.transferQueueMVC.clearFileObjects()
+                self.source_dir_obj.getCurrentFiles()
+                self.handleUpdateTimer()
+
     def handleQuit(self, boolean):
         self.close()
 
@@ -303,8 +468,11 @@ class Window(QtWidgets.QMainWindow):
             # Stop old directory watcher.
             if self.source_dir_obj is not None:
                 self.source_dir_obj.watchDirectory(False)
-            
-            self.source_dir_obj = DirObjectFileSystem(new_directory)
+                self.source_dir_obj.cleanUp()
+
+            self.ui.statusbar.showMessage("Updating the source index..")
+            self.source_dir_obj = DirObjectFileSystem(new_directory,
+                                                      index = self.openIndex("source:" + new_directory))
             self.source_dir_obj.getCurrentFiles()
             self.ui.sourceLabel.setText(new_directory)
             self.ui.transferQueueMVC.clearFileObjects()
@@ -322,8 +490,22 @@ class Window(QtWidgets.QMainWindow):
         self.ui.actionSource.setEnabled(True)
 
     def handleUpdateTimer(self):
-        for src_file in self.source_dir_obj.getFiles():
-            self.ui.transferQueueMVC.addFileObject(src_file)        
+        src_files = self.source_dir_obj.getFiles()
+        if self.destination_dir_obj is not None:
+            src_files = list(filter(self.destination_dir_obj.shouldTransfer, src_files))
+        self.ui.transferQueueMVC.addFileObjects(src_files)
+
+        if self.destination_dir_obj is not None:
+            self.ui.statusbar.showMessage(self.destination_dir_obj.getStatistics().getSummary())
+
+    def openIndex(self, name):
+        """
+        Returns the index for a source or destination directory.
+        """
+        index_dir = QtCore.QStandardPaths.writableLocation(QtCore.QStandardPaths.AppLocalDataLocation)
+        os.makedirs(index_dir, exist_ok = True)
+        filename = "index_" + hashlib.md5(name.encode()).hexdigest() + ".db"
+        return dirIndex.DirIndex(os.path.join(index_dir, filename))
 
         
 if (__name__ == '__main__'):
@@ -51,6 +51,15 @@ class Ui_MainWindow(object):
         self.destinationLabel = QtWidgets.QLabel(self.destinationGroupBox)
         self.destinationLabel.setObjectName("destinationLabel")
         self.gridLayout_3.addWidget(self.destinationLabel, 0, 0, 1, 1)
+        self.threadsLabel = QtWidgets.QLabel(self.destinationGroupBox)
+        self.threadsLabel.setObjectName("threadsLabel")
+        self.gridLayout_3.addWidget(self.threadsLabel, 0, 1, 1, 1)
+        self.threadsSpinBox = QtWidgets.QSpinBox(self.destinationGroupBox)
+        self.threadsSpinBox.setMinimum(1)
+        self.threadsSpinBox.setMaximum(16)
+        self.threadsSpinBox.setProperty("value", 4)
+        self.threadsSpinBox.setObjectName("threadsSpinBox")
+        self.gridLayout_3.addWidget(self.threadsSpinBox, 0, 2, 1, 1)
         self.startPushButton = QtWidgets.QPushButton(self.destinationGroupBox)
         sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Maximum, QtWidgets.QSizePolicy.Preferred)
         sizePolicy.setHorizontalStretch(0)
@@ -59,7 +68,7 @@ class Ui_MainWindow(object):
         self.startPushButton.setSizePolicy(sizePolicy)
         self.startPushButton.setMinimumSize(QtCore.QSize(100, 0))
         self.startPushButton.setObjectName("startPushButton")
-        self.gridLayout_3.addWidget(self.startPushButton, 0, 1, 1, 1)
+        self.gridLayout_3.addWidget(self.startPushButton, 0, 3, 1, 1)
         self.horizontalLayout.addWidget(self.destinationGroupBox)
         self.verticalLayout.addLayout(self.horizontalLayout)
         MainWindow.setCentralWidget(self.centralwidget)
@@ -97,6 +106,7 @@ class Ui_MainWindow(object):
         self.transferGroupBox.setTitle(_translate("MainWindow", "Transfer Queue"))
         self.destinationGroupBox.setTitle(_translate("MainWindow", "Destination"))
         self.destinationLabel.setText(_translate("MainWindow", "NA"))
+        self.threadsLabel.setText(_translate("MainWindow", "Threads"))
         self.startPushButton.setText(_translate("MainWindow", "Start"))
         self.menuFile.setTitle(_translate("MainWindow", "File"))
         self.actionSource_directory.setText(_translate("MainWindow", "Source directory"))
@@ -5,6 +5,7 @@
 # Hazen 08/16
 #
 
+import threading
 import time
 
 from PyQt5 import QtCore, QtGui, QtWidgets
@@ -68,15 +69,20 @@ class TransferQueueListViewDelegate(QtWidgets.QStyledItemDelegate):
         #style = option.widget.style()
         #style.drawControl(QtGui.QStyle.CE_ItemViewItem, option, painter, option.widget)
 
-        # Draw text.
+        # Draw text, files that could not be transferred are shown in red.
         color = QtGui.QColor(0,0,0)
+        if (tq_item.getStatus() == "failed"):
+            color = QtGui.QColor(200,0,0)
         painter.setPen(color)
         painter.setBrush(color)
 
         text_rect = QtCore.QRect(item_rect)
         text_rect.setTop(text_rect.top() + 2)
         painter.drawText(text_rect, QtCore.Qt.AlignLeft, " " + fo_object.getPartialPathName())
-        painter.drawText(text_rect, QtCore.Qt.AlignRight, fo_object.getMTime().strftime("%c") + " ")
+        if (tq_item.getStatus() == "failed"):
+            painter.drawText(text_rect, QtCore.Qt.AlignRight, tq_item.getError() + " ")
+        else:
+            painter.drawText(text_rect, QtCore.Qt.AlignRight, fo_object.getMTime().strftime("%c") + " ")
 
     def sizeHint(self, option, index):
         result = QtWidgets.QStyledItemDelegate.sizeHint(self, option, index)
@@ -100,19 +106,37 @@ class TransferQueueStandardItem(QtGui.QStandardItem):
     """
     def __init__(self, file_object):
         QtGui.QStandardItem.__init__(self, file_object.__str__())
+        self.error = ""
         self.file_object = file_object
         self.progress = 0
+        self.retries = 0
         self.status = "queued"
 
+    def getError(self):
+        return self.error
+
     def getFileObject(self):
         return self.file_object
 
     def getProgress(self):
         return self.progress
+
+    def getRetries(self):
+        return self.retries
     
     def getStatus(self):
         return self.status
 
+    def incRetries(self):
+        self.retries += 1
+
+    def setError(self, error):
+        """
+        Record why the last transfer failed, this is also the tool tip.
+        """
+        self.error = error
+        self.setToolTip(error)
+
     def setProgress(self, progress):
         self.progress = progress
         self.emitDataChanged()
@@ -134,10 +158,15 @@ class TransferQueueMVC(QtWidgets.QListView):
     
     """
     Encapsulates a list view specialized for the transfer file queue and it's associated model.
+
+    Up to max_threads files are transferred at the same time. A file whose
+    transfer failed goes back in the queue (the transfer will resume where
+    it stopped) until it has failed max_retries times.
     """
     def __init__(self, parent = None):
         QtWidgets.QListView.__init__(self, parent)
         self.destination_dir_obj = None
+        self.max_retries = 3
         self.max_threads = 1
         self.running_threads = []
         self.tr_timer = QtCore.QTimer(self)
@@ -161,13 +190,29 @@ class TransferQueueMVC(QtWidgets.QListView):
         self.destination_dir_obj = dir_obj
         
     def addFileObject(self, file_object):
-        q_item = TransferQueueStandardItem(file_object)
-        self.tq_model.appendRow(q_item)
+        self.addFileObjects([file_object])
+
+    def addFileObjects(self, file_objects):
+        """
+        Add several files, the queue is only sorted once.
+        """
+        if not file_objects:
+            return
+        for file_object in file_objects:
+            self.tq_model.appendRow(TransferQueueStandardItem(file_object))
         self.tq_proxy_model.sort(0)
 
     def amTransferring(self):
         return self.tr_timer.isActive()
     
+    def cleanUp(self):
+        """
+        Stop the transfer and wait for the transfer threads to finish.
+        """
+        self.stopTransfer()
+        for tr_thread in self.running_threads:
+            tr_thread.wait()
+
     def clearFileObjects(self):
         self.tq_model.clear()
 
@@ -177,12 +222,15 @@ class TransferQueueMVC(QtWidgets.QListView):
         Files at the top of the queue go first.
         """
         tr_max = self.max_threads - len(self.running_threads)
-        if (tr_max > self.tq_model.rowCount()):
-            tr_max = self.tq_model.rowCount()
-        for i in range(tr_max):
+        for i in range(self.tq_proxy_model.rowCount()):
+            if (tr_max <= 0):
+                break
             proxy_index = self.tq_proxy_model.index(i, 0)
             source_index = self.tq_proxy_model.mapToSource(proxy_index)
             source_item = self.tq_model.itemFromIndex(source_index)
+            if (source_item.getStatus() != "queued"):
+                continue
+            tr_max -= 1
             source_item.setStatus("in_transfer")
             tr_thread = TransferThread(self.destination_dir_obj, source_item)
             tr_thread.transferComplete.connect(self.handleTransferComplete)
@@ -192,12 +240,26 @@ class TransferQueueMVC(QtWidgets.QListView):
 
     def handleTransferComplete(self, tr_thread):
         tq_item = tr_thread.getTQItem()
-        
-        # Remove this from the list of items in the transfer queue.
-        source_index = self.tq_model.indexFromItem(tq_item)
-        self.tq_model.removeRow(source_index.row())
 
-        # Throw away this thread.
+        # If the transfer failed put this back in the queue, unless we
+        # have already tried too many times.
+        if tr_thread.getError() is not None:
+            if not tr_thread.wasCancelled():
+                tq_item.setError(str(tr_thread.getError()))
+                tq_item.incRetries()
+            if (tq_item.getRetries() < self.max_retries):
+                tq_item.setStatus("queued")
+            else:
+                tq_item.setStatus("failed")
+
+        # Otherwise remove this from the list of items in the transfer queue.
+        else:
+            source_index = self.tq_model.indexFromItem(tq_item)
+            self.tq_model.removeRow(source_index.row())
+
+        # Throw away this thread, this was the last thing it did but
+        # it has to finish before it can be deleted.
+        tr_thread.wait()
         tr_thread.transferComplete.disconnect()
         tr_thread.transferProgress.disconnect()
         self.running_threads.remove(tr_thread)
@@ -218,7 +280,13 @@ class TransferQueueMVC(QtWidgets.QListView):
         self.transferStarted.emit()
 
     def stopTransfer(self):
+        """
+        Stop the transfer, the files that are being transferred
+        will be resumed when the transfer is started again.
+        """
         self.tr_timer.stop()
+        for tr_thread in self.running_threads:
+            tr_thread.cancel()
         if (len(self.running_threads) == 0):
             self.transferStopped.emit()
 
@@ -232,16 +300,32 @@ class TransferThread(QtCore.QThread):
 
     def __init__(self, dir_object, tq_item):
         QtCore.QThread.__init__(self)
+        self.cancel_event = threading.Event()
         self.dir_object = dir_object
+        self.error = None
         self.tq_item = tq_item
 
+    def cancel(self):
+        self.cancel_event.set()
+
+    def getError(self):
+        return self.error
+    
     def getTQItem(self):
         return self.tq_item
-    
+
     def run(self):
         file_object = self.tq_item.getFileObject()
-        if self.dir_object.shouldTransfer(file_object):
-            callback = lambda x: self.transferProgress.emit(self.tq_item, x)
-            self.dir_object.transferFile(file_object, callback)
+        try:
+            if self.dir_object.shouldTransfer(file_object):
+                callback = lambda x: self.transferProgress.emit(self.tq_item, x)
+                self.dir_object.transferFile(file_object, callback, cancel = self.cancel_event)
+        except Exception as e:
+            self.error = e
+            if not self.wasCancelled():
+                self.dir_object.getStatistics().addFailure()
         self.transferComplete.emit(self)
 
+    def wasCancelled(self):
+        return self.cancel_event.is_set()
+
@@ -341,7 +341,7 @@ class TCPMoveHandler(QtCore.QObject):
 
         # Add this object as a tag on the message so that it won't get deleted
         # by the garbage collector.
-        self.hal_message.tcp_move_handler = self
+        self.hal_message.keep_alive = self
 
     def handleIsMoving(self, is_moving):
         #
@@ -354,7 +354,7 @@ class TCPMoveHandler(QtCore.QObject):
 
             # Delete the reference to this object so that it will get deleted
             # by the garbage collector.
-            self.hal_message.tcp_move_handler = None
+            self.hal_message.keep_alive = None
 
     def handleWatchdogTimer(self):
         print("> stage move request timed out")
@@ -367,5 +367,5 @@ class TCPMoveHandler(QtCore.QObject):
 
         # Delete the reference to this object so that it will get deleted
         # by the garbage collector.
-        self.hal_message.tcp_move_handler = None
+        self.hal_message.keep_alive = None
         
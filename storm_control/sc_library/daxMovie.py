@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+"""
+Memory mapped access to .dax movies, as well as reading and
+writing of the associated .inf and .idx files.
+
+The .idx file is optional. It is a numpy (.npy format) array
+with one INDEX_DTYPE record per frame. Values that were not
+available when the movie was taken are NaN.
+
+This is used both by HAL (to write movies) and by Steve (to
+read them). It can also be used to read a movie that is still
+being recorded, see DaxMovie.refresh().
+"""
+
+import numpy
+import os
+import re
+
+
+INDEX_DTYPE = numpy.dtype([("frame", "<i8"),
+                           ("timestamp", "<f8"),
+                           ("stage_x", "<f8"),
+                           ("stage_y", "<f8"),
+                           ("lock_offset", "<f8")])
+
+
+class DaxMovieException(Exception):
+    pass
+
+
+def indexFilename(dax_filename):
+    return os.path.splitext(dax_filename)[0] + ".idx"
+
+
+def infFilename(dax_filename):
+    return os.path.splitext(dax_filename)[0] + ".inf"
+
+
+def loadIndex(idx_filename):
+    """
+    Returns the index as a numpy array of type INDEX_DTYPE.
+    """
+    with open(idx_filename, "rb") as fp:
+        index = numpy.load(fp)
+    if (index.dtype != INDEX_DTYPE):
+        raise DaxMovieException(idx_filename + " is not an index file.")
+    return index
+
+
+def readInf(inf_filename):
+    """
+    Returns a dictionary with the 'image_x', 'image_y', 'number_frames'
+    and 'big_endian' values from an .inf file.
+    """
+    size_re = re.compile(r'frame dimensions = ([\d]+) x ([\d]+)')
+    length_re = re.compile(r'number of frames = ([\d]+)')
+    endian_re = re.compile(r' (big|little) endian')
+
+    info = {"big_endian" : False,
+            "image_x" : None,
+            "image_y" : None,
+            "number_frames" : None}
+    with open(inf_filename) as fp:
+        for line in fp:
+            m = size_re.match(line)
+            if m:
+                info["image_x"] = int(m.group(1))
+                info["image_y"] = int(m.group(2))
+
+            m = length_re.match(line)
+            if m:
+                info["number_frames"] = int(m.group(1))
+
+            m = endian_re.search(line)
+            if m:
+                info["big_endian"] = (m.group(1) == "big")
+
+    if info["image_x"] is None:
+        raise DaxMovieException("Could not determine image size from " + inf_filename)
+    return info
+
+
+def saveIndex(idx_filename, index):
+    """
+    Save an index (a numpy array of type INDEX_DTYPE).
+    """
+    with open(idx_filename, "wb") as fp:
+        numpy.save(fp, numpy.asarray(index, dtype = INDEX_DTYPE))
+
+
+def writeInf(inf_filename, image_x, image_y, number_frames):
+    """
+    Write a very simple .inf file. All the metadata is stored in
+    the .xml file that HAL saves with each recording.
+    """
+    w = str(image_x)
+    h = str(image_y)
+    with open(inf_filename, "w") as inf_fp:
+        inf_fp.write("binning = 1 x 1\n")
+        inf_fp.write("data type = 16 bit integers (binary, little endian)\n")
+        inf_fp.write("frame dimensions = " + w + " x " + h + "\n")
+        inf_fp.write("number of frames = " + str(number_frames) + "\n")
+        inf_fp.write("x_start = 1\n")
+        inf_fp.write("x_end = " + w + "\n")
+        inf_fp.write("y_start = 1\n")
+        inf_fp.write("y_end = " + h + "\n")
+
+
+class DaxMovie(object):
+    """
+    A memory mapped (read only) .dax movie.
+
+    Frames are returned as views into the memory map, so no data
+    is read until it is actually used. Use numpy.array() to get a
+    copy if you need to modify the data or close the movie.
+    """
+    def __init__(self, filename, image_x = None, image_y = None, big_endian = False, **kwds):
+        """
+        filename - The name of the .dax file.
+        image_x, image_y - The frame size. These only need to be specified
+                           if there is no .inf file (yet).
+        big_endian - The byte order, if there is no .inf file.
+        """
+        super().__init__(**kwds)
+        self.filename = filename
+        self.index = None
+        self.movie = None
+        self.number_frames = 0
+
+        # Get the movie size from the .inf file, if it exists.
+        self.inf_frames = None
+        if os.path.exists(infFilename(filename)):
+            info = readInf(infFilename(filename))
+            image_x = info["image_x"]
+            image_y = info["image_y"]
+            big_endian = info["big_endian"]
+            self.inf_frames = info["number_frames"]
+
+        if (image_x is None) or (image_y is None):
+            raise DaxMovieException("No .inf file and no image size for " + filename)
+
+        self.image_x = image_x
+        self.image_y = image_y
+        if big_endian:
+            self.dtype = numpy.dtype(">u2")
+        else:
+            self.dtype = numpy.dtype("<u2")
+
+        # Load the index, if it exists.
+        if os.path.exists(indexFilename(filename)):
+            self.index = loadIndex(indexFilename(filename))
+
+        self.refresh()
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, value, traceback):
+        self.close()
+
+    def __getitem__(self, key):
+        """
+        Index / slice the movie as a (frames, image_y, image_x) array.
+        """
+        return self.movie[key]
+
+    def __len__(self):
+        return self.number_frames
+
+    def close(self):
+        self.movie = None
+
+    def filmSize(self):
+        return [self.image_x, self.image_y, self.number_frames]
+
+    def frame(self, frame_number):
+        """
+        Returns a (image_y, image_x) view of a frame.
+        """
+        if (frame_number < 0) or (frame_number >= self.number_frames):
+            raise DaxMovieException("Frame " + str(frame_number) + " is out of range, " + str(self.number_frames) + " frames.")
+        return self.movie[frame_number]
+
+    def frameBytes(self):
+        return 2 * self.image_x * self.image_y
+
+    def getIndex(self):
+        """
+        Returns the index (an array of type INDEX_DTYPE), or None.
+        """
+        return self.index
+
+    def refresh(self):
+        """
+        (Re)create the memory map. This can be used to pick up new
+        frames if the movie is still being written.
+        """
+        n_frames = int(os.path.getsize(self.filename)/self.frameBytes())
+        if self.inf_frames is not None:
+            n_frames = min(n_frames, self.inf_frames)
+
+        if (n_frames == 0):
+            self.movie = numpy.zeros((0, self.image_y, self.image_x), dtype = self.dtype)
+        else:
+            self.movie = numpy.memmap(self.filename,
+                                      dtype = self.dtype,
+                                      mode = "r",
+                                      shape = (n_frames, self.image_y, self.image_x))
+        self.number_frames = n_frames
+        return self.number_frames
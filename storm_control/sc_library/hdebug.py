@@ -5,15 +5,33 @@ Debugging decorators & logging.
 Hazen 01/14
 """
 
+import atexit
 import functools
 import logging
 import logging.handlers
+import struct
+import time
 
 from PyQt5 import QtCore
 
 a_logger = False
 logging_mutex = QtCore.QMutex()
 
+#
+# Events (such as HAL messages being queued, sent, handled, etc.) are
+# logged in a binary format as there can be a lot of them. The events
+# file is a series of records, each of which starts with a record type
+# byte. Strings (event names, module names, message types) are stored
+# once in a string record and then referred to by their index.
+#
+EVENT_RECORD = struct.Struct("<BdqHHH") # type, time, id, event, source, m_type.
+STRING_RECORD = struct.Struct("<BHH")   # type, index, length.
+
+event_fp = None
+event_filename = None
+event_mutex = QtCore.QMutex()
+event_strings = {}
+
 def objectToString(a_object, a_name, a_attrs):
     a_string = "<" + a_name
     for a_attr in a_attrs:
@@ -54,6 +72,36 @@ def debug(fn):
         return temp
     return __wrapper
 
+def closeEventLog():
+    """
+    Close the events file, this is called automatically at exit.
+    """
+    global event_fp, event_mutex, event_strings
+    event_mutex.lock()
+    if event_fp is not None:
+        event_fp.close()
+        event_fp = None
+    event_strings = {}
+    event_mutex.unlock()
+
+atexit.register(closeEventLog)
+
+def eventStringIndex(a_string):
+    """
+    Returns the index of a string in the events file, writing a string
+    record if this string has not been seen before.
+    """
+    global event_fp, event_strings
+    try:
+        return event_strings[a_string]
+    except KeyError:
+        index = len(event_strings)
+        data = a_string.encode()
+        event_fp.write(STRING_RECORD.pack(0, index, len(data)))
+        event_fp.write(data)
+        event_strings[a_string] = index
+        return index
+
 def getDebug():
     """
     Return True/False if debugging information desired.
@@ -64,6 +112,32 @@ def getDebug():
     else:
         return False
 
+def logEvent(event, e_id, source, m_type):
+    """
+    Log an event. This is a no-op if logging has not been started.
+
+    event - The event name, for example 'queued'.
+    e_id - The (integer) ID of the object, for example the message ID.
+    source - The source of the event.
+    m_type - The type of the object.
+    """
+    global event_filename, event_fp, event_mutex
+    if event_filename is None:
+        return
+    
+    event_mutex.lock()
+    try:
+        if event_fp is None:
+            event_fp = open(event_filename, "wb")
+        event_fp.write(EVENT_RECORD.pack(1,
+                                         time.time(),
+                                         e_id,
+                                         eventStringIndex(event),
+                                         eventStringIndex(source),
+                                         eventStringIndex(m_type)))
+    finally:
+        event_mutex.unlock()
+
 def logText(a_string, to_console = False):
     """
     Note: Calling this with to_console = True from a thread that is not
@@ -80,6 +154,28 @@ def logText(a_string, to_console = False):
     else:
         print(a_string)
 
+def readEvents(filename):
+    """
+    Generator that returns the events in an events file as
+    (time, event, id, source, m_type) tuples.
+    """
+    strings = {}
+    with open(filename, "rb") as fp:
+        while True:
+            r_type = fp.read(1)
+            if (len(r_type) == 0):
+                break
+
+            if (r_type == b"\x00"):
+                [r_type, index, length] = STRING_RECORD.unpack(r_type + fp.read(STRING_RECORD.size - 1))
+                strings[index] = fp.read(length).decode()
+            else:
+                data = fp.read(EVENT_RECORD.size - 1)
+                if (len(data) != (EVENT_RECORD.size - 1)):
+                    break
+                [r_type, e_time, e_id, event, source, m_type] = EVENT_RECORD.unpack(r_type + data)
+                yield (e_time, strings[event], e_id, strings[source], strings[m_type])
+
 def startLogging(directory, program_name):
     """
     This should only be called once in "main". It uses QSettings() to generate
@@ -89,7 +185,7 @@ def startLogging(directory, program_name):
     FIXME? As this seems to just append to existing log files, it would probably
            be better to delete the existing files first.
     """
-    global a_logger
+    global a_logger, event_filename
 
     # Get logger index (to allow logging from several programs with the same name).
     settings = QtCore.QSettings("Zhuang Lab", "hdebug logger")
@@ -120,6 +216,11 @@ def startLogging(directory, program_name):
     if a_logger:
         rf_handler.setFormatter(rt_formatter)
         a_logger.addHandler(rf_handler)
+
+    # Events go into a separate (binary) file, this is opened
+    # when the first event is logged.
+    closeEventLog()
+    event_filename = directory + program_name + "_" + str(index) + ".events"
         
 
 #
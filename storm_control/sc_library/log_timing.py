@@ -1,13 +1,16 @@
 #!/usr/bin/env python
 """
-This parses a log file series (i.e. log, log.1, log.2, etc..) and
-outputs timing and call frequency information for HAL messages.
+This parses a log file series (i.e. log, log.1, log.2, etc..), or
+the binary events file, and outputs timing and call frequency
+information for HAL messages.
 
 Hazen 5/18
 """
 from datetime import datetime
 import os
 
+import storm_control.sc_library.hdebug as hdebug
+
 
 pattern = '%Y-%m-%d %H:%M:%S,%f'
 
@@ -93,6 +96,8 @@ class Message(object):
         return (self.processing_time != None)
 
     def parseTime(self, time):
+        if isinstance(time, float):
+            return datetime.fromtimestamp(time)
         return datetime.strptime(time, pattern)
 
     def processed(self, time):
@@ -153,6 +158,45 @@ def groupByX(grp_fn, messages):
     return m_grp
         
 
+def eventTiming(filename):
+    """
+    Returns a dictionary of Message objects keyed by their ID number
+    from a binary events file.
+    """
+    zero_time = None
+    messages = {}
+
+    for [time, event, m_id, source, m_type] in hdebug.readEvents(filename):
+        m_id = str(m_id)
+        
+        if zero_time is None:
+            zero_time = time
+
+        if (event == "handled by"):
+            if m_id in messages:
+                messages[m_id].handledBy(source)
+
+        elif (event == "queued"):
+            messages[m_id] = Message(m_type = m_type,
+                                     source = source,
+                                     time = time,
+                                     zero_time = zero_time)
+
+        elif (event == "sent"):
+            if m_id in messages:
+                messages[m_id].sent(time)
+
+        elif (event == "processed"):
+            if m_id in messages:
+                messages[m_id].processed(time)
+
+        elif (event == "worker done"):
+            if m_id in messages:
+                messages[m_id].incNWorkers()
+
+    return messages
+
+
 def logTiming(basename, ignore_incomplete = True):
     """
     Returns a dictionary of Message objects keyed by their ID number.
@@ -160,7 +204,13 @@ def logTiming(basename, ignore_incomplete = True):
     zero_time = None
     messages = {}
 
+    # Use the events file if there is one.
+    if os.path.exists(basename + ".events"):
+        messages = eventTiming(basename + ".events")
+
     for ext in [".5", ".4", ".3", ".2", ".1", ""]:
+        if messages:
+            break
 
         fname = basename + ".out" + ext
         if not os.path.exists(fname):
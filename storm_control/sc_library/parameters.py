@@ -6,15 +6,53 @@ the resulting settings.
 Hazen 06/15
 """
 
+import collections
 import copy
+import hashlib
+import io
+import itertools
 import os
+import pickle
 import traceback
-import xml
 
-from xml.dom import minidom
 from xml.etree import ElementTree
 
 
+#
+# This is incremented whenever a parameter or a sub-section is added to
+# (or removed from) any StormXMLObject. The path caches of the
+# StormXMLObjects and the ParameterHandles use it to tell whether what
+# they resolved earlier is still valid.
+#
+structure_version = 0
+
+#
+# Parameters and StormXMLObjects have a version which changes whenever
+# their value (or for a StormXMLObject, anything in it) changes. Copies
+# keep the version of the original, so two objects with the same version
+# are the same. The versions come from this counter so that they are
+# unique.
+#
+version_counter = itertools.count()
+
+#
+# Values of these types are not copied when a Parameter is copied and
+# setting a Parameter to an equal value of these types does not change
+# its version.
+#
+simple_types = frozenset([bool, float, int, str, type(None)])
+
+#
+# Parameters files that have already been parsed, with the least recently
+# used first. The keys are [file name, recurse] and the values are
+# [[modification time, size], sha1 of the contents, StormXMLObject]. See
+# setFileCache() for the sizes and for the optional on disk cache.
+#
+file_cache = collections.OrderedDict()
+file_cache_size = 16
+sidecar_directory = None
+
+
 #
 # Functions.
 #
@@ -135,20 +173,28 @@ def difference(params1, params2):
     exist in params2.
     """
     differences = []
-    
+
+    # This works directly with the dictionaries of each section as
+    # it is called for every parameter. Sections with the same version
+    # are the same so they don't need to be checked.
     def diffRecurse(root, p1, p2):
-        for attr in p1.getAttrs():
-            prop = p1.get(attr)
+        if (p1._version_ == p2._version_):
+            return
+        p2_parameters = p2.parameters
+        for attr, prop in p1.parameters.items():
+            prop2 = p2_parameters.get(attr)
 
             if isinstance(prop, StormXMLObject):
-                if p2.has(attr):
-                    diffRecurse(root + attr + ".", prop, p2.get(attr))
+                if isinstance(prop2, StormXMLObject):
+                    diffRecurse(root + attr + ".", prop, prop2)
                 else:
                     differences.append(root + attr)
             else:
-                if not p2.has(attr):
+                if prop2 is None:
                     differences.append(root + attr)
-                elif (prop != p2.get(attr)):
+                elif isinstance(prop2, StormXMLObject):
+                    differences.append(root + attr)
+                elif (prop.getv() != prop2.getv()):
                     differences.append(root + attr)
 
     diffRecurse("", params1, params2)
@@ -173,6 +219,13 @@ def fileType(xml_file):
         return ["unknown", traceback.format_exc()]
 
     
+def clearFileCache():
+    """
+    Remove all the parsed parameters files from the (in memory) cache.
+    """
+    file_cache.clear()
+
+
 def halParameters(parameters_file):
     """
     Parses a parameters file to create a parameters object specifically for HAL.
@@ -190,22 +243,169 @@ def halParameters(parameters_file):
     return xml_object
 
 
+def loadParametersFile(parameters_file, recurse):
+    """
+    Returns a StormXMLObject for a parameters file, either a copy of
+    the one in the cache or by parsing the file.
+    """
+    filename = os.path.abspath(parameters_file)
+    key = (filename, recurse)
+    stat = os.stat(filename)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+
+    # The file has not changed since we parsed it.
+    cached = file_cache.get(key)
+    if cached is not None and (cached[0] == stamp):
+        file_cache.move_to_end(key)
+        return cached[2].copy()
+
+    with open(filename, "rb") as fp:
+        data = fp.read()
+    digest = hashlib.sha1(data).hexdigest()
+
+    # The file was touched, but the contents are the same.
+    if cached is not None and (cached[1] == digest):
+        xml_object = cached[2]
+
+    else:
+        xml_object = None
+        sidecar = None
+        if sidecar_directory is not None:
+            sidecar = os.path.join(sidecar_directory, digest + "_" + str(recurse) + ".pickle")
+            xml_object = loadSidecar(sidecar)
+
+        if xml_object is None:
+            xml = ElementTree.fromstring(data)
+            if (xml.tag != "settings"):
+                raise ParametersException(parameters_file + " is not a setting file.")
+            xml_object = StormXMLObject(xml, recurse)
+
+            if sidecar is not None:
+                saveSidecar(sidecar, xml_object)
+
+    if (file_cache_size > 0):
+        file_cache[key] = [stamp, digest, xml_object]
+        file_cache.move_to_end(key)
+        while (len(file_cache) > file_cache_size):
+            file_cache.popitem(last = False)
+        xml_object = xml_object.copy()
+
+    return xml_object
+
+
+def loadSidecar(sidecar):
+    """
+    Returns the StormXMLObject in a sidecar file, or None if there
+    is no such file or it could not be loaded.
+    """
+    if not os.path.exists(sidecar):
+        return None
+    try:
+        with open(sidecar, "rb") as fp:
+            xml_object = pickle.load(fp)
+    except Exception:
+        print("Could not load", sidecar)
+        return None
+    if isinstance(xml_object, StormXMLObject):
+        return xml_object
+    return None
+
+
 def parameters(parameters_file, recurse = False, add_filename_param = True):
     """
     Parses a parameters file to create a parameters object.
-    """
-    xml = ElementTree.parse(parameters_file).getroot()
-    if (xml.tag != "settings"):
-        raise ParametersException(parameters_file + " is not a setting file.")
 
-    # Create XML object.
-    xml_object = StormXMLObject(xml, recurse)
+    The parsed files are cached, so loading the same (unchanged) file
+    again only costs a copy.
+    """
+    xml_object = loadParametersFile(parameters_file, recurse)
     if add_filename_param:
         xml_object.set("parameters_file", parameters_file)
     
     return xml_object
 
 
+def saveSidecar(sidecar, xml_object):
+    """
+    Save the StormXMLObject in a sidecar file. This is written to a
+    temporary file first so that other processes never see a partial
+    sidecar file.
+    """
+    try:
+        temp_name = sidecar + "." + str(os.getpid()) + ".tmp"
+        with open(temp_name, "wb") as fp:
+            pickle.dump(xml_object, fp, protocol = pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_name, sidecar)
+    except (OSError, pickle.PicklingError):
+        print("Could not save", sidecar)
+
+
+def setFileCache(size = 16, directory = None):
+    """
+    Set how many parsed parameters files to keep in memory (0 to
+    disable the in memory cache), and the directory to store the
+    parsed files in (the sidecar files).
+
+    The sidecar files are pickles so they are only safe to use in
+    directories that only trusted users can write to.
+    """
+    global file_cache_size
+    global sidecar_directory
+
+    file_cache_size = size
+    sidecar_directory = directory
+    while (len(file_cache) > file_cache_size):
+        file_cache.popitem(last = False)
+    if sidecar_directory is not None and not os.path.exists(sidecar_directory):
+        os.makedirs(sidecar_directory)
+
+
+def structureChanged():
+    """
+    Called when a parameter or a sub-section is added or removed.
+    """
+    global structure_version
+    structure_version += 1
+
+
+def writeData(fp, data):
+    """
+    Write escaped text / attribute values. Characters that can't be
+    represented in ISO-8859-1 are written as character references.
+    """
+    data = data.replace("&", "&amp;").replace("<", "&lt;").replace("\"", "&quot;").replace(">", "&gt;")
+    if not data.isascii():
+        data = data.encode("ascii", "xmlcharrefreplace").decode()
+    fp.write(data)
+
+
+def writeElement(fp, element, indent):
+    """
+    Write an ElementTree element (and its children) in the format
+    that minidom's toprettyxml(indent = "  ") uses.
+    """
+    fp.write(indent + "<" + element.tag)
+    for name, value in element.attrib.items():
+        fp.write(" " + name + "=\"")
+        writeData(fp, value)
+        fp.write("\"")
+
+    if (len(element) == 0):
+        if element.text:
+            fp.write(">")
+            writeData(fp, element.text)
+            fp.write("</" + element.tag + ">\n")
+        else:
+            fp.write("/>\n")
+    else:
+        fp.write(">\n")
+        if element.text:
+            writeData(fp, indent + "  " + element.text + "\n")
+        for child in element:
+            writeElement(fp, child, indent + "  ")
+        fp.write(indent + "</" + element.tag + ">\n")
+
+
 #
 # Classes.
 # 
@@ -239,13 +439,62 @@ class Parameter(object):
         self.is_mutable = is_mutable
         self.name = name
         self.order = order
+        self.owners = []
         self.ptype = "string"
-        self.value = None
+        self._value_ = None
+        self.version = next(version_counter)
         
         self.setv(value)
 
+    def __getstate__(self):
+        # The copy is not in any of the StormXMLObjects that this is in.
+        state = self.__dict__.copy()
+        state["owners"] = []
+        return state
+
+    def __setstate__(self, state):
+        # This could have been pickled by a different process, so it
+        # needs a new version.
+        self.__dict__.update(state)
+        self.version = next(version_counter)
+
+    @property
+    def value(self):
+        return self._value_
+
+    @value.setter
+    def value(self, new_value):
+        """
+        All changes to the value go through here so that the versions of
+        this Parameter and of the StormXMLObjects that it is in are updated.
+        """
+        old_value = self._value_
+        if (type(new_value) is type(old_value)) and (type(new_value) in simple_types) and (new_value == old_value):
+            return
+        self._value_ = new_value
+        self.version = next(version_counter)
+        for owner in self.owners:
+            owner.changed()
+
+    def addOwner(self, owner):
+        self.owners.append(owner)
+
     def copy(self):
-        return copy.deepcopy(self)
+        """
+        This is a (faster) deep copy. Attributes of the simple types
+        are shared with the original.
+        """
+        memo = {}
+        state = self.__dict__.copy()
+        del state["owners"]
+        for key, value in state.items():
+            if not type(value) in simple_types:
+                state[key] = copy.deepcopy(value, memo)
+        state["owners"] = []
+
+        new = self.__class__.__new__(self.__class__)
+        new.__dict__ = state
+        return new
     
     def getDescription(self):
         return self.description
@@ -260,7 +509,10 @@ class Parameter(object):
         return self.order
 
     def getv(self):
-        return self.value
+        return self._value_
+
+    def getVersion(self):
+        return self.version
 
     def isMutable(self):
         return self.is_mutable
@@ -271,6 +523,9 @@ class Parameter(object):
     def isSet(self):
         return False
 
+    def removeOwner(self, owner):
+        self.owners.remove(owner)
+
     def setMutable(self, value):
         self.is_mutable = bool(value)
 
@@ -522,16 +777,84 @@ class ParameterStringFilename(ParameterString):
         self.use_save_dialog = use_save_dialog
 
 
+class ParameterHandle(object):
+    """
+    A pre-resolved reference to a parameter (or sub-section) of a
+    StormXMLObject. This is for code that gets or sets the same
+    parameter many times, for example once per frame. The name is
+    only looked up again after a parameter or sub-section has been
+    added or removed.
+    """
+    def __init__(self, pname = None, xml_object = None, **kwds):
+        super().__init__(**kwds)
+        self.pname = pname
+        self.prop = None
+        self.version = None
+        self.xml_object = xml_object
+
+    def get(self, default = None):
+        """
+        Returns either the value of the Parameter or the StormXMLObject.
+        """
+        if (self.version != structure_version):
+            self.resolve()
+        prop = self.prop
+        if prop is None:
+            if default is not None:
+                return default
+            raise ParametersExceptionGet("Requested property " + self.pname + " not found and no default was specified.")
+        if isinstance(prop, StormXMLObject):
+            return prop
+        return prop.getv()
+
+    def getp(self):
+        """
+        Returns the Parameter or the StormXMLObject.
+        """
+        if (self.version != structure_version):
+            self.resolve()
+        if self.prop is None:
+            raise ParametersExceptionGet("Requested property " + self.pname + " not found")
+        return self.prop
+
+    def has(self):
+        if (self.version != structure_version):
+            self.resolve()
+        return self.prop is not None
+
+    def resolve(self):
+        self.prop = self.xml_object.lookup(self.pname)
+        self.version = structure_version
+
+    def setv(self, value):
+        self.getp().setv(value)
+
+
 class StormXMLObject(object):
     """
     A collection of Parameters objects that are (usually) created 
     dynamically by parsing an XML file. All parameter names must 
     be unique for each section.
+
+    Look ups of (dotted) names are cached in self._paths_. The cache
+    is cleared when the structure of any StormXMLObject has changed
+    since it was filled (see structure_version).
+
+    Each Parameter and StormXMLObject knows which StormXMLObjects it
+    is in (its owners) so that changes to the version of a Parameter
+    also change the versions of all the StormXMLObjects that contain it.
+    Versions only track changes that are made with setv() or set(), or
+    by adding or removing parameters, and not, for example, changes to
+    a list that is the value of a parameter.
     """
     def __init__(self, nodes = None, recurse = False, validate = True, **kwds):
         super().__init__(**kwds)
 
+        self._owners_ = []
+        self._paths_ = {}
+        self._paths_version_ = structure_version
         self._validate_ = validate
+        self._version_ = next(version_counter)
         self.parameters = {}
 
         if nodes is None:
@@ -633,11 +956,26 @@ class StormXMLObject(object):
             # This handles sub-nodes.
             elif recurse and (len(node) > 0):
                 self.parameters[node.tag] = StormXMLObject(node, True)
+                self.parameters[node.tag].addOwner(self)
 
             # If we were able to make a parameter object add it to the record.
             if param is not None:
                 self.addParameter(node.tag, param)
 
+    def __getstate__(self):
+        # The path cache is not copied (or pickled), and the copy
+        # is not in any of the StormXMLObjects that this is in.
+        state = self.__dict__.copy()
+        state["_owners_"] = []
+        state["_paths_"] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._version_ = next(version_counter)
+        for prop in self.parameters.values():
+            prop.addOwner(self)
+
     def add(self, pname, pvalue = None):
         """
         Add a new Parameter to the parameters.
@@ -655,15 +993,16 @@ class StormXMLObject(object):
 
         pnames = pname.split(".")
         if (len(pnames) > 1):
-            try:
-                prop = self.get(pnames[0])
-            except ParametersExceptionGet:
+            if not pnames[0] in self.parameters:
                 self.addSubSection(pnames[0])
             prop = self.get(pnames[0])
             prop.add(".".join(pnames[1:]), pvalue)
         else:
             self.addParameter(pname, pvalue)
 
+    def addOwner(self, owner):
+        self._owners_.append(owner)
+
     def addParameter(self, pname, pvalue):
         """
         Handles adding Parameters.
@@ -675,6 +1014,9 @@ class StormXMLObject(object):
                 self.parameters[pname] = pvalue
             else:
                 self.parameters[pname] = ParameterSimple(pname, pvalue)
+            self.parameters[pname].addOwner(self)
+            self.changed()
+            structureChanged()
 
     def addSubSection(self, sname, svalue = None, overwrite = False):
         """
@@ -690,6 +1032,9 @@ class StormXMLObject(object):
         if (len(snames) > 1):
             if not snames[0] in self.parameters:
                 cur_section = self.parameters[snames[0]] = StormXMLObject()
+                cur_section.addOwner(self)
+                self.changed()
+                structureChanged()
             else:
                 cur_section = self.parameters[snames[0]]
             return cur_section.addSubSection(".".join(snames[1:]),
@@ -705,14 +1050,44 @@ class StormXMLObject(object):
                 if not overwrite:
                     raise ParametersException("Section " + sname + " already exists")
                 if isinstance(svalue, StormXMLObject):
+                    self.parameters[sname].removeOwner(self)
                     self.parameters[sname] = svalue
                 else:
                     raise ParametersException("Object is a " + type(svalue) + " not a StormXMLObject")
+            self.parameters[sname].addOwner(self)
+            self.changed()
+            structureChanged()
 
             return self.parameters[sname]
 
-    def copy(self):
-        return copy.deepcopy(self)
+    def changed(self):
+        """
+        Called when something in this object changes.
+        """
+        self._version_ = next(version_counter)
+        for owner in self._owners_:
+            owner.changed()
+
+    def copy(self, memo = None):
+        """
+        Return a copy of this object. The copy has the same versions as
+        this object. Parameters (or sub-sections) that appear more than
+        once in this object are also shared in the copy.
+        """
+        if memo is None:
+            memo = {}
+        new = StormXMLObject(validate = self._validate_)
+        new._version_ = self._version_
+        for pname, prop in self.parameters.items():
+            if id(prop) in memo:
+                new_prop = memo[id(prop)]
+            elif isinstance(prop, StormXMLObject):
+                new_prop = memo[id(prop)] = prop.copy(memo)
+            else:
+                new_prop = memo[id(prop)] = prop.copy()
+            new_prop.addOwner(new)
+            new.parameters[pname] = new_prop
+        return new
 
     def delete(self, name):
         """
@@ -723,25 +1098,26 @@ class StormXMLObject(object):
             if (len(names) > 1):
                 self.get(".".join(names[:-1])).delete(names[-1])
             else:
+                self.parameters[name].removeOwner(self)
                 del self.parameters[name]
+                self.changed()
+                structureChanged()
 
     def get(self, pname, default = None):
         """
         Returns either the value of the Parameter object specified by pname or
         the corresponding StormXMLObject.
         """
-        try:
-            prop = self.getp(pname)
-        except ParametersException:
+        prop = self.lookup(pname)
+        if prop is None:
             if default is not None:
                 return default
             else:
                 raise ParametersExceptionGet("Requested property " + pname + " not found and no default was specified.")
+        elif isinstance(prop, StormXMLObject):
+            return prop
         else:
-            if isinstance(prop, StormXMLObject):
-                return prop
-            else:
-                return prop.getv()
+            return prop.getv()
 
     def getAttrs(self):
         """
@@ -749,6 +1125,12 @@ class StormXMLObject(object):
         """
         return self.parameters.keys()
 
+    def getHandle(self, pname):
+        """
+        Return a ParameterHandle for the property specified by pname.
+        """
+        return ParameterHandle(pname = pname, xml_object = self)
+
     def getOrder(self):
         """
         A convience so that we can sort these along with Parameter objects.
@@ -759,17 +1141,10 @@ class StormXMLObject(object):
         """
         Return the property specified by pname.
         """
-        # Check for sub-property.
-        pnames = pname.split(".")
-        if (len(pnames) > 1):
-            xml_object = self.getp(pnames[0])
-            #print pnames, type(xml_object)
-            return xml_object.getp(".".join(pnames[1:]))
-
-        if pname in self.parameters:
-            return self.parameters[pname]
-        else:
+        prop = self.lookup(pname)
+        if prop is None:
             raise ParametersExceptionGet("Requested property " + pname + " not found")
+        return prop
 
     def getProps(self):
         """
@@ -784,22 +1159,46 @@ class StormXMLObject(object):
         attrs = self.parameters.keys()
         return sorted(attrs, key = lambda x: (self.parameters[x].getOrder(), x))
 
+    def getVersion(self):
+        return self._version_
+
     def has(self, pname):
         """
         Return true if this object has a particular Parameter.
         """
-        try:
-            prop = self.getp(pname)
-        except ParametersExceptionGet:
-            return False
-        return True
+        return self.lookup(pname) is not None
+
+    def lookup(self, pname):
+        """
+        Return the property specified by pname, or None if there is
+        no such property.
+        """
+        if (self._paths_version_ != structure_version):
+            self._paths_ = {}
+            self._paths_version_ = structure_version
+        elif pname in self._paths_:
+            return self._paths_[pname]
+
+        prop = self
+        for name in pname.split("."):
+            if isinstance(prop, StormXMLObject):
+                prop = prop.parameters.get(name)
+            else:
+                prop = None
+            if prop is None:
+                break
+        self._paths_[pname] = prop
+        return prop
+
+    def removeOwner(self, owner):
+        self._owners_.remove(owner)
 
     def saveToFile(self, filename, all_params = False):
         """
         Save the Parameters as XML in a file.
         """
         with open(filename, "w") as fp:
-            fp.write(self.toString(all_params = all_params))
+            self.writeXML(fp, all_params = all_params)
 
     def set(self, pname, pvalue):
         """
@@ -851,13 +1250,9 @@ class StormXMLObject(object):
         """
         Return an XML string representation of this object.
         """
-        rough_string = ElementTree.tostring(self.toXML(override_is_saved = all_params))
-        try:
-            reparsed = minidom.parseString(rough_string)
-        except xml.parsers.expat.ExpatError as exception:
-            print(rough_string)
-            raise exception
-        return reparsed.toprettyxml(indent = "  ", encoding = "ISO-8859-1").decode()
+        fp = io.StringIO()
+        self.writeXML(fp, all_params = all_params)
+        return fp.getvalue()
 
     def toXML(self, xml = None, name = "settings", override_is_saved = False):
         """
@@ -879,6 +1274,16 @@ class StormXMLObject(object):
                 value.toXML(xml, override_is_saved = override_is_saved)
         return xml
 
+    def writeXML(self, fp, all_params = False):
+        """
+        Write the XML representation of this object to the file fp.
+
+        The output is the same as that of minidom's toprettyxml() but
+        this writes the elements directly instead of re-parsing them.
+        """
+        fp.write('<?xml version="1.0" encoding="ISO-8859-1"?>\n')
+        writeElement(fp, self.toXML(override_is_saved = all_params), "")
+
 
 #
 # Testing
@@ -13,6 +13,7 @@ jeffmoffitt@gmail.com
 # 
 import sys
 import time
+from collections import deque
 from PyQt5 import QtCore, QtGui, QtNetwork, QtWidgets
 
 from storm_control.sc_library.tcpMessage import TCPMessage
@@ -22,12 +23,25 @@ import storm_control.sc_library.tcpCommunications as tcpCommunications
 class TCPClient(QtCore.QObject, tcpCommunications.TCPCommunicationsMixin):
     """
     A TCP client class used to transfer TCP messages from one program to another
+
+    Messages can be sent without waiting for the response to the previous
+    message. Responses are matched to messages using TCPMessage.getID().
+
+    max_outstanding is the maximum number of messages that can be waiting
+    for a response, the default is no limit. Messages that are sent when
+    this many are outstanding, or when the server has said that it is busy,
+    are queued and sent as the responses arrive.
     """
     comLostConnection = QtCore.pyqtSignal()
+    dataReceived = QtCore.pyqtSignal(object, object)
     messageReceived = QtCore.pyqtSignal(object)
 
-    def __init__(self, **kwds):
+    def __init__(self, max_outstanding = None, **kwds):
         super().__init__(**kwds)
+        self.busy = False
+        self.max_outstanding = max_outstanding
+        self.outstanding = {}
+        self.send_queue = deque()
         
         # Create instance of TCP socket
         self.socket = QtNetwork.QTcpSocket()
@@ -51,12 +65,52 @@ class TCPClient(QtCore.QObject, tcpCommunications.TCPCommunicationsMixin):
         if not self.socket.waitForConnected(1000):
             print(self.server_name + " server not found")
 
+    def getOutstanding(self):
+        """
+        Return the number of messages that we have not had a response to yet.
+        """
+        return len(self.outstanding) + len(self.send_queue)
+
+    def handleBusy(self, busy):
+        self.busy = busy
+        self.sendQueued()
+
     def handleDisconnect(self):
         """
         Handles the disconnect from the socket.
         """
+        self.busy = False
+        self.outstanding = {}
+        self.frame_reader.reset()
+        self.send_queue.clear()
         self.comLostConnection.emit()
 
+    def handleMessage(self, message):
+        self.outstanding.pop(message.getID(), None)
+        super().handleMessage(message)
+        self.sendQueued()
+
+    def sendMessage(self, message):
+        """
+        Queue a message for sending.
+        """
+        if self.isConnected():
+            self.send_queue.append(message)
+            self.sendQueued()
+        else:
+            super().sendMessage(message)
+
+    def sendQueued(self):
+        """
+        Send as many of the queued messages as we can.
+        """
+        while self.send_queue and not self.busy:
+            if self.max_outstanding is not None and (len(self.outstanding) >= self.max_outstanding):
+                break
+            message = self.send_queue.popleft()
+            self.outstanding[message.getID()] = message
+            super().sendMessage(message)
+
     def startCommunication(self):
         """
         Start communications with server
@@ -7,24 +7,181 @@ Jeffrey Moffitt
 jeffmoffitt@gmail.com
 
 Hazen 05/14
+
+Messages are exchanged in one of two ways:
+
+1. Framed (the default for TCPClient). Each message is preceded by
+   its length in bytes as a 4 byte big-endian unsigned integer. Any
+   number of messages can be in flight, responses are matched to
+   requests by message ID.
+
+2. Line based (the original protocol). Each message is a single line
+   of JSON. This is still supported so that existing clients work.
+
+The server figures out which of these the client is using from the
+first byte that it receives. The first byte of a frame is the frame
+type, which is never '{', the rest of the first 4 bytes are the size.
+
+Framed connections can also exchange numpy arrays (binary data). The
+frame for these is a JSON header (with the dtype, shape and size of
+the array and the ID of the message that the data belongs to) followed
+by the array's bytes. On the receiving side the array is read directly
+into the buffer that the numpy array uses, so there is no copying once
+it has been received.
 """
+import json
+import numpy
+import struct
 
 from PyQt5 import QtCore, QtNetwork
 
 from storm_control.sc_library.tcpMessage import TCPMessage
 
 
+frame_header = struct.Struct(">I")
+max_frame_size = 2**24 - 1
+
+# Frame types.
+MESSAGE_FRAME = 0
+DATA_FRAME = 1
+
+
+class TCPCommunicationsException(Exception):
+    pass
+
+
+def frameData(np_array, message_id = None, info = {}, encoding = 'utf-8'):
+    """
+    Return a numpy array as a header frame and the array's bytes.
+    """
+    np_array = numpy.ascontiguousarray(np_array)
+    header = {"dtype" : np_array.dtype.str,
+              "info" : info,
+              "message_id" : message_id,
+              "shape" : list(np_array.shape),
+              "size" : np_array.nbytes}
+    return [makeFrame(DATA_FRAME, json.dumps(header).encode(encoding)), np_array.tobytes()]
+
+
+def frameMessage(message, encoding = 'utf-8'):
+    """
+    Return a message as a length prefixed frame.
+    """
+    return makeFrame(MESSAGE_FRAME, message.toJSON().encode(encoding))
+
+
+def makeFrame(frame_type, frame_bytes):
+    if (len(frame_bytes) > max_frame_size):
+        raise TCPCommunicationsException("Frame of " + str(len(frame_bytes)) + " bytes is too large.")
+    return frame_header.pack((frame_type << 24) + len(frame_bytes)) + frame_bytes
+
+
+class FrameReader(object):
+    """
+    Assembles messages and arrays from the (framed) data received
+    on a socket.
+
+    addBytes() returns a list with the messages (TCPMessage) and
+    arrays ([header, numpy array]) that were completed by the data.
+    """
+    def __init__(self, encoding = 'utf-8', **kwds):
+        super().__init__(**kwds)
+        self.buffer = bytearray()
+        self.data = None
+        self.data_header = None
+        self.data_received = 0
+        self.encoding = encoding
+
+    def addBytes(self, new_bytes):
+        items = []
+        new_bytes = memoryview(new_bytes)
+
+        # The buffer is empty while receiving an array, so the data
+        # can be copied straight into the array.
+        if self.data is not None:
+            new_bytes = new_bytes[self.addData(new_bytes, items):]
+
+        # Parse the frames in the buffer, the parsed bytes are only
+        # removed from the buffer at the end.
+        self.buffer += new_bytes
+        buffer_view = memoryview(self.buffer)
+        offset = 0
+        try:
+            while True:
+                if self.data is not None:
+                    offset += self.addData(buffer_view[offset:], items)
+                    if self.data is not None:
+                        break
+                    continue
+
+                if ((len(self.buffer) - offset) < frame_header.size):
+                    break
+                [word] = frame_header.unpack_from(self.buffer, offset)
+                end = offset + frame_header.size + (word & max_frame_size)
+                if (len(self.buffer) < end):
+                    break
+
+                frame_str = str(buffer_view[offset + frame_header.size:end], self.encoding)
+                offset = end
+
+                frame_type = (word >> 24)
+                if (frame_type == MESSAGE_FRAME):
+                    items.append(TCPMessage.fromJSON(frame_str))
+                elif (frame_type == DATA_FRAME):
+                    self.data_header = json.loads(frame_str)
+                    self.data = bytearray(self.data_header["size"])
+                    self.data_received = 0
+                else:
+                    raise TCPCommunicationsException("Unknown frame type " + str(frame_type))
+        finally:
+            buffer_view.release()
+            del self.buffer[:offset]
+
+        return items
+
+    def addData(self, data_bytes, items):
+        """
+        Copy data_bytes into the array that we are receiving, the array
+        is added to items when it is complete. Returns the number of
+        bytes that were used.
+        """
+        n_bytes = min(len(self.data) - self.data_received, len(data_bytes))
+        self.data[self.data_received:self.data_received + n_bytes] = data_bytes[:n_bytes]
+        self.data_received += n_bytes
+        if (self.data_received == len(self.data)):
+            np_array = numpy.frombuffer(self.data, dtype = self.data_header["dtype"])
+            items.append([self.data_header, np_array.reshape(self.data_header["shape"])])
+            self.data = None
+        return n_bytes
+
+    def isEmpty(self):
+        """
+        Returns True if we are not in the middle of a frame.
+        """
+        return (len(self.buffer) == 0) and (self.data is None)
+
+    def reset(self):
+        self.buffer = bytearray()
+        self.data = None
+
+
 class TCPCommunicationsMixin(object):
     """
     A mixin class that defines the basic process of exchanging TCP 
     messages. Client and servers (multi-) inherit this class.
 
-    They will should also include the following signal:
+    They will should also include the following signals:
+    dataReceived = QtCore.pyqtSignal(object, object)
     messageReceived = QtCore.pyqtSignal(object)
+
+    dataReceived is emitted with the header (a dictionary) and the numpy
+    array when an array is received. The 'message_id' field of the header
+    is the ID of the message that the array belongs to.
     """
     def __init__(self,
                  address = QtNetwork.QHostAddress(QtNetwork.QHostAddress.LocalHost),
                  encoding = 'utf-8',
+                 framed = True,
                  port = 9500,
                  server_name = "default",
                  verbose = False,
@@ -34,6 +191,8 @@ class TCPCommunicationsMixin(object):
         # Initialize internal attributes
         self.address = address
         self.encoding = encoding
+        self.framed = framed
+        self.frame_reader = FrameReader(encoding = encoding)
         self.port = port 
         self.server_name = server_name
         self.socket = None
@@ -48,30 +207,60 @@ class TCPCommunicationsMixin(object):
             if self.verbose:
                 print("Closing TCP communications: " + self.server_name)
             
-    def handleBusy(self):
+    def getBytesToWrite(self):
         """
-        Handle a busy message. Reserved for future use.
+        Return the number of bytes waiting to be sent.
         """
-        pass
+        if self.isConnected():
+            return self.socket.bytesToWrite()
+        return 0
 
-    def handleReadyRead(self):
+    def handleBusy(self, busy):
         """
-        Create TCP message class from JSON message and forward as appropriate
+        Handle a busy message. This is how the other side signals
+        that it has (or no longer has) too many pending messages.
         """
-        message_str = ""
-        while self.socket.canReadLine():
-            # Read data line
-            message_str += str(self.socket.readLine(), self.encoding)
+        pass
 
-        # Create message.
-        message = TCPMessage.fromJSON(message_str)
+    def handleMessage(self, message):
+        """
+        Handle a message from the other side.
+        """
         if self.verbose:
             print("Received: \n" + str(message))
 
         if (message.getType() == "Busy"):
-            self.handleBusy()
+            self.handleBusy(message.getData("busy", True))
         else:
             self.messageReceived.emit(message)
+
+    def handleReadyRead(self):
+        """
+        Create TCP message class(es) from the socket data and forward as appropriate.
+        """
+        if self.framed is None:
+            if (self.socket.bytesAvailable() == 0):
+                return
+            self.framed = (bytes(self.socket.peek(1)) != b"{")
+
+        # A server that refuses a connection always sends a line.
+        if self.framed and self.frame_reader.isEmpty() and (bytes(self.socket.peek(1)) == b"{"):
+            items = [TCPMessage.fromJSON(str(self.socket.readAll(), self.encoding))]
+            
+        elif self.framed:
+            items = self.frame_reader.addBytes(self.socket.readAll().data())
+        else:
+            items = []
+            while self.socket.canReadLine():
+                message_str = str(self.socket.readLine(), self.encoding)
+                if message_str.strip():
+                    items.append(TCPMessage.fromJSON(message_str))
+
+        for item in items:
+            if isinstance(item, TCPMessage):
+                self.handleMessage(item)
+            else:
+                self.dataReceived.emit(*item)
     
     def isConnected(self):
         """
@@ -82,13 +271,28 @@ class TCPCommunicationsMixin(object):
         else:
             return False
 
+    def sendData(self, np_array, message_id = None, info = {}):
+        """
+        Send a numpy array, info is a dictionary of (JSON serializable)
+        information about the array. This only works for framed connections.
+        """
+        if not self.framed:
+            raise TCPCommunicationsException("Data can only be sent on framed connections.")
+        if self.isConnected():
+            for data in frameData(np_array, message_id = message_id, info = info, encoding = self.encoding):
+                self.socket.write(data)
+            self.socket.flush()
+
     def sendMessage(self, message):
         """
-        Send TCP message as JSON string if the socket is connected.
+        Send TCP message if the socket is connected.
         """
         if self.isConnected():
-            message_str = message.toJSON() + "\n"
-            self.socket.write(message_str.encode(self.encoding))
+            if self.framed:
+                self.socket.write(frameMessage(message, self.encoding))
+            else:
+                message_str = message.toJSON() + "\n"
+                self.socket.write(message_str.encode(self.encoding))
             self.socket.flush()
             if self.verbose:
                 print("Sent: \n" + str(message))
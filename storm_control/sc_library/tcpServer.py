@@ -20,9 +20,13 @@ import storm_control.sc_library.tcpCommunications as tcpCommunications
 class TCPServer(QtNetwork.QTcpServer, tcpCommunications.TCPCommunicationsMixin):
     """
     A TCP server for passing TCP messages between programs.
+
+    The server uses whichever protocol (framed or line based) the
+    client uses.
     """
     comGotConnection = QtCore.pyqtSignal()
     comLostConnection = QtCore.pyqtSignal()
+    dataReceived = QtCore.pyqtSignal(object, object)
     messageReceived = QtCore.pyqtSignal(object)
     
     def __init__(self, **kwds):
@@ -67,12 +71,18 @@ class TCPServer(QtNetwork.QTcpServer, tcpCommunications.TCPCommunicationsMixin):
         socket = self.nextPendingConnection()
 
         if not self.isConnected():
+            self.framed = None
+            self.frame_reader.reset()
             self.socket = socket
             self.socket.readyRead.connect(self.handleReadyRead)
             self.socket.disconnected.connect(self.handleClientDisconnect)
             self.comGotConnection.emit()
             if self.verbose:
                 print("Connected new client")
+
+            # The client may have already sent something.
+            if (self.socket.bytesAvailable() > 0):
+                self.handleReadyRead()
         else: # Refuse new socket if one already exists
             message = TCPMessage(message_type = "Busy") # from tcpMessage.TCPMessage
             if self.verbose:
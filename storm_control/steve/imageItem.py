@@ -5,8 +5,14 @@ This module handles:
 1. The images that Steve displays.
 2. Loading images from the disk.
 
+Each image has a pyramid of downsampled copies which is saved with
+the image in the mosaic file. When the image is drawn the pixmap is
+created from the copy that best matches the current view scale, so
+zoomed out views of large mosaics only use small pixmaps.
+
 Hazen 10/18
 """
+import math
 import numpy
 import os
 import pickle
@@ -19,6 +25,21 @@ import storm_control.steve.movieReader as movieReader
 import storm_control.steve.steveItems as steveItems
 
 
+def downsample(image):
+    """
+    Return a copy of image binned 2x2. If the image has an odd number
+    of rows or columns the last row or column is dropped.
+    """
+    [h, w] = image.shape
+    h = 2 * (h//2)
+    w = 2 * (w//2)
+    binned = image[0:h:2,0:w:2].astype(numpy.float32)
+    binned += image[1:h:2,0:w:2]
+    binned += image[0:h:2,1:w:2]
+    binned += image[1:h:2,1:w:2]
+    return (0.25 * binned).astype(image.dtype)
+
+
 def getCameraExtension(movie_xml):
     ext = movie_xml.get("camera1.extension", "")
     if (len(ext) > 0):
@@ -27,6 +48,115 @@ def getCameraExtension(movie_xml):
         return ""
 
 
+def makePyramid(image, min_size = 64):
+    """
+    Return a list of downsampled versions of image, each one half the
+    size of the previous one. The last one is the first whose larger
+    dimension is at most min_size pixels.
+    """
+    pyramid = []
+    while (max(image.shape) > min_size) and (min(image.shape) > 1):
+        image = downsample(image)
+        pyramid.append(image)
+    return pyramid
+
+
+def rescaleImage(image, pixmap_min, pixmap_max):
+    """
+    Rescale image to 8 bits using pixmap_min and pixmap_max.
+    """
+    scale = 255.0/max(float(pixmap_max - pixmap_min), 1.0e-6)
+
+    # For 8 and 16 bit images that are larger than the look up table
+    # it is faster to rescale all the possible values once.
+    if (image.dtype in [numpy.uint8, numpy.uint16]) and (image.size > numpy.iinfo(image.dtype).max):
+        lut = numpy.arange(numpy.iinfo(image.dtype).max + 1, dtype = numpy.float32)
+        lut = rescaleImage(lut, pixmap_min, pixmap_max)
+        return lut[image]
+
+    image = scale * (numpy.asarray(image, dtype = numpy.float32) - float(pixmap_min))
+    numpy.clip(image, 0.0, 255.0, out = image)
+    return image.astype(numpy.uint8)
+
+
+class ImagePyramidItem(QtWidgets.QGraphicsItem):
+    """
+    Draws an image using the image pyramid level that best matches
+    the current view scale. The pixmap for a level is only created
+    when the item is drawn, and only the pixmap of the most recently
+    drawn level is kept.
+
+    The item's coordinates are the pixels of the full resolution image.
+    """
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+
+        self.levels = []
+        self.pixmap = None
+        self.pixmap_level = None
+        self.pixmap_max = 0
+        self.pixmap_min = 0
+
+    def boundingRect(self):
+        if (len(self.levels) == 0):
+            return QtCore.QRectF()
+        [h, w] = self.levels[0].shape
+        return QtCore.QRectF(0, 0, w, h)
+
+    def getLevel(self, level_of_detail):
+        """
+        Return the index of the smallest level that has at least
+        one pixel per screen pixel at level_of_detail.
+        """
+        if (level_of_detail >= 1.0) or (level_of_detail <= 0.0):
+            return 0
+        level = int(math.floor(math.log2(1.0/level_of_detail)))
+        return min(level, len(self.levels) - 1)
+
+    def getPixmap(self, level):
+        """
+        Return the (cached) QPixmap for level.
+        """
+        if (self.pixmap is None) or (self.pixmap_level != level):
+            image = numpy.ascontiguousarray(rescaleImage(self.levels[level], self.pixmap_min, self.pixmap_max))
+            [h, w] = image.shape
+            q_image = QtGui.QImage(image.data, w, h, w, QtGui.QImage.Format_Indexed8)
+            q_image.ndarray = image
+            for i in range(256):
+                q_image.setColor(i, QtGui.QColor(i,i,i).rgb())
+            self.pixmap = QtGui.QPixmap.fromImage(q_image)
+            self.pixmap_level = level
+        return self.pixmap
+
+    def getPixmapLevel(self):
+        return self.pixmap_level
+
+    def paint(self, painter, option, widget):
+        if (len(self.levels) == 0):
+            return
+        level = self.getLevel(option.levelOfDetailFromTransform(painter.worldTransform()))
+        pixmap = self.getPixmap(level)
+        scale = 2**level
+        painter.drawPixmap(QtCore.QRectF(0, 0, scale * pixmap.width(), scale * pixmap.height()),
+                           pixmap,
+                           QtCore.QRectF(pixmap.rect()))
+
+    def setContrast(self, pixmap_min, pixmap_max):
+        self.pixmap = None
+        self.pixmap_max = pixmap_max
+        self.pixmap_min = pixmap_min
+        self.update()
+
+    def setLevels(self, levels):
+        """
+        levels is a list with the full resolution image followed by
+        the downsampled images.
+        """
+        self.prepareGeometryChange()
+        self.levels = levels
+        self.pixmap = None
+
+
 class ImageItem(steveItems.SteveItem):
     """
     Base class for image items, this is also the default single
@@ -42,6 +172,7 @@ class ImageItem(steveItems.SteveItem):
         self.objective_name = objective_name
         self.pixmap_max = 0
         self.pixmap_min = 0
+        self.pyramid = []
         self.x_pix = 0
         self.x_offset_pix = 0
         self.x_um = x_um
@@ -56,32 +187,20 @@ class ImageItem(steveItems.SteveItem):
         if y_um is not None:
             self.y_pix = coord.umToPix(y_um)
         
-        self.graphics_item = QtWidgets.QGraphicsPixmapItem()
+        self.graphics_item = ImagePyramidItem()
+
+        if numpy_data is not None:
+            self.pyramid = makePyramid(numpy_data)
+            self.graphics_item.setLevels([numpy_data] + self.pyramid)
 
     def dataToPixmap(self, pixmap_min, pixmap_max):
         """
-        Create a QtGui.QPixmap item from the numpy data.
+        Set the contrast of the QtGui.QPixmap items that are created
+        from the image pyramid when the image is drawn.
         """
         self.pixmap_min = pixmap_min
         self.pixmap_max = pixmap_max
-
-        image = self.numpy_data.copy()
-
-        # Rescale & convert to 8bit
-        image = numpy.ascontiguousarray(image, dtype = numpy.float32)
-        image = 255.0 * (image - float(self.pixmap_min))/float(self.pixmap_max - self.pixmap_min)
-        image[(image > 255.0)] = 255.0
-        image[(image < 0.0)] = 0.0
-        image = image.astype(numpy.uint8)
-
-        # Create the pixmap
-        w, h = image.shape
-        q_image = QtGui.QImage(image.data, h, w, QtGui.QImage.Format_Indexed8)
-        q_image.ndarray = image
-        for i in range(256):
-            q_image.setColor(i, QtGui.QColor(i,i,i).rgb())
-        q_pixmap = QtGui.QPixmap.fromImage(q_image)
-        self.graphics_item.setPixmap(q_pixmap)
+        self.graphics_item.setContrast(pixmap_min, pixmap_max)
 
     def getContrast(self):
         """
@@ -108,9 +227,9 @@ class ImageItem(steveItems.SteveItem):
         return [self.x_um, self.y_um]
     
     def getSizeUm(self):
-        pixmap = self.graphics_item.pixmap()
-        width_um = coord.pixToUm(pixmap.width()/self.magnification)
-        height_um = coord.pixToUm(pixmap.height()/self.magnification)
+        rect = self.graphics_item.boundingRect()
+        width_um = coord.pixToUm(rect.width()/self.magnification)
+        height_um = coord.pixToUm(rect.height()/self.magnification)
         return (width_um, height_um)
         
     def getZValue(self):
@@ -134,6 +253,11 @@ class ImageItem(steveItems.SteveItem):
             else:
                 warnings.warn("Ignoring unknown attribute " + new_key)
 
+        # Mosaics saved by older versions of Steve don't have the image pyramid.
+        if (len(self.pyramid) == 0):
+            self.pyramid = makePyramid(self.numpy_data)
+        self.graphics_item.setLevels([self.numpy_data] + self.pyramid)
+
         # Create pixmap & set scale.
         self.dataToPixmap(self.pixmap_min, self.pixmap_max)
         self.setTransform()
@@ -180,9 +304,9 @@ class ImageItem(steveItems.SteveItem):
         self.setPos()
 
     def setPos(self):
-        pixmap = self.graphics_item.pixmap()
-        x_pix = self.x_pix - (pixmap.width() * 0.5 / self.magnification)
-        y_pix = self.y_pix - (pixmap.height() * 0.5 / self.magnification)
+        rect = self.graphics_item.boundingRect()
+        x_pix = self.x_pix - (rect.width() * 0.5 / self.magnification)
+        y_pix = self.y_pix - (rect.height() * 0.5 / self.magnification)
         self.graphics_item.setPos(x_pix + self.x_offset_pix, y_pix + self.y_offset_pix)
 
     def setTransform(self):
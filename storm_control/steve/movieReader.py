@@ -14,6 +14,7 @@ import os
 import re
 import tifffile
 
+import storm_control.sc_library.daxMovie as daxMovie
 import storm_control.sc_library.parameters as parameters
 
 
@@ -202,55 +203,36 @@ class Reader(object):
 class DaxReader(Reader):
     """
     Dax reader class. This is a Zhuang lab custom format.
+
+    The movie is memory mapped using sc_library.daxMovie.
     """
     def __init__(self, filename, verbose = False):
         super(DaxReader, self).__init__(filename, verbose = verbose)
-        
-        # save the filenames
-        dirname = os.path.dirname(filename)
-        if (len(dirname) > 0):
-            dirname = dirname + "/"
-        self.inf_filename = dirname + os.path.splitext(os.path.basename(filename))[0] + ".inf"
-
-        # defaults
-        self.image_height = None
-        self.image_width = None
-
-        # extract the movie information from the associated inf file
-        size_re = re.compile(r'frame dimensions = ([\d]+) x ([\d]+)')
-        length_re = re.compile(r'number of frames = ([\d]+)')
-        endian_re = re.compile(r' (big|little) endian')
-
-        inf_file = open(self.inf_filename, "r")
-        while True:
-            line = inf_file.readline()
-            if not line: break
-            m = size_re.match(line)
-            if m:
-                self.image_height = int(m.group(2))
-                self.image_width = int(m.group(1))
-            m = length_re.match(line)
-            if m:
-                self.number_frames = int(m.group(1))
-            m = endian_re.search(line)
-            if m:
-                if m.group(1) == "big":
-                    self.bigendian = 1
-                else:
-                    self.bigendian = 0
 
-        inf_file.close()
+        self.movie = daxMovie.DaxMovie(filename)
+        [self.image_width, self.image_height, self.number_frames] = self.movie.filmSize()
+
+    def averageFrames(self, start = False, end = False):
+        """
+        Average multiple frames in a movie.
+        """
+        if (not start):
+            start = 0
+        if (not end):
+            end = self.number_frames
+        return numpy.mean(self.movie[start:end], axis = 0, dtype = numpy.float64)
 
-        # Error out if we couldn't figure out the image size.
-        if not self.image_height:
-            raise IOError("Could not determine image size!")
+    def close(self):
+        super(DaxReader, self).close()
+        if hasattr(self, "movie"):
+            self.movie.close()
 
-        # Open the dax file
-        if os.path.exists(filename):
-            self.fileptr = open(filename, "rb")
-        else:
-            if self.verbose:
-                print("dax data not found", filename)
+    def getIndex(self):
+        """
+        Returns the movies index (a numpy array of type daxMovie.INDEX_DTYPE)
+        or None if the movie does not have a .idx file.
+        """
+        return self.movie.getIndex()
 
     def loadAFrame(self, frame_number):
         """
@@ -258,12 +240,9 @@ class DaxReader(Reader):
         """
         super(DaxReader, self).loadAFrame(frame_number)
 
-        self.fileptr.seek(frame_number * self.image_height * self.image_width * 2)
-        image_data = numpy.fromfile(self.fileptr, dtype='uint16', count = self.image_height * self.image_width)
-        image_data = numpy.reshape(image_data, [self.image_height, self.image_width])
-        if self.bigendian:
-            image_data.byteswap(True)
-        return image_data
+        # This makes a (native byte order) copy so that the data remains
+        # valid after the movie is closed.
+        return numpy.array(self.movie.frame(frame_number), dtype = numpy.uint16)
 
 
 class TifReader(Reader):
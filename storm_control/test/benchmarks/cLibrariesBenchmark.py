@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Benchmark of the C libraries and their numpy fall backs.
+
+This measures the number of calls per second of the image rescaling,
+focus quality and LMMoment object finding functions using the C
+library and using numpy, for synthetic frames of different sizes,
+and reports the results as JSON.
+
+Usage:
+  python cLibrariesBenchmark.py --sizes 256 512 2048 --repeats 20
+"""
+import argparse
+import json
+import numpy
+import time
+
+import storm_control.hal4000.camera.frame as frame
+import storm_control.hal4000.focusLock.focusQuality as focusQuality
+import storm_control.hal4000.halLib.c_image_manipulation_c as cImageManipulation
+import storm_control.hal4000.spotCounter.lmmObjectFinder as lmmObjectFinder
+
+
+def makeFrame(size, n_spots):
+    """
+    Create a frame with (roughly) Gaussian spots on a noisy background.
+    """
+    np_data = numpy.random.normal(100.0, 5.0, (size, size))
+    psf = numpy.exp(-(numpy.arange(-4, 5)**2)/(2.0 * 1.5 * 1.5))
+    psf = 1000.0 * numpy.outer(psf, psf)
+    for i in range(n_spots):
+        [x, y] = numpy.random.randint(4, size - 5, 2)
+        np_data[y-4:y+5,x-4:x+5] += psf
+    return frame.Frame(np_data.astype(numpy.uint16), 0, size, size, "camera1")
+
+
+def rate(fn, repeats):
+    """
+    Return the number of calls of fn per second.
+    """
+    start_time = time.perf_counter()
+    for i in range(repeats):
+        fn()
+    return repeats/(time.perf_counter() - start_time)
+
+
+def benchmark(a_frame, repeats):
+    """
+    Returns a dictionary with the results.
+    """
+    image = a_frame.getData()
+    kernels = {"focus quality" : lambda use_numpy : focusQuality.imageGradient(a_frame, use_numpy = use_numpy),
+               "lmmoment" : lambda use_numpy : lmmObjectFinder.findObjects(a_frame, 300, use_numpy = use_numpy),
+               "rescale" : lambda use_numpy : cImageManipulation.rescaleImage(image, False, False, False, [100, 1000], None,
+                                                                              use_numpy = use_numpy)}
+    available = {"focus quality" : (focusQuality.focus_quality is not None),
+                 "lmmoment" : (lmmObjectFinder.lmmoment is not None),
+                 "rescale" : (cImageManipulation.image_manip is not None)}
+
+    results = {}
+    for name in sorted(kernels):
+        results[name] = {}
+        backends = ["numpy"]
+        if available[name]:
+            backends = ["c", "numpy"]
+        for backend in backends:
+            fn = kernels[name]
+            results[name][backend + " calls/s"] = rate(lambda : fn(backend == "numpy"), repeats)
+        if available[name]:
+            results[name]["c speed up"] = results[name]["c calls/s"]/results[name]["numpy calls/s"]
+    return results
+
+
+if (__name__ == "__main__"):
+
+    parser = argparse.ArgumentParser(description = 'C libraries benchmark.')
+
+    parser.add_argument('--sizes', dest='sizes', type=int, nargs='+', required=False, default=[256, 512, 2048],
+                        help = "The frame sizes (the frames are square).")
+    parser.add_argument('--density', dest='density', type=float, required=False, default=1.0e-4,
+                        help = "The number of spots per pixel.")
+    parser.add_argument('--repeats', dest='repeats', type=int, required=False, default=20,
+                        help = "The number of calls of each function.")
+    parser.add_argument('--output', dest='output', type=str, required=False, default=None,
+                        help = "Save the results to this file, the default is to print them.")
+
+    args = parser.parse_args()
+
+    lmmObjectFinder.initialize()
+
+    all_results = []
+    for size in args.sizes:
+        results = benchmark(makeFrame(size, int(args.density * size * size)), args.repeats)
+        results["size"] = size
+        all_results.append(results)
+
+    lmmObjectFinder.cleanUp()
+
+    if args.output is None:
+        print(json.dumps(all_results, indent = 1))
+    else:
+        with open(args.output, "w") as fp:
+            json.dump(all_results, fp, indent = 1)
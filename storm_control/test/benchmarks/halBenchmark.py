@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+"""
+Headless benchmark of HAL's camera to disk path.
+
+This starts HAL (HalCore) with the emulated camera, records a film
+for each combination of frame size, exposure time and movie format
+and reports the results as JSON. For each film we report:
+
+ 1. The sustained frame rate (from the camera frames that HAL got
+    while filming) and the number of frames that the writers dropped.
+ 2. The queued to processed latency percentiles of the HAL messages.
+ 3. How busy the GUI thread was during the film.
+
+Usage:
+  python halBenchmark.py --sizes 512 2048 --exposures 0.01 --frames 200 --output results.json
+"""
+import argparse
+import json
+import numpy
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from PyQt5 import QtWidgets
+
+import storm_control.sc_library.hdebug as hdebug
+import storm_control.sc_library.log_timing as logTiming
+import storm_control.sc_library.parameters as params
+
+import storm_control.hal4000.hal4000 as hal4000
+import storm_control.hal4000.halLib.halMessage as halMessage
+import storm_control.hal4000.halLib.imagewriters as imagewriters
+import storm_control.hal4000.testing.testActions as testActions
+import storm_control.hal4000.testing.testing as testing
+
+
+def defaultConfig():
+    return os.path.join(os.path.dirname(hal4000.__file__), "xml", "none_linux_config.xml")
+
+
+class BusyMonitor(object):
+    """
+    Measures how much time the thread that this is used in (the GUI
+    thread) spends doing something other than waiting for events.
+
+    This is the CPU time of the thread, the signals of Qt's event
+    dispatcher (awake / aboutToBlock) are not emitted reliably enough
+    for this (for example with the glib event dispatcher).
+    """
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.busy_time = None
+        self.start_cpu = None
+        self.start_time = None
+        self.stop_time = None
+
+    def getResults(self):
+        elapsed = self.stop_time - self.start_time
+        return {"gui busy time (s)" : self.busy_time,
+                "gui busy fraction" : self.busy_time/elapsed}
+
+    def start(self):
+        self.start_cpu = time.thread_time()
+        self.start_time = time.perf_counter()
+
+    def stop(self):
+        self.busy_time = time.thread_time() - self.start_cpu
+        self.stop_time = time.perf_counter()
+
+
+class BenchmarkTest(testing.Testing):
+    """
+    This is loaded as HAL's 'testing' module. It loads the benchmark
+    parameters and then records a single film.
+    """
+    def __init__(self, module_params = None, **kwds):
+        super().__init__(module_params = module_params, **kwds)
+        self.busy_monitor = None
+        self.filming = False
+        self.frame_times = []
+        self.results = module_params.get("results")
+
+        self.test_actions = [testActions.SetDirectory(directory = module_params.get("film_directory")),
+                             testActions.LoadParameters(filename = module_params.get("parameters_file")),
+                             testActions.SetParameters(p_name = 0),
+                             testActions.Record(filename = "benchmark",
+                                                length = module_params.get("frames"))]
+
+    def handleNewFrame(self, frame):
+        if self.filming:
+            self.frame_times.append(time.perf_counter())
+
+    def handleResponses(self, message):
+        if message.isType("get functionality"):
+            message.getResponses()[0].getData()["functionality"].newFrame.connect(self.handleNewFrame)
+        else:
+            super().handleResponses(message)
+            
+    def processMessage(self, message):
+        super().processMessage(message)
+
+        if message.isType("configure1"):
+            self.sendMessage(halMessage.HalMessage(m_type = "get functionality",
+                                                   data = {"name" : "camera1"}))
+            
+        elif message.isType("start film"):
+            self.filming = True
+            self.busy_monitor = BusyMonitor()
+            self.busy_monitor.start()
+
+        elif message.isType("stop film"):
+            self.filming = False
+            self.busy_monitor.stop()
+            self.results.update(self.busy_monitor.getResults())
+            self.results["elapsed time (s)"] = self.busy_monitor.stop_time - self.busy_monitor.start_time
+            self.results["frames"] = message.getData()["number frames"]
+            if (len(self.frame_times) > 1):
+                self.results["frames/s"] = (len(self.frame_times) - 1)/(self.frame_times[-1] - self.frame_times[0])
+            else:
+                self.results["frames/s"] = 0.0
+
+
+def benchmark(config_file, directory, size, exposure_time, filetype, frames):
+    """
+    Record a single film, returns a dictionary with the results.
+    """
+    config = params.config(config_file)
+    config.setv("directory", directory)
+
+    # Configure the emulated camera.
+    cam_params = config.get("modules.camera1.camera.parameters")
+    cam_params.add("chip_size", max(size, 512))
+    cam_params.add("min_exposure_time", min(exposure_time, 0.01))
+
+    # Parameters for the film.
+    parameters = params.StormXMLObject()
+    parameters.add("camera1.exposure_time", params.ParameterFloat(name = "exposure_time", value = exposure_time))
+    parameters.add("camera1.x_start", params.ParameterInt(name = "x_start", value = 1))
+    parameters.add("camera1.x_end", params.ParameterInt(name = "x_end", value = size))
+    parameters.add("camera1.y_start", params.ParameterInt(name = "y_start", value = 1))
+    parameters.add("camera1.y_end", params.ParameterInt(name = "y_end", value = size))
+    parameters.add("film.filetype", params.ParameterString(name = "filetype", value = filetype))
+    parameters_file = os.path.join(directory, "benchmark_parameters.xml")
+    parameters.saveToFile(parameters_file)
+
+    results = {"filetype" : filetype,
+               "size" : size,
+               "exposure time (s)" : exposure_time}
+    c_test = config.addSubSection("modules.testing")
+    c_test.add("class_name", "BenchmarkTest")
+    c_test.add("module_name", "storm_control.test.benchmarks.halBenchmark")
+    c_test.add("film_directory", directory)
+    c_test.add("frames", frames)
+    c_test.add("parameters_file", parameters_file)
+    c_test.add("results", results)
+
+    # Log message events so that we can get the message timing.
+    hdebug.startLogging(directory, "benchmark")
+    events_file = hdebug.event_filename
+
+    hal = hal4000.HalCore(config = config,
+                          testing_mode = True,
+                          show_gui = False)
+    QtWidgets.QApplication.instance().exec_()
+    hdebug.closeEventLog()
+
+    # Film results.
+    for name in os.listdir(directory):
+        if name.startswith("benchmark") and name.endswith(filetype):
+            results["file size (MB)"] = os.path.getsize(os.path.join(directory, name))/(1024.0 * 1024.0)
+    acq_params = params.parameters(os.path.join(directory, "benchmark.xml"), recurse = True)
+    results["dropped frames"] = acq_params.get("acquisition.dropped_frames", 0)
+
+    # Message timing results.
+    latency = []
+    for message in logTiming.eventTiming(events_file).values():
+        if message.isComplete():
+            latency.append(message.getQueuedTime() + message.getProcessingTime())
+    latency = 1.0e3 * numpy.array(latency)
+    results["messages"] = latency.size
+    for pct in [50, 90, 99]:
+        results["message latency p" + str(pct) + " (ms)"] = float(numpy.percentile(latency, pct))
+    results["message latency max (ms)"] = float(numpy.max(latency))
+
+    return results
+
+
+if (__name__ == "__main__"):
+
+    parser = argparse.ArgumentParser(description = 'HAL camera to disk benchmark.')
+
+    parser.add_argument('--config', dest='config', type=str, required=False, default=defaultConfig(),
+                        help = "The HAL configuration file, this must use the emulated camera.")
+    parser.add_argument('--sizes', dest='sizes', type=int, nargs='+', required=False, default=[512],
+                        help = "The frame sizes (the frames are square).")
+    parser.add_argument('--exposures', dest='exposures', type=float, nargs='+', required=False, default=[0.01],
+                        help = "The exposure times in seconds.")
+    parser.add_argument('--formats', dest='formats', type=str, nargs='+', required=False, default=None,
+                        help = "The movie formats, the default is all of them.")
+    parser.add_argument('--frames', dest='frames', type=int, required=False, default=200,
+                        help = "The number of frames to record.")
+    parser.add_argument('--directory', dest='directory', type=str, required=False, default=None,
+                        help = "Where to save the films, the default is a temporary directory.")
+    parser.add_argument('--output', dest='output', type=str, required=False, default=None,
+                        help = "Save the results to this file, the default is to print them.")
+
+    args = parser.parse_args()
+
+    formats = args.formats
+    if formats is None:
+        formats = imagewriters.availableFileFormats(False)
+
+    app = QtWidgets.QApplication(sys.argv)
+
+    all_results = []
+    for size in args.sizes:
+        for exposure_time in args.exposures:
+            for filetype in formats:
+                directory = tempfile.mkdtemp(dir = args.directory)
+
+                # HAL prints a lot of information.
+                stdout = sys.stdout
+                sys.stdout = open(os.devnull, "w")
+                try:
+                    all_results.append(benchmark(args.config,
+                                                 directory + os.path.sep,
+                                                 size,
+                                                 exposure_time,
+                                                 filetype,
+                                                 args.frames))
+                finally:
+                    sys.stdout.close()
+                    sys.stdout = stdout
+                    shutil.rmtree(directory)
+
+                print("Finished", filetype, size, exposure_time, file = sys.stderr)
+
+    if args.output is None:
+        print(json.dumps(all_results, indent = 1))
+    else:
+        with open(args.output, "w") as fp:
+            json.dump(all_results, fp, indent = 1)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of the cost of sending messages through HalCore.
+
+This starts HalCore with N modules that do nothing, then measures
+the round trip time of messages (from queued to finalized), both
+when they are sent one at a time and when they are sent in bursts.
+
+Usage:
+  python messageBenchmark.py --modules 5 25 50 --messages 2000
+"""
+import argparse
+import json
+import numpy
+import os
+import sys
+import time
+
+from PyQt5 import QtCore, QtWidgets
+
+import storm_control.hal4000.hal4000 as hal4000
+import storm_control.hal4000.halLib.halMessage as halMessage
+import storm_control.hal4000.halLib.halModule as halModule
+import storm_control.sc_library.hdebug as hdebug
+import storm_control.sc_library.parameters as params
+
+
+class BenchModule(halModule.HalModule):
+    """
+    A module that does nothing.
+    """
+    def __init__(self, module_params = None, qt_settings = None, **kwds):
+        super().__init__(**kwds)
+        if module_params.get("subscribe"):
+            self.message_types = {"configure1", "start"}
+
+        
+class BenchDriver(BenchModule):
+    """
+    This is loaded as the 'hal' module, it sends the benchmark
+    messages once HAL has started.
+    """
+    def __init__(self, module_params = None, **kwds):
+        super().__init__(module_params = module_params, **kwds)
+        self.message_types = None
+        self.n_messages = module_params.get("n_messages")
+        self.results = module_params.get("results")
+        self.times = []
+
+        halMessage.addMessage("bench", validator = {"data" : None, "resp" : None})
+
+    def cleanUp(self, qt_settings):
+        QtWidgets.QApplication.instance().quit()
+        
+    def handleBurstDone(self, index):
+        self.times.append(time.perf_counter())
+        if (index == (self.n_messages - 1)):
+            self.results["burst"] = self.n_messages/(self.times[-1] - self.times[0])
+            self.sendMessage(halMessage.HalMessage(m_type = "close event"))
+
+    def handleSequentialDone(self, index):
+        self.times.append(time.perf_counter())
+        if (index < (self.n_messages - 1)):
+            self.sendBench(index + 1)
+        else:
+            self.results["sequential"] = numpy.diff(numpy.array(self.times))
+            self.times = [time.perf_counter()]
+            for i in range(self.n_messages):
+                self.sendMessage(halMessage.HalMessage(m_type = "bench",
+                                                       finalizer = lambda x = i: self.handleBurstDone(x)))
+
+    def processMessage(self, message):
+        if message.isType("start"):
+            self.times = [time.perf_counter()]
+            self.sendBench(0)
+
+    def sendBench(self, index):
+        self.sendMessage(halMessage.HalMessage(m_type = "bench",
+                                               finalizer = lambda : self.handleSequentialDone(index)))
+        
+
+def benchmark(n_modules, n_messages, subscribe = False):
+    """
+    Returns a dictionary with the round trip time statistics for
+    n_messages sent to n_modules.
+    """
+    config = params.StormXMLObject()
+    config.add("setup_name", "benchmark")
+    
+    results = {}
+    for i in range(n_modules):
+        if (i == 0):
+            m_params = config.addSubSection("modules.hal")
+            m_params.add("class_name", "BenchDriver")
+            m_params.add("n_messages", n_messages)
+            m_params.add("results", results)
+        else:
+            m_params = config.addSubSection("modules.bench" + str(i))
+            m_params.add("class_name", "BenchModule")
+        m_params.add("module_name", __name__)
+        m_params.add("subscribe", subscribe)
+
+    hal = hal4000.HalCore(config = config,
+                          show_gui = False)
+    QtWidgets.QApplication.instance().exec_()
+
+    seq = results["sequential"]
+    return {"modules" : n_modules,
+            "subscribe" : subscribe,
+            "messages" : n_messages,
+            "sequential mean (us)" : 1.0e6 * float(numpy.mean(seq)),
+            "sequential median (us)" : 1.0e6 * float(numpy.median(seq)),
+            "sequential p99 (us)" : 1.0e6 * float(numpy.percentile(seq, 99)),
+            "burst (messages/s)" : results["burst"]}
+        
+
+if (__name__ == "__main__"):
+
+    parser = argparse.ArgumentParser(description = 'HalCore message round trip benchmark.')
+
+    parser.add_argument('--modules', dest='modules', type=int, nargs='+', required=False, default=[5, 25],
+                        help = "The number of modules.")
+    parser.add_argument('--messages', dest='messages', type=int, required=False, default=1000,
+                        help = "The number of messages to send.")
+    parser.add_argument('--subscribe', dest='subscribe', action='store_true',
+                        help = "The modules only subscribe to the messages that they need.")
+    parser.add_argument('--log', dest='log', type=str, required=False, default=None,
+                        help = "Log to this directory.")
+
+    args = parser.parse_args()
+
+    if args.log is not None:
+        hdebug.startLogging(args.log, "benchmark")
+        
+    app = QtWidgets.QApplication(sys.argv)
+
+    # HalCore prints every message that it sends.
+    all_results = []
+    for n_modules in args.modules:
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+        try:
+            all_results.append(benchmark(n_modules, args.messages, subscribe = args.subscribe))
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    print(json.dumps(all_results, indent = 1))
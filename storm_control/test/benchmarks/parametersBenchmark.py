@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""
+Benchmark of StormXMLObject parameter look ups.
+
+This measures the number of look ups per second of get(), has() and
+of a ParameterHandle for parameters at different depths, as well as
+the number of copy(), difference(), toString() and parameters file
+load calls per second, and reports the results as JSON.
+
+Usage:
+  python parametersBenchmark.py --parameters hal_parameters.xml --repeats 100000
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import storm_control.sc_library.parameters as params
+
+
+def makeParameters(n_sections, n_parameters):
+    """
+    Create some parameters that look (roughly) like HAL's parameters.
+    """
+    parameters = params.StormXMLObject()
+    for i in range(n_sections):
+        section = parameters.addSubSection("section" + str(i))
+        for j in range(n_parameters):
+            section.add(params.ParameterInt(name = "int" + str(j), value = j))
+        sub_section = section.addSubSection("display")
+        for j in range(n_parameters):
+            sub_section.add(params.ParameterFloat(name = "float" + str(j), value = float(j)))
+    return parameters
+
+
+def rate(fn, repeats):
+    """
+    Return the number of calls of fn per second.
+    """
+    start_time = time.perf_counter()
+    for i in range(repeats):
+        fn()
+    return repeats/(time.perf_counter() - start_time)
+
+
+def benchmark(parameters, repeats):
+    """
+    Returns a dictionary with the results.
+    """
+    results = {}
+
+    # Pick the first and the deepest parameter for the look ups.
+    pnames = []
+    xml_object = parameters
+    root = ""
+    while True:
+        attrs = sorted(xml_object.getAttrs())
+        sections = [x for x in attrs if isinstance(xml_object.getp(x), params.StormXMLObject)]
+        values = [x for x in attrs if not x in sections]
+        if values:
+            pnames.append(root + values[0])
+        if not sections:
+            break
+        root += sections[0] + "."
+        xml_object = xml_object.get(sections[0])
+    pnames = sorted(set([pnames[0], pnames[-1]]), key = lambda x: x.count("."))
+
+    for pname in pnames:
+        handle = parameters.getHandle(pname)
+        results[pname] = {"depth" : pname.count(".") + 1,
+                          "get/s" : rate(lambda : parameters.get(pname), repeats),
+                          "getp/s" : rate(lambda : parameters.getp(pname), repeats),
+                          "handle get/s" : rate(lambda : handle.get(), repeats),
+                          "has/s" : rate(lambda : parameters.has(pname), repeats),
+                          "has (missing)/s" : rate(lambda : parameters.has(pname + "_missing"), repeats)}
+
+    # difference() of two copies, of two copies where one section was
+    # changed, and of two independent versions of the parameters.
+    p_copy = parameters.copy()
+    n_diffs = max(1, repeats//1000)
+    results["difference/s"] = rate(lambda : params.difference(parameters, p_copy), n_diffs)
+    p_copy.delete(pnames[-1])
+    p_copy.add(pnames[-1], parameters.getp(pnames[-1]).copy())
+    results["difference (one change)/s"] = rate(lambda : params.difference(parameters, p_copy), n_diffs)
+    p_other = params.StormXMLObject(parameters.toXML(override_is_saved = True), recurse = True)
+    results["difference (independent)/s"] = rate(lambda : params.difference(parameters, p_other), n_diffs)
+    results["copy/s"] = rate(lambda : parameters.copy(), n_diffs)
+
+    # Serializing and loading.
+    results["toString/s"] = rate(lambda : parameters.toString(all_params = True), n_diffs)
+
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, "parameters.xml")
+        parameters.saveToFile(filename, all_params = True)
+        load = lambda : params.parameters(filename, recurse = True)
+
+        params.setFileCache(size = 0)
+        results["load/s"] = rate(load, n_diffs)
+        params.setFileCache(size = 0, directory = os.path.join(directory, "sidecars"))
+        results["load (sidecar)/s"] = rate(load, n_diffs)
+        params.setFileCache()
+        results["load (cached)/s"] = rate(load, n_diffs)
+    finally:
+        shutil.rmtree(directory)
+
+    return results
+
+
+if (__name__ == "__main__"):
+
+    parser = argparse.ArgumentParser(description = 'StormXMLObject look up benchmark.')
+
+    parser.add_argument('--parameters', dest='parameters', type=str, required=False, default=None,
+                        help = "A parameters file, the default is to use generated parameters.")
+    parser.add_argument('--sections', dest='sections', type=int, required=False, default=20,
+                        help = "The number of sections of the generated parameters.")
+    parser.add_argument('--size', dest='size', type=int, required=False, default=20,
+                        help = "The number of parameters in each section of the generated parameters.")
+    parser.add_argument('--repeats', dest='repeats', type=int, required=False, default=100000,
+                        help = "The number of look ups.")
+    parser.add_argument('--output', dest='output', type=str, required=False, default=None,
+                        help = "Save the results to this file, the default is to print them.")
+
+    args = parser.parse_args()
+
+    if args.parameters is None:
+        parameters = makeParameters(args.sections, args.size)
+    else:
+        parameters = params.parameters(args.parameters, recurse = True)
+
+    results = benchmark(parameters, args.repeats)
+
+    if args.output is None:
+        print(json.dumps(results, indent = 1))
+    else:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent = 1)
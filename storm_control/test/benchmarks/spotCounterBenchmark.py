@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+Benchmark of the spot counter.
+
+This measures the number of frames per second that the spot counter
+can analyze, both as a single image in the current thread and in
+tiles with a varying number of worker threads, and reports the
+results as JSON.
+
+Usage:
+  python spotCounterBenchmark.py --size 2048 --spots 2000 --threads 1 2 4 8
+"""
+import argparse
+import json
+import numpy
+import sys
+import time
+
+from PyQt5 import QtCore, QtWidgets
+
+import storm_control.hal4000.camera.frame as frame
+import storm_control.hal4000.spotCounter.findSpots as findSpots
+import storm_control.hal4000.spotCounter.lmmObjectFinder as lmmObjectFinder
+
+
+def makeFrame(size, n_spots):
+    """
+    Create a frame with (roughly) Gaussian spots on a noisy background.
+    """
+    np_data = numpy.random.normal(100.0, 5.0, (size, size))
+    psf = numpy.exp(-(numpy.arange(-4, 5)**2)/(2.0 * 1.5 * 1.5))
+    psf = 1000.0 * numpy.outer(psf, psf)
+    for i in range(n_spots):
+        [x, y] = numpy.random.randint(4, size - 5, 2)
+        np_data[y-4:y+5,x-4:x+5] += psf
+    return frame.Frame(np_data.astype(numpy.uint16).flatten(), 0, size, size, "camera1")
+
+
+def benchmark(a_frame, threshold, threads, tile_size, frames):
+    """
+    Returns a dictionary with the results.
+    """
+    results = {}
+
+    # Whole image, current thread.
+    lmmObjectFinder.initialize()
+    start_time = time.perf_counter()
+    for i in range(frames):
+        frame_analysis = findSpots.FrameAnalysis(frame = a_frame, threshold = threshold)
+        frame_analysis.analyzeImage()
+    results["whole frames/s"] = frames/(time.perf_counter() - start_time)
+    results["localizations"] = frame_analysis.getCounts()
+    lmmObjectFinder.cleanUp()
+
+    # Tiles, worker threads.
+    for n_threads in threads:
+        spot_counter = findSpots.SpotCounter(max_threads = n_threads,
+                                             queue_size = frames,
+                                             tile_size = tile_size)
+        counts = []
+        event_loop = QtCore.QEventLoop()
+
+        def handleImageProcessed(frame_analysis):
+            counts.append(frame_analysis.getCounts())
+            if (len(counts) == frames):
+                event_loop.quit()
+
+        spot_counter.imageProcessed.connect(handleImageProcessed)
+
+        start_time = time.perf_counter()
+        for i in range(frames):
+            spot_counter.newFrameToAnalyze("camera1", a_frame, threshold)
+        event_loop.exec_()
+        elapsed = time.perf_counter() - start_time
+
+        spot_counter.cleanUp()
+        results["tiled frames/s (" + str(n_threads) + " threads)"] = frames/elapsed
+        results["tiled localizations (" + str(n_threads) + " threads)"] = counts[-1]
+
+    return results
+
+
+if (__name__ == "__main__"):
+
+    parser = argparse.ArgumentParser(description = 'Spot counter benchmark.')
+
+    parser.add_argument('--size', dest='size', type=int, required=False, default=2048,
+                        help = "The frame size (the frames are square).")
+    parser.add_argument('--spots', dest='spots', type=int, required=False, default=2000,
+                        help = "The number of spots in the frame.")
+    parser.add_argument('--threshold', dest='threshold', type=int, required=False, default=300,
+                        help = "The spot finding threshold.")
+    parser.add_argument('--threads', dest='threads', type=int, nargs='+', required=False, default=[1, 2, 4],
+                        help = "The number of worker threads.")
+    parser.add_argument('--tile_size', dest='tile_size', type=int, required=False, default=256,
+                        help = "The number of rows in a tile.")
+    parser.add_argument('--frames', dest='frames', type=int, required=False, default=50,
+                        help = "The number of frames to analyze.")
+    parser.add_argument('--output', dest='output', type=str, required=False, default=None,
+                        help = "Save the results to this file, the default is to print them.")
+
+    args = parser.parse_args()
+
+    app = QtWidgets.QApplication(sys.argv)
+
+    results = benchmark(makeFrame(args.size, args.spots),
+                        args.threshold,
+                        args.threads,
+                        args.tile_size,
+                        args.frames)
+
+    if args.output is None:
+        print(json.dumps(results, indent = 1))
+    else:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent = 1)
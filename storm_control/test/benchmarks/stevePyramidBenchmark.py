@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Benchmark of drawing Steve mosaics.
+
+This creates a grid of image items and measures how long it takes
+to draw the whole mosaic at different view scales, as well as the
+size of the pixmaps that were created, and reports the results as
+JSON.
+
+Usage:
+  python stevePyramidBenchmark.py --tiles 20 --size 1024 --scales 0.01 0.05 0.2
+"""
+import argparse
+import json
+import numpy
+import sys
+import time
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+import storm_control.steve.imageItem as imageItem
+
+
+def makeScene(n_tiles, size):
+    """
+    Create a n_tiles x n_tiles grid of image items.
+    """
+    scene = QtWidgets.QGraphicsScene()
+    image_items = []
+    numpy_data = numpy.random.randint(0, 2000, (size, size)).astype(numpy.uint16)
+    for i in range(n_tiles):
+        for j in range(n_tiles):
+            image_item = imageItem.ImageItem(numpy_data = numpy_data,
+                                              objective_name = "obj1",
+                                              x_um = float(i * size),
+                                              y_um = float(j * size))
+            image_item.dataToPixmap(100, 1000)
+            image_item.setMagnification(1.0)
+            scene.addItem(image_item.getGraphicsItem())
+            image_items.append(image_item)
+    return [scene, image_items]
+
+
+def benchmark(scene, image_items, scales, view_size):
+    """
+    Returns a dictionary with the results.
+    """
+    results = {}
+    rect = scene.itemsBoundingRect()
+    for scale in scales:
+        q_image = QtGui.QImage(view_size, view_size, QtGui.QImage.Format_RGB32)
+        painter = QtGui.QPainter(q_image)
+        source = QtCore.QRectF(rect.topLeft(), QtCore.QSizeF(view_size/scale, view_size/scale))
+
+        start_time = time.perf_counter()
+        scene.render(painter, QtCore.QRectF(0, 0, view_size, view_size), source)
+        elapsed = time.perf_counter() - start_time
+        painter.end()
+
+        pixmap_bytes = 0
+        for image_item in image_items:
+            pixmap = image_item.getGraphicsItem().pixmap
+            if pixmap is not None:
+                pixmap_bytes += pixmap.width() * pixmap.height() * pixmap.depth() // 8
+
+        results[str(scale)] = {"draw time (s)" : elapsed,
+                               "pixmap MB" : pixmap_bytes/(1024.0 * 1024.0)}
+
+        # Start the next scale without any pixmaps.
+        for image_item in image_items:
+            image_item.setContrast(100, 1000)
+    return results
+
+
+if (__name__ == "__main__"):
+
+    parser = argparse.ArgumentParser(description = 'Steve mosaic drawing benchmark.')
+
+    parser.add_argument('--tiles', dest='tiles', type=int, required=False, default=20,
+                        help = "The mosaic is tiles x tiles images.")
+    parser.add_argument('--size', dest='size', type=int, required=False, default=1024,
+                        help = "The image size (the images are square).")
+    parser.add_argument('--scales', dest='scales', type=float, nargs='+', required=False, default=[0.01, 0.05, 0.2],
+                        help = "The view scales.")
+    parser.add_argument('--view_size', dest='view_size', type=int, required=False, default=1000,
+                        help = "The view size in pixels.")
+    parser.add_argument('--output', dest='output', type=str, required=False, default=None,
+                        help = "Save the results to this file, the default is to print them.")
+
+    args = parser.parse_args()
+
+    app = QtWidgets.QApplication(sys.argv)
+
+    [scene, image_items] = makeScene(args.tiles, args.size)
+    results = benchmark(scene, image_items, args.scales, args.view_size)
+
+    if args.output is None:
+        print(json.dumps(results, indent = 1))
+    else:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent = 1)
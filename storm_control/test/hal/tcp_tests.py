@@ -238,6 +238,92 @@ class FindSum4(testing.TestingTCP):
                                             test_mode = True)]
 
 
+#
+# Test "Get Frame" message.
+#
+class GetFrameAction1(testActionsTCP.GetFrame):
+
+    def checkMessage(self, tcp_message):
+        assert not tcp_message.hasError()
+        assert(len(self.data) == 1)
+        [header, np_array] = self.data[0]
+        assert(header["message_id"] == tcp_message.getID())
+        assert(header["info"]["frame_number"] == tcp_message.getResponse("frame_number"))
+        assert(np_array.shape == (512, 512))
+
+class GetFrame1(testing.TestingTCP):
+    """
+    Take a movie, then get the last frame.
+    """
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+
+        self.test_actions = [testActionsTCP.TakeMovie(directory = test.dataDirectory(),
+                                                      length = 5,
+                                                      name = "movie_01"),
+                             GetFrameAction1()]
+
+class GetFrameAction2(testActionsTCP.GetFrame):
+
+    def checkMessage(self, tcp_message):
+        assert tcp_message.hasError()
+        assert(len(self.data) == 0)
+
+class GetFrame2(testing.TestingTCP):
+    """
+    Get a frame from a camera that does not exist.
+    """
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+
+        self.test_actions = [GetFrameAction2(camera = "camera9")]
+
+
+#
+# Test "Get Lock Telemetry" message.
+#
+class GetLockTelemetryAction1(testActionsTCP.GetLockTelemetry):
+
+    def checkMessage(self, tcp_message):
+        assert not tcp_message.hasError()
+        points = tcp_message.getResponse("points")
+        assert(points > 5)
+        assert(len(tcp_message.getResponse("offset")) == 5)
+        assert(tcp_message.getResponse("locked_fraction") > 0.0)
+        times = tcp_message.getResponse("time")
+        assert(times == sorted(times))
+
+class GetLockTelemetry1(testing.TestingTCP):
+    """
+    Lock, then get the lock telemetry.
+    """
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+
+        self.test_actions = [testActions.ShowGUIControl(control_name = "focus lock"),
+                             testActions.Timer(100),
+                             SetFocusLockModeAction1(mode_name = "Always On",
+                                                     locked = True),
+                             testActions.Timer(1500),
+                             GetLockTelemetryAction1(duration = 10.0,
+                                                     max_points = 5)]
+
+class GetLockTelemetryAction2(testActionsTCP.GetLockTelemetry):
+
+    def checkMessage(self, tcp_message):
+        assert not tcp_message.hasError()
+        assert(tcp_message.getResponse("points") is None)
+
+class GetLockTelemetry2(testing.TestingTCP):
+    """
+    Test mode, there is no response.
+    """
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+
+        self.test_actions = [GetLockTelemetryAction2(test_mode = True)]
+
+
 #
 # Test "Get Mosaic Settings" message.
 #
@@ -603,6 +689,39 @@ class SetProgression5(testing.TestingTCP):
                                               name = "movie_01"),
                              testActions.Timer(500)]
 
+
+#
+# Test "Stream Frames" message.
+#
+class StreamFramesAction1(testActionsTCP.StreamFrames):
+
+    def checkMessage(self, tcp_message):
+        assert not tcp_message.hasError()
+        if not self.tcp_message.getData("stream"):
+            assert(tcp_message.getResponse("sent_frames") >= 5)
+
+class StreamFramesTakeMovieAction1(testActionsTCP.TakeMovie):
+
+    def checkMessage(self, tcp_message):
+        frame_numbers = [x[0]["info"]["frame_number"] for x in self.data]
+        assert(len(frame_numbers) >= 5)
+        assert(frame_numbers[-5:] == list(range(5)))
+        assert(all(map(lambda x: (x[1].shape == (512, 512)), self.data)))
+
+class StreamFrames1(testing.TestingTCP):
+    """
+    Stream the frames of a movie.
+    """
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+
+        self.test_actions = [StreamFramesAction1(),
+                             StreamFramesTakeMovieAction1(directory = test.dataDirectory(),
+                                                          length = 5,
+                                                          name = "movie_01"),
+                             StreamFramesAction1(stream = False)]
+
+
 #
 # Test "Take Movie" message.
 #
@@ -37,6 +37,27 @@ def testCImageManipulation():
             assert(numpy.allclose(c_nim, py_nim, atol = 1.1))
 
 
+def testCImageManipulationLarge():
+    import storm_control.hal4000.halLib.c_image_manipulation_c as cIM
+
+    # Large enough to be split into bands of rows (if there is more than one core).
+    nim = numpy.random.randint(4000, size = (1200, 1000)).astype(numpy.uint16)
+
+    for ori in [[False, False, False], [True, False, True], [False, True, True]]:
+        [c_nim, c_image_min, c_image_max] = cIM.rescaleImage(nim, *ori, [100, 3000], 3500)
+        [py_nim, py_image_min, py_image_max] = cIM.rescaleImage(nim, *ori, [100, 3000], 3500, True)
+
+        assert(c_image_min == py_image_min)
+        assert(c_image_max == py_image_max)
+        assert(numpy.array_equal(c_nim, py_nim))
+
+    # Check that the lookup table is cached.
+    assert(cIM.getLUT(100, 3000, 3500) is cIM.getLUT(100, 3000, 3500))
+    assert(cIM.getLUT(100, 3000, 3500)[3500] == 255)
+    assert(cIM.getLUT(100, 3000, None)[3500] == 255)
+    assert(cIM.getLUT(100, 3000, 3500)[3000] == 254)
+
+
 
 def testFocusQuality():
     import storm_control.hal4000.camera.frame as frame
@@ -64,6 +85,16 @@ def testFocusQuality():
     assert(grad == 0.0)
     
 
+def testFocusQualityNumpy():
+    import storm_control.hal4000.camera.frame as frame
+    import storm_control.hal4000.focusLock.focusQuality as fq
+
+    for [image_x, image_y] in [[256, 256], [100, 37]]:
+        image = numpy.random.randint(4000, size = (image_y, image_x)).astype(numpy.uint16)
+        a_frame = frame.Frame(image, 0, image_x, image_y, "na")
+        assert(fq.imageGradient(a_frame) == fq.imageGradient(a_frame, use_numpy = True))
+    
+
 def testLMMoment():
     import storm_control.hal4000.camera.frame as frame
     import storm_control.hal4000.spotCounter.lmmObjectFinder as lof
@@ -86,9 +117,43 @@ def testLMMoment():
     lof.cleanUp()
 
 
+def testLMMomentNumpy():
+    import storm_control.hal4000.camera.frame as frame
+    import storm_control.hal4000.spotCounter.lmmObjectFinder as lof
+
+    lof.initialize()
+
+    # Spots on a noisy background, with a saturated area.
+    image_x = 300
+    image_y = 200
+    image = numpy.random.normal(100.0, 5.0, (image_y, image_x))
+    psf = numpy.exp(-(numpy.arange(-4, 5)**2)/(2.0 * 1.5 * 1.5))
+    psf = 1000.0 * numpy.outer(psf, psf)
+    for i in range(200):
+        [r, c] = [numpy.random.randint(4, image_y - 5), numpy.random.randint(4, image_x - 5)]
+        image[r-4:r+5,c-4:c+5] += numpy.random.uniform(0.2, 1.0) * psf
+    image[10:20,10:20] = 40000
+
+    a_frame = frame.Frame(image.astype(numpy.uint16).flatten(), 0, image_x, image_y, "na")
+
+    for threshold in [0, 300]:
+        for tile in [None, [50, 120]]:
+            [x1, y1, n1] = lof.findObjects(a_frame, threshold, tile = tile)
+            [x2, y2, n2] = lof.findObjects(a_frame, threshold, tile = tile, use_numpy = True)
+            assert(n1 > 10)
+            assert(n1 == n2)
+            assert(numpy.array_equal(x1[:n1], x2[:n2]))
+            assert(numpy.array_equal(y1[:n1], y2[:n2]))
+
+    lof.cleanUp()
+
+
 if (__name__ == "__main__"):
     testCImageManipulation()
+    testCImageManipulationLarge()
     testFocusQuality()
+    testFocusQualityNumpy()
     testLMMoment()
+    testLMMomentNumpy()
     
     
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+Tests of the camera display frame renderer.
+"""
+import numpy
+
+import storm_control.hal4000.camera.frame as frame
+import storm_control.hal4000.qtWidgets.qtCameraGraphicsScene as qtCameraGraphicsScene
+
+
+def renderFrames(qtbot, frames, settings):
+    """
+    Render frames (one at a time), returns a list of the results. The
+    images are copied as the renderer re-uses them.
+    """
+    results = []
+    renderer = qtCameraGraphicsScene.QtCameraFrameRenderer()
+
+    def handleRendered(rendered):
+        rendered["q image copy"] = rendered["q image"].copy()
+        results.append(rendered)
+        renderer.renderingDone()
+
+    renderer.rendered.connect(handleRendered)
+    renderer.start()
+    for a_frame in frames:
+        n_results = len(results)
+        assert renderer.render(a_frame, settings)
+
+        # The renderer is busy until we get the results.
+        assert not renderer.render(a_frame, settings)
+        qtbot.waitUntil(lambda : (len(results) > n_results))
+    renderer.stopThread()
+    return results
+
+
+def test_frame_renderer_1(qtbot):
+    """
+    Test rendering and buffer re-use.
+    """
+    settings = {"colortable" : None,
+                "display_range" : [0, 100],
+                "saturated_value" : None,
+                "scale" : [1, 1]}
+
+    frames = []
+    for i in range(3):
+        np_data = numpy.full(30 * 20, 10 * i, dtype = numpy.uint16)
+        np_data[5 * 30 + 7] = 300
+        frames.append(frame.Frame(np_data, i, 30, 20, "camera1"))
+    results = renderFrames(qtbot, frames, settings)
+    
+    assert(len(results) == 3)
+    for i, rendered in enumerate(results):
+        q_image = rendered["q image copy"]
+        assert(rendered["image min"] == 10 * i)
+        assert(rendered["image max"] == 300)
+        assert(q_image.width() == 30)
+        assert(q_image.height() == 20)
+        assert(q_image.pixelIndex(0, 0) == int(2.55 * 10 * i + 0.5))
+        assert(q_image.pixelIndex(7, 5) == 255)
+        assert(q_image.colorCount() == 256)
+        assert(q_image.pixelColor(7, 5).red() == 255)
+        assert(rendered["latency"] >= 0.0)
+
+    # The image buffers alternate.
+    assert(int(results[0]["q image"].constBits()) == int(results[2]["q image"].constBits()))
+    assert(int(results[0]["q image"].constBits()) != int(results[1]["q image"].constBits()))
+
+
+def test_frame_renderer_2(qtbot):
+    """
+    Test binned cameras and color tables.
+    """
+    colortable = [[255 - i, i, 0] for i in range(256)]
+    settings = {"colortable" : colortable,
+                "display_range" : [0, 255],
+                "saturated_value" : None,
+                "scale" : [2, 2]}
+
+    np_data = numpy.arange(16 * 8, dtype = numpy.uint16)
+    [rendered] = renderFrames(qtbot, [frame.Frame(np_data, 0, 16, 8, "camera1")], settings)
+
+    q_image = rendered["q image copy"]
+    assert(q_image.width() == 32)
+    assert(q_image.height() == 16)
+    color = q_image.pixelColor(2 * 3, 2 * 1)
+    assert(color.green() == (16 + 3))
+    assert(color.red() == (255 - 16 - 3))
+
+    # Re-used buffers show the new frames.
+    settings["scale"] = [1, 1]
+    frames = [frame.Frame(numpy.full(16 * 8, 10 * i, dtype = numpy.uint16), i, 16, 8, "camera1") for i in range(4)]
+    results = renderFrames(qtbot, frames, settings)
+    assert([x["q image copy"].pixelColor(0, 0).green() for x in results] == [0, 10, 20, 30])
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+"""
+Tests of running Dave commands at the same time.
+"""
+from xml.etree import ElementTree
+
+from PyQt5 import QtCore
+
+import storm_control.dave.dave as dave
+import storm_control.dave.sequenceViewer as sequenceViewer
+import storm_control.hal4000.halLib.halMessage as halMessage
+import storm_control.hal4000.tcpControl.tcpControl as tcpControl
+import storm_control.sc_library.parameters as params
+import storm_control.sc_library.tcpMessage as tcpMessage
+
+
+class FakeClient(QtCore.QObject):
+    """
+    Records the messages instead of sending them.
+    """
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.sent = []
+
+    def sendMessage(self, message):
+        self.sent.append(message)
+
+
+def createAction(xml):
+    return sequenceViewer.createDaveAction(ElementTree.fromstring(xml))
+
+
+def createHAL(parallel_mode):
+    """
+    Returns the HAL TCP control module and the list of the HAL messages
+    that it sends (except for the 'configuration' messages).
+    """
+    halMessage.initializeMessages()
+    module_params = params.StormXMLObject()
+    configuration = module_params.addSubSection("configuration")
+    configuration.add(params.ParameterSetBoolean(name = "parallel_mode", value = parallel_mode))
+    configuration.add(params.ParameterInt(name = "tcp_port", value = 9000))
+
+    tcp_control = tcpControl.TCPControl(module_name = "tcp_control",
+                                        module_params = module_params)
+    tcp_control.control.verbose = False
+    sent = []
+    def handleNewMessage(message):
+        if not message.isType("configuration"):
+            sent.append(message)
+    tcp_control.newMessage.connect(handleNewMessage)
+    return [tcp_control, sent]
+
+
+def handleHALMessage(tcp_control, message, data):
+    """
+    Respond to a HAL message as the HAL module that handles it would.
+    """
+    message.addResponse(halMessage.HalMessageResponse(source = "test", data = data))
+    tcp_control.handleResponses(message)
+
+
+def createEngine(lookahead):
+    engine = dave.CommandEngine(lookahead = lookahead)
+    engine.HALClient = FakeClient()
+    engine.kilroyClient = FakeClient()
+
+    results = {"done" : 0, "problems" : []}
+    def handleDone():
+        results["done"] += 1
+    engine.done.connect(handleDone)
+    engine.problem.connect(results["problems"].append)
+    return [engine, results]
+
+
+def imagingCycle():
+    """
+    A valve protocol and the standard imaging cycle.
+    """
+    return [createAction('<DAValveProtocol>Hybridize</DAValveProtocol>'),
+            createAction('<DAMoveStage><stage_x>1.0</stage_x><stage_y>2.0</stage_y></DAMoveStage>'),
+            createAction('<DASetParameters><parameters type="string">p1</parameters></DASetParameters>'),
+            createAction('<DACheckFocus><num_focus_checks>10</num_focus_checks></DACheckFocus>'),
+            createAction('<DATakeMovie><name>movie_01</name><length>10</length></DATakeMovie>')]
+
+
+def test_dave_command_engine_1(qtbot):
+    """
+    Test starting the commands that don't share resources at the same time.
+    """
+    [engine, results] = createEngine(2)
+    [valve, move, params, focus, movie] = imagingCycle()
+
+    # The valve protocol, the move and the parameters can be started together.
+    engine.startCommand(valve)
+    assert(results["done"] == 1)
+    assert(engine.canStart(move))
+    engine.startCommand(move)
+    assert(results["done"] == 2)
+    assert(engine.canStart(params))
+    engine.startCommand(params)
+    assert(results["done"] == 2)
+    assert(engine.HALClient.sent == [move.getMessage(), params.getMessage()])
+    assert(engine.kilroyClient.sent == [valve.getMessage()])
+
+    # The focus check has to wait for all of them.
+    assert(not engine.canStart(focus))
+
+    # Replies can arrive in any order.
+    engine.handleMessageReceived(params.getMessage())
+    assert(results["done"] == 3)
+    assert(not engine.canStart(focus))
+    engine.handleMessageReceived(move.getMessage())
+    engine.handleMessageReceived(valve.getMessage())
+    assert(results["done"] == 5)
+    assert(engine.isIdle())
+    assert(len(results["problems"]) == 0)
+
+    # Nothing else can be started while the movie is being taken.
+    engine.startCommand(movie)
+    assert(not engine.canStart(move))
+
+    # Replies that don't match a running command are an error.
+    engine.handleMessageReceived(tcpMessage.TCPMessage(message_type = "Take Movie"))
+    assert(len(results["problems"]) == 1)
+    assert(engine.isIdle())
+
+
+def test_dave_command_engine_2(qtbot):
+    """
+    Test that the commands are run one at a time by default and in test mode.
+    """
+    [engine, results] = createEngine(0)
+    [valve, move, params, focus, movie] = imagingCycle()
+
+    engine.startCommand(move)
+    assert(results["done"] == 0)
+    assert(not engine.canStart(params))
+    engine.handleMessageReceived(move.getMessage())
+    assert(results["done"] == 1)
+    assert(engine.canStart(params))
+
+    [engine, results] = createEngine(2)
+    engine.startCommand(valve, test_mode = True)
+    assert(results["done"] == 0)
+    assert(not engine.canStart(move))
+
+    # Actions that Dave handles itself are only run by themselves.
+    engine.handleMessageReceived(valve.getMessage())
+    engine.startCommand(move)
+    assert(not engine.canStart(createAction('<DADelay><delay>10</delay></DADelay>')))
+
+
+def test_dave_command_engine_3(qtbot):
+    """
+    Test that HAL handles a stage move and the following parameter
+    change at the same time only in parallel mode.
+    """
+    for parallel_mode in [False, True]:
+        [tcp_control, sent] = createHAL(parallel_mode)
+        engine = dave.CommandEngine(lookahead = 2)
+        assert(engine.HALClient.startCommunication())
+
+        [valve, move, set_params, focus, movie] = imagingCycle()
+        engine.startCommand(move)
+        assert(engine.canStart(set_params))
+        engine.startCommand(set_params)
+        qtbot.waitUntil(lambda : (len(sent) > 0))
+        assert(sent[0].isType("tcp message"))
+        assert(sent[0].getData()["tcp message"].isType("Move Stage"))
+
+        if parallel_mode:
+
+            # The move is acknowledged and the parameters are set without
+            # waiting for HAL to process the move.
+            qtbot.waitUntil(lambda : (len(sent) == 2))
+            assert(engine.commands == [set_params])
+            handleHALMessage(tcp_control, sent[0], {"handled" : True})
+        else:
+
+            # HAL waits for the move to complete before setting the parameters.
+            qtbot.wait(200)
+            assert(len(sent) == 1)
+            assert(engine.commands == [move, set_params])
+            handleHALMessage(tcp_control, sent[0], {"handled" : True})
+            qtbot.waitUntil(lambda : (len(sent) == 2))
+
+        assert(sent[1].isType("set parameters"))
+        handleHALMessage(tcp_control, sent[1], {"current" : True, "found" : True})
+        qtbot.waitUntil(lambda : engine.isIdle())
+
+        engine.HALClient.stopCommunication()
+        tcp_control.cleanUp(None)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Tests of loading and stepping through Dave sequences.
+"""
+import os
+
+import storm_control.dave.sequenceViewer as sequenceViewer
+import storm_control.test as test
+
+
+def makeSequence(n_loops, n_positions):
+    """
+    Create a sequence file with n_loops x n_positions x 2 actions. The
+    movies have 3 different parameters, so there are n_positions + 3
+    action ids.
+    """
+    filename = os.path.join(test.dataDirectory(), "dave_sequence_viewer.xml")
+    with open(filename, "w") as fp:
+        fp.write('<?xml version="1.0" encoding="ISO-8859-1"?>\n<sequence>\n')
+        for i in range(n_loops):
+            fp.write('<branch name="loop_' + str(i) + '">\n')
+            for j in range(n_positions):
+                fp.write('<branch name="position_' + str(j) + '">\n')
+                fp.write('<DAMoveStage><stage_x type="float">' + str(j) + '</stage_x><stage_y type="float">0.0</stage_y></DAMoveStage>\n')
+                fp.write('<DATakeMovie><name>movie_' + str(i) + '_' + str(j) + '</name><length>10</length>')
+                fp.write('<parameters>p' + str(j % 3) + '</parameters></DATakeMovie>\n')
+                fp.write('</branch>\n')
+            fp.write('</branch>\n')
+        fp.write('</sequence>\n')
+    return filename
+
+
+def test_dave_sequence_viewer_1(qtbot):
+    """
+    Test that the items are only created when they are needed.
+    """
+    filename = makeSequence(20, 30)
+    model = sequenceViewer.parseSequenceFile(filename)
+    os.remove(filename)
+
+    assert(model.getNumberItems() == 1200)
+    assert(model.rowCount() == 20)
+    assert(model.item(5).rowCount() == 0)
+    assert(model.hasChildren(model.indexFromItem(model.item(5))))
+
+    # Fetching a branch creates it's children.
+    index = model.indexFromItem(model.item(5))
+    assert(model.canFetchMore(index))
+    model.fetchMore(index)
+    assert(not model.canFetchMore(index))
+    assert(model.item(5).rowCount() == 30)
+
+    # Getting an item creates the items of the branches that it is in.
+    item = model.getItem(1000)
+    assert(item.getParentName() == "position_20")
+    assert(item.parent().parent().text() == "loop_16")
+    assert(model.getItem(1000) is item)
+
+    model.setCurrentAction(item)
+    assert(model.getCurrentIndex() == 1000)
+
+
+def test_dave_sequence_viewer_2(qtbot):
+    """
+    Test validation and the run estimates.
+    """
+    filename = makeSequence(10, 30)
+    model = sequenceViewer.parseSequenceFile(filename)
+    os.remove(filename)
+
+    # There is one test action for each id.
+    model.setTestMode(True)
+    assert(model.getNumberItems() == 33)
+
+    # Set the estimates for the movies.
+    for i in range(33):
+        item = model.getCurrentItem()
+        if not item.getDaveActionID().startswith("Move Stage"):
+            item.getDaveAction().setDuration(10.0)
+            item.getDaveAction().setDiskUsage(2.0)
+            model.updateEstimates()
+        model.getNextItem(False)
+
+    # The movies with parameters 'p1' are invalid.
+    model.resetItemIndex()
+    while (model.getCurrentItem().getDaveActionID() != "p1"):
+        model.getNextItem(False)
+    model.setCurrentItemValid(False)
+    assert(not model.isAllValid())
+
+    model.setTestMode(False)
+    assert(model.getNumberItems() == 600)
+    assert(model.getRunSize() == 400.0)
+    assert(model.getRemainingTime() == 2000.0)
+    assert(model.getRemainingTime(300) == 1000.0)
+    assert(model.getRemainingTime(600) == 0.0)
+
+    # Invalid actions are skipped.
+    model.resetItemIndex()
+    actions = 1
+    while model.getNextItem(True) is not None:
+        assert(model.getCurrentItem().isValid())
+        actions += 1
+    assert(actions == 500)
+
+    model.setAllValid(True)
+    assert(model.isAllValid())
+    assert(model.getRunSize() == 600.0)
+
+    # Peeking doesn't change the current item.
+    model.resetItemIndex()
+    next_action = model.peekNextAction(True)
+    assert(model.getCurrentIndex() == 0)
+    assert(model.getNextItem(True).getDaveAction() is next_action)
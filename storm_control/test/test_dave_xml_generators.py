@@ -3,10 +3,13 @@
 Test Dave XML generators.
 """
 import os
+from xml.etree import ElementTree
 
 import storm_control.test as test
 
+import storm_control.dave.sequenceViewer as sequenceViewer
 import storm_control.dave.xml_generators.v1Generator as v1Generator
+import storm_control.dave.xml_generators.v2Generator as v2Generator
 
 
 def test_v1_1():
@@ -21,3 +24,31 @@ def test_v1_1():
 
     v1Generator.generate(None, input_xml, input_positions, output_xml)
 
+
+
+def test_v2_1(qtbot):
+    """
+    Test generating a sequence from a recipe and parsing it incrementally.
+    """
+    input_xml = test.daveXmlFilePathAndName("v2_generator_test.xml")
+    output_xml = os.path.join(test.dataDirectory(), "dave_v2_sequence.xml")
+
+    xml_parser = v2Generator.XMLRecipeParser(xml_filename = input_xml,
+                                             output_filename = output_xml,
+                                             verbose = False)
+    assert(xml_parser.parseXML() == output_xml)
+
+    # Parsing the file incrementally and all at once should give the same sequence.
+    def toList(events):
+        return [[event, data if (event != "action") else ElementTree.tostring(data)] for [event, data] in events]
+
+    events = toList(sequenceViewer.iterSequenceFile(output_xml))
+    assert(events == toList(sequenceViewer.iterSequence(ElementTree.parse(output_xml).getroot())))
+
+    # 2 valve protocols and 4 actions for each of 2 movies at each of the 19 positions for each valve protocol.
+    assert(len([x for x in events if (x[0] == "action")]) == 2 + 2 * 2 * 19 * 4)
+
+    model = sequenceViewer.parseSequenceFile(output_xml)
+    assert(model.getNumberItems() == 2 + 2 * 2 * 19 * 4)
+    assert(model.getCurrentItem().getParentName() == "Valve Loop")
+    os.remove(output_xml)
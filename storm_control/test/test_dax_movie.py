@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Tests of sc_library.daxMovie.
+"""
+import numpy
+import os
+
+import storm_control.test as test
+
+import storm_control.sc_library.daxMovie as daxMovie
+import storm_control.steve.movieReader as movieReader
+
+
+def makeMovie(basename, n_frames, image_x, image_y):
+    data = numpy.arange(n_frames * image_x * image_y, dtype = numpy.uint16)
+    data = data.reshape((n_frames, image_y, image_x))
+    data.tofile(basename + ".dax")
+    daxMovie.writeInf(basename + ".inf", image_x, image_y, n_frames)
+    return data
+
+
+def test_dax_movie_1():
+    """
+    Test random access and slicing.
+    """
+    basename = os.path.join(test.dataDirectory(), "dax_movie_1")
+    data = makeMovie(basename, 10, 12, 8)
+
+    with daxMovie.DaxMovie(basename + ".dax") as movie:
+        assert(movie.filmSize() == [12, 8, 10])
+        assert(len(movie) == 10)
+        assert(movie.getIndex() is None)
+        assert(numpy.array_equal(movie.frame(7), data[7]))
+        assert(numpy.array_equal(movie[2:5], data[2:5]))
+        assert(numpy.array_equal(movie[:,3,4], data[:,3,4]))
+
+
+def test_dax_movie_2():
+    """
+    Test reading a movie that is still being written.
+    """
+    filename = os.path.join(test.dataDirectory(), "dax_movie_2.dax")
+    data = numpy.ones((4, 8, 12), dtype = numpy.uint16)
+
+    with open(filename, "wb") as fp:
+        movie = daxMovie.DaxMovie(filename, image_x = 12, image_y = 8)
+        assert(len(movie) == 0)
+
+        data[:2].tofile(fp)
+        fp.flush()
+        assert(movie.refresh() == 2)
+
+        data[2:].tofile(fp)
+        fp.flush()
+        assert(movie.refresh() == 4)
+        assert(numpy.array_equal(movie[3], data[3]))
+        movie.close()
+
+
+def test_dax_movie_3():
+    """
+    Test index files and the Steve reader.
+    """
+    basename = os.path.join(test.dataDirectory(), "dax_movie_3")
+    data = makeMovie(basename, 5, 16, 4)
+
+    index = [(i, 0.1 * i, 1.0, 2.0, numpy.nan) for i in range(5)]
+    daxMovie.saveIndex(basename + ".idx", index)
+
+    reader = movieReader.inferReader(basename + ".dax")
+    assert(reader.filmSize() == [16, 4, 5])
+    assert(numpy.array_equal(reader.loadAFrame(3), data[3]))
+    assert(numpy.allclose(reader.averageFrames(), numpy.mean(data, axis = 0)))
+
+    r_index = reader.getIndex()
+    assert(numpy.array_equal(r_index["frame"], numpy.arange(5)))
+    assert(numpy.allclose(r_index["timestamp"], 0.1 * numpy.arange(5)))
+    assert(numpy.all(numpy.isnan(r_index["lock_offset"])))
+    reader.close()
+
+
+if (__name__ == "__main__"):
+    test_dax_movie_1()
+    test_dax_movie_2()
+    test_dax_movie_3()
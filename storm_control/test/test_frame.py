@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Tests of the Frame and FramePool classes.
+"""
+import gc
+import numpy
+import sys
+import threading
+
+import storm_control.hal4000.camera.cameraFunctionality as cameraFunctionality
+import storm_control.hal4000.camera.frame as frame
+
+
+def test_frame_pool_1():
+    """
+    Test that storage is re-used once the frame is gone.
+    """
+    pool = frame.FramePool(16, 8, numpy.uint16)
+
+    a_frame = frame.Frame(pool.acquire(), 0, 16, 8, "na", pool = pool)
+    ptr = a_frame.getDataPtr()
+    assert(a_frame.getData().size == 16 * 8)
+    del a_frame
+
+    assert(pool.getNFree() == 1)
+    np_data = pool.acquire()
+    assert(np_data.ctypes.data == ptr)
+    assert(pool.getNAllocated() == 1)
+
+
+def test_frame_pool_2():
+    """
+    Test that storage that is still in use is not re-used.
+    """
+    pool = frame.FramePool(16, 8, numpy.uint16)
+
+    a_frame = frame.Frame(pool.acquire(), 0, 16, 8, "na", pool = pool)
+    a_view = a_frame.getData().reshape((8, 16))
+    del a_frame
+
+    np_data = pool.acquire()
+    assert(pool.getNAllocated() == 2)
+    assert(np_data.ctypes.data != a_view.ctypes.data)
+
+    # Once the view is gone the storage is available again.
+    del a_view
+    pool.release(np_data)
+    del np_data
+    pool.acquire()
+    pool.acquire()
+    assert(pool.getNAllocated() == 2)
+
+
+def test_frame_pool_3():
+    """
+    Test explicit release and shared pools.
+    """
+    pool = frame.getFramePool(32, 4)
+    assert(pool is frame.getFramePool(32, 4, numpy.uint16))
+    assert(pool is not frame.getFramePool(4, 32))
+
+    a_frame = frame.Frame(pool.acquire(), 0, 32, 4, "na", pool = pool)
+    n_free = pool.getNFree()
+    a_frame.release()
+    a_frame.release()
+    assert(pool.getNFree() == (n_free + 1))
+    del a_frame
+    assert(pool.getNFree() == (n_free + 1))
+
+
+def test_frame_pool_4():
+    """
+    Test that frames can be garbage collected while the pool is locked.
+    """
+    pool = frame.FramePool(32, 4, numpy.uint16, max_free = 2)
+
+    # A frame that is only freed by the cyclic garbage collector.
+    cycle = [frame.Frame(pool.acquire(), 0, 32, 4, "na", pool = pool)]
+    cycle.append(cycle)
+    del cycle
+
+    pool.mutex.lock()
+    try:
+        gc.collect()
+    finally:
+        pool.mutex.unlock()
+    assert(pool.getNFree() == 1)
+
+    # The number of unused buffers is limited to max_free.
+    for i in range(4):
+        pool.release(numpy.empty(128, dtype = numpy.uint16))
+    assert(pool.getNFree() == 2)
+
+
+def test_latest_frame_1():
+    """
+    Test that the latest frame and the number of frames always match
+    when they are set in another thread.
+    """
+    cam_fn = cameraFunctionality.CameraFunctionality(camera_name = "camera1")
+    assert(cam_fn.getLatestFrame() == [None, 0])
+
+    def setFrames():
+        for i in range(20000):
+            cam_fn.setLatestFrame(frame.Frame(None, i, 1, 1, "camera1"))
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1.0e-6)
+    try:
+        camera_thread = threading.Thread(target = setFrames)
+        camera_thread.start()
+        while camera_thread.is_alive():
+            [latest_frame, n_frames] = cam_fn.getLatestFrame()
+            if latest_frame is not None:
+                assert(latest_frame.frame_number == (n_frames - 1))
+        camera_thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert(cam_fn.getLatestFrame()[1] == 20000)
+
+
+if (__name__ == "__main__"):
+    test_frame_pool_1()
+    test_frame_pool_2()
+    test_frame_pool_3()
+    test_frame_pool_4()
+    test_latest_frame_1()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Tests of HAL message handling.
+"""
+import os
+
+import storm_control.hal4000.halLib.halMessage as halMessage
+import storm_control.hal4000.halLib.halModule as halModule
+import storm_control.sc_library.hdebug as hdebug
+import storm_control.test as test
+
+
+class CountingModule(halModule.HalModule):
+
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.processed = []
+
+    def processMessage(self, message):
+        self.processed.append(message.m_type)
+
+
+def test_hal_messages_1():
+    """
+    Test that modules handle queued messages in batches.
+    """
+    halMessage.initializeMessages()
+    module = CountingModule(module_name = "counter")
+
+    messages = []
+    for i in range(halModule.max_batch_size + 5):
+        message = halMessage.HalMessage(m_type = "sync")
+        message.incRefCount()
+        messages.append(message)
+        module.handleMessage(message)
+
+    # The first batch is handled in a single call.
+    module.nextMessage()
+    assert(len(module.processed) == halModule.max_batch_size)
+    assert(module.queued_messages_timer.isActive())
+
+    module.nextMessage()
+    assert(len(module.processed) == len(messages))
+    assert(all(map(lambda x: (x.getRefCount() == 0), messages)))
+
+
+def test_hal_messages_2():
+    """
+    Test message validation.
+    """
+    halMessage.initializeMessages()
+    halMessage.addMessage("check",
+                          validator = {"data" : {"a" : [True, int],
+                                                 "b" : [False, str]},
+                                       "resp" : None})
+
+    source = halModule.HalModule(module_name = "source")
+    halMessage.validateData(halMessage.HalMessage(m_type = "check", source = source, data = {"a" : 1}))
+    halMessage.validateData(halMessage.HalMessage(m_type = "check", source = source, data = {"a" : 1, "b" : "x"}))
+
+    for data in [None, {"b" : "x"}, {"a" : "1"}, {"a" : 1, "c" : 2}]:
+        try:
+            halMessage.validateData(halMessage.HalMessage(m_type = "check", source = source, data = data))
+        except halMessage.HalMessageException:
+            pass
+        else:
+            assert False, "No exception for " + str(data)
+
+    message = halMessage.HalMessage(m_type = "check", source = source, data = {"a" : 1})
+    response = halMessage.HalMessageResponse(source = "source", data = {"a" : 1})
+    try:
+        halMessage.validateResponse(message, response)
+    except halMessage.HalMessageException:
+        pass
+    else:
+        assert False, "No exception for response."
+
+
+def test_hal_messages_3():
+    """
+    Test logging message events.
+    """
+    hdebug.startLogging(test.logDirectory(), "hal_messages")
+
+    source = halModule.HalModule(module_name = "source")
+    message = halMessage.HalMessage(m_type = "test", source = source)
+    message.incRefCount()
+    message.logEvent("queued")
+    message.decRefCount(name = "module1")
+    message.logEvent("processed")
+
+    filename = hdebug.event_filename
+    hdebug.closeEventLog()
+
+    events = list(hdebug.readEvents(filename))
+    assert([x[1] for x in events] == ["queued", "handled by", "processed"])
+    assert(all(map(lambda x: (x[2] == message.m_id) and (x[4] == "test"), events)))
+    assert(events[1][3] == "module1")
+    os.remove(filename)
+
+
+if (__name__ == "__main__"):
+    test_hal_messages_1()
+    test_hal_messages_2()
+    test_hal_messages_3()
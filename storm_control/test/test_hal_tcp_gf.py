@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+"""
+Test getting and streaming frames.
+"""
+from storm_control.test.hal.standardHalTest import halTest
+
+
+def test_hal_tcp_gf_1():
+
+    halTest(config_xml = "none_tcp_config.xml",
+            class_name = "GetFrame1",
+            test_module = "storm_control.test.hal.tcp_tests")
+
+
+def test_hal_tcp_gf_2():
+
+    halTest(config_xml = "none_tcp_config.xml",
+            class_name = "GetFrame2",
+            test_module = "storm_control.test.hal.tcp_tests")
+
+
+def test_hal_tcp_gf_3():
+
+    halTest(config_xml = "none_tcp_config.xml",
+            class_name = "StreamFrames1",
+            test_module = "storm_control.test.hal.tcp_tests")
+
+    
+if (__name__ == "__main__"):
+    test_hal_tcp_gf_1()
+    test_hal_tcp_gf_2()
+    test_hal_tcp_gf_3()
@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+"""
+Test getting the focus lock telemetry.
+"""
+from storm_control.test.hal.standardHalTest import halTest
+
+
+def test_hal_tcp_glt_1():
+
+    halTest(config_xml = "none_tcp_config.xml",
+            class_name = "GetLockTelemetry1",
+            test_module = "storm_control.test.hal.tcp_tests")
+
+
+def test_hal_tcp_glt_2():
+
+    halTest(config_xml = "none_tcp_config.xml",
+            class_name = "GetLockTelemetry2",
+            test_module = "storm_control.test.hal.tcp_tests")
+
+    
+if (__name__ == "__main__"):
+    test_hal_tcp_glt_1()
+    test_hal_tcp_glt_2()
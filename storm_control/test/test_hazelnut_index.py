@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+Tests of the Hazelnut directory index.
+"""
+import os
+import shutil
+
+import storm_control.hazelnut.dirIndex as dirIndex
+import storm_control.test as test
+
+
+class CountingDirectory(dirIndex.LocalDirectory):
+    """
+    Records which directories were listed.
+    """
+    def __init__(self, root, **kwds):
+        super().__init__(root, **kwds)
+        self.listed = []
+
+    def listDirectory(self, path):
+        self.listed.append(path)
+        return super().listDirectory(path)
+
+
+def makeFile(root, path, size = 10):
+    filename = os.path.join(root, *path.split("/"))
+    os.makedirs(os.path.dirname(filename), exist_ok = True)
+    with open(filename, "wb") as fp:
+        fp.write(os.urandom(size))
+    return filename
+
+
+def makeTree():
+    root = os.path.join(test.dataDirectory(), "hazelnut_index")
+    if os.path.exists(root):
+        shutil.rmtree(root)
+    for i in range(3):
+        for j in range(4):
+            makeFile(root, "day_" + str(i) + "/movie_" + str(j) + ".dax", size = 100 + j)
+            makeFile(root, "day_" + str(i) + "/movie_" + str(j) + ".xml")
+    return root
+
+
+def test_hazelnut_index_1():
+    """
+    Test that only the directories that changed are listed.
+    """
+    root = makeTree()
+    db_name = os.path.join(test.dataDirectory(), "hazelnut_index.db")
+    if os.path.exists(db_name):
+        os.remove(db_name)
+
+    index = dirIndex.DirIndex(db_name)
+    changed = index.scan(dirIndex.LocalDirectory(root))
+    assert(len(changed) == 24)
+    assert(len(index.getPaths(".xml")) == 12)
+    assert(index.getFile("day_1/movie_2.dax").size == 102)
+    index.close()
+
+    # Nothing changed, so only the directory times are checked.
+    index = dirIndex.DirIndex(db_name)
+    directory = CountingDirectory(root)
+    assert(index.scan(directory) == [])
+    assert(directory.listed == [])
+    assert(index.getNumberFiles() == 24)
+
+    # A new movie.
+    makeFile(root, "day_2/movie_9.dax")
+    makeFile(root, "day_2/movie_9.xml")
+    directory = CountingDirectory(root)
+    assert(sorted(index.scan(directory)) == ["day_2/movie_9.dax", "day_2/movie_9.xml"])
+    assert(directory.listed == ["day_2"])
+
+    # Removed files and directories.
+    os.remove(os.path.join(root, "day_0", "movie_0.dax"))
+    shutil.rmtree(os.path.join(root, "day_1"))
+    assert(index.scan(dirIndex.LocalDirectory(root)) == [])
+    assert(index.getFile("day_0/movie_0.dax") is None)
+    assert(index.getNumberFiles() == 17)
+    index.close()
+
+    shutil.rmtree(root)
+    os.remove(db_name)
+
+
+def test_hazelnut_index_2():
+    """
+    Test updating the index from file events.
+    """
+    root = makeTree()
+    index = dirIndex.DirIndex(":memory:")
+    index.scan(dirIndex.LocalDirectory(root))
+
+    # Modified files.
+    filename = makeFile(root, "day_0/movie_1.dax", size = 500)
+    index.updateFile("day_0/movie_1.dax", filename)
+    assert(index.getFile("day_0/movie_1.dax").size == 500)
+
+    # Deleted files.
+    os.remove(filename)
+    index.updateFile("day_0/movie_1.dax", filename)
+    assert(index.getFile("day_0/movie_1.dax") is None)
+
+    # Transferred files record the hash.
+    index.addFile("day_0/movie_1.dax", 500, 1.0, "abc")
+    assert(index.getFile("day_0/movie_1.dax").hash == "abc")
+
+    index.removeDirectory("day_2")
+    assert(index.getNumberFiles() == 16)
+    index.close()
+
+    shutil.rmtree(root)
+
+
+if (__name__ == "__main__"):
+    test_hazelnut_index_1()
+    test_hazelnut_index_2()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+"""
+Tests of the Hazelnut file transfers.
+"""
+import datetime
+import hashlib
+import os
+import threading
+
+import storm_control.hazelnut.fileTransfer as fileTransfer
+import storm_control.hazelnut.transferQueue as transferQueue
+import storm_control.test as test
+
+
+class FakeFileObject(object):
+
+    def __init__(self, partialpath_name):
+        self.mtime = datetime.datetime.now()
+        self.partialpath_name = partialpath_name
+
+    def __str__(self):
+        return self.partialpath_name
+
+    def getMTime(self):
+        return self.mtime
+
+    def getPartialPathName(self):
+        return self.partialpath_name
+
+
+class FullDestination(object):
+    """
+    A destination where every transfer fails.
+    """
+    def __init__(self):
+        self.statistics = fileTransfer.TransferStatistics()
+
+    def getStatistics(self):
+        return self.statistics
+
+    def shouldTransfer(self, file_object):
+        return True
+
+    def transferFile(self, file_object, callback, cancel = None):
+        raise IOError("No space left on device")
+
+
+def makeFile(name, size):
+    filename = os.path.join(test.dataDirectory(), name)
+    with open(filename, "wb") as fp:
+        fp.write(os.urandom(size))
+    return filename
+
+
+def readFile(filename):
+    with open(filename, "rb") as fp:
+        return fp.read()
+
+
+def test_hazelnut_transfer_1():
+    """
+    Test copying a file.
+    """
+    src_name = makeFile("hazelnut_src.dax", 1000000)
+    dest_name = os.path.join(test.dataDirectory(), "hazelnut", "hazelnut_dest.dax")
+    statistics = fileTransfer.TransferStatistics()
+    progress = []
+
+    digest = fileTransfer.copyFile(src_name, dest_name,
+                                   callback = progress.append,
+                                   statistics = statistics)
+
+    assert(digest == hashlib.md5(readFile(src_name)).hexdigest())
+    assert(readFile(dest_name) == readFile(src_name))
+    assert(os.path.getmtime(dest_name) == os.path.getmtime(src_name))
+    assert(not os.path.exists(dest_name + fileTransfer.partial_ext))
+    assert(progress[-1] == 100)
+
+    stats = statistics.getStatistics()
+    assert(stats["files"] == 1)
+    assert(stats["bytes"] == 1000000)
+    assert(stats["rate"] > 0.0)
+
+    os.remove(src_name)
+    os.remove(dest_name)
+    os.rmdir(os.path.dirname(dest_name))
+
+
+def test_hazelnut_transfer_2():
+    """
+    Test resuming a transfer that was cancelled.
+    """
+    old_chunk_size = fileTransfer.chunk_size
+    fileTransfer.chunk_size = 100000
+    try:
+        src_name = makeFile("hazelnut_src.dax", 1000000)
+        dest_name = os.path.join(test.dataDirectory(), "hazelnut_dest.dax")
+        statistics = fileTransfer.TransferStatistics()
+
+        # Cancel after 3 chunks.
+        cancel = threading.Event()
+        def callback(progress):
+            if (progress >= 30):
+                cancel.set()
+
+        try:
+            fileTransfer.copyFile(src_name, dest_name, callback = callback, cancel = cancel)
+            assert False
+        except fileTransfer.TransferCancelled:
+            pass
+        assert(not os.path.exists(dest_name))
+        assert(os.path.getsize(dest_name + fileTransfer.partial_ext) == 300000)
+
+        # Resume.
+        fileTransfer.copyFile(src_name, dest_name, statistics = statistics)
+        assert(readFile(dest_name) == readFile(src_name))
+
+        stats = statistics.getStatistics()
+        assert(stats["resumed"] == 1)
+        assert(stats["resumed_bytes"] == 300000)
+        assert(stats["bytes"] == 700000)
+    finally:
+        fileTransfer.chunk_size = old_chunk_size
+
+    os.remove(src_name)
+    os.remove(dest_name)
+
+
+def test_hazelnut_transfer_3():
+    """
+    Test that a corrupted partial copy is detected.
+    """
+    src_name = makeFile("hazelnut_src.dax", 500000)
+    dest_name = os.path.join(test.dataDirectory(), "hazelnut_dest.dax")
+    partial_name = dest_name + fileTransfer.partial_ext
+
+    with open(partial_name, "wb") as fp:
+        fp.write(os.urandom(1000))
+    try:
+        fileTransfer.copyFile(src_name, dest_name)
+        assert False
+    except fileTransfer.TransferException:
+        pass
+    assert(not os.path.exists(partial_name))
+    assert(not os.path.exists(dest_name))
+
+    # The next try starts from the beginning.
+    fileTransfer.copyFile(src_name, dest_name)
+    assert(readFile(dest_name) == readFile(src_name))
+
+    # The partial copy is not used if the source was modified after it.
+    with open(partial_name, "wb") as fp:
+        fp.write(readFile(src_name)[:1000])
+    os.utime(partial_name, (0, os.path.getmtime(src_name) - 10))
+    fileTransfer.copyFile(src_name, dest_name)
+    assert(readFile(dest_name) == readFile(src_name))
+
+    os.remove(src_name)
+    os.remove(dest_name)
+
+
+def test_hazelnut_transfer_4(qtbot):
+    """
+    Test that failed transfers are retried and then marked as failed.
+    """
+    destination = FullDestination()
+    tq_mvc = transferQueue.TransferQueueMVC()
+    tq_mvc.addDestination(destination)
+    tq_mvc.addFileObject(FakeFileObject("movie_01.dax"))
+    tq_item = tq_mvc.tq_model.item(0)
+
+    tq_mvc.startTransfer()
+    qtbot.waitUntil(lambda : (tq_item.getStatus() == "failed"))
+    tq_mvc.cleanUp()
+
+    assert(tq_item.getRetries() == tq_mvc.max_retries)
+    assert(tq_item.getError() == "No space left on device")
+    assert(tq_item.toolTip() == tq_item.getError())
+    assert(destination.getStatistics().getStatistics()["failed"] == tq_mvc.max_retries)
+
+
+if (__name__ == "__main__"):
+    test_hazelnut_transfer_1()
+    test_hazelnut_transfer_2()
+    test_hazelnut_transfer_3()
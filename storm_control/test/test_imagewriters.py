@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+"""
+Tests of the image writers.
+"""
+import numpy
+import os
+import threading
+
+from PyQt5 import QtCore
+
+import storm_control.test as test
+
+import storm_control.hal4000.camera.frame as frame
+import storm_control.hal4000.film.film as film
+import storm_control.hal4000.film.filmSettings as filmSettings
+import storm_control.hal4000.halLib.imagewriters as imagewriters
+
+
+class FakeCameraFunctionality(QtCore.QObject):
+    newFrame = QtCore.pyqtSignal(object)
+    stopped = QtCore.pyqtSignal()
+
+    def __init__(self, camera_name = "camera1", x_pixels = None, y_pixels = None, **kwds):
+        super().__init__(**kwds)
+        self.camera_name = camera_name
+        self.parameters = {"bytes_per_frame" : 2 * x_pixels * y_pixels,
+                           "extension" : "",
+                           "x_pixels" : x_pixels,
+                           "y_pixels" : y_pixels}
+
+    def getCameraName(self):
+        return self.camera_name
+
+    def getParameter(self, pname):
+        return self.parameters[pname]
+
+
+def test_writer_thread_1():
+    """
+    Test that all the frames are written, and in the right order.
+    """
+    filename = os.path.join(test.dataDirectory(), "writer_test_1.dax")
+    frame_size = 64 * 64
+
+    with open(filename, "wb", buffering = 0) as fp:
+        wt = imagewriters.WriterThread(frame_size = frame_size,
+                                       n_buffers = 4,
+                                       write_fn = lambda frames : imagewriters.writeBuffers(fp, frames))
+        wt.start()
+
+        n_added = 0
+        for i in range(20):
+            if wt.addFrame(numpy.full(frame_size, i, dtype = numpy.uint16)):
+                n_added += 1
+        wt.stopThread()
+
+    stats = wt.getStatistics()
+    assert(stats["queue depth"] == 0)
+    assert((n_added + stats["dropped frames"]) == 20)
+
+    data = numpy.fromfile(filename, dtype = numpy.uint16).reshape(-1, frame_size)
+    assert(data.shape[0] == n_added)
+
+    # Frames are in order and were not corrupted.
+    firsts = data[:,0]
+    assert(numpy.all(firsts[1:] > firsts[:-1]))
+    for i in range(data.shape[0]):
+        assert(numpy.all(data[i] == data[i,0]))
+
+
+def test_writer_thread_2():
+    """
+    Test that frames are dropped (not blocked on) when the ring is full.
+    """
+    block = threading.Event()
+    written = []
+
+    def writeFn(frames):
+        block.wait()
+        for frame in frames:
+            written.append(int(frame[0]))
+
+    wt = imagewriters.WriterThread(frame_size = 16,
+                                   n_buffers = 4,
+                                   write_fn = writeFn)
+    wt.start()
+
+    # The writer thread can take at most 4 frames, the ring can hold 4 more.
+    n_added = 0
+    for i in range(20):
+        if wt.addFrame(numpy.full(16, i, dtype = numpy.uint16)):
+            n_added += 1
+
+    assert(n_added <= 8)
+    assert(wt.getStatistics()["dropped frames"] == (20 - n_added))
+
+    block.set()
+    wt.stopThread()
+    assert(written == list(range(n_added)))
+
+
+class FailingDaxFile(imagewriters.DaxFile):
+    """
+    A .dax file writer for a full disk.
+    """
+    def writeFrames(self, frames):
+        raise IOError("No space left on device")
+
+
+def test_dax_file_1():
+    """
+    Test that the file is closed when writing failed.
+    """
+    basename = os.path.join(test.dataDirectory(), "dax_test_1")
+    cam_fn = FakeCameraFunctionality(x_pixels = 16, y_pixels = 16)
+    film_settings = filmSettings.FilmSettings(basename = basename, filetype = ".dax")
+
+    writer = FailingDaxFile(camera_functionality = cam_fn, film_settings = film_settings)
+    cam_fn.newFrame.emit(frame.Frame(numpy.zeros(256, dtype = numpy.uint16), 0, 16, 16, "camera1"))
+    cam_fn.stopped.emit()
+    try:
+        writer.closeWriter()
+        assert False
+    except imagewriters.ImageWriterException:
+        pass
+    assert(writer.fp.closed)
+    os.remove(basename + ".dax")
+
+
+class FakeFilm(object):
+    """
+    The parts of the film module that stopFilmingLevel2() uses.
+    """
+    stopFilmingLevel2 = film.Film.stopFilmingLevel2
+
+    def __init__(self, film_settings, writers, **kwds):
+        super().__init__(**kwds)
+        self.film_settings = film_settings
+        self.messages = []
+        self.number_frames = 1
+        self.ui_enabled = False
+        self.view = self
+        self.writers = writers
+
+    def amInLiveMode(self):
+        return False
+
+    def enableUI(self, state):
+        self.ui_enabled = state
+
+    def sendMessage(self, message):
+        self.messages.append(message.getType())
+
+
+def test_dax_file_2():
+    """
+    Test that filming stops and all the files are closed when one writer failed.
+    """
+    basenames = [os.path.join(test.dataDirectory(), "dax_test_2_" + str(i)) for i in range(3)]
+    cam_fn = FakeCameraFunctionality(x_pixels = 16, y_pixels = 16)
+    writers = []
+    for i, basename in enumerate(basenames):
+        film_settings = filmSettings.FilmSettings(basename = basename, filetype = ".dax")
+        if (i == 1):
+            writers.append(FailingDaxFile(camera_functionality = cam_fn, film_settings = film_settings))
+        else:
+            writers.append(imagewriters.DaxFile(camera_functionality = cam_fn, film_settings = film_settings))
+    cam_fn.newFrame.emit(frame.Frame(numpy.zeros(256, dtype = numpy.uint16), 0, 16, 16, "camera1"))
+    cam_fn.stopped.emit()
+
+    film_module = FakeFilm(filmSettings.FilmSettings(tcp_request = True), writers)
+    try:
+        film_module.stopFilmingLevel2()
+        assert False
+    except imagewriters.ImageWriterException:
+        pass
+    assert(film_module.ui_enabled)
+    assert(film_module.messages == ["stop film"])
+    for writer in writers:
+        assert(writer.fp.closed)
+        assert(writer.writer_thread.isFinished())
+    for basename in basenames:
+        os.remove(basename + ".dax")
+        if os.path.exists(basename + ".inf"):
+            os.remove(basename + ".inf")
+
+
+def test_hdf5_file_1():
+    """
+    Test that HDF5 movies can be read back with h5py.
+    """
+    if imagewriters.h5py is None:
+        return
+
+    basename = os.path.join(test.dataDirectory(), "hdf5_test_1")
+    cam_fn = FakeCameraFunctionality(x_pixels = 32, y_pixels = 16)
+    film_settings = filmSettings.FilmSettings(basename = basename, filetype = ".h5")
+    film_settings.setPixelSize(0.16)
+
+    index_values = {"lock offset" : 0.5, "stage x" : 1.0, "stage y" : 2.0}
+    writer = imagewriters.createFileWriter(cam_fn, film_settings, index_values = index_values)
+
+    rs = numpy.random.RandomState(1)
+    data = rs.poisson(lam = 3.0, size = (20, 16, 32)).astype(numpy.uint16)
+    data[5,3,4] = 65535
+    for i in range(data.shape[0]):
+        cam_fn.newFrame.emit(frame.Frame(data[i].ravel(), i + 10, 32, 16, "camera1"))
+    cam_fn.stopped.emit()
+    writer.closeWriter()
+
+    with imagewriters.h5py.File(basename + ".h5", "r") as h5:
+        assert(numpy.array_equal(h5["movie"][()], data))
+        assert(numpy.array_equal(h5["frame_number"][()], numpy.arange(20) + 10))
+        assert(numpy.all(numpy.diff(h5["timestamp"][()]) >= 0.0))
+        assert(numpy.allclose(h5["stage_y"][()], 2.0))
+        assert(h5["movie"].attrs["camera"] == "camera1")
+        assert(h5["movie"].chunks == (1, 16, 32))
+        assert(h5["movie"].id.get_storage_size() < data.nbytes)
+
+
+def test_hdf5_multi_file_1():
+    """
+    Test saving several cameras in a single HDF5 file.
+    """
+    if imagewriters.h5py is None:
+        return
+
+    basename = os.path.join(test.dataDirectory(), "hdf5_multi_test_1")
+    cam_fns = [FakeCameraFunctionality(camera_name = "camera1", x_pixels = 32, y_pixels = 16),
+               FakeCameraFunctionality(camera_name = "camera2", x_pixels = 8, y_pixels = 4)]
+    film_settings = filmSettings.FilmSettings(basename = basename, filetype = ".multi.h5")
+    film_settings.setPixelSize(0.16)
+
+    writers = imagewriters.createFileWriters(cam_fns, film_settings)
+    assert(len(writers) == 1)
+
+    data1 = numpy.arange(10 * 16 * 32, dtype = numpy.uint16).reshape((10, 16, 32))
+    data2 = numpy.arange(10 * 4 * 8, dtype = numpy.uint16).reshape((10, 4, 8))
+    for i in range(10):
+        cam_fns[0].newFrame.emit(frame.Frame(data1[i].ravel(), i, 32, 16, "camera1"))
+        if ((i % 2) == 0):
+            cam_fns[1].newFrame.emit(frame.Frame(data2[i].ravel(), i, 8, 4, "camera2"))
+
+    cam_fns[0].stopped.emit()
+    assert not writers[0].isStopped()
+    cam_fns[1].stopped.emit()
+    writers[0].closeWriter()
+
+    with imagewriters.h5py.File(basename + ".multi.h5", "r") as h5:
+        assert(numpy.array_equal(h5["camera1/movie"][()], data1))
+        assert(numpy.array_equal(h5["camera2/movie"][()], data2[::2]))
+        assert(numpy.array_equal(h5["camera2/frame_number"][()], numpy.arange(0, 10, 2)))
+        assert(h5["camera2/movie"].attrs["camera"] == "camera2")
+
+
+if (__name__ == "__main__"):
+    test_writer_thread_1()
+    test_writer_thread_2()
+    test_dax_file_1()
+    test_dax_file_2()
+    test_hdf5_file_1()
+    test_hdf5_multi_file_1()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+Tests of the focus lock telemetry.
+"""
+import numpy
+import os
+
+import storm_control.hal4000.focusLock.lockTelemetry as lockTelemetry
+import storm_control.test as test
+
+
+def addQPD(telemetry, n):
+    for i in range(n):
+        telemetry.addQPD({"is_good" : True, "offset" : float(i), "sum" : 100.0},
+                         float(i) * 0.1, True, (i % 2) == 0)
+
+
+def test_lock_telemetry_1():
+    """
+    Test the ring buffer.
+    """
+    buf = lockTelemetry.RingBuffer(dtype = numpy.int64, size = 5)
+    assert(buf.getData().size == 0)
+
+    for i in range(3):
+        buf.add(i)
+    assert(buf.getData().tolist() == [0, 1, 2])
+    assert(buf.getData(since = 1).tolist() == [1, 2])
+
+    for i in range(3, 12):
+        buf.add(i)
+    assert(buf.getCount() == 12)
+    assert(buf.getFirst() == 7)
+    assert(buf.getData().tolist() == [7, 8, 9, 10, 11])
+    assert(buf.getData(since = 9).tolist() == [9, 10, 11])
+    assert(buf.getData(since = 12).size == 0)
+
+
+def test_lock_telemetry_2():
+    """
+    Test getting the TCP response.
+    """
+    telemetry = lockTelemetry.LockTelemetry(size = 100)
+    assert(telemetry.getResponse() == {"points" : 0})
+
+    addQPD(telemetry, 150)
+    telemetry.addFocusQuality(1.0, 0.5)
+
+    response = telemetry.getResponse(max_points = 10)
+    assert(response["points"] == 100)
+    assert(len(response["offset"]) == 10)
+    assert(response["offset"][0] == 50.0)
+    assert(response["offset"][-1] == 149.0)
+    assert(response["good_lock_fraction"] == 0.5)
+    assert(response["locked_fraction"] == 1.0)
+    assert(response["focus_quality"] == [0.5])
+
+    # Nothing in the last -1 seconds.
+    assert(telemetry.getResponse(duration = -1.0)["points"] == 0)
+
+
+def test_lock_telemetry_3():
+    """
+    Test saving the telemetry during a film that is longer than the buffer.
+    """
+    telemetry = lockTelemetry.LockTelemetry(size = 10)
+    addQPD(telemetry, 5)
+
+    filename = os.path.join(test.dataDirectory(), "telemetry_lock.txt")
+    telemetry.startFilm(filename)
+    addQPD(telemetry, 33)
+    telemetry.stopFilm()
+
+    # These are not saved.
+    addQPD(telemetry, 5)
+
+    data = numpy.loadtxt(filename, skiprows = 1)
+    assert(data.shape == (33, 7))
+    assert(numpy.array_equal(data[:,1], numpy.arange(33)))
+    os.remove(filename)
+
+
+if (__name__ == "__main__"):
+    test_lock_telemetry_1()
+    test_lock_telemetry_2()
+    test_lock_telemetry_3()
@@ -2,6 +2,12 @@
 """
 Tests of the parameters object functionality.
 """
+import copy
+import os
+import shutil
+
+from xml.dom import minidom
+from xml.etree import ElementTree
 
 import storm_control.test as test
 
@@ -155,6 +161,230 @@ def test_parameters_8():
 
     assert(s1.getSortedAttrs() == ['dd', 'bb', 'aa', 'cc'])
 
+
+def test_parameters_9():
+    """
+    Test that look ups stay correct as parameters are added and removed.
+    """
+    p1 = params.StormXMLObject()
+    p1.add("foo.bar", 1)
+    assert p1.has("foo.bar")
+    assert not p1.has("foo.baz")
+    assert not p1.has("foo.bar.baz")
+
+    p1.get("foo").add("baz", 2)
+    assert(p1.get("foo.baz") == 2)
+
+    p1.delete("foo.bar")
+    assert not p1.has("foo.bar")
+    assert(p1.get("foo.bar", 3) == 3)
+
+    s1 = params.StormXMLObject()
+    s1.add("bar", 4)
+    p1.addSubSection("foo", s1, overwrite = True)
+    assert(p1.get("foo.bar") == 4)
+    assert not p1.has("foo.baz")
+
+    # Copies have their own cache.
+    p2 = p1.copy()
+    p2.setv("foo.bar", 5)
+    assert(p1.get("foo.bar") == 4)
+    assert(p2.get("foo.bar") == 5)
+
+
+def test_parameters_10():
+    """
+    Test parameter handles.
+    """
+    p1 = params.StormXMLObject()
+    p1.add("foo.bar", 1)
+
+    h1 = p1.getHandle("foo.bar")
+    h2 = p1.getHandle("foo.baz")
+    assert(h1.get() == 1)
+    assert not h2.has()
+    assert(h2.get(2) == 2)
+
+    h1.setv(3)
+    assert(p1.get("foo.bar") == 3)
+
+    p1.add("foo.baz", 4)
+    assert(h2.get() == 4)
+
+    p1.delete("foo.bar")
+    assert not h1.has()
+    try:
+        h1.get()
+    except params.ParametersExceptionGet:
+        pass
+    else:
+        assert False, "No exception for a deleted parameter."
+
+
+def test_parameters_11():
+    """
+    Test difference() when a parameter is a section in the other object.
+    """
+    p1 = params.StormXMLObject()
+    p1.add("foo", 1)
+    p1.add("bar.baz", 2)
+
+    p2 = params.StormXMLObject()
+    p2.add("foo.bar", 1)
+    p2.add("bar", 2)
+
+    assert(sorted(params.difference(p1, p2)) == ["bar", "foo"])
+
+
+def test_parameters_12():
+    """
+    Test parameter versions.
+    """
+    p1 = params.parameters(test.xmlFilePathAndName("test_parameters.xml"), recurse = True)
+    p2 = p1.copy()
+    assert(p1.getVersion() == p2.getVersion())
+
+    # Setting the same value does not change the version.
+    p2.setv("camera1.flip_horizontal", False)
+    assert(p1.getVersion() == p2.getVersion())
+
+    # Setting a different value changes the version of the parameter
+    # and of all the sections that it is in.
+    s1 = p2.get("camera1")
+    s1_version = s1.getVersion()
+    p2.setv("camera1.flip_horizontal", True)
+    assert(p1.getVersion() != p2.getVersion())
+    assert(s1.getVersion() != s1_version)
+    assert(params.difference(p1, p2) == ["camera1.flip_horizontal"])
+
+    p2.setv("camera1.flip_horizontal", False)
+    assert(len(params.difference(p1, p2)) == 0)
+
+    # Parameters that are in more than one section.
+    p3 = params.StormXMLObject()
+    s2 = p3.addSubSection("bar")
+    s2.add(p1.getp("display00.camera1.display_max"))
+    p1_version = p1.getVersion()
+    s2.setv("display_max", 200)
+    assert(p1.getVersion() != p1_version)
+    assert(params.difference(p1, p2) == ["display00.camera1.display_max"])
+
+    # Removed parameters are no longer tracked.
+    s2.delete("display_max")
+    s2_version = s2.getVersion()
+    p1.setv("display00.camera1.display_max", 300)
+    assert(s2.getVersion() == s2_version)
+    assert(len(params.difference(p1, p2)) == 0)
+
+    # Copies made with the copy module also track changes.
+    p4 = copy.deepcopy(p1)
+    p4_version = p4.getVersion()
+    p4.setv("display00.camera1.display_max", 100)
+    assert(p4.getVersion() != p4_version)
+    assert(params.difference(p4, p1) == ["display00.camera1.display_max"])
+    
+
+def test_parameters_13():
+    """
+    Test that the parameters copy() is a deep copy.
+    """
+    p1 = params.StormXMLObject()
+    p1.add(params.ParameterSetString(name = "foo", value = "a", allowed = ["a", "b"]))
+    p1.add("bar.baz", [1, 2])
+
+    p2 = p1.copy()
+    p2.getp("foo").getAllowed().append("c")
+    p2.setv("foo", "c")
+    p2.get("bar.baz").append(3)
+
+    assert(p1.getp("foo").getAllowed() == ["a", "b"])
+    assert(p1.get("foo") == "a")
+    assert(p1.get("bar.baz") == [1, 2])
+    assert(p2.get("bar.baz") == [1, 2, 3])
+
+
+def test_parameters_14():
+    """
+    Test the parameters file cache.
+    """
+    filename = os.path.join(test.dataDirectory(), "test_parameters_14.xml")
+    sidecars = os.path.join(test.dataDirectory(), "test_parameters_14")
+    shutil.copyfile(test.xmlFilePathAndName("test_parameters.xml"), filename)
+
+    params.clearFileCache()
+    p1 = params.parameters(filename, recurse = True)
+    p2 = params.parameters(filename, recurse = True)
+    assert(len(params.difference(p1, p2)) == 0)
+
+    # The objects are independent.
+    p1.setv("camera1.flip_horizontal", True)
+    assert not p2.get("camera1.flip_horizontal")
+
+    # Changing the file changes the parameters.
+    p1.saveToFile(filename)
+    p3 = params.parameters(filename, recurse = True)
+    assert p3.get("camera1.flip_horizontal")
+
+    # Parameters from sidecar files.
+    try:
+        params.setFileCache(size = 0, directory = sidecars)
+        p4 = params.parameters(filename, recurse = True)
+        assert(len(os.listdir(sidecars)) == 1)
+        p5 = params.parameters(filename, recurse = True)
+        assert(len(params.difference(p4, p5)) == 0)
+        assert(len(params.difference(p5, p3)) == 0)
+        assert(p4.getVersion() != p5.getVersion())
+    finally:
+        params.setFileCache()
+        shutil.rmtree(sidecars)
+        os.remove(filename)
+
+
+def test_parameters_15():
+    """
+    Test that toString() matches minidom's pretty printing.
+    """
+    p1 = params.parameters(test.xmlFilePathAndName("test_parameters.xml"), recurse = True)
+    p1.add(params.ParameterString(name = "escaped", value = 'a&b<c>"d\' e'))
+    p1.add(params.ParameterString(name = "empty", value = ""))
+    p1.addSubSection("empty_section")
+
+    for all_params in [False, True]:
+        rough_string = ElementTree.tostring(p1.toXML(override_is_saved = all_params))
+        reparsed = minidom.parseString(rough_string)
+        expected = reparsed.toprettyxml(indent = "  ", encoding = "ISO-8859-1").decode()
+        assert(p1.toString(all_params = all_params) == expected)
+
+
+
+def test_parameters_16():
+    """
+    Test that saving the parameters with a film doesn't leave the
+    (temporary) saved parameters as an owner of the modules parameters.
+    """
+    import storm_control.hal4000.film.film as film
+    import storm_control.hal4000.halLib.halMessage as halMessage
+
+    live = params.StormXMLObject()
+    live.add(params.ParameterInt(name = "exposure", value = 10))
+    notes = params.ParameterString(name = "notes", value = "a note")
+
+    responses = [halMessage.HalMessageResponse(source = "camera1", data = {"parameters" : live}),
+                 halMessage.HalMessageResponse(source = "hal", data = {"acquisition" : [notes]})]
+    for i in range(10):
+        [to_save, saved_notes] = film.filmParameters(responses, 100, 0)
+
+    assert(saved_notes == "a note")
+    assert(to_save.get("camera1.exposure") == 10)
+    assert(to_save.get("acquisition.number_frames") == 100)
+    assert(len(live._owners_) == 0)
+    assert(len(live.getp("exposure").owners) == 1)
+    assert(len(notes.owners) == 0)
+
+    # Changes to the modules parameters don't change the saved parameters.
+    live.set("exposure", 20)
+    assert(to_save.get("camera1.exposure") == 10)
+
         
 if (__name__ == "__main__"):
     test_parameters_1()
@@ -165,3 +395,11 @@ if (__name__ == "__main__"):
     test_parameters_6()
     test_parameters_7()
     test_parameters_8()
+    test_parameters_9()
+    test_parameters_10()
+    test_parameters_11()
+    test_parameters_12()
+    test_parameters_13()
+    test_parameters_14()
+    test_parameters_15()
+    test_parameters_16()
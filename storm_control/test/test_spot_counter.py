@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+"""
+Tests of the spot counter analysis queues, scheduling and tiling.
+"""
+import numpy
+
+import storm_control.hal4000.camera.frame as frame
+import storm_control.hal4000.spotCounter.findSpots as findSpots
+import storm_control.hal4000.spotCounter.lmmObjectFinder as lmmObjectFinder
+
+
+def makeFrame(frame_number, size = 64, spots = ()):
+    np_data = numpy.zeros((size, size), dtype = numpy.uint16) + 100
+    for [x, y] in spots:
+        np_data[y-1:y+2,x-1:x+2] = 1000
+    return frame.Frame(np_data.flatten(), frame_number, size, size, "camera1")
+
+
+def makeRandomFrame(size_x, size_y, n_spots):
+    """
+    A frame with spots at random sub-pixel positions.
+    """
+    numpy.random.seed(1)
+    [yy, xx] = numpy.mgrid[0:size_y,0:size_x]
+    np_data = numpy.random.normal(100.0, 2.0, (size_y, size_x))
+    for i in range(n_spots):
+        x = numpy.random.uniform(0, size_x)
+        y = numpy.random.uniform(0, size_y)
+        np_data += 1000.0 * numpy.exp(-((xx - x) * (xx - x) + (yy - y) * (yy - y))/(2.0 * 1.5 * 1.5))
+    return frame.Frame(np_data.astype(numpy.uint16).flatten(), 0, size_x, size_y, "camera1")
+
+
+def makeFrameAnalysis(frame_number):
+    return findSpots.FrameAnalysis(camera_name = "camera1",
+                                   frame = makeFrame(frame_number, size = 4),
+                                   threshold = 500)
+
+
+def test_spot_counter_1():
+    """
+    Test the 'drop_oldest' and 'latest_only' queue policies.
+    """
+    queue = findSpots.AnalysisQueue(policy = "drop_oldest", queue_size = 3)
+    for i in range(10):
+        queue.addFrameAnalysis(makeFrameAnalysis(i))
+    assert([queue.getFrameAnalysis().getFrameNumber() for i in range(3)] == [7, 8, 9])
+    assert(queue.getFrameAnalysis() is None)
+
+    stats = queue.getStatistics()
+    assert(stats["dropped"] == 7)
+    assert(stats["queued"] == 0)
+
+    queue = findSpots.AnalysisQueue(policy = "latest_only", queue_size = 3)
+    for i in range(10):
+        queue.addFrameAnalysis(makeFrameAnalysis(i))
+    assert(queue.getFrameAnalysis().getFrameNumber() == 9)
+    assert(queue.getStatistics()["dropped"] == 9)
+
+
+def test_spot_counter_2():
+    """
+    Test the 'every_nth' queue policy.
+    """
+    queue = findSpots.AnalysisQueue(every_nth = 4, policy = "every_nth", queue_size = 10)
+    for i in range(20):
+        queue.addFrameAnalysis(makeFrameAnalysis(i))
+    assert([x.getFrameNumber() for x in queue.queue] == [0, 4, 8, 12, 16])
+
+    stats = queue.getStatistics()
+    assert(stats["dropped"] == 0)
+    assert(stats["skipped"] == 15)
+
+    queue.resetStatistics()
+    assert(queue.getStatistics()["skipped"] == 0)
+    assert(queue.getStatistics()["queued"] == 5)
+
+
+def test_spot_counter_3():
+    """
+    Test that an unknown queue policy is an error.
+    """
+    try:
+        findSpots.SpotCounter(max_threads = 1, queue_policy = "newest")
+    except findSpots.SpotCounterException:
+        pass
+    else:
+        assert False, "No exception for an unknown queue policy."
+
+
+def test_spot_counter_4(qtbot):
+    """
+    Test analyzing frames from two cameras.
+    """
+    spot_counter = findSpots.SpotCounter(max_threads = 2,
+                                         max_size = 64 * 64,
+                                         queue_size = 100)
+    results = []
+    spot_counter.imageProcessed.connect(lambda x : results.append([x.getCameraName(),
+                                                                   x.getFrameNumber(),
+                                                                   x.getCounts()]))
+
+    spots = [[10, 10], [30, 40], [50, 20]]
+    for i in range(5):
+        for camera_name in ["camera1", "camera2"]:
+            spot_counter.newFrameToAnalyze(camera_name, makeFrame(i, spots = spots), 500)
+
+    # Frames that are too large are ignored.
+    spot_counter.newFrameToAnalyze("camera1", makeFrame(5, size = 128), 500)
+
+    qtbot.waitUntil(lambda : (len(results) == 10))
+
+    spot_counter.cleanUp()
+
+    for camera_name in ["camera1", "camera2"]:
+        assert(sorted([x[1] for x in results if (x[0] == camera_name)]) == list(range(5)))
+    assert(all(map(lambda x : (x[2] == len(spots)), results)))
+
+    stats = spot_counter.getStatistics()
+    assert(stats["camera1"]["processed"] == 5)
+    assert(stats["camera2"]["processed"] == 5)
+    assert(stats["camera1"]["dropped"] == 0)
+
+
+def test_spot_counter_5():
+    """
+    Test that analyzing a frame in tiles gives the same localizations.
+    """
+    lmmObjectFinder.initialize()
+    a_frame = makeRandomFrame(200, 300, 200)
+
+    whole = findSpots.FrameAnalysis(frame = a_frame, threshold = 300)
+    whole.analyzeImage()
+    [x1, y1] = whole.getLocalizations()
+    assert(x1.size > 100)
+
+    for tile_size in [1, 7, 64, 299, 300]:
+        tiles = lmmObjectFinder.tiles(a_frame.image_y, tile_size)
+        tiled = findSpots.FrameAnalysis(frame = a_frame, threshold = 300, tiles = tiles)
+        tiled.analyzeImage(numpy.zeros(lmmObjectFinder.max_locs, dtype = numpy.float32),
+                           numpy.zeros(lmmObjectFinder.max_locs, dtype = numpy.float32))
+        [x2, y2] = tiled.getLocalizations()
+        assert(x2.size == x1.size)
+        assert(numpy.allclose(numpy.sort(x1 + 1000.0 * y1), numpy.sort(x2 + 1000.0 * y2)))
+
+    lmmObjectFinder.cleanUp()
+
+
+def test_spot_counter_6(qtbot):
+    """
+    Test analyzing frames that are larger than max_size in tiles.
+    """
+    spot_counter = findSpots.SpotCounter(max_threads = 4,
+                                         max_size = 64 * 64,
+                                         queue_size = 10,
+                                         tile_size = 50)
+    results = []
+    spot_counter.imageProcessed.connect(lambda x : results.append(x.getLocalizations()))
+
+    # Spots on either side of the tile borders.
+    spots = [[20, 20], [60, 48], [100, 51], [150, 100], [180, 150]]
+    for i in range(3):
+        spot_counter.newFrameToAnalyze("camera1", makeFrame(i, size = 200, spots = spots), 500)
+
+    qtbot.waitUntil(lambda : (len(results) == 3))
+
+    spot_counter.cleanUp()
+
+    for [x, y] in results:
+        assert(numpy.allclose(numpy.sort(x), [20, 60, 100, 150, 180]))
+        assert(numpy.allclose(numpy.sort(y), [20, 48, 51, 100, 150]))
+    assert(spot_counter.getStatistics()["camera1"]["processed"] == 3)
+
+
+if (__name__ == "__main__"):
+    test_spot_counter_1()
+    test_spot_counter_2()
+    test_spot_counter_3()
+    test_spot_counter_5()
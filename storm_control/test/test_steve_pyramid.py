@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Tests of the Steve image pyramids.
+"""
+import numpy
+import os
+import pickle
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+import storm_control.steve.imageItem as imageItem
+import storm_control.test as test
+
+
+def makeImageItem(size_x = 300, size_y = 512):
+    numpy.random.seed(1)
+    numpy_data = numpy.random.randint(0, 2000, (size_y, size_x)).astype(numpy.uint16)
+    image_item = imageItem.ImageItem(numpy_data = numpy_data,
+                                      objective_name = "obj1",
+                                      x_um = 10.0,
+                                      y_um = 20.0)
+    image_item.dataToPixmap(100, 1000)
+    image_item.setMagnification(1.0)
+    image_item.setZValue(1.0)
+    return image_item
+
+
+def render(image_item, scale):
+    """
+    Draw image_item at scale and return the pyramid level that was used.
+    """
+    scene = QtWidgets.QGraphicsScene()
+    scene.addItem(image_item.getGraphicsItem())
+    q_image = QtGui.QImage(200, 200, QtGui.QImage.Format_RGB32)
+    painter = QtGui.QPainter(q_image)
+    source = QtCore.QRectF(image_item.getGraphicsItem().pos(), QtCore.QSizeF(200.0/scale, 200.0/scale))
+    scene.render(painter, QtCore.QRectF(0, 0, 200, 200), source)
+    painter.end()
+    scene.removeItem(image_item.getGraphicsItem())
+    return image_item.getGraphicsItem().getPixmapLevel()
+
+
+def test_steve_pyramid_1():
+    """
+    Test creating the pyramid and rescaling.
+    """
+    image = numpy.arange(35, dtype = numpy.uint16).reshape((5, 7))
+    binned = imageItem.downsample(image)
+    assert(binned.shape == (2, 3))
+    assert(binned.dtype == numpy.uint16)
+    assert(binned[0,0] == 4)
+
+    pyramid = imageItem.makePyramid(numpy.zeros((512, 300), dtype = numpy.uint16))
+    assert([x.shape for x in pyramid] == [(256, 150), (128, 75), (64, 37)])
+
+    # The look up table and the direct calculation should agree.
+    image = numpy.random.randint(0, 65536, (300, 300)).astype(numpy.uint16)
+    assert(numpy.array_equal(imageItem.rescaleImage(image, 100, 1000),
+                             imageItem.rescaleImage(image.astype(numpy.float32), 100, 1000)))
+
+
+def test_steve_pyramid_2(qtbot):
+    """
+    Test that the pyramid level matches the view scale.
+    """
+    image_item = makeImageItem()
+    assert(render(image_item, 2.0) == 0)
+    assert(render(image_item, 0.3) == 1)
+    assert(render(image_item, 0.1) == 3)
+    assert(render(image_item, 0.001) == 3)
+
+    # The item size doesn't depend on the level.
+    assert(numpy.allclose(image_item.getSizeUm(), [300.0, 512.0]))
+
+    # Changing the contrast discards the pixmap.
+    image_item.setContrast(0, 2000)
+    assert(image_item.getGraphicsItem().pixmap is None)
+
+
+def test_steve_pyramid_3(qtbot):
+    """
+    Test that the pyramid is saved and loaded with the mosaic.
+    """
+    image_item = makeImageItem()
+    filename = image_item.saveItem(test.dataDirectory(), "pyramid")
+
+    loaded = imageItem.ImageItemLoader().load(test.dataDirectory(), filename)
+    assert(len(loaded.pyramid) == 3)
+    for i in range(3):
+        assert(numpy.array_equal(loaded.pyramid[i], image_item.pyramid[i]))
+    assert(loaded.getContrast() == [100, 1000])
+
+    # Older mosaics don't have a pyramid.
+    fname = os.path.join(test.dataDirectory(), filename)
+    with open(fname, "rb") as fp:
+        a_dict = pickle.load(fp)
+    del a_dict["pyramid"]
+    with open(fname, "wb") as fp:
+        pickle.dump(a_dict, fp)
+
+    loaded = imageItem.ImageItemLoader().load(test.dataDirectory(), filename)
+    assert(len(loaded.pyramid) == 3)
+    os.remove(fname)
+
+
+if (__name__ == "__main__"):
+    test_steve_pyramid_1()
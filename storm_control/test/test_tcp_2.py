@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+"""
+Tests of the framed, pipelined TCP protocol.
+"""
+import numpy
+
+from PyQt5 import QtCore
+
+import storm_control.sc_library.tcpClient as tcpClient
+import storm_control.sc_library.tcpCommunications as tcpCommunications
+import storm_control.sc_library.tcpMessage as tcpMessage
+import storm_control.sc_library.tcpServer as tcpServer
+
+
+class Server(QtCore.QObject):
+    """
+    Holds on to the messages that it gets until told to respond.
+    """
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.max_pending = 0
+        self.pending = []
+        self.server = tcpServer.TCPServer(port = 9501, server_name = "Test")
+        self.server.messageReceived.connect(self.handleMessageReceived)
+
+    def handleMessageReceived(self, message):
+        self.pending.append(message)
+        self.max_pending = max(self.max_pending, len(self.pending))
+
+    def respond(self):
+        for message in self.pending:
+            message.addResponse("received", True)
+            self.server.sendMessage(message)
+        self.pending = []
+
+
+def test_tcp_framing_1():
+    """
+    Test framing and unframing messages.
+    """
+    messages = [tcpMessage.TCPMessage(message_type = "Test", message_data = {"index" : i, "text" : "a\nb"})
+                for i in range(3)]
+    data = b"".join(map(tcpCommunications.frameMessage, messages))
+
+    # Feed the data in pieces.
+    reader = tcpCommunications.FrameReader()
+    received = []
+    for i in range(0, len(data), 7):
+        received += reader.addBytes(data[i:i+7])
+
+    assert(reader.isEmpty())
+    assert([x.getID() for x in received] == [x.getID() for x in messages])
+    assert(received[2].getData("text") == "a\nb")
+
+
+def test_tcp_framing_2():
+    """
+    Test framing and unframing arrays.
+    """
+    message = tcpMessage.TCPMessage(message_type = "Test")
+    arrays = [numpy.arange(12, dtype = numpy.uint16).reshape((3, 4)),
+              numpy.zeros(0, dtype = numpy.float64),
+              numpy.arange(10, dtype = numpy.int32)[::2]]
+    data = b"".join(tcpCommunications.frameData(arrays[0], message_id = message.getID(), info = {"a" : 1}))
+    data += tcpCommunications.frameMessage(message)
+    data += b"".join(tcpCommunications.frameData(arrays[1]))
+    data += b"".join(tcpCommunications.frameData(arrays[2]))
+
+    for chunk_size in [5, len(data)]:
+        reader = tcpCommunications.FrameReader()
+        received = []
+        for i in range(0, len(data), chunk_size):
+            received += reader.addBytes(data[i:i+chunk_size])
+
+        assert(reader.isEmpty())
+        assert(len(received) == 4)
+        assert(received[1].getID() == message.getID())
+        [header, np_array] = received[0]
+        assert(header["message_id"] == message.getID())
+        assert(header["info"]["a"] == 1)
+        assert(np_array.dtype == numpy.uint16)
+        assert(numpy.array_equal(np_array, arrays[0]))
+        for i in [1, 2]:
+            assert(numpy.array_equal(received[i+1][1], arrays[i]))
+
+
+def test_tcp_framing_3():
+    """
+    Test reading many frames at once.
+    """
+    messages = [tcpMessage.TCPMessage(message_type = "Test", message_data = {"index" : i})
+                for i in range(1000)]
+    frames = list(map(tcpCommunications.frameMessage, messages))
+    data = b"".join(frames)
+
+    # All but the last 5 bytes.
+    reader = tcpCommunications.FrameReader()
+    received = reader.addBytes(data[:-5])
+    assert(len(received) == 999)
+    assert(len(reader.buffer) == (len(frames[-1]) - 5))
+
+    received += reader.addBytes(data[-5:])
+    assert(reader.isEmpty())
+    assert([x.getData("index") for x in received] == list(range(1000)))
+
+
+def test_tcp_pipeline_1(qtbot):
+    """
+    Test that the client limits the number of outstanding messages
+    and that responses are matched to messages.
+    """
+    server = Server()
+    client = tcpClient.TCPClient(max_outstanding = 2, port = 9501, server_name = "Test")
+    responses = []
+    client.messageReceived.connect(responses.append)
+    assert(client.startCommunication())
+
+    messages = [tcpMessage.TCPMessage(message_type = "Test", message_data = {"index" : i}) for i in range(5)]
+    for message in messages:
+        client.sendMessage(message)
+
+    while (len(responses) < len(messages)):
+        qtbot.waitUntil(lambda : (len(server.pending) > 0))
+        n_responses = len(responses) + len(server.pending)
+        server.respond()
+        qtbot.waitUntil(lambda : (len(responses) == n_responses))
+
+    assert(server.max_pending == 2)
+    assert([x.getID() for x in responses] == [x.getID() for x in messages])
+    assert(all(map(lambda x: x.getResponse("received"), responses)))
+    assert(client.getOutstanding() == 0)
+
+    client.stopCommunication()
+    server.server.close()
+
+
+def test_tcp_pipeline_2(qtbot):
+    """
+    Test that the client stops sending when the server is busy.
+    """
+    server = Server()
+    client = tcpClient.TCPClient(port = 9501, server_name = "Test")
+    assert(client.startCommunication())
+    qtbot.waitUntil(lambda : server.server.isConnected())
+
+    server.server.sendMessage(tcpMessage.TCPMessage(message_type = "Busy", message_data = {"busy" : True}))
+    qtbot.waitUntil(lambda : client.busy)
+
+    client.sendMessage(tcpMessage.TCPMessage(message_type = "Test"))
+    qtbot.wait(100)
+    assert(len(server.pending) == 0)
+
+    server.server.sendMessage(tcpMessage.TCPMessage(message_type = "Busy", message_data = {"busy" : False}))
+    qtbot.waitUntil(lambda : (len(server.pending) == 1))
+
+    client.stopCommunication()
+    server.server.close()
+
+
+def test_tcp_lines_1(qtbot):
+    """
+    Test that the server still works with the line based protocol.
+    """
+    server = Server()
+    client = tcpClient.TCPClient(framed = False, port = 9501, server_name = "Test")
+    responses = []
+    client.messageReceived.connect(responses.append)
+    assert(client.startCommunication())
+
+    messages = [tcpMessage.TCPMessage(message_type = "Test", message_data = {"index" : i}) for i in range(3)]
+    for message in messages:
+        client.sendMessage(message)
+    qtbot.waitUntil(lambda : (len(server.pending) == 3))
+    assert(server.server.framed is False)
+
+    server.respond()
+    qtbot.waitUntil(lambda : (len(responses) == 3))
+    assert([x.getData("index") for x in responses] == [0, 1, 2])
+
+    client.stopCommunication()
+    server.server.close()
+
+
+def test_tcp_data_1(qtbot):
+    """
+    Test sending arrays.
+    """
+    server = Server()
+    client = tcpClient.TCPClient(port = 9501, server_name = "Test")
+    received = []
+    client.dataReceived.connect(lambda header, np_array : received.append([header, np_array]))
+    assert(client.startCommunication())
+
+    # The server only knows that the client is using frames once it gets a message.
+    client.sendMessage(tcpMessage.TCPMessage(message_type = "Test"))
+    qtbot.waitUntil(lambda : (len(server.pending) == 1))
+
+    np_array = numpy.random.randint(0, 65535, size = (512, 256)).astype(numpy.uint16)
+    server.server.sendData(np_array, message_id = 10, info = {"frame_number" : 2})
+    qtbot.waitUntil(lambda : (len(received) == 1))
+
+    [header, r_array] = received[0]
+    assert(header["message_id"] == 10)
+    assert(header["info"]["frame_number"] == 2)
+    assert(numpy.array_equal(r_array, np_array))
+
+    client.stopCommunication()
+    server.server.close()
+
+
+if (__name__ == "__main__"):
+    test_tcp_framing_1()
+    test_tcp_framing_2()
+    test_tcp_framing_3()